@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库写入基准测试
+对比逐条写入（save_to_database）与批量写入（BulkScheduleWriter）的写入速度
+
+运行：python benchmark_db_writer.py --rows 5000 --env local
+注意：会向配置的数据库写入测试数据（船名以BENCH-开头，版本号为负数，不会被发布），结束后自动删除
+"""
+import argparse
+import time
+
+from process_routes import (
+    BulkScheduleWriter, load_config, save_to_database, setup_database
+)
+
+BENCH_VESSEL_PREFIX = "BENCH-"
+
+
+def generate_routes(count, pol_count=10, pod_count=20):
+    """生成模拟航线数据"""
+    routes = []
+    for i in range(count):
+        pol_cd = f"CNB{i % pol_count:02d}"
+        pod_cd = f"USB{(i // pol_count) % pod_count:02d}"
+        routes.append({
+            "polCd": pol_cd,
+            "podCd": pod_cd,
+            "pol": f"BENCH POL {pol_cd}",
+            "pod": f"BENCH POD {pod_cd}",
+            "vessel": f"{BENCH_VESSEL_PREFIX}{i:06d}",
+            "voyage": f"V{i % 100:03d}E",
+            "routeEtd": "3",
+            "etd": "2025-06-01 00:00:00",
+            "eta": "2025-06-27 00:00:00",
+            "totalDuration": "26",
+            "isReferenceCarrier": "1",
+            "shareCabins": [{"carrierCd": "MSK"}, {"carrierCd": "CMA"}],
+        })
+    return routes
+
+
+def cleanup(config, data_versions):
+    """删除基准测试写入的数据（先删除共舱明细，避免留下孤立的明细记录）"""
+    conn = setup_database(config)
+    try:
+        with conn.cursor() as cursor:
+            params = (BENCH_VESSEL_PREFIX + "%", tuple(data_versions))
+            cursor.execute(
+                """
+                DELETE sc FROM vessel_schedule_share_cabin sc
+                JOIN vessel_schedule vs ON vs.id = sc.schedule_id
+                WHERE vs.vessel LIKE %s AND vs.data_version IN %s
+                """,
+                params
+            )
+            cursor.execute(
+                "DELETE FROM vessel_schedule WHERE vessel LIKE %s AND data_version IN %s",
+                params
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def benchmark_per_row(routes, config, data_version):
+    """逐条写入（每次调用新建连接并执行建表检查）"""
+    started_at = time.monotonic()
+    # 与原抓取流程一致：按50条一个组合逐次调用
+    written = 0
+    for start in range(0, len(routes), 50):
+        written += save_to_database(routes[start:start + 50], config, data_version, publish=False)
+    return written, time.monotonic() - started_at
+
+
+def benchmark_bulk(routes, config, data_version, chunk_size):
+    """批量写入（复用一个连接，按批executemany）"""
+    started_at = time.monotonic()
+    with BulkScheduleWriter(config, chunk_size=chunk_size, incremental=False) as writer:
+        for start in range(0, len(routes), 50):
+            writer.write(routes[start:start + 50], data_version)
+    return writer.rows_written, time.monotonic() - started_at
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='数据库写入基准测试')
+    parser.add_argument('--rows', type=int, default=5000, help='写入的航线条数')
+    parser.add_argument('--chunk_size', type=int, default=500, help='批量写入每批条数')
+    parser.add_argument('--config_file', default='config.json', help='配置文件路径')
+    parser.add_argument('--env', choices=['local', 'docker', 'container'], help='运行环境')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config_file = {
+        'docker': 'config.docker.json',
+        'container': 'config.container.json',
+        'local': 'config.json',
+    }.get(args.env, args.config_file)
+    config = load_config(config_file)
+
+    routes = generate_routes(args.rows)
+    # 使用负数版本号，避免与真实数据版本冲突
+    per_row_version, bulk_version = -1, -2
+
+    try:
+        print(f"逐条写入 {len(routes)} 条...")
+        per_row_written, per_row_elapsed = benchmark_per_row(routes, config, per_row_version)
+        print(f"批量写入 {len(routes)} 条（每批 {args.chunk_size} 条）...")
+        bulk_written, bulk_elapsed = benchmark_bulk(routes, config, bulk_version, args.chunk_size)
+    finally:
+        cleanup(config, [per_row_version, bulk_version])
+
+    per_row_rate = per_row_written / per_row_elapsed if per_row_elapsed else 0
+    bulk_rate = bulk_written / bulk_elapsed if bulk_elapsed else 0
+    print(f"\n逐条写入：{per_row_written} 条，耗时 {per_row_elapsed:.2f} 秒，{per_row_rate:.0f} 条/秒")
+    print(f"批量写入：{bulk_written} 条，耗时 {bulk_elapsed:.2f} 秒，{bulk_rate:.0f} 条/秒")
+    if per_row_rate:
+        print(f"提升：{bulk_rate / per_row_rate:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
+import hashlib
 import json
 import requests
 import datetime
 import argparse
 import os
 import pymysql
+import random
+import threading
 import time
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from zoneinfo import ZoneInfo
 
 # 默认配置
 DEFAULT_CONFIG = {
@@ -16,6 +22,17 @@ DEFAULT_CONFIG = {
     "pod_cd": "VNVUT",
     "weeks_out": "6",
     "is_transit": "0",
+    # 航线API地址（可指向本地stub_server.py回放录制数据）
+    "schedule_api_url": "https://api.trackingeyes.com/api/schedule/vesselSchedule",
+    # 并发抓取配置：并发数、每秒请求数（令牌桶速率）、突发容量
+    "concurrency": 4,
+    "rate_limit": 2,
+    "rate_burst": 2,
+    "max_retries": 3,
+    # 批量写入数据库时每批的条数
+    "db_chunk_size": 500,
+    # 航线时间字符串所在时区，类型化时间字段按UTC写入（与Django USE_TZ一致）
+    "schedule_timezone": "Asia/Shanghai",
     # 数据库默认配置（将从配置文件中覆盖）
     "db_host": "localhost",
     "db_port": 3306,
@@ -120,14 +137,64 @@ def fetch_discharge_ports(base_url="http://localhost:8000/api", code=None, name=
     print(f"成功获取 {len(all_results)} 个目的港数据")
     return all_results
 
-def fetch_vessel_schedule(config: Dict[str, str]) -> Dict[str, Any]:
-    """从API获取航线数据，失败时最多重试3次"""
+class TokenBucket:
+    """令牌桶限速器（线程安全）
+    
+    按rate（每秒令牌数）匀速补充令牌，最多积累capacity个；每次请求前调用acquire()，
+    没有令牌时阻塞等待。rate<=0表示不限速
+    """
+    
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """获取一个令牌，必要时等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+def create_http_session(pool_size: int = 10) -> requests.Session:
+    """创建共享的HTTP会话，连接池大小与并发数一致以复用keep-alive连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+def compute_backoff(attempt: int, base_delay: float = 1.0, max_delay: float = 30.0) -> float:
+    """计算第attempt次重试前的等待时间（指数退避 + 全抖动），避免并发请求同时重试"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def fetch_vessel_schedule(config: Dict[str, str], session: requests.Session = None,
+                          rate_limiter: TokenBucket = None) -> Dict[str, Any]:
+    """从API获取航线数据，失败时按抖动退避重试
+    
+    Args:
+        config: 配置（含pol_cd、pod_cd）
+        session: 共享的HTTP会话，None时每次单独发起请求
+        rate_limiter: 令牌桶限速器，None表示不限速
+    """
     # 计算起始日期（当前日期减去days_back天）
     days_back = int(config.get("days_back", 2))
     start_date = (datetime.datetime.now() - datetime.timedelta(days=days_back)).strftime("%Y-%m-%d")
     
     # 修正URL拼接方式
-    url = f"https://api.trackingeyes.com/api/schedule/vesselSchedule?token={config['token']}&companyCode={config['company_id']}&orgCode=null"
+    api_url = config.get("schedule_api_url") or DEFAULT_CONFIG["schedule_api_url"]
+    url = f"{api_url}?token={config['token']}&companyCode={config['company_id']}&orgCode=null"
     
     payload = json.dumps({
         "polCd": config['pol_cd'],
@@ -142,42 +209,99 @@ def fetch_vessel_schedule(config: Dict[str, str]) -> Dict[str, Any]:
     }
     
     # 最大重试次数
-    max_retries = 3
-    retry_delay = 1  # 初始重试延迟（秒）
+    max_retries = int(config.get("max_retries", 3))
+    pair = f"{config['pol_cd']}->{config['pod_cd']}"
     
     for attempt in range(max_retries + 1):  # +1是因为第一次不算重试
         try:
-            print(f"请求API，尝试 {attempt + 1}/{max_retries + 1}")
-            response = requests.request("POST", url, headers=headers, data=payload)
+            if rate_limiter:
+                rate_limiter.acquire()
+            print(f"[{pair}] 请求API，尝试 {attempt + 1}/{max_retries + 1}")
+            if session is not None:
+                response = session.request("POST", url, headers=headers, data=payload, timeout=60)
+            else:
+                response = requests.request("POST", url, headers=headers, data=payload)
             response.raise_for_status()  # 检查请求是否成功
             
             # 检查API返回状态码
             resp_data = response.json()
             if resp_data.get("code") == 200:
-                print(f"API请求成功，状态码: {resp_data.get('code')}")
+                print(f"[{pair}] API请求成功，状态码: {resp_data.get('code')}")
                 return resp_data
             else:
                 error_msg = f"API返回错误: 状态码 {resp_data.get('code')}, 消息: {resp_data.get('message', '无消息')}"
                 if attempt < max_retries:
-                    print(f"{error_msg}, 将在{retry_delay}秒后重试...")
+                    retry_delay = compute_backoff(attempt)
+                    print(f"[{pair}] {error_msg}, 将在{retry_delay:.2f}秒后重试...")
                     time.sleep(retry_delay)
-                    retry_delay *= 2  # 指数退避策略，每次重试延迟加倍
                 else:
-                    print(f"最终{error_msg}, 达到最大重试次数")
+                    print(f"[{pair}] 最终{error_msg}, 达到最大重试次数")
                     return resp_data
                     
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             if attempt < max_retries:
-                print(f"API请求失败: {e}, 将在{retry_delay}秒后重试...")
+                retry_delay = compute_backoff(attempt)
+                print(f"[{pair}] API请求失败: {e}, 将在{retry_delay:.2f}秒后重试...")
                 time.sleep(retry_delay)
-                retry_delay *= 2  # 指数退避策略
             else:
-                print(f"API请求失败: {e}, 达到最大重试次数")
+                print(f"[{pair}] API请求失败: {e}, 达到最大重试次数")
                 return {"code": 500, "message": f"API请求失败: {e}", "result": []}
     
     # 理论上不会执行到这里，但为了代码完整性
     return {"code": 500, "message": "未知错误，所有重试均失败", "result": []}
 
+def fetch_schedules_concurrently(pairs: List[Tuple[str, str]], config: Dict[str, str],
+                                 concurrency: int = 4, rate_limiter: TokenBucket = None,
+                                 session: requests.Session = None) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """并发抓取多个港口组合的航线数据
+    
+    请求在线程池中执行，共享HTTP会话和令牌桶；结果按完成顺序返回，
+    调用方在主线程中处理和写库
+    
+    Args:
+        pairs: 港口组合列表 [(pol_cd, pod_cd), ...]
+        config: 基础配置
+        concurrency: 最大并发请求数
+        rate_limiter: 令牌桶限速器
+        session: 共享HTTP会话，None时自动创建
+        
+    Yields:
+        (pol_cd, pod_cd, data)
+    """
+    concurrency = max(1, int(concurrency))
+    own_session = session is None
+    if own_session:
+        session = create_http_session(pool_size=concurrency)
+    
+    def _fetch(pol_cd, pod_cd):
+        pair_config = config.copy()
+        pair_config["pol_cd"] = pol_cd
+        pair_config["pod_cd"] = pod_cd
+        return fetch_vessel_schedule(pair_config, session=session, rate_limiter=rate_limiter)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(_fetch, pol_cd, pod_cd): (pol_cd, pod_cd)
+                for pol_cd, pod_cd in pairs
+            }
+            for future in as_completed(futures):
+                pol_cd, pod_cd = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    data = {"code": 500, "message": f"抓取失败: {e}", "result": []}
+                yield pol_cd, pod_cd, data
+    finally:
+        if own_session:
+            session.close()
+
+def save_recorded_response(data: Dict[str, Any], record_dir: str, pol_cd: str, pod_cd: str) -> None:
+    """保存API原始响应，供stub_server.py回放"""
+    os.makedirs(record_dir, exist_ok=True)
+    with open(os.path.join(record_dir, f"{pol_cd}_{pod_cd}.json"), 'w') as f:
+        json.dump(data, f, ensure_ascii=False)
+
 def process_routes(data, requested_pod_cd=None):
     """处理航线数据，根据规则选择最优航线"""
     # 检查API是否返回成功
@@ -293,6 +417,18 @@ def setup_database(config):
             `ext_field1` VARCHAR(255) COMMENT '扩展字段1',
             `ext_field2` VARCHAR(255) COMMENT '扩展字段2',
             `ext_field3` TEXT COMMENT '扩展字段3',
+            `content_hash` VARCHAR(64) COMMENT '航线内容哈希',
+            `eta_at` DATETIME COMMENT '计划到港时间（UTC）',
+            `etd_at` DATETIME COMMENT '计划离港时间（UTC）',
+            `booking_cutoff_at` DATETIME COMMENT '截订舱时间（UTC）',
+            `cy_open_at` DATETIME COMMENT '进港时间（UTC）',
+            `cy_close_at` DATETIME COMMENT '截港时间（UTC）',
+            `custom_cutoff_at` DATETIME COMMENT '截放行时间（UTC）',
+            `cut_off_at` DATETIME COMMENT '截申报时间（UTC）',
+            `si_cutoff_at` DATETIME COMMENT '截单时间（UTC）',
+            `vgm_cutoff_at` DATETIME COMMENT '截VGM时间（UTC）',
+            `carrier_set` VARCHAR(255) COMMENT '共舱船公司集合',
+            `carrier_set_hash` VARCHAR(64) COMMENT '共舱船公司集合哈希',
             PRIMARY KEY (`id`),
             UNIQUE KEY `unique_route` (`polCd`, `podCd`, `vessel`, `voyage`, `data_version`)
         ) ENGINE=InnoDB DEFAULT CHARSET=%s COMMENT='船舶航线数据';
@@ -300,6 +436,70 @@ def setup_database(config):
         
         # 使用参数化查询，避免字符串格式化错误
         cursor.execute(create_table_sql % config['db_charset'])
+        
+        # 旧表补充后续新增的字段（内容哈希、类型化时间字段）
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'vessel_schedule'",
+            (config['db_name'],)
+        )
+        existing_columns = {row[0] for row in cursor.fetchall()}
+        for column, definition in ADDED_SCHEDULE_COLUMNS:
+            if column not in existing_columns:
+                print(f"为数据表 vessel_schedule 添加字段 {column}...")
+                cursor.execute(f"ALTER TABLE `vessel_schedule` ADD COLUMN `{column}` {definition}")
+        
+        # 共舱明细表：shareCabins中每个船公司一条记录，用于按船公司查询共舱航线
+        print("检查数据表 vessel_schedule_share_cabin 是否存在...")
+        create_share_cabin_sql = """
+        CREATE TABLE IF NOT EXISTS `vessel_schedule_share_cabin` (
+            `id` BIGINT AUTO_INCREMENT,
+            `schedule_id` INT NOT NULL COMMENT '航线ID',
+            `carrierCd` VARCHAR(20) NOT NULL COMMENT '船公司',
+            `sort_order` SMALLINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '在shareCabins中的顺序',
+            `price` DECIMAL(10, 2) COMMENT '价格',
+            `available` TINYINT(1) COMMENT '是否可用',
+            `remark` VARCHAR(255) COMMENT '备注',
+            PRIMARY KEY (`id`),
+            UNIQUE KEY `unique_schedule_carrier` (`schedule_id`, `carrierCd`),
+            KEY `idx_vssc_carrier_schedule` (`carrierCd`, `schedule_id`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=%s COMMENT='航线共舱船公司';
+        """
+        cursor.execute(create_share_cabin_sql % config['db_charset'])
+        
+        # 数据版本登记表：polCd、podCd为空字符串的记录表示全局版本
+        print("检查数据表 data_version_registry 是否存在...")
+        create_registry_sql = """
+        CREATE TABLE IF NOT EXISTS `data_version_registry` (
+            `id` BIGINT AUTO_INCREMENT,
+            `polCd` VARCHAR(10) NOT NULL DEFAULT '' COMMENT '起运港五字码，空表示全局',
+            `podCd` VARCHAR(10) NOT NULL DEFAULT '' COMMENT '目的港五字码，空表示全局',
+            `data_version` INT NOT NULL COMMENT '已发布数据版本号',
+            `published_at` DATETIME NOT NULL COMMENT '发布时间',
+            PRIMARY KEY (`id`),
+            UNIQUE KEY `unique_route_version` (`polCd`, `podCd`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=%s COMMENT='数据版本登记';
+        """
+        cursor.execute(create_registry_sql % config['db_charset'])
+        
+        # 航线统计汇总表：统计接口只读取此表，发布版本时按版本重算
+        print("检查数据表 vessel_schedule_stats 是否存在...")
+        create_stats_sql = """
+        CREATE TABLE IF NOT EXISTS `vessel_schedule_stats` (
+            `id` BIGINT AUTO_INCREMENT,
+            `data_version` INT NOT NULL COMMENT '数据版本号',
+            `status` SMALLINT NOT NULL COMMENT '数据状态：1-有效，0-无效',
+            `dimension` VARCHAR(10) NOT NULL COMMENT '统计维度：carrier/pol/pod',
+            `code` VARCHAR(20) NOT NULL DEFAULT '' COMMENT '船公司代码/港口五字码',
+            `name` VARCHAR(100) NOT NULL DEFAULT '' COMMENT '港口名称',
+            `count` INT NOT NULL DEFAULT 0 COMMENT '航线数量',
+            `updated_at` DATETIME(6) NOT NULL COMMENT '更新时间',
+            PRIMARY KEY (`id`),
+            UNIQUE KEY `unique_version_status_dimension_code_name` (`data_version`, `status`, `dimension`, `code`, `name`),
+            KEY `idx_vss_dimension_status` (`dimension`, `status`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=%s COMMENT='航线统计';
+        """
+        cursor.execute(create_stats_sql % config['db_charset'])
         conn.commit()
         print("数据库初始化完成")
         
@@ -322,11 +522,538 @@ def get_latest_data_version(conn):
         return result[0]
     return 0
 
-def save_to_database(selected_routes, config, data_version=None):
-    """将筛选出的数据保存到数据库"""
+def publish_data_version(cursor, data_version, routes):
+    """在当前事务中发布数据版本：更新全局版本及本次涉及航线的版本登记
+    
+    Args:
+        cursor: 数据库游标（由调用方负责提交事务）
+        data_version: 要发布的数据版本号
+        routes: 航线集合 {(polCd, podCd), ...}
+    """
+    published_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    pointers = [('', '')] + sorted(set(routes))
+    cursor.executemany(
+        """
+        INSERT INTO data_version_registry (polCd, podCd, data_version, published_at)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            data_version = VALUES(data_version),
+            published_at = VALUES(published_at)
+        """,
+        [(pol_cd, pod_cd, data_version, published_at) for pol_cd, pod_cd in pointers]
+    )
+    print(f"已发布数据版本 {data_version}，更新 {len(pointers) - 1} 条航线版本登记")
+
+def refresh_schedule_stats(cursor, data_version):
+    """在当前事务中重算指定数据版本的航线统计（按船公司、起运港、目的港汇总）
+    
+    Args:
+        cursor: 数据库游标（由调用方负责提交事务）
+        data_version: 数据版本号
+    """
+    cursor.execute("DELETE FROM vessel_schedule_stats WHERE data_version = %s", (data_version,))
+    for dimension, code_column, name_column in (
+        ('carrier', 'carriercd', "''"),
+        ('pol', 'polCd', "COALESCE(pol, '')"),
+        ('pod', 'podCd', "COALESCE(pod, '')"),
+    ):
+        cursor.execute(
+            f"""
+            INSERT INTO vessel_schedule_stats (data_version, status, dimension, code, name, count, updated_at)
+            SELECT data_version, status, %s, COALESCE({code_column}, ''), {name_column}, COUNT(*), NOW(6)
+            FROM vessel_schedule
+            WHERE data_version = %s
+            GROUP BY data_version, status, COALESCE({code_column}, ''), {name_column}
+            """,
+            (dimension, data_version)
+        )
+
+def publish_staged_version(config, data_version, staged_routes, conn=None):
+    """校验暂存的数据版本，并在一个事务中发布（切换版本登记）
+    
+    暂存期间接口始终读取上一个已发布版本；只有写入了有效数据的航线才会被发布，
+    写入失败的航线继续使用其上一个版本
+    
+    Args:
+        config: 配置
+        data_version: 暂存的数据版本号
+        staged_routes: 本次写入的航线及成功条数 {(polCd, podCd): count}
+        conn: 复用的数据库连接（如BulkScheduleWriter的连接），None时新建并在结束后关闭
+        
+    Returns:
+        bool: 是否发布成功
+    """
+    if not staged_routes:
+        print(f"数据版本 {data_version} 没有暂存数据，不发布")
+        return False
+    
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = setup_database(config)
+        cursor = conn.cursor()
+        
+        # 校验：按航线统计暂存版本中实际落库的有效数据
+        cursor.execute(
+            """
+            SELECT polCd, podCd, COUNT(*) FROM vessel_schedule
+            WHERE data_version = %s AND status = 1
+            GROUP BY polCd, podCd
+            """,
+            (data_version,)
+        )
+        stored_counts = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+        
+        publish_routes = []
+        for route, expected_count in staged_routes.items():
+            stored_count = stored_counts.get(route, 0)
+            if stored_count == 0:
+                print(f"警告：航线 {route[0]} -> {route[1]} 在版本 {data_version} 中没有数据，保留其上一版本")
+                continue
+            if stored_count != expected_count:
+                print(f"警告：航线 {route[0]} -> {route[1]} 写入 {expected_count} 条，实际落库 {stored_count} 条")
+            publish_routes.append(route)
+        
+        if not publish_routes:
+            print(f"数据版本 {data_version} 校验未通过，不发布")
+            return False
+        
+        # 单个事务内切换全局及各航线版本登记，并重算该版本的航线统计
+        publish_data_version(cursor, data_version, publish_routes)
+        refresh_schedule_stats(cursor, data_version)
+        conn.commit()
+        cursor.close()
+        return True
+    except Exception as e:
+        print(f"发布数据版本 {data_version} 失败: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if own_conn and conn:
+            conn.close()
+
+def publish_existing_version(config, data_version):
+    """发布数据库中已暂存的数据版本（用于 --stage_only 之后的手动发布）"""
+    conn = setup_database(config)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT polCd, podCd, COUNT(*) FROM vessel_schedule
+            WHERE data_version = %s AND status = 1
+            GROUP BY polCd, podCd
+            """,
+            (data_version,)
+        )
+        staged_routes = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+        cursor.close()
+    finally:
+        conn.close()
+    
+    if publish_staged_version(config, data_version, staged_routes):
+        print(f"数据版本 {data_version} 已发布，共 {len(staged_routes)} 个航线组合")
+    return staged_routes
+
+UPSERT_SCHEDULE_SQL = """
+    INSERT INTO vessel_schedule (
+        routeCd, routeEtd, carriercd, isReferenceCarrier, imo, vessel, voyage, shipAgency,
+        polCd, pol, polTerminal, polTerminalCd, podCd, pod, podTerminal, podTerminalCd,
+        eta, etd, totalDuration, isTransit, transitPortEn, transitPortCd,
+        vesselAfterTransit, voyageAfterTransit, secondTransitPortEn, secondTransitPortCd,
+        secondVesselAfterTransit, secondVoyageAfterTransit, bookingCutoff,
+        cyOpen, cyClose, customCutoff, cutOff, siCutoff, vgmCutoff,
+        shareCabins, fetch_timestamp, fetch_date, data_version, status,
+        eta_at, etd_at, booking_cutoff_at, cy_open_at, cy_close_at,
+        custom_cutoff_at, cut_off_at, si_cutoff_at, vgm_cutoff_at,
+        carrier_set, carrier_set_hash, content_hash
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s,
+        %s, %s, %s,
+        %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s,
+        %s, %s, %s, %s,
+        %s, %s, %s
+    )
+    ON DUPLICATE KEY UPDATE
+        routeCd = VALUES(routeCd),
+        routeEtd = VALUES(routeEtd),
+        carriercd = VALUES(carriercd),
+        isReferenceCarrier = VALUES(isReferenceCarrier),
+        imo = VALUES(imo),
+        shipAgency = VALUES(shipAgency),
+        pol = VALUES(pol),
+        polTerminal = VALUES(polTerminal),
+        polTerminalCd = VALUES(polTerminalCd),
+        pod = VALUES(pod),
+        podTerminal = VALUES(podTerminal),
+        podTerminalCd = VALUES(podTerminalCd),
+        eta = VALUES(eta),
+        etd = VALUES(etd),
+        totalDuration = VALUES(totalDuration),
+        isTransit = VALUES(isTransit),
+        transitPortEn = VALUES(transitPortEn),
+        transitPortCd = VALUES(transitPortCd),
+        vesselAfterTransit = VALUES(vesselAfterTransit),
+        voyageAfterTransit = VALUES(voyageAfterTransit),
+        secondTransitPortEn = VALUES(secondTransitPortEn),
+        secondTransitPortCd = VALUES(secondTransitPortCd),
+        secondVesselAfterTransit = VALUES(secondVesselAfterTransit),
+        secondVoyageAfterTransit = VALUES(secondVoyageAfterTransit),
+        bookingCutoff = VALUES(bookingCutoff),
+        cyOpen = VALUES(cyOpen),
+        cyClose = VALUES(cyClose),
+        customCutoff = VALUES(customCutoff),
+        cutOff = VALUES(cutOff),
+        siCutoff = VALUES(siCutoff),
+        vgmCutoff = VALUES(vgmCutoff),
+        shareCabins = VALUES(shareCabins),
+        fetch_timestamp = VALUES(fetch_timestamp),
+        fetch_date = VALUES(fetch_date),
+        data_version = VALUES(data_version),
+        status = VALUES(status),
+        eta_at = VALUES(eta_at),
+        etd_at = VALUES(etd_at),
+        booking_cutoff_at = VALUES(booking_cutoff_at),
+        cy_open_at = VALUES(cy_open_at),
+        cy_close_at = VALUES(cy_close_at),
+        custom_cutoff_at = VALUES(custom_cutoff_at),
+        cut_off_at = VALUES(cut_off_at),
+        si_cutoff_at = VALUES(si_cutoff_at),
+        vgm_cutoff_at = VALUES(vgm_cutoff_at),
+        carrier_set = VALUES(carrier_set),
+        carrier_set_hash = VALUES(carrier_set_hash),
+        content_hash = VALUES(content_hash)
+"""
+
+# 航线内容字段（参与内容哈希计算，顺序与UPSERT_SCHEDULE_SQL一致）
+SCHEDULE_CONTENT_COLUMNS = (
+    'routeCd', 'routeEtd', 'carriercd', 'isReferenceCarrier', 'imo', 'vessel', 'voyage', 'shipAgency',
+    'polCd', 'pol', 'polTerminal', 'polTerminalCd', 'podCd', 'pod', 'podTerminal', 'podTerminalCd',
+    'eta', 'etd', 'totalDuration', 'isTransit', 'transitPortEn', 'transitPortCd',
+    'vesselAfterTransit', 'voyageAfterTransit', 'secondTransitPortEn', 'secondTransitPortCd',
+    'secondVesselAfterTransit', 'secondVoyageAfterTransit', 'bookingCutoff',
+    'cyOpen', 'cyClose', 'customCutoff', 'cutOff', 'siCutoff', 'vgmCutoff',
+    'shareCabins',
+)
+
+# 类型化时间字段：{字符串字段: 时间字段}，由字符串字段推导，不参与内容哈希
+SCHEDULE_DATETIME_COLUMNS = (
+    ('eta', 'eta_at'),
+    ('etd', 'etd_at'),
+    ('bookingCutoff', 'booking_cutoff_at'),
+    ('cyOpen', 'cy_open_at'),
+    ('cyClose', 'cy_close_at'),
+    ('customCutoff', 'custom_cutoff_at'),
+    ('cutOff', 'cut_off_at'),
+    ('siCutoff', 'si_cutoff_at'),
+    ('vgmCutoff', 'vgm_cutoff_at'),
+)
+
+# 共舱船公司集合字段：shareCabins中去重排序的船公司代码及其哈希，不参与内容哈希
+SCHEDULE_CARRIER_SET_COLUMNS = ('carrier_set', 'carrier_set_hash')
+
+# 由内容字段推导的字段（顺序与UPSERT_SCHEDULE_SQL一致），沿用上一版本时一并复制
+SCHEDULE_DERIVED_COLUMNS = tuple(column for _, column in SCHEDULE_DATETIME_COLUMNS) + SCHEDULE_CARRIER_SET_COLUMNS
+
+# 建表之后新增的字段，旧表在setup_database中补充
+ADDED_SCHEDULE_COLUMNS = (
+    ('content_hash', "VARCHAR(64) NULL COMMENT '航线内容哈希'"),
+) + tuple(
+    (column, "DATETIME NULL COMMENT '类型化时间（UTC）'") for _, column in SCHEDULE_DATETIME_COLUMNS
+) + (
+    ('carrier_set', "VARCHAR(255) NULL COMMENT '共舱船公司集合'"),
+    ('carrier_set_hash', "VARCHAR(64) NULL COMMENT '共舱船公司集合哈希'"),
+)
+
+# 航线时间字符串格式
+SCHEDULE_DATETIME_FORMATS = (
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+    '%Y/%m/%d %H:%M:%S', '%Y/%m/%d',
+)
+
+# 内容未变化的航线：在数据库内从上一版本复制到新版本，不再传输和解析整行数据（新版本仍是完整的行）
+CARRY_FORWARD_SCHEDULE_SQL = """
+    INSERT INTO vessel_schedule (
+        {columns}, fetch_timestamp, fetch_date, data_version, status, {derived_columns}, content_hash
+    )
+    SELECT {columns}, %s, %s, %s, status, {derived_columns}, content_hash
+    FROM vessel_schedule WHERE id IN %s
+    ON DUPLICATE KEY UPDATE
+        {updates},
+        fetch_timestamp = VALUES(fetch_timestamp),
+        fetch_date = VALUES(fetch_date),
+        status = VALUES(status),
+        content_hash = VALUES(content_hash)
+""".format(
+    columns=', '.join(SCHEDULE_CONTENT_COLUMNS),
+    derived_columns=', '.join(SCHEDULE_DERIVED_COLUMNS),
+    updates=',\n        '.join(
+        f"{column} = VALUES({column})" for column in SCHEDULE_CONTENT_COLUMNS + SCHEDULE_DERIVED_COLUMNS
+    ),
+)
+
+# 航线写入参数中的字段位置
+PARAM_VESSEL_INDEX = SCHEDULE_CONTENT_COLUMNS.index('vessel')
+PARAM_VOYAGE_INDEX = SCHEDULE_CONTENT_COLUMNS.index('voyage')
+PARAM_POL_INDEX = SCHEDULE_CONTENT_COLUMNS.index('polCd')
+PARAM_POD_INDEX = SCHEDULE_CONTENT_COLUMNS.index('podCd')
+
+
+def parse_schedule_datetime(value, timezone_name: str = DEFAULT_CONFIG["schedule_timezone"]) -> Optional[str]:
+    """将航线时间字符串（按timezone_name解释）转换为UTC时间字符串，无法解析时返回None"""
+    if not value:
+        return None
+    value = str(value).strip().replace('T', ' ')
+    for fmt in SCHEDULE_DATETIME_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(value, fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        return None
+    local_time = parsed.replace(tzinfo=ZoneInfo(timezone_name))
+    return local_time.astimezone(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_share_cabin_entries(route) -> List[Dict[str, Any]]:
+    """航线的共舱配置（按原顺序去重，字符串格式的船公司转换为{'carrierCd': ...}），与后台ShareCabinService.parse一致"""
+    entries = []
+    seen = set()
+    for cabin in route.get('shareCabins') or []:
+        if isinstance(cabin, dict):
+            carrier_cd = cabin.get('carrierCd')
+        elif isinstance(cabin, str):
+            carrier_cd, cabin = cabin, {'carrierCd': cabin}
+        else:
+            continue
+        if carrier_cd and carrier_cd not in seen:
+            seen.add(carrier_cd)
+            entries.append(cabin)
+    return entries
+
+
+def compute_carrier_set(route) -> Tuple[str, str]:
+    """计算航线的共舱船公司集合及其哈希，没有共舱信息时使用航线的船公司"""
+    carrier_codes = sorted({entry['carrierCd'] for entry in get_share_cabin_entries(route)})
+    if not carrier_codes and route.get('carriercd'):
+        carrier_codes = [route['carriercd']]
+    carrier_set = ','.join(carrier_codes)
+    return carrier_set, hashlib.sha256(carrier_set.encode('utf-8')).hexdigest()
+
+
+def build_share_cabin_rows(schedule_id, route) -> List[Tuple]:
+    """构建航线的共舱明细写入参数，顺序与INSERT_SHARE_CABIN_SQL一致"""
+    entries = get_share_cabin_entries(route)
+    if not entries and route.get('carriercd'):
+        entries = [{'carrierCd': route['carriercd']}]
+    
+    rows = []
+    for sort_order, entry in enumerate(entries):
+        price = entry.get('price')
+        try:
+            price = float(price) if price not in (None, '') else None
+        except (TypeError, ValueError):
+            price = None
+        available = entry.get('available')
+        remark = entry.get('remark')
+        rows.append((
+            schedule_id,
+            str(entry['carrierCd'])[:20],
+            sort_order,
+            price,
+            available if isinstance(available, bool) else None,
+            str(remark)[:255] if remark not in (None, '') else None,
+        ))
+    return rows
+
+
+INSERT_SHARE_CABIN_SQL = """
+    INSERT INTO vessel_schedule_share_cabin (
+        schedule_id, carrierCd, sort_order, price, available, remark
+    ) VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def write_share_cabins(cursor, routes, data_version, chunk_size=500) -> int:
+    """重建已写入航线的共舱明细：按航线组合加载航线ID，先删除旧明细再批量插入
+    
+    Returns:
+        int: 写入的明细条数
+    """
+    routes_by_pair = {}
+    for route in routes:
+        routes_by_pair.setdefault((route.get('polCd', ''), route.get('podCd', '')), []).append(route)
+    
+    schedule_ids = []
+    rows = []
+    for (pol_cd, pod_cd), pair_routes in routes_by_pair.items():
+        cursor.execute("""
+            SELECT id, vessel, voyage FROM vessel_schedule
+            WHERE polCd = %s AND podCd = %s AND data_version = %s
+        """, (pol_cd, pod_cd, data_version))
+        ids = {(vessel, voyage): row_id for row_id, vessel, voyage in cursor.fetchall()}
+        for route in pair_routes:
+            schedule_id = ids.get((route.get('vessel', ''), route.get('voyage', '')))
+            if schedule_id is None:
+                continue
+            schedule_ids.append(schedule_id)
+            rows.extend(build_share_cabin_rows(schedule_id, route))
+    
+    for start in range(0, len(schedule_ids), chunk_size):
+        cursor.execute(
+            "DELETE FROM vessel_schedule_share_cabin WHERE schedule_id IN %s",
+            (tuple(schedule_ids[start:start + chunk_size]),)
+        )
+    for start in range(0, len(rows), chunk_size):
+        cursor.executemany(INSERT_SHARE_CABIN_SQL, rows[start:start + chunk_size])
+    return len(rows)
+
+
+# 沿用上一版本的航线：共舱明细同样在库内从上一版本对应的记录复制，与复制的shareCabins、carrier_set保持一致
+# 按 (polCd, podCd, vessel, voyage) 关联上一版本记录与新版本记录；先删除新版本记录已有的明细（同一版本重复写入时）
+DELETE_CARRIED_SHARE_CABIN_SQL = """
+    DELETE sc FROM vessel_schedule_share_cabin sc
+    JOIN vessel_schedule cur ON cur.id = sc.schedule_id
+    JOIN vessel_schedule prev ON prev.polCd = cur.polCd AND prev.podCd = cur.podCd
+        AND prev.vessel = cur.vessel AND prev.voyage = cur.voyage
+    WHERE prev.id IN %s AND cur.data_version = %s
+"""
+
+COPY_SHARE_CABIN_SQL = """
+    INSERT INTO vessel_schedule_share_cabin (
+        schedule_id, carrierCd, sort_order, price, available, remark
+    )
+    SELECT cur.id, sc.carrierCd, sc.sort_order, sc.price, sc.available, sc.remark
+    FROM vessel_schedule prev
+    JOIN vessel_schedule cur ON cur.polCd = prev.polCd AND cur.podCd = prev.podCd
+        AND cur.vessel = prev.vessel AND cur.voyage = prev.voyage AND cur.data_version = %s
+    JOIN vessel_schedule_share_cabin sc ON sc.schedule_id = prev.id
+    WHERE prev.id IN %s
+"""
+
+
+def copy_share_cabins(cursor, previous_ids, data_version, chunk_size=500) -> int:
+    """将沿用上一版本的航线的共舱明细从上一版本记录复制到新版本记录
+    
+    Args:
+        previous_ids: 被沿用的上一版本航线ID
+        
+    Returns:
+        int: 复制的明细条数
+    """
+    copied = 0
+    for start in range(0, len(previous_ids), chunk_size):
+        chunk = tuple(previous_ids[start:start + chunk_size])
+        cursor.execute(DELETE_CARRIED_SHARE_CABIN_SQL, (chunk, data_version))
+        copied += cursor.execute(COPY_SHARE_CABIN_SQL, (data_version, chunk))
+    return copied
+
+
+def compute_route_hash(content):
+    """计算航线内容哈希（不含抓取时间、版本号等每次都会变化的字段）"""
+    serialized = json.dumps(list(content), ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def split_changed_rows(rows, previous_hashes):
+    """按内容哈希区分需要完整写入的航线和可沿用上一版本的航线
+    
+    Args:
+        rows: build_schedule_params生成的写入参数
+        previous_hashes: 上一版本的航线哈希 {(vessel, voyage): (id, content_hash)}
+        
+    Returns:
+        tuple: (需要完整写入的参数列表, 可沿用的上一版本记录ID列表)
+    """
+    changed_rows = []
+    carried_ids = []
+    for params in rows:
+        previous = previous_hashes.get((params[PARAM_VESSEL_INDEX], params[PARAM_VOYAGE_INDEX]))
+        if previous and previous[1] and previous[1] == params[-1]:
+            carried_ids.append(previous[0])
+        else:
+            changed_rows.append(params)
+    return changed_rows, carried_ids
+
+def build_schedule_params(route, fetch_timestamp, fetch_date, data_version,
+                          timezone_name: str = DEFAULT_CONFIG["schedule_timezone"]):
+    """构建单条航线的写入参数，顺序与UPSERT_SCHEDULE_SQL一致（内容哈希在最后）"""
+    # 准备数据
+    shareCabins_json = json.dumps(route.get('shareCabins', []), ensure_ascii=False)
+
+    content = (
+        route.get('routeCd', ''),
+        route.get('routeEtd', ''),
+        route.get('carriercd', ''),
+        route.get('isReferenceCarrier', ''),
+        route.get('imo', ''),
+        route.get('vessel', ''),
+        route.get('voyage', ''),
+        route.get('shipAgency', ''),
+        route.get('polCd', ''),
+        route.get('pol', ''),
+        route.get('polTerminal', ''),
+        route.get('polTerminalCd', ''),
+        route.get('podCd', ''),
+        route.get('pod', ''),
+        route.get('podTerminal', ''),
+        route.get('podTerminalCd', ''),
+        route.get('eta', ''),
+        route.get('etd', ''),
+        route.get('totalDuration', ''),
+        route.get('isTransit', ''),
+        route.get('transitPortEn', ''),
+        route.get('transitPortCd', ''),
+        route.get('vesselAfterTransit', ''),
+        route.get('voyageAfterTransit', ''),
+        route.get('secondTransitPortEn', ''),
+        route.get('secondTransitPortCd', ''),
+        route.get('secondVesselAfterTransit', ''),
+        route.get('secondVoyageAfterTransit', ''),
+        route.get('bookingCutoff', ''),
+        route.get('cyOpen', ''),
+        route.get('cyClose', ''),
+        route.get('customCutoff', ''),
+        route.get('cutOff', ''),
+        route.get('siCutoff', ''),
+        route.get('vgmCutoff', ''),
+        shareCabins_json,
+    )
+    datetimes = tuple(
+        parse_schedule_datetime(route.get(source), timezone_name)
+        for source, _ in SCHEDULE_DATETIME_COLUMNS
+    )
+    return content + (
+        fetch_timestamp,
+        fetch_date,
+        data_version,
+        1,  # status 默认为1（有效）
+    ) + datetimes + compute_carrier_set(route) + (
+        compute_route_hash(content),
+    )
+
+def save_to_database(selected_routes, config, data_version=None, publish=True):
+    """将筛选出的数据保存到数据库
+    
+    Args:
+        selected_routes: 筛选后的航线数据
+        config: 配置
+        data_version: 数据版本号，None表示使用最新版本号加1
+        publish: 是否在写入后立即发布该版本；暂存模式下传False，
+                 由调用方在全部写入完成后通过publish_staged_version统一发布
+        
+    Returns:
+        int: 成功写入的条数
+    """
     if not selected_routes:
         print("没有筛选出数据，不写入数据库")
-        return
+        return 0
     
     print(f"===DEBUG=== 开始存储 {len(selected_routes)} 条数据到数据库")
     print(f"===DEBUG=== 数据库配置: host={config.get('db_host')}, db={config.get('db_name')}")
@@ -359,108 +1086,11 @@ def save_to_database(selected_routes, config, data_version=None):
         for i, route in enumerate(selected_routes):
             try:
                 # 准备SQL语句
-                sql = """
-                INSERT INTO vessel_schedule (
-                    routeCd, routeEtd, carriercd, isReferenceCarrier, imo, vessel, voyage, shipAgency,
-                    polCd, pol, polTerminal, polTerminalCd, podCd, pod, podTerminal, podTerminalCd,
-                    eta, etd, totalDuration, isTransit, transitPortEn, transitPortCd,
-                    vesselAfterTransit, voyageAfterTransit, secondTransitPortEn, secondTransitPortCd,
-                    secondVesselAfterTransit, secondVoyageAfterTransit, bookingCutoff,
-                    cyOpen, cyClose, customCutoff, cutOff, siCutoff, vgmCutoff,
-                    shareCabins, fetch_timestamp, fetch_date, data_version, status
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s,
-                    %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s
-                )
-                ON DUPLICATE KEY UPDATE
-                    routeCd = VALUES(routeCd),
-                    routeEtd = VALUES(routeEtd),
-                    carriercd = VALUES(carriercd),
-                    isReferenceCarrier = VALUES(isReferenceCarrier),
-                    imo = VALUES(imo),
-                    shipAgency = VALUES(shipAgency),
-                    pol = VALUES(pol),
-                    polTerminal = VALUES(polTerminal),
-                    polTerminalCd = VALUES(polTerminalCd),
-                    pod = VALUES(pod),
-                    podTerminal = VALUES(podTerminal),
-                    podTerminalCd = VALUES(podTerminalCd),
-                    eta = VALUES(eta),
-                    etd = VALUES(etd),
-                    totalDuration = VALUES(totalDuration),
-                    isTransit = VALUES(isTransit),
-                    transitPortEn = VALUES(transitPortEn),
-                    transitPortCd = VALUES(transitPortCd),
-                    vesselAfterTransit = VALUES(vesselAfterTransit),
-                    voyageAfterTransit = VALUES(voyageAfterTransit),
-                    secondTransitPortEn = VALUES(secondTransitPortEn),
-                    secondTransitPortCd = VALUES(secondTransitPortCd),
-                    secondVesselAfterTransit = VALUES(secondVesselAfterTransit),
-                    secondVoyageAfterTransit = VALUES(secondVoyageAfterTransit),
-                    bookingCutoff = VALUES(bookingCutoff),
-                    cyOpen = VALUES(cyOpen),
-                    cyClose = VALUES(cyClose),
-                    customCutoff = VALUES(customCutoff),
-                    cutOff = VALUES(cutOff),
-                    siCutoff = VALUES(siCutoff),
-                    vgmCutoff = VALUES(vgmCutoff),
-                    shareCabins = VALUES(shareCabins),
-                    fetch_timestamp = VALUES(fetch_timestamp),
-                    fetch_date = VALUES(fetch_date),
-                    data_version = VALUES(data_version),
-                    status = VALUES(status)
-                """
-                
-                # 准备数据
-                shareCabins_json = json.dumps(route.get('shareCabins', []), ensure_ascii=False)
+                sql = UPSERT_SCHEDULE_SQL
                 
-                # 参数值
-                params = (
-                    route.get('routeCd', ''),
-                    route.get('routeEtd', ''),
-                    route.get('carriercd', ''),
-                    route.get('isReferenceCarrier', ''),
-                    route.get('imo', ''),
-                    route.get('vessel', ''),
-                    route.get('voyage', ''),
-                    route.get('shipAgency', ''),
-                    route.get('polCd', ''),
-                    route.get('pol', ''),
-                    route.get('polTerminal', ''),
-                    route.get('polTerminalCd', ''),
-                    route.get('podCd', ''),
-                    route.get('pod', ''),
-                    route.get('podTerminal', ''),
-                    route.get('podTerminalCd', ''),
-                    route.get('eta', ''),
-                    route.get('etd', ''),
-                    route.get('totalDuration', ''),
-                    route.get('isTransit', ''),
-                    route.get('transitPortEn', ''),
-                    route.get('transitPortCd', ''),
-                    route.get('vesselAfterTransit', ''),
-                    route.get('voyageAfterTransit', ''),
-                    route.get('secondTransitPortEn', ''),
-                    route.get('secondTransitPortCd', ''),
-                    route.get('secondVesselAfterTransit', ''),
-                    route.get('secondVoyageAfterTransit', ''),
-                    route.get('bookingCutoff', ''),
-                    route.get('cyOpen', ''),
-                    route.get('cyClose', ''),
-                    route.get('customCutoff', ''),
-                    route.get('cutOff', ''),
-                    route.get('siCutoff', ''),
-                    route.get('vgmCutoff', ''),
-                    shareCabins_json,
-                    current_timestamp,
-                    current_datetime,
-                    new_data_version,
-                    1  # status 默认为1（有效）
+                params = build_schedule_params(
+                    route, current_timestamp, current_datetime, new_data_version,
+                    config.get('schedule_timezone', DEFAULT_CONFIG['schedule_timezone'])
                 )
                 
                 # 执行SQL
@@ -475,6 +1105,20 @@ def save_to_database(selected_routes, config, data_version=None):
                 # 继续处理下一条，不中断整个过程
                 continue
         
+        # 重建共舱明细（失败不影响航线数据）
+        if success_count > 0:
+            try:
+                write_share_cabins(cursor, selected_routes, new_data_version)
+            except pymysql.MySQLError as share_cabin_error:
+                print(f"写入共舱明细失败: {share_cabin_error}")
+        
+        # 与数据写入在同一事务中更新版本登记，提交后接口即可读取新版本
+        if publish and success_count > 0:
+            publish_data_version(
+                cursor, new_data_version,
+                {(route.get('polCd', ''), route.get('podCd', '')) for route in selected_routes}
+            )
+        
         # 提交事务
         print("===DEBUG=== 正在提交事务...")
         conn.commit()
@@ -484,6 +1128,7 @@ def save_to_database(selected_routes, config, data_version=None):
         cursor.close()
         conn.close()
         print("===DEBUG=== 数据库连接已关闭")
+        return success_count
         
     except Exception as e:
         print(f"数据库操作出错: {e}")
@@ -492,6 +1137,210 @@ def save_to_database(selected_routes, config, data_version=None):
         if 'conn' in locals() and conn:
             conn.close()
             print("===DEBUG=== 异常情况下数据库连接已关闭")
+        return 0
+
+class BulkScheduleWriter:
+    """批量航线写入器
+    
+    整个抓取过程复用一个数据库连接，建库建表只在连接时执行一次；
+    航线按chunk_size分批通过executemany写入（pymysql会改写为多行VALUES的单条INSERT），
+    某批写入失败时退回逐条写入以定位出错的记录。
+    
+    增量模式（incremental=True）下，按内容哈希与该航线已发布版本比较，只传输新增或变化的航线，
+    内容未变化的航线在数据库内直接从上一版本复制到新版本。复制仍为新版本写入完整的记录，
+    减少的是传输和解析，不减少行数和索引写入（读取方都按data_version精确匹配，没有按引用沿用）。
+    
+    用法：
+        with BulkScheduleWriter(config, chunk_size=500) as writer:
+            writer.write(routes, data_version)
+        print(writer.rows_per_second)
+    """
+    
+    def __init__(self, config: Dict[str, str], chunk_size: int = 500, incremental: bool = True):
+        self.config = config
+        self.chunk_size = max(1, int(chunk_size))
+        self.incremental = incremental
+        self.conn = None
+        self.rows_written = 0
+        self.rows_carried = 0
+        self.rows_failed = 0
+        self.share_cabin_rows = 0
+        # 各航线组合成功写入（含沿用上一版本）的条数 {(polCd, podCd): count}，用于发布前校验
+        self.route_counts = {}
+        self.elapsed_seconds = 0.0
+    
+    def __enter__(self):
+        self.connect()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+    
+    def connect(self):
+        """建立连接（仅首次执行建库建表检查）"""
+        if self.conn is None:
+            self.conn = setup_database(self.config)
+        return self.conn
+    
+    def close(self):
+        """关闭连接"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+    
+    @property
+    def rows_per_second(self) -> float:
+        """累计写入速度（条/秒）"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.rows_written / self.elapsed_seconds
+    
+    def write(self, routes: List[Dict[str, Any]], data_version: int) -> int:
+        """批量写入航线并提交事务
+        
+        Args:
+            routes: 航线数据
+            data_version: 数据版本号
+            
+        Returns:
+            int: 成功写入的条数
+        """
+        if not routes:
+            return 0
+        
+        conn = self.connect()
+        started_at = time.monotonic()
+        fetch_timestamp = int(datetime.datetime.now().timestamp())
+        fetch_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timezone_name = self.config.get('schedule_timezone', DEFAULT_CONFIG['schedule_timezone'])
+        rows = [
+            build_schedule_params(route, fetch_timestamp, fetch_date, data_version, timezone_name)
+            for route in routes
+        ]
+        
+        route_by_params = {id(params): route for params, route in zip(rows, routes)}
+        written_rows = []
+        carried_rows = []
+        carried_ids = []
+        with conn.cursor() as cursor:
+            changed_rows = rows
+            if self.incremental:
+                changed_rows, carried_ids = self._split_by_previous_version(cursor, rows, data_version)
+                carried = self._carry_forward(cursor, carried_ids, fetch_timestamp, fetch_date, data_version)
+                if carried < len(carried_ids):
+                    # 复制失败的航线改为完整写入
+                    changed_rows = rows
+                    carried_ids = []
+                else:
+                    changed_keys = {id(params) for params in changed_rows}
+                    carried_rows = [params for params in rows if id(params) not in changed_keys]
+            
+            for start in range(0, len(changed_rows), self.chunk_size):
+                chunk = changed_rows[start:start + self.chunk_size]
+                try:
+                    cursor.executemany(UPSERT_SCHEDULE_SQL, chunk)
+                    written_rows.extend(chunk)
+                except pymysql.MySQLError as chunk_error:
+                    print(f"批量写入第 {start + 1}-{start + len(chunk)} 条失败: {chunk_error}，改为逐条写入")
+                    written_rows.extend(self._write_rows_individually(cursor, chunk))
+            
+            # 完整写入的航线按抓取数据重建共舱明细，沿用的航线从上一版本复制（失败不影响航线数据）
+            try:
+                self.share_cabin_rows += write_share_cabins(
+                    cursor, [route_by_params[id(params)] for params in written_rows], data_version, self.chunk_size
+                )
+                self.share_cabin_rows += copy_share_cabins(cursor, carried_ids, data_version, self.chunk_size)
+            except pymysql.MySQLError as share_cabin_error:
+                print(f"写入共舱明细失败: {share_cabin_error}")
+        conn.commit()
+        
+        written = len(written_rows)
+        carried = len(carried_rows)
+        for params in written_rows + carried_rows:
+            route_key = (params[PARAM_POL_INDEX], params[PARAM_POD_INDEX])
+            self.route_counts[route_key] = self.route_counts.get(route_key, 0) + 1
+        self.rows_written += written + carried
+        self.rows_carried += carried
+        self.rows_failed += len(rows) - written - carried
+        self.elapsed_seconds += time.monotonic() - started_at
+        return written + carried
+    
+    def _split_by_previous_version(self, cursor, rows, data_version):
+        """一次加载本批全部航线组合已发布版本的内容哈希，区分变化和未变化的航线"""
+        rows_by_route = {}
+        for params in rows:
+            route_key = (params[PARAM_POL_INDEX], params[PARAM_POD_INDEX])
+            rows_by_route.setdefault(route_key, []).append(params)
+        
+        previous_hashes = self._load_previous_hashes(cursor, rows_by_route, data_version)
+        changed_rows = []
+        carried_ids = []
+        for route_key, route_rows in rows_by_route.items():
+            route_changed, route_carried = split_changed_rows(route_rows, previous_hashes.get(route_key, {}))
+            changed_rows.extend(route_changed)
+            carried_ids.extend(route_carried)
+        return changed_rows, carried_ids
+    
+    def _load_previous_hashes(self, cursor, route_keys, data_version):
+        """加载一批航线组合已发布版本的航线哈希 {(polCd, podCd): {(vessel, voyage): (id, content_hash)}}
+        
+        一次查询版本登记（航线版本优先，未登记时使用全局版本），一次按 (polCd, podCd, data_version) 读取哈希
+        """
+        route_keys = list(route_keys)
+        if not route_keys:
+            return {}
+        
+        cursor.execute("""
+            SELECT polCd, podCd, data_version FROM data_version_registry
+            WHERE (polCd, podCd) IN %s OR (polCd = '' AND podCd = '')
+        """, (tuple(route_keys),))
+        pointers = {(pol_cd, pod_cd): version for pol_cd, pod_cd, version in cursor.fetchall()}
+        global_version = pointers.get(('', ''))
+        
+        previous_versions = []
+        for pol_cd, pod_cd in route_keys:
+            version = pointers.get((pol_cd, pod_cd), global_version)
+            if version is not None and version != data_version:
+                previous_versions.append((pol_cd, pod_cd, version))
+        if not previous_versions:
+            return {}
+        
+        cursor.execute("""
+            SELECT polCd, podCd, id, vessel, voyage, content_hash FROM vessel_schedule
+            WHERE (polCd, podCd, data_version) IN %s
+        """, (tuple(previous_versions),))
+        previous_hashes = {}
+        for pol_cd, pod_cd, row_id, vessel, voyage, content_hash in cursor.fetchall():
+            previous_hashes.setdefault((pol_cd, pod_cd), {})[(vessel, voyage)] = (row_id, content_hash)
+        return previous_hashes
+    
+    def _carry_forward(self, cursor, carried_ids, fetch_timestamp, fetch_date, data_version) -> int:
+        """将内容未变化的航线从上一版本复制到新版本，返回复制的条数"""
+        carried = 0
+        for start in range(0, len(carried_ids), self.chunk_size):
+            chunk = carried_ids[start:start + self.chunk_size]
+            try:
+                cursor.execute(
+                    CARRY_FORWARD_SCHEDULE_SQL,
+                    (fetch_timestamp, fetch_date, data_version, tuple(chunk))
+                )
+                carried += len(chunk)
+            except pymysql.MySQLError as carry_error:
+                print(f"沿用上一版本航线失败: {carry_error}，改为完整写入")
+                return carried
+        return carried
+    
+    def _write_rows_individually(self, cursor, rows) -> List[Tuple]:
+        """逐条写入，跳过出错的记录，返回写入成功的参数"""
+        written = []
+        for params in rows:
+            try:
+                cursor.execute(UPSERT_SCHEDULE_SQL, params)
+                written.append(params)
+            except pymysql.MySQLError as row_error:
+                print(f"写入航线 {params[PARAM_VESSEL_INDEX]} {params[PARAM_VOYAGE_INDEX]} 出错: {row_error}")
+        return written
 
 def save_config(config: Dict[str, str], config_file: str = "config.json") -> None:
     """保存配置到文件"""
@@ -526,6 +1375,14 @@ def parse_args():
     parser.add_argument('--pod_filter_name', help='目的港名称过滤条件')
     parser.add_argument('--config_file', default='config.json', help='配置文件路径 (默认: config.json, Docker环境可用: config.docker.json)')
     parser.add_argument('--env', choices=['local', 'docker', 'container'], help='运行环境 (local=本地, docker=Docker外部, container=容器内部)')
+    parser.add_argument('--stage_only', action='store_true', help='仅暂存本次数据版本，不发布')
+    parser.add_argument('--concurrency', type=int, help='并发请求数（默认4）')
+    parser.add_argument('--rate_limit', type=float, help='每秒最多请求数，0表示不限速（默认2）')
+    parser.add_argument('--schedule_api_url', help='航线API地址，可指向本地stub_server.py')
+    parser.add_argument('--record_dir', help='保存每个组合的API原始响应到该目录，供stub_server.py回放')
+    parser.add_argument('--db_chunk_size', type=int, help='批量写入数据库时每批的条数（默认500）')
+    parser.add_argument('--full_write', action='store_true', help='关闭库内复制，所有航线都由抓取程序完整写入新版本')
+    parser.add_argument('--publish_version', type=int, help='校验并发布已暂存的数据版本后退出')
     return parser.parse_args()
 
 def main():
@@ -555,6 +1412,11 @@ def main():
     if args.save_config:
         save_config(config)
     
+    # 发布已暂存的数据版本
+    if args.publish_version:
+        publish_existing_version(config, args.publish_version)
+        return
+    
     # 判断是否使用API获取港口数据
     if args.use_port_api:
         # 获取起运港和目的港数据
@@ -601,58 +1463,85 @@ def main():
         else:
             new_data_version = 0
         
-        # 对每对起运港和目的港进行查询
-        for pol in pol_ports:
-            for pod in pod_ports:
-                processed_count += 1
-                pol_cd = pol["code"]
-                pod_cd = pod["code"]
-                
-                print(f"正在处理组合 [{processed_count}/{total_combinations}]: 起运港 {pol_cd} ({pol.get('name_zh', '')}) -> 目的港 {pod_cd} ({pod.get('name_zh', '')})")
+        # 所有港口组合
+        pairs = [(pol["code"], pod["code"]) for pol in pol_ports for pod in pod_ports]
+        pol_names = {pol["code"]: pol.get('name_zh', '') for pol in pol_ports}
+        pod_names = {pod["code"]: pod.get('name_zh', '') for pod in pod_ports}
+        
+        # 获取数据：测试数据直接复用，否则通过线程池并发请求（共享会话 + 令牌桶限速）
+        if args.use_test_data and os.path.exists('test.json'):
+            with open('test.json', 'r') as file:
+                test_data = json.load(file)
+            print("使用测试数据")
+            fetch_results = ((pol_cd, pod_cd, test_data) for pol_cd, pod_cd in pairs)
+        else:
+            if args.use_test_data:
+                print("测试数据文件test.json不存在，改用API请求")
+            concurrency = int(config.get("concurrency", 4))
+            rate_limiter = TokenBucket(
+                float(config.get("rate_limit", 2)), float(config.get("rate_burst", 2))
+            )
+            print(f"并发抓取：并发数 {concurrency}，限速 {rate_limiter.rate}/秒")
+            fetch_results = fetch_schedules_concurrently(
+                pairs, config, concurrency=concurrency, rate_limiter=rate_limiter
+            )
+        
+        data = {}
+        crawl_started_at = time.monotonic()
+        
+        # 整个抓取过程复用一个连接批量写入
+        writer = None
+        if not args.skip_db:
+            writer = BulkScheduleWriter(
+                config,
+                chunk_size=int(config.get("db_chunk_size", 500)),
+                incremental=not args.full_write
+            )
+        
+        # 在主线程中按完成顺序处理每个组合并写库
+        for pol_cd, pod_cd, data in fetch_results:
+            processed_count += 1
+            
+            print(f"正在处理组合 [{processed_count}/{total_combinations}]: 起运港 {pol_cd} ({pol_names.get(pol_cd, '')}) -> 目的港 {pod_cd} ({pod_names.get(pod_cd, '')})")
+            
+            if args.record_dir:
+                save_recorded_response(data, args.record_dir, pol_cd, pod_cd)
+            
+            # 处理数据
+            selected_routes = process_routes(data, pod_cd)
+            
+            # 添加到总结果列表
+            if selected_routes:
+                all_selected_routes.extend(selected_routes)
                 
-                # 更新当前配置
-                current_config = config.copy()
-                current_config["pol_cd"] = pol_cd
-                current_config["pod_cd"] = pod_cd
+                # 打印结果
+                print(f"该组合选择了 {len(selected_routes)} 条航线")
                 
-                # 获取数据
-                if args.use_test_data:
+                # 立即保存到数据库
+                if not args.skip_db:
                     try:
-                        with open('test.json', 'r') as file:
-                            data = json.load(file)
-                        print("使用测试数据")
-                    except FileNotFoundError:
-                        print("测试数据文件test.json不存在，改用API请求")
-                        data = fetch_vessel_schedule(current_config)
-                else:
-                    # 从API获取数据
-                    data = fetch_vessel_schedule(current_config)
-                
-                # 处理数据
-                selected_routes = process_routes(data, pod_cd)
-                
-                # 添加到总结果列表
-                if selected_routes:
-                    all_selected_routes.extend(selected_routes)
-                    
-                    # 打印结果
-                    print(f"该组合选择了 {len(selected_routes)} 条航线")
-                    
-                    # 立即保存到数据库
-                    if not args.skip_db:
-                        try:
-                            print(f"正在将该组合的 {len(selected_routes)} 条航线保存到数据库...")
-                            save_to_database(selected_routes, config, new_data_version)
-                            print("该组合数据已保存到数据库")
-                        except Exception as e:
-                            print(f"保存该组合数据失败: {e}")
-                else:
-                    print("该组合未找到符合条件的航线")
-                
-                # 避免API请求过于频繁
-                if processed_count < total_combinations:
-                    print("休息1秒后继续...")
-                    time.sleep(1)
+                        print(f"正在将该组合的 {len(selected_routes)} 条航线保存到数据库...")
+                        saved_count = writer.write(selected_routes, new_data_version)
+                        print(f"该组合 {saved_count} 条数据已暂存到数据库（待发布）")
+                    except Exception as e:
+                        print(f"保存该组合数据失败: {e}")
+            else:
+                print("该组合未找到符合条件的航线")
+        
+        print(f"抓取完成：{processed_count} 个组合，耗时 {time.monotonic() - crawl_started_at:.1f} 秒")
+        
+        # 全部组合写入完成后，一次性发布本次数据版本；暂存条数只统计成功写入的航线
+        if writer is not None:
+            staged_routes = writer.route_counts
+            print(f"数据库写入：成功 {writer.rows_written} 条（其中沿用上一版本 {writer.rows_carried} 条），"
+                  f"失败 {writer.rows_failed} 条，写入速度 {writer.rows_per_second:.0f} 条/秒")
+            try:
+                if args.stage_only:
+                    print(f"仅暂存模式：数据版本 {new_data_version} 未发布，可使用 --publish_version {new_data_version} 发布")
+                elif publish_staged_version(config, new_data_version, staged_routes, conn=writer.conn):
+                    print(f"数据版本 {new_data_version} 已发布，共 {len(staged_routes)} 个航线组合")
+            finally:
+                writer.close()
         
         # 保存最后一次请求的数据（调试用）
         save_data(data)
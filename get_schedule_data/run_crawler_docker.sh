@@ -81,6 +81,7 @@ show_help() {
     echo "  --pol CODE       指定起运港代码"
     echo "  --pod CODE       指定目的港代码"
     echo "  --check          仅检查环境，不运行爬虫"
+    echo "  --skip-compact   爬虫完成后不归档历史版本"
     echo "  --help           显示此帮助信息"
     echo ""
     echo "示例:"
@@ -101,6 +102,7 @@ main() {
     POL_CODE=""
     POD_CODE=""
     CHECK_ONLY=false
+    SKIP_COMPACT=false
     
     while [[ $# -gt 0 ]]; do
         case $1 in
@@ -124,6 +126,10 @@ main() {
                 CHECK_ONLY=true
                 shift
                 ;;
+            --skip-compact)
+                SKIP_COMPACT=true
+                shift
+                ;;
             --help)
                 show_help
                 exit 0
@@ -193,6 +199,16 @@ print(f'   当前版本: {version}')
 print(f'   船舶数量: {vessels}')
 conn.close()
 "
+        
+        # 归档超出保留范围的历史版本
+        if [ "$SKIP_COMPACT" = true ]; then
+            log_info "跳过历史版本归档"
+        elif docker ps | grep -q "ship_schedule_web"; then
+            log_info "🗂️  归档历史版本..."
+            docker exec ship_schedule_web python manage.py compact_schedule_versions || log_warn "历史版本归档失败"
+        else
+            log_warn "Web容器未运行，跳过历史版本归档"
+        fi
     else
         log_error "❌ 爬虫运行失败"
         exit 1
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地航线API模拟服务器
+回放录制的trackingeyes航线接口响应，用于在不访问真实接口的情况下测试并发抓取
+
+录制：python process_routes.py --use_port_api --skip_db --record_dir recordings
+回放：python stub_server.py --recordings recordings --port 8089
+抓取：python process_routes.py --use_port_api --skip_db --schedule_api_url http://127.0.0.1:8089/api/schedule/vesselSchedule
+
+recordings目录中的文件名为 {polCd}_{podCd}.json；找不到对应文件时使用 default.json，
+仍不存在则返回空结果
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    """模拟服务器的配置与请求统计（线程安全）"""
+
+    def __init__(self, recordings_dir=None, latency=0.0, fail_rate=0.0, quota=0.0):
+        self.recordings_dir = recordings_dir
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.quota = quota
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.failed_count = 0
+        self.throttled_count = 0
+        self.request_times = []
+
+    def load_response(self, pol_cd, pod_cd):
+        """读取录制的响应"""
+        if self.recordings_dir:
+            for name in (f"{pol_cd}_{pod_cd}.json", "default.json"):
+                path = os.path.join(self.recordings_dir, name)
+                if os.path.exists(path):
+                    with open(path, 'r') as f:
+                        return json.load(f)
+        return {"code": 200, "message": "Success", "result": []}
+
+    def record_request(self):
+        """记录一次请求，返回是否超出每秒配额"""
+        now = time.monotonic()
+        with self.lock:
+            self.request_count += 1
+            self.request_times.append(now)
+            if self.quota <= 0:
+                return False
+            recent = [t for t in self.request_times if now - t < 1.0]
+            self.request_times = recent
+            if len(recent) > self.quota:
+                self.throttled_count += 1
+                return True
+            return False
+
+
+def create_handler(state):
+    """创建绑定到指定状态的请求处理类"""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 支持keep-alive
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                body = {}
+
+            if state.record_request():
+                self._send(429, {"code": 429, "message": "Too Many Requests", "result": []})
+                return
+
+            if state.latency:
+                time.sleep(state.latency)
+
+            if state.fail_rate and random.random() < state.fail_rate:
+                with state.lock:
+                    state.failed_count += 1
+                self._send(500, {"code": 500, "message": "stub injected failure", "result": []})
+                return
+
+            data = state.load_response(body.get("polCd"), body.get("podCd"))
+            self._send(200, data)
+
+        def _send(self, status_code, data):
+            payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(host='127.0.0.1', port=0, **kwargs):
+    """在后台线程启动模拟服务器，返回(server, state)；port=0时自动分配端口"""
+    state = StubState(**kwargs)
+    server = ThreadingHTTPServer((host, port), create_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, state
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='航线API模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8089, help='监听端口')
+    parser.add_argument('--recordings', help='录制响应所在目录')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的模拟延迟（秒）')
+    parser.add_argument('--fail_rate', type=float, default=0.0, help='随机返回500的比例（0-1）')
+    parser.add_argument('--quota', type=float, default=0.0, help='每秒允许的请求数，超出返回429，0表示不限制')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server, state = start_stub_server(
+        host=args.host, port=args.port, recordings_dir=args.recordings,
+        latency=args.latency, fail_rate=args.fail_rate, quota=args.quota
+    )
+    print(f"模拟服务器已启动: http://{args.host}:{server.server_address[1]}/api/schedule/vesselSchedule")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n共收到 {state.request_count} 个请求，注入失败 {state.failed_count} 个，限流 {state.throttled_count} 个")
+        server.shutdown()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发抓取测试：使用本地模拟服务器验证并发数、限速和重试
+运行：python -m unittest test_concurrent_fetch
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from process_routes import (
+    DEFAULT_CONFIG, TokenBucket, compute_backoff, fetch_schedules_concurrently
+)
+from stub_server import start_stub_server
+
+
+def create_recorded_response(pol_cd, pod_cd):
+    """生成录制格式的航线响应"""
+    return {
+        "code": 200,
+        "message": "Success",
+        "result": [{
+            "vessel": f"VESSEL-{pol_cd}",
+            "voyage": f"V001-{pod_cd}",
+            "polCd": pol_cd,
+            "podCd": pod_cd,
+            "isReferenceCarrier": "1",
+            "shareCabins": [{"carrierCd": "MSK"}]
+        }]
+    }
+
+
+class ConcurrentFetchTest(unittest.TestCase):
+    """并发抓取测试"""
+
+    def setUp(self):
+        self.recordings_dir = tempfile.mkdtemp()
+        self.pairs = [(f"CNP{i:02d}", f"USP{j:02d}") for i in range(4) for j in range(5)]
+        for pol_cd, pod_cd in self.pairs:
+            with open(os.path.join(self.recordings_dir, f"{pol_cd}_{pod_cd}.json"), 'w') as f:
+                json.dump(create_recorded_response(pol_cd, pod_cd), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.recordings_dir)
+
+    def _start_server(self, **kwargs):
+        server, state = start_stub_server(recordings_dir=self.recordings_dir, **kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        config = DEFAULT_CONFIG.copy()
+        config["schedule_api_url"] = f"http://127.0.0.1:{server.server_address[1]}/api/schedule/vesselSchedule"
+        return config, state
+
+    def test_fetches_all_pairs_concurrently(self):
+        """并发请求比串行更快，且每个组合都返回对应的录制数据"""
+        config, state = self._start_server(latency=0.1)
+
+        started_at = time.monotonic()
+        results = list(fetch_schedules_concurrently(self.pairs, config, concurrency=10))
+        elapsed = time.monotonic() - started_at
+
+        self.assertEqual(len(results), len(self.pairs))
+        for pol_cd, pod_cd, data in results:
+            self.assertEqual(data["code"], 200)
+            self.assertEqual(data["result"][0]["polCd"], pol_cd)
+            self.assertEqual(data["result"][0]["podCd"], pod_cd)
+        self.assertEqual(state.request_count, len(self.pairs))
+        # 20个组合每个0.1秒，串行至少2秒
+        self.assertLess(elapsed, 1.5)
+
+    def test_rate_limiter_respects_quota(self):
+        """令牌桶限速下不会触发服务端配额限制"""
+        config, state = self._start_server(quota=10)
+        rate_limiter = TokenBucket(rate=8, capacity=1)
+
+        results = list(fetch_schedules_concurrently(
+            self.pairs[:12], config, concurrency=6, rate_limiter=rate_limiter
+        ))
+
+        self.assertEqual(state.throttled_count, 0)
+        self.assertTrue(all(data["code"] == 200 for _, _, data in results))
+
+    def test_retries_injected_failures(self):
+        """服务端返回错误时按退避重试直到成功"""
+        config, state = self._start_server(fail_rate=0.3)
+        config["max_retries"] = 10
+
+        with mock.patch('process_routes.compute_backoff', return_value=0):
+            results = list(fetch_schedules_concurrently(self.pairs, config, concurrency=5))
+
+        self.assertTrue(all(data["code"] == 200 for _, _, data in results))
+        self.assertEqual(state.request_count, len(self.pairs) + state.failed_count)
+
+    def test_token_bucket_rate(self):
+        """令牌桶按设定速率发放令牌"""
+        bucket = TokenBucket(rate=20, capacity=1)
+
+        started_at = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        elapsed = time.monotonic() - started_at
+
+        # 首个令牌立即可用，其余10个需要约0.5秒
+        self.assertGreaterEqual(elapsed, 0.45)
+
+    def test_backoff_is_jittered_and_capped(self):
+        """退避时间带随机抖动且不超过上限"""
+        delays = {compute_backoff(3, base_delay=1.0, max_delay=5.0) for _ in range(20)}
+
+        self.assertGreater(len(delays), 1)
+        self.assertTrue(all(0 <= delay <= 5.0 for delay in delays))
+
+
+if __name__ == "__main__":
+    unittest.main()
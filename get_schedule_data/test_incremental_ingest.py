@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量写入测试：验证航线内容哈希、变化航线的识别和类型化时间字段
+运行：python -m unittest test_incremental_ingest
+"""
+import unittest
+from unittest import mock
+
+import pymysql
+
+from process_routes import (
+    SCHEDULE_CARRIER_SET_COLUMNS, SCHEDULE_DATETIME_COLUMNS, UPSERT_SCHEDULE_SQL, BulkScheduleWriter,
+    build_schedule_params, build_share_cabin_rows, compute_carrier_set, parse_schedule_datetime, split_changed_rows
+)
+
+
+def create_route(vessel, etd="2025-06-01"):
+    """生成航线数据"""
+    return {
+        "polCd": "CNSHA",
+        "podCd": "USNYC",
+        "vessel": vessel,
+        "voyage": "V001",
+        "etd": etd,
+        "shareCabins": [{"carrierCd": "MSK"}],
+    }
+
+
+class IncrementalIngestTest(unittest.TestCase):
+    """增量写入测试"""
+
+    def test_hash_ignores_fetch_time_and_version(self):
+        """抓取时间和版本号不影响内容哈希"""
+        first = build_schedule_params(create_route("VESSEL_1"), 1716825600, "2024-05-28 00:00:00", 1)
+        second = build_schedule_params(create_route("VESSEL_1"), 1716912000, "2024-05-29 00:00:00", 2)
+
+        self.assertEqual(first[-1], second[-1])
+        self.assertEqual(len(first[-1]), 64)
+
+    def test_hash_changes_with_content(self):
+        """航线内容变化时哈希不同"""
+        first = build_schedule_params(create_route("VESSEL_1"), 1716825600, "2024-05-28 00:00:00", 1)
+        changed = build_schedule_params(create_route("VESSEL_1", etd="2025-06-02"), 1716825600, "2024-05-28 00:00:00", 1)
+
+        self.assertNotEqual(first[-1], changed[-1])
+
+    def test_split_changed_rows(self):
+        """只有新增或变化的航线需要完整写入，未变化的沿用上一版本记录"""
+        previous = [
+            build_schedule_params(create_route(vessel), 1716825600, "2024-05-28 00:00:00", 1)
+            for vessel in ("VESSEL_1", "VESSEL_2")
+        ]
+        previous_hashes = {
+            ("VESSEL_1", "V001"): (11, previous[0][-1]),
+            ("VESSEL_2", "V001"): (12, previous[1][-1]),
+        }
+        rows = [
+            build_schedule_params(create_route("VESSEL_1"), 1716912000, "2024-05-29 00:00:00", 2),
+            build_schedule_params(create_route("VESSEL_2", etd="2025-06-03"), 1716912000, "2024-05-29 00:00:00", 2),
+            build_schedule_params(create_route("VESSEL_3"), 1716912000, "2024-05-29 00:00:00", 2),
+        ]
+
+        changed_rows, carried_ids = split_changed_rows(rows, previous_hashes)
+
+        self.assertEqual(carried_ids, [11])
+        self.assertEqual([params[5] for params in changed_rows], ["VESSEL_2", "VESSEL_3"])
+
+    def test_rows_without_previous_hash_are_rewritten(self):
+        """上一版本没有哈希（增量写入上线前的数据）时完整写入"""
+        rows = [build_schedule_params(create_route("VESSEL_1"), 1716912000, "2024-05-29 00:00:00", 2)]
+
+        changed_rows, carried_ids = split_changed_rows(rows, {("VESSEL_1", "V001"): (11, None)})
+
+        self.assertEqual(carried_ids, [])
+        self.assertEqual(len(changed_rows), 1)
+
+    def test_typed_datetimes_are_utc(self):
+        """类型化时间字段按配置时区解释并转换为UTC，无法解析时为None"""
+        self.assertEqual(parse_schedule_datetime("2025-06-01 08:30:00"), "2025-06-01 00:30:00")
+        self.assertEqual(parse_schedule_datetime("2025-06-01"), "2025-05-31 16:00:00")
+        self.assertEqual(parse_schedule_datetime("2025-06-01", "UTC"), "2025-06-01 00:00:00")
+        self.assertIsNone(parse_schedule_datetime("TBA"))
+        self.assertIsNone(parse_schedule_datetime(""))
+
+    def test_params_include_typed_datetimes(self):
+        """写入参数包含类型化时间字段和共舱船公司集合，数量与SQL占位符一致，哈希仍在最后"""
+        params = build_schedule_params(create_route("VESSEL_1"), 1716825600, "2024-05-28 00:00:00", 1)
+        etd_index = (
+            -1 - len(SCHEDULE_CARRIER_SET_COLUMNS) - len(SCHEDULE_DATETIME_COLUMNS)
+            + [column for column, _ in SCHEDULE_DATETIME_COLUMNS].index("etd")
+        )
+
+        self.assertEqual(len(params), UPSERT_SCHEDULE_SQL.count("%s"))
+        self.assertEqual(params[etd_index], "2025-05-31 16:00:00")
+        self.assertEqual(params[-3], "MSK")
+        self.assertEqual(len(params[-1]), 64)
+
+    def test_carrier_set(self):
+        """共舱船公司集合去重排序，没有共舱信息时使用航线的船公司"""
+        route = create_route("VESSEL_1")
+        route["shareCabins"] = [{"carrierCd": "MSK"}, {"carrierCd": "CMA"}, "MSK"]
+
+        carrier_set, carrier_set_hash = compute_carrier_set(route)
+
+        self.assertEqual(carrier_set, "CMA,MSK")
+        self.assertEqual(len(carrier_set_hash), 64)
+        self.assertEqual(compute_carrier_set({"carriercd": "ONE", "shareCabins": []})[0], "ONE")
+
+    def test_share_cabin_rows(self):
+        """共舱明细按shareCabins顺序生成，保留价格等配置字段"""
+        route = create_route("VESSEL_1")
+        route["shareCabins"] = [{"carrierCd": "MSK"}, {"carrierCd": "CMA", "price": "4200", "available": True}]
+
+        rows = build_share_cabin_rows(7, route)
+
+        self.assertEqual(rows, [(7, "MSK", 0, None, None, None), (7, "CMA", 1, 4200.0, True, None)])
+
+
+class BulkScheduleWriterTest(unittest.TestCase):
+    """批量写入器测试（模拟数据库连接）"""
+
+    def create_writer(self, cursor):
+        """创建使用模拟连接的写入器"""
+        writer = BulkScheduleWriter({}, chunk_size=10, incremental=False)
+        writer.conn = mock.MagicMock()
+        writer.conn.cursor.return_value.__enter__.return_value = cursor
+        return writer
+
+    def test_route_counts_only_include_saved_rows(self):
+        """批量写入失败后逐条写入，发布校验用的航线条数只统计写入成功的记录"""
+        cursor = mock.MagicMock()
+        cursor.executemany.side_effect = pymysql.MySQLError("batch failed")
+
+        def execute(sql, params=None):
+            if sql is UPSERT_SCHEDULE_SQL and params[5] == "VESSEL_2":
+                raise pymysql.MySQLError("row failed")
+
+        cursor.execute.side_effect = execute
+        cursor.fetchall.return_value = []
+        writer = self.create_writer(cursor)
+        routes = [create_route(vessel) for vessel in ("VESSEL_1", "VESSEL_2", "VESSEL_3")]
+
+        with mock.patch("process_routes.write_share_cabins", return_value=0), \
+                mock.patch("process_routes.copy_share_cabins", return_value=0):
+            saved = writer.write(routes, 2)
+
+        self.assertEqual(saved, 2)
+        self.assertEqual(writer.rows_failed, 1)
+        self.assertEqual(writer.route_counts, {("CNSHA", "USNYC"): 2})
+
+    def test_previous_hashes_loaded_once_per_batch(self):
+        """一批包含多个航线组合时，只查询一次版本登记和一次上一版本哈希"""
+        cursor = mock.MagicMock()
+        cursor.fetchall.side_effect = [
+            [("CNSHA", "USNYC", 5), ("", "", 6)],
+            [("CNSHA", "USNYC", 11, "VESSEL_1", "V001", "hash-1"), ("CNNGB", "USLAX", 21, "VESSEL_2", "V001", None)],
+        ]
+        writer = self.create_writer(cursor)
+
+        previous_hashes = writer._load_previous_hashes(cursor, [("CNSHA", "USNYC"), ("CNNGB", "USLAX")], 7)
+
+        self.assertEqual(cursor.execute.call_count, 2)
+        self.assertEqual(cursor.execute.call_args[0][1], ((("CNSHA", "USNYC", 5), ("CNNGB", "USLAX", 6)),))
+        self.assertEqual(previous_hashes, {
+            ("CNSHA", "USNYC"): {("VESSEL_1", "V001"): (11, "hash-1")},
+            ("CNNGB", "USLAX"): {("VESSEL_2", "V001"): (21, None)},
+        })
+
+    def test_share_cabins_copied_for_carried_routes(self):
+        """完整写入的航线按抓取数据重建共舱明细，沿用的航线从上一版本复制明细"""
+        unchanged = build_schedule_params(create_route("VESSEL_1"), 1716825600, "2024-05-28 00:00:00", 1)
+        cursor = mock.MagicMock()
+        cursor.fetchall.side_effect = [
+            [("CNSHA", "USNYC", 1)],
+            [("CNSHA", "USNYC", 11, "VESSEL_1", "V001", unchanged[-1]),
+             ("CNSHA", "USNYC", 12, "VESSEL_2", "V001", "old-hash")],
+        ]
+        writer = self.create_writer(cursor)
+        writer.incremental = True
+        routes = [create_route("VESSEL_1"), create_route("VESSEL_2", etd="2025-06-02")]
+
+        with mock.patch("process_routes.write_share_cabins", return_value=1) as write_share_cabins, \
+                mock.patch("process_routes.copy_share_cabins", return_value=1) as copy_share_cabins:
+            saved = writer.write(routes, 2)
+
+        self.assertEqual(saved, 2)
+        self.assertEqual(writer.rows_carried, 1)
+        self.assertEqual([route["vessel"] for route in write_share_cabins.call_args[0][1]], ["VESSEL_2"])
+        self.assertEqual(copy_share_cabins.call_args[0][1:3], ([11], 2))
+        self.assertEqual(writer.share_cabin_rows, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+JWT认证后端
+访问令牌携带精简的主体声明（用户ID、超级管理员标记、权限快照版本号），
+认证时从进程内的认证主体缓存解析用户，只在未命中时查询数据库
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .services import AuthPrincipalService, PermissionSnapshotService
+
+# 令牌中的超级管理员标记和签发时的权限快照版本号
+SUPERUSER_CLAIM = 'su'
+PERMISSION_VERSION_CLAIM = 'pv'
+
+
+class PrincipalRefreshToken(RefreshToken):
+    """
+    携带主体声明的刷新令牌
+    由它派生的访问令牌复制相同的声明；声明供前端直接读取，服务端仍以最新的权限快照为准
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        """为用户签发令牌"""
+        token = super().for_user(user)
+        token[SUPERUSER_CLAIM] = user.is_superuser
+        token[PERMISSION_VERSION_CLAIM] = PermissionSnapshotService.get_version(user.pk)
+        return token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    使用认证主体缓存的JWT认证
+    按 (用户ID, 当前权限快照版本号) 读取进程内缓存的用户和权限代码，命中时不查数据库；
+    用户被停用、删除或修改后版本号改变，缓存不再命中，回源数据库按simplejwt的规则重新校验。
+    缓存条目有最长保留时间，默认缓存不是各进程共享的后端时每次都回源（见AuthPrincipalService）。
+    刷新令牌的吊销仍由token_blacklist处理
+    """
+
+    def get_user(self, validated_token):
+        """根据已验证的令牌解析用户"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version = PermissionSnapshotService.get_version(user_id)
+        principal = AuthPrincipalService.get(user_id, version)
+
+        if principal is None:
+            user = super().get_user(validated_token)
+            codes = PermissionSnapshotService.get_permission_codes(user)
+            revoke_hash = get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None
+            AuthPrincipalService.put(user, version, codes, revoke_hash)
+            return user
+
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != principal['revoke_hash']:
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code="password_changed"
+            )
+
+        user = AuthPrincipalService.build_user(principal)
+        PermissionSnapshotService.remember(user.pk, principal['codes'])
+        return user
@@ -217,15 +217,20 @@ class User(AbstractBaseUser, PermissionsMixin):
         """返回用户的简短名称"""
         return self.first_name if self.first_name else self.email.split('@')[0]
 
+    def get_permission_snapshot(self):
+        """
+        获取用户的权限代码集合（frozenset）
+        通过用户的有效角色获取，由权限快照服务缓存
+        """
+        from .services import PermissionSnapshotService
+        return PermissionSnapshotService.get_permission_codes(self)
+
     def get_user_permissions(self):
         """
         获取用户的所有权限代码
         通过用户的角色来获取权限
         """
-        permissions = set()
-        for role in self.roles.filter(is_active=True):
-            permissions.update(role.get_permission_codes())
-        return list(permissions)
+        return list(self.get_permission_snapshot())
 
     def has_permission(self, permission_code):
         """
@@ -233,7 +238,7 @@ class User(AbstractBaseUser, PermissionsMixin):
         """
         if self.is_superuser:
             return True
-        return permission_code in self.get_user_permissions()
+        return permission_code in self.get_permission_snapshot()
 
     def get_role_names(self):
         """
@@ -3,15 +3,33 @@
 确保中文字符正确显示，不被转义为Unicode编码
 """
 import json
+from django.conf import settings
 from rest_framework.renderers import JSONRenderer
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class UnicodeJSONRenderer(JSONRenderer):
     """
     自定义JSON渲染器
     确保中文等Unicode字符正确显示
+
+    安装了orjson且 JSON_RENDER_BACKEND 为 'orjson'（默认）时直接生成UTF-8字节串；
+    Decimal、日期时间等orjson不支持或格式不同的类型交给encoder_class处理，输出与标准库一致。
+    已知差异只有科学计数法浮点数的写法（1e16 与 1e+16）以及NaN/Infinity输出为null；
+    orjson无法处理的数据（超过64位的整数、嵌套过深等）回退到标准库
     """
     charset = 'utf-8'
+
+    def get_backend(self):
+        """当前使用的JSON编码实现：'orjson' 或 'json'"""
+        backend = getattr(settings, 'JSON_RENDER_BACKEND', 'orjson')
+        if backend == 'orjson' and orjson is not None:
+            return 'orjson'
+        return 'json'
     
     def render(self, data, accepted_media_type=None, renderer_context=None):
         """
@@ -33,6 +51,17 @@ class UnicodeJSONRenderer(JSONRenderer):
         if renderer_context and self.get_indent(renderer_context):
             indent = self.get_indent(renderer_context)
         
+        # orjson只支持2个空格的缩进
+        if self.get_backend() == 'orjson' and indent in (None, 2):
+            try:
+                return self.render_orjson(data, indent)
+            except orjson.JSONEncodeError:
+                pass
+        
+        return self.render_json(data, indent)
+    
+    def render_json(self, data, indent=None):
+        """使用标准库json渲染"""
         ret = json.dumps(
             data,
             cls=self.encoder_class,
@@ -43,6 +72,16 @@ class UnicodeJSONRenderer(JSONRenderer):
         
         return ret.encode(self.charset)
     
+    def render_orjson(self, data, indent=None):
+        """
+        使用orjson渲染
+        日期时间交给encoder_class按DRF的格式输出（UTC写作Z），非字符串键按标准库的方式转为字符串
+        """
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=self.encoder_class().default, option=option)
+    
     def get_indent(self, renderer_context):
         """
         获取JSON缩进设置
@@ -64,4 +103,13 @@ class UnicodeJSONRenderer(JSONRenderer):
            (hasattr(view, 'json_indent') and view.json_indent):
             return 2
         
-        return None 
\ No newline at end of file
+        return None 
+
+
+class CompactJSONRenderer(UnicodeJSONRenderer):
+    """
+    紧凑格式JSON渲染器
+    编码方式与UnicodeJSONRenderer相同；注册format='compact'，使 ?format=compact 通过DRF的内容协商，
+    由视图根据 request.accepted_renderer.format 返回紧凑结构（见CabinGroupingService.to_compact）
+    """
+    format = 'compact'
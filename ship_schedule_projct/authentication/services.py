@@ -3,17 +3,30 @@
 处理用户认证、权限管理等业务逻辑
 """
 import logging
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.db import transaction
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.utils import timezone
 
 from .models import User, Role, Permission
-from ship_schedule.utils import CacheHelper
+from ship_schedule.utils import CacheHelper, KeysetPagination
 
 logger = logging.getLogger(__name__)
 
+# 请求内的权限快照记忆，由request_started/request_finished信号启用和清理
+_snapshot_state = threading.local()
+
+# 进程内的认证主体LRU缓存 {(user_id, 版本号): 主体}，由AuthPrincipalService读写
+_principal_cache = OrderedDict()
+_principal_lock = threading.Lock()
+
 
 class AuthService:
     """
@@ -97,6 +110,259 @@ class AuthService:
             return False, f"注册失败: {str(e)}", None
 
 
+class PermissionSnapshotService:
+    """
+    用户权限快照服务
+    所有权限检查共用的快照层：每个用户的权限代码集合（frozenset）通过一次关联查询得到，
+    在同一请求内记忆，跨请求写入缓存。缓存键挂在全局权限命名空间和用户命名空间下，
+    角色/权限定义变化时失效全局命名空间，用户角色分配变化时失效该用户的命名空间
+    """
+
+    CACHE_NAMESPACE = 'permission'
+    USER_NAMESPACE = 'user:{user_id}'
+    SNAPSHOT_KEY = 'permission_snapshot:{user_id}'
+    CACHE_TIMEOUT = 3600
+
+    @staticmethod
+    def begin_request(**kwargs):
+        """请求开始时启用请求内记忆"""
+        _snapshot_state.memo = {}
+
+    @staticmethod
+    def end_request(**kwargs):
+        """请求结束时丢弃请求内记忆"""
+        _snapshot_state.memo = None
+
+    @staticmethod
+    def _get_memo():
+        """当前请求的记忆字典，不在请求中时为None"""
+        return getattr(_snapshot_state, 'memo', None)
+
+    @staticmethod
+    def _invalidate(*namespaces) -> None:
+        """
+        立即失效命名空间，并在事务提交后再失效一次：
+        避免并发请求在提交前按新版本号缓存了旧数据
+        """
+        CacheHelper.invalidate_namespace(*namespaces)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: CacheHelper.invalidate_namespace(*namespaces))
+
+    @staticmethod
+    def load_permission_codes(user_id: int) -> frozenset:
+        """一次关联查询获取用户通过有效角色拥有的权限代码"""
+        return frozenset(
+            Permission.objects.filter(
+                role__user__id=user_id,
+                role__is_active=True
+            ).values_list('code', flat=True).distinct()
+        )
+
+    @staticmethod
+    def get_permission_codes(user: User) -> frozenset:
+        """
+        获取用户的权限代码集合
+
+        Args:
+            user: 用户对象
+
+        Returns:
+            frozenset: 权限代码集合（不含超级管理员的隐式权限）
+        """
+        if not user or not user.pk:
+            return frozenset()
+
+        memo = PermissionSnapshotService._get_memo()
+        if memo is not None and user.pk in memo:
+            return memo[user.pk]
+
+        # 缓存中保存排序后的列表，兼容JSON序列化的缓存后端
+        codes = frozenset(CacheHelper.get_or_set(
+            PermissionSnapshotService.SNAPSHOT_KEY.format(user_id=user.pk),
+            lambda: sorted(PermissionSnapshotService.load_permission_codes(user.pk)),
+            timeout=PermissionSnapshotService.CACHE_TIMEOUT,
+            namespaces=(
+                PermissionSnapshotService.CACHE_NAMESPACE,
+                PermissionSnapshotService.USER_NAMESPACE.format(user_id=user.pk)
+            )
+        ))
+
+        if memo is not None:
+            memo[user.pk] = codes
+        return codes
+
+    @staticmethod
+    def remember(user_id: int, codes: frozenset) -> None:
+        """把已知的权限代码集合写入请求内记忆（认证时从认证主体缓存取得）"""
+        memo = PermissionSnapshotService._get_memo()
+        if memo is not None:
+            memo[user_id] = codes
+
+    @staticmethod
+    def get_version(user_id: int) -> str:
+        """
+        用户权限快照的当前版本号，由全局权限命名空间和用户命名空间的版本组成
+        任一命名空间失效（角色、权限或用户本身变化）时版本号改变；只读缓存，不查数据库
+        """
+        global_namespace = PermissionSnapshotService.CACHE_NAMESPACE
+        user_namespace = PermissionSnapshotService.USER_NAMESPACE.format(user_id=user_id)
+        versions = CacheHelper.get_namespace_versions(global_namespace, user_namespace)
+        return f"{versions[global_namespace]}.{versions[user_namespace]}"
+
+    @staticmethod
+    def invalidate_users(user_ids) -> None:
+        """用户角色分配或用户本身变化后，失效这些用户的命名空间"""
+        user_ids = set(user_ids)
+        memo = PermissionSnapshotService._get_memo()
+        if memo is not None:
+            for user_id in user_ids:
+                memo.pop(user_id, None)
+        AuthPrincipalService.evict(user_ids)
+        PermissionSnapshotService._invalidate(*(
+            PermissionSnapshotService.USER_NAMESPACE.format(user_id=user_id) for user_id in user_ids
+        ))
+
+    @staticmethod
+    def invalidate_all() -> None:
+        """角色或权限定义变化后，失效全局权限命名空间使全部用户的快照失效"""
+        memo = PermissionSnapshotService._get_memo()
+        if memo is not None:
+            memo.clear()
+        AuthPrincipalService.evict()
+        PermissionSnapshotService._invalidate(PermissionSnapshotService.CACHE_NAMESPACE)
+
+
+class AuthPrincipalService:
+    """
+    认证主体缓存服务
+    JWT认证解析出的用户（字段值、权限代码集合）缓存在进程内LRU中，键为 (用户ID, 权限快照版本号)。
+    命中时直接构造用户对象，认证和权限检查都不查数据库；用户、角色或权限变化时版本号改变，
+    各进程的旧条目不再命中，下次请求回源数据库重新校验（包括用户是否被停用或删除）。
+    本进程内的修改同时立即清除相关条目
+
+    版本号保存在Django缓存中，只有各进程共享缓存（如Redis）时其他进程的修改才能使本进程的条目失效：
+    默认缓存为本地内存或虚拟缓存时不使用LRU（AUTH_PRINCIPAL_CACHE_ENABLED可显式开启或关闭）。
+    每个条目最多保留AUTH_PRINCIPAL_CACHE_TIMEOUT秒，版本号失效未能传播时（如缓存被清空或写入失败）
+    停用的用户最迟在该时间后被拒绝
+    """
+
+    # 不缓存密码哈希，访问时按延迟字段从数据库加载
+    EXCLUDED_FIELDS = ('password',)
+    # 各进程不共享数据的缓存后端
+    PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+    @staticmethod
+    def get_max_size() -> int:
+        """LRU最多缓存的主体数量"""
+        return getattr(settings, 'AUTH_PRINCIPAL_CACHE_SIZE', 10000)
+
+    @staticmethod
+    def get_timeout() -> int:
+        """每个主体在LRU中保留的最长时间（秒）"""
+        return getattr(settings, 'AUTH_PRINCIPAL_CACHE_TIMEOUT', 60)
+
+    @staticmethod
+    def is_enabled() -> bool:
+        """是否使用进程内LRU：未显式配置时，只在默认缓存为各进程共享的后端时使用"""
+        enabled = getattr(settings, 'AUTH_PRINCIPAL_CACHE_ENABLED', None)
+        if enabled is not None:
+            return enabled
+        return not isinstance(caches['default'], AuthPrincipalService.PROCESS_LOCAL_CACHES)
+
+    @staticmethod
+    def get(user_id: int, version: str) -> Optional[Dict]:
+        """读取缓存的主体，未命中、已过期或未启用LRU时返回None"""
+        if not AuthPrincipalService.is_enabled():
+            return None
+        key = (user_id, version)
+        with _principal_lock:
+            principal = _principal_cache.get(key)
+            if principal is None:
+                return None
+            if principal['expires_at'] <= time.monotonic():
+                del _principal_cache[key]
+                return None
+            _principal_cache.move_to_end(key)
+            return principal
+
+    @staticmethod
+    def put(user: User, version: str, codes: frozenset, revoke_hash: Optional[str] = None) -> Dict:
+        """
+        缓存从数据库加载的用户
+
+        Args:
+            user: 用户对象
+            version: 加载前读取的权限快照版本号（先读版本再加载，加载期间的修改会改变版本号，不会缓存旧数据）
+            codes: 用户的权限代码集合
+            revoke_hash: 开启CHECK_REVOKE_TOKEN时校验用的密码哈希摘要
+
+        Returns:
+            Dict: 缓存的主体
+        """
+        field_names = tuple(
+            field.attname for field in User._meta.concrete_fields
+            if field.attname not in AuthPrincipalService.EXCLUDED_FIELDS
+        )
+        principal = {
+            'field_names': field_names,
+            'values': tuple(getattr(user, name) for name in field_names),
+            'codes': codes,
+            'revoke_hash': revoke_hash,
+            'expires_at': time.monotonic() + AuthPrincipalService.get_timeout(),
+        }
+        if not AuthPrincipalService.is_enabled():
+            return principal
+        max_size = AuthPrincipalService.get_max_size()
+        with _principal_lock:
+            _principal_cache[(user.pk, version)] = principal
+            _principal_cache.move_to_end((user.pk, version))
+            while len(_principal_cache) > max_size:
+                _principal_cache.popitem(last=False)
+        return principal
+
+    @staticmethod
+    def build_user(principal: Dict) -> User:
+        """由缓存的主体构造用户对象（每个请求一个新实例，互不影响）"""
+        return User.from_db('default', principal['field_names'], principal['values'])
+
+    @staticmethod
+    def evict(user_ids=None) -> None:
+        """清除本进程内指定用户（None表示全部）的缓存主体"""
+        with _principal_lock:
+            if user_ids is None:
+                _principal_cache.clear()
+                return
+            user_ids = set(user_ids)
+            for key in [key for key in _principal_cache if key[0] in user_ids]:
+                del _principal_cache[key]
+
+
+class UserListService:
+    """
+    用户列表服务类
+    提供用户列表的游标分页和总数缓存
+    """
+
+    # 用户列表总数缓存的命名空间，新增、删除或启用/停用用户时失效
+    CACHE_NAMESPACE = 'user_list'
+    # 游标分页支持的排序 {排序参数: 字段}
+    CURSOR_ORDERINGS = {'date_joined': 'date_joined'}
+
+    @staticmethod
+    def get_keyset_paginator() -> KeysetPagination:
+        """用户列表使用的游标分页器，按 (date_joined, id) 翻页"""
+        return KeysetPagination(
+            orderings=UserListService.CURSOR_ORDERINGS,
+            default_ordering='-date_joined',
+            count_namespaces=(UserListService.CACHE_NAMESPACE,)
+        )
+
+    @staticmethod
+    def invalidate():
+        """失效用户列表总数缓存"""
+        CacheHelper.invalidate_namespace(UserListService.CACHE_NAMESPACE)
+
+
 class PermissionService:
     """
     权限服务类
@@ -122,19 +388,7 @@ class PermissionService:
         if user.is_superuser:
             return True
         
-        # 检查缓存
-        cache_key = f"user_permission:{user.id}:{permission_code}"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
-        
-        # 检查权限
-        has_permission = user.has_permission(permission_code)
-        
-        # 缓存结果5分钟
-        cache.set(cache_key, has_permission, 300)
-        
-        return has_permission
+        return permission_code in PermissionSnapshotService.get_permission_codes(user)
     
     @staticmethod
     def get_user_permissions(user: User) -> List[str]:
@@ -150,30 +404,11 @@ class PermissionService:
         if not user or not user.is_authenticated:
             return []
         
-        # 检查缓存
-        cache_key = f"user_permissions:{user.id}"
-        cached_permissions = cache.get(cache_key)
-        if cached_permissions is not None:
-            return cached_permissions
-        
-        # 获取权限
-        permissions = []
-        
         if user.is_superuser:
             # 超级管理员拥有所有权限
-            permissions = list(Permission.objects.values_list('code', flat=True))
-        else:
-            # 通过角色获取权限
-            permissions = list(
-                Permission.objects.filter(
-                    roles__users=user
-                ).distinct().values_list('code', flat=True)
-            )
-        
-        # 缓存结果5分钟
-        cache.set(cache_key, permissions, 300)
-        
-        return permissions
+            return list(Permission.objects.values_list('code', flat=True))
+
+        return sorted(PermissionSnapshotService.get_permission_codes(user))
     
     @staticmethod
     def assign_user_roles(user: User, role_ids: List[int]) -> Tuple[bool, str]:
@@ -214,15 +449,7 @@ class PermissionService:
         Args:
             user: 用户对象
         """
-        try:
-            # 清除用户权限列表缓存
-            cache.delete(f"user_permissions:{user.id}")
-            
-            # 清除具体权限检查缓存
-            CacheHelper.delete_pattern(f"user_permission:{user.id}:*")
-            
-        except Exception as e:
-            logger.warning(f"清除用户权限缓存失败: {e}")
+        PermissionSnapshotService.invalidate_users([user.pk])
 
 
 class RoleService:
@@ -260,6 +487,7 @@ class RoleService:
                 if permission_ids:
                     permissions = Permission.objects.filter(id__in=permission_ids)
                     role.permissions.set(permissions)
+                    PermissionSnapshotService.invalidate_all()
                 
                 logger.info(f"角色创建成功: {name}")
                 return True, "角色创建成功", role
@@ -286,9 +514,8 @@ class RoleService:
                 permissions = Permission.objects.filter(id__in=permission_ids)
                 role.permissions.set(permissions)
                 
-                # 清除相关用户的权限缓存
-                for user in role.users.all():
-                    PermissionService._clear_user_permission_cache(user)
+                # 角色权限变化，失效全部用户的权限快照
+                PermissionSnapshotService.invalidate_all()
                 
                 logger.info(f"角色权限更新成功: {role.name}")
                 return True, "权限更新成功"
@@ -316,6 +543,7 @@ class RoleService:
             with transaction.atomic():
                 role_name = role.name
                 role.delete()
+                PermissionSnapshotService.invalidate_all()
                 
                 logger.info(f"角色删除成功: {role_name}")
                 return True, "角色删除成功"
@@ -328,6 +556,8 @@ class RoleService:
 # 导出服务类
 __all__ = [
     'AuthService',
+    'PermissionSnapshotService',
+    'AuthPrincipalService',
     'PermissionService', 
     'RoleService'
 ]
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+权限快照失效信号处理器
+角色分配、角色权限、角色状态或权限代码变化时递增权限快照版本号；
+请求开始/结束时启用和清理请求内的权限快照记忆；
+用户修改或删除时失效其认证主体缓存；
+用户新增、删除或启用状态变化时失效用户列表总数缓存
+"""
+from django.core.signals import request_started, request_finished
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User, Role, Permission
+from .services import PermissionSnapshotService, UserListService
+
+request_started.connect(PermissionSnapshotService.begin_request, dispatch_uid='permission_snapshot_begin')
+request_finished.connect(PermissionSnapshotService.end_request, dispatch_uid='permission_snapshot_end')
+
+M2M_CHANGE_ACTIONS = ('post_add', 'post_remove', 'post_clear')
+
+
+@receiver(m2m_changed, sender=User.roles.through)
+def invalidate_permission_snapshot_on_user_roles_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    用户角色分配变化时失效相关用户的快照
+
+    user.roles.add()等正向修改只影响该用户；role.user_set.add()等反向修改影响pk_set中的用户，
+    role.user_set.clear()无法得知受影响的用户，失效全部快照
+    """
+    if action not in M2M_CHANGE_ACTIONS:
+        return
+
+    if not reverse:
+        PermissionSnapshotService.invalidate_users([instance.pk])
+    elif pk_set:
+        PermissionSnapshotService.invalidate_users(pk_set)
+    else:
+        PermissionSnapshotService.invalidate_all()
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def invalidate_permission_snapshot_on_role_permissions_change(sender, action, **kwargs):
+    """角色权限变化时失效全部快照"""
+    if action in M2M_CHANGE_ACTIONS:
+        PermissionSnapshotService.invalidate_all()
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permission_snapshot_on_definition_change(sender, instance, created=False, **kwargs):
+    """角色启用/停用、删除或权限代码变化时失效全部快照；新建时还没有用户关联，无需失效"""
+    if not created:
+        PermissionSnapshotService.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_list_count(sender, instance, update_fields=None, **kwargs):
+    """用户新增、删除或启用状态变化时失效用户列表总数；登录等只更新其他字段的保存跳过"""
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    UserListService.invalidate()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_principal_on_user_change(sender, instance, update_fields=None, **kwargs):
+    """
+    用户保存（停用、改密码、变更超级管理员等）或删除时递增该用户的版本号，
+    各进程缓存的认证主体不再命中，下次请求回源数据库校验；只更新最后登录时间的保存跳过
+    """
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    PermissionSnapshotService.invalidate_users([instance.pk])
@@ -24,6 +24,9 @@ from .serializers import (
     AvatarUploadSerializer
 )
 from .permissions import HasPermission, permission_required, get_permission_map
+from .backends import PrincipalRefreshToken
+from .services import UserListService
+from ship_schedule.utils import KeysetPagination
 
 
 class UserRegistrationView(generics.CreateAPIView):
@@ -52,7 +55,7 @@ class UserRegistrationView(generics.CreateAPIView):
         user = serializer.save()
 
         # 生成JWT token
-        refresh = RefreshToken.for_user(user)
+        refresh = PrincipalRefreshToken.for_user(user)
 
         # 返回用户信息和token
         user_serializer = UserSerializer(user)
@@ -86,7 +89,7 @@ def login_view(request):
     user = serializer.validated_data['user']
 
     # 生成JWT token
-    refresh = RefreshToken.for_user(user)
+    refresh = PrincipalRefreshToken.for_user(user)
 
     # 更新最后登录时间
     user.save(update_fields=['last_login'])
@@ -487,6 +490,12 @@ class UserManagementViewSet(viewsets.ModelViewSet):
         if is_active:
             queryset = queryset.filter(is_active=is_active.lower() == 'true')
 
+        # 游标分页
+        if KeysetPagination.is_requested(request):
+            paginator = UserListService.get_keyset_paginator()
+            serializer = self.get_serializer(paginator.paginate_queryset(queryset, request), many=True)
+            return Response(get_user_cursor_page(serializer.data, paginator), status=status.HTTP_200_OK)
+
         # 分页处理
         page = int(request.GET.get('page', 1))
         page_size = int(request.GET.get('page_size', 20))
@@ -578,6 +587,19 @@ class UserManagementViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_200_OK)
 
 
+def get_user_cursor_page(users, paginator):
+    """用户列表游标分页的响应体，字段与页码分页保持一致"""
+    meta = paginator.page_meta
+    return {
+        'users': users,
+        'total': meta['total_count'],
+        'page_size': meta['page_size'],
+        'ordering': meta['ordering'],
+        'next_cursor': meta['next_cursor'],
+        'previous_cursor': meta['previous_cursor']
+    }
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 @permission_required('user.list')
@@ -594,6 +616,12 @@ def users_list_view(request):
     """
     users = User.objects.all().order_by('-date_joined')
 
+    # 游标分页
+    if KeysetPagination.is_requested(request):
+        paginator = UserListService.get_keyset_paginator()
+        serializer = UserSerializer(paginator.paginate_queryset(users, request), many=True)
+        return Response(get_user_cursor_page(serializer.data, paginator), status=status.HTTP_200_OK)
+
     # 分页处理（简单实现）
     page = int(request.GET.get('page', 1))
     page_size = int(request.GET.get('page_size', 20))
@@ -8,3 +8,7 @@ class LocalFeesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'local_fees'
     verbose_name = '本地费用管理'
+
+    def ready(self):
+        """应用启动时导入信号处理器"""
+        import local_fees.signals
@@ -7,6 +7,9 @@ from django.db import models
 
 class LocalFee(models.Model):
     """本地费用模型"""
+    # 本地费用的变更计数命名空间，费用增删改时递增，用于生成查询接口ETag
+    CACHE_NAMESPACE = 'local_fee'
+
     id = models.AutoField(primary_key=True, verbose_name="ID")
     
     # 核心字段
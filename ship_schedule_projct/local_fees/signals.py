@@ -0,0 +1,17 @@
+"""
+本地费用信号处理器
+费用增删改后递增本地费用的变更计数，使查询接口的ETag失效
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import LocalFee
+from ship_schedule.utils import CacheHelper
+
+
+@receiver(post_save, sender=LocalFee)
+@receiver(post_delete, sender=LocalFee)
+def invalidate_local_fee_namespace(sender, instance, **kwargs):
+    """本地费用变化时（事务提交后）失效查询接口的ETag，避免提交前的并发请求取到新ETag和旧数据"""
+    transaction.on_commit(lambda: CacheHelper.invalidate_namespace(LocalFee.CACHE_NAMESPACE))
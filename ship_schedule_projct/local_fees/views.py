@@ -12,6 +12,22 @@ from django.shortcuts import get_object_or_404
 from .models import LocalFee
 from .serializers import LocalFeeSerializer, LocalFeeQuerySerializer
 from authentication.permissions import HasPermission, get_permission_map
+from ship_schedule.utils import CacheHelper, ConditionalGetHelper
+
+
+def query_fees_etag(viewset, request):
+    """
+    本地费用查询接口的ETag：由查询参数和本地费用的变更计数组成，参数缺失时返回None
+    """
+    pol_cd = request.query_params.get('polCd')
+    pod_cd = request.query_params.get('podCd')
+    if not pol_cd or not pod_cd:
+        return None
+    namespace = LocalFee.CACHE_NAMESPACE
+    return ConditionalGetHelper.make_etag(
+        namespace, pol_cd, pod_cd, request.query_params.get('carriercd') or None,
+        CacheHelper.get_namespace_versions(namespace)[namespace]
+    )
 
 
 class LocalFeeViewSet(viewsets.ModelViewSet):
@@ -135,6 +151,7 @@ class LocalFeeViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=False, methods=['get'], url_path='query')
+    @ConditionalGetHelper.conditional(query_fees_etag)
     def query_fees(self, request):
         """
         查询本地费用
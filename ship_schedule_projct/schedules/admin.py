@@ -1,5 +1,8 @@
+import json
+
 from django.contrib import admin
-from .models import VesselSchedule, VesselInfoFromCompany
+from .models import VesselSchedule, VesselInfoFromCompany, VesselScheduleArchive, VesselInfoImportJob
+from .signals import enqueue_vessel_schedule_sync
 
 
 @admin.register(VesselSchedule)
@@ -71,13 +74,21 @@ class VesselScheduleAdmin(admin.ModelAdmin):
     
     def make_active(self, request, queryset):
         """批量激活"""
-        updated = queryset.update(status=1)
+        schedule_ids = list(queryset.values_list('id', flat=True))
+        data_versions = set(queryset.values_list('data_version', flat=True))
+        # 同时清空内容哈希，下次抓取时完整写入，不沿用修改前的状态
+        updated = queryset.update(status=1, content_hash=None)
+        # update()不触发post_save，激活后统一同步船舶信息并重算所在版本的统计
+        enqueue_vessel_schedule_sync(schedule_ids, data_versions=data_versions)
         self.message_user(request, f'{updated} 条记录已激活')
     make_active.short_description = "激活选中的航线"
     
     def make_inactive(self, request, queryset):
         """批量停用"""
-        updated = queryset.update(status=0)
+        data_versions = set(queryset.values_list('data_version', flat=True))
+        updated = queryset.update(status=0, content_hash=None)
+        # 停用无需同步船舶信息，只重算所在版本的统计
+        enqueue_vessel_schedule_sync((), data_versions=data_versions)
         self.message_user(request, f'{updated} 条记录已停用')
     make_inactive.short_description = "停用选中的航线"
 
@@ -132,3 +143,70 @@ class VesselInfoFromCompanyAdmin(admin.ModelAdmin):
         updated = queryset.update(gp_20='有现舱', hq_40='有现舱')
         self.message_user(request, f'{updated} 条记录已设置为有现舱')
     set_available_cabin.short_description = "设置选中记录为有现舱"
+
+
+@admin.register(VesselScheduleArchive)
+class VesselScheduleArchiveAdmin(admin.ModelAdmin):
+    """船舶航线归档查看界面（只读）"""
+
+    # 列表显示字段
+    list_display = [
+        'id', 'vessel', 'voyage', 'polCd', 'podCd',
+        'first_version', 'last_version', 'version_count', 'archived_at'
+    ]
+
+    # 列表过滤器
+    list_filter = ['polCd', 'podCd']
+
+    # 搜索字段
+    search_fields = ['vessel', 'voyage', 'polCd', 'podCd']
+
+    # 分页
+    list_per_page = 20
+
+    # 归档数据不在后台修改
+    exclude = ['payload']
+    readonly_fields = [
+        'polCd', 'podCd', 'vessel', 'voyage', 'content_hash', 'first_version',
+        'last_version', 'version_count', 'versions', 'archived_at', 'archived_payload'
+    ]
+
+    # 排序
+    ordering = ['-last_version', 'vessel', 'voyage']
+
+    def archived_payload(self, obj):
+        """显示解压后的航线数据"""
+        return json.dumps(obj.get_payload(), ensure_ascii=False, indent=2)
+    archived_payload.short_description = "航线数据"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VesselInfoImportJob)
+class VesselInfoImportJobAdmin(admin.ModelAdmin):
+    """船舶信息导入任务查看界面（只读）"""
+
+    # 列表显示字段
+    list_display = [
+        'id', 'file_name', 'file_format', 'status', 'processed_rows',
+        'created_count', 'updated_count', 'failed_count', 'created_by', 'created_at'
+    ]
+
+    # 列表过滤器
+    list_filter = ['status', 'file_format']
+
+    # 搜索字段
+    search_fields = ['file_name']
+
+    # 分页
+    list_per_page = 20
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
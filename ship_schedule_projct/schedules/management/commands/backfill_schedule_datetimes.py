@@ -0,0 +1,64 @@
+"""
+Django管理命令：回填航线的类型化时间字段（etd_at、eta_at及各截止时间）
+新增类型化字段后对历史数据执行一次；抓取程序写入的新数据已自带这些字段
+用法：
+    python manage.py backfill_schedule_datetimes                      # 回填etd_at为空的记录
+    python manage.py backfill_schedule_datetimes --data-version 12   # 只回填指定版本
+    python manage.py backfill_schedule_datetimes --all               # 重新解析全部记录
+    python manage.py backfill_schedule_datetimes --dry-run           # 预览模式，不写入
+    python manage.py backfill_schedule_datetimes --chunk-size 5000   # 每批处理5000条
+"""
+from django.core.management.base import BaseCommand, CommandError
+from schedules.services import ScheduleDateTimeService
+
+
+class Command(BaseCommand):
+    help = '分批回填vessel_schedule的类型化时间字段'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每批读取和更新的记录数量，默认1000'
+        )
+
+        parser.add_argument(
+            '--data-version',
+            type=int,
+            help='只回填指定数据版本'
+        )
+
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='重新解析全部记录，而不只是etd_at为空的记录'
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='预览模式，只统计不写入'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size 必须大于0")
+
+        self.stdout.write("🚀 开始回填航线时间字段")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("🔍 预览模式，不会写入数据"))
+
+        result = ScheduleDateTimeService.backfill(
+            chunk_size=options['chunk_size'],
+            data_version=options['data_version'],
+            only_missing=not options['all'],
+            dry_run=options['dry_run']
+        )
+
+        self.stdout.write(f"📊 扫描记录: {result['scanned']}")
+        self.stdout.write(f"✅ {'可回填' if options['dry_run'] else '已回填'}: {result['updated']}")
+        if result['unparsed']:
+            self.stdout.write(self.style.WARNING(f"⚠️  无法解析时间: {result['unparsed']}"))
+
+        self.stdout.write(self.style.SUCCESS("🎉 完成！"))
@@ -0,0 +1,63 @@
+"""
+Django管理命令：回填航线的共舱船公司集合（carrier_set）和共舱明细表
+新增共舱明细表后对历史数据执行一次；抓取程序和后台保存的新数据已自动写入
+用法：
+    python manage.py backfill_share_cabins                      # 回填carrier_set为空的记录
+    python manage.py backfill_share_cabins --data-version 12   # 只回填指定版本
+    python manage.py backfill_share_cabins --all               # 重新计算全部记录
+    python manage.py backfill_share_cabins --dry-run           # 预览模式，不写入
+    python manage.py backfill_share_cabins --chunk-size 5000   # 每批处理5000条
+"""
+from django.core.management.base import BaseCommand, CommandError
+from schedules.services import ShareCabinService
+
+
+class Command(BaseCommand):
+    help = '分批回填vessel_schedule的共舱船公司集合和共舱明细表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每批读取和更新的记录数量，默认1000'
+        )
+
+        parser.add_argument(
+            '--data-version',
+            type=int,
+            help='只回填指定数据版本'
+        )
+
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='重新计算全部记录，而不只是carrier_set为空的记录'
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='预览模式，只统计不写入'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size 必须大于0")
+
+        self.stdout.write("🚀 开始回填共舱船公司")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("🔍 预览模式，不会写入数据"))
+
+        result = ShareCabinService.backfill(
+            chunk_size=options['chunk_size'],
+            data_version=options['data_version'],
+            only_missing=not options['all'],
+            dry_run=options['dry_run']
+        )
+
+        self.stdout.write(f"📊 扫描航线: {result['scanned']}")
+        self.stdout.write(f"✅ 已回填航线: {result['updated']}")
+        self.stdout.write(f"📦 共舱明细: {result['share_cabin_rows']}")
+
+        self.stdout.write(self.style.SUCCESS("🎉 完成！"))
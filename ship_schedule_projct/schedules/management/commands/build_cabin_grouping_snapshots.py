@@ -0,0 +1,71 @@
+"""
+Django管理命令：预生成共舱分组快照
+在爬虫提交新的数据版本后执行，使前台查询直接命中快照
+用法：
+    python manage.py build_cabin_grouping_snapshots                         # 为所有航线的已发布版本生成快照
+    python manage.py build_cabin_grouping_snapshots --polCd CNSHA --podCd USLAX   # 只生成指定航线
+    python manage.py build_cabin_grouping_snapshots --data-version 12       # 指定数据版本
+"""
+from django.core.management.base import BaseCommand
+from schedules.models import VesselSchedule, CabinGroupingSnapshot
+from schedules.services import CabinGroupingService, DataVersionService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每次批量查询已发布版本的航线数
+VERSION_LOOKUP_CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = '为航线预生成共舱分组快照'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polCd', type=str, help='起运港五字码')
+        parser.add_argument('--podCd', type=str, help='目的港五字码')
+        parser.add_argument(
+            '--data-version',
+            type=int,
+            help='指定数据版本号，默认使用各航线已发布的版本（不包括爬虫暂存中的版本）'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🚀 开始生成共舱分组快照")
+
+        queryset = VesselSchedule.objects.filter(status=1)
+        if options['polCd']:
+            queryset = queryset.filter(polCd=options['polCd'])
+        if options['podCd']:
+            queryset = queryset.filter(podCd=options['podCd'])
+
+        if options['data_version'] is not None:
+            routes = queryset.filter(data_version=options['data_version']).values(
+                'polCd', 'podCd'
+            ).distinct()
+            targets = [(r['polCd'], r['podCd'], options['data_version']) for r in routes]
+        else:
+            routes = sorted(set(queryset.order_by().values_list('polCd', 'podCd')))
+            targets = []
+            for start in range(0, len(routes), VERSION_LOOKUP_CHUNK_SIZE):
+                versions = DataVersionService.get_latest_versions(routes[start:start + VERSION_LOOKUP_CHUNK_SIZE])
+                targets.extend(
+                    (pol_cd, pod_cd, version) for (pol_cd, pod_cd), version in sorted(versions.items())
+                    if version is not None
+                )
+
+        built_count = 0
+        for pol_cd, pod_cd, data_version in targets:
+            for kind, _ in CabinGroupingSnapshot.KIND_CHOICES:
+                try:
+                    # 该版本没有有效航线时不写入快照，不计数
+                    if CabinGroupingService.build_snapshot(kind, pol_cd, pod_cd, data_version):
+                        built_count += 1
+                except Exception as e:
+                    logger.error(f"生成共舱分组快照失败 {pol_cd}->{pod_cd} v{data_version}: {e}")
+                    self.stdout.write(self.style.ERROR(
+                        f"❌ {kind} {pol_cd} → {pod_cd} v{data_version}: {str(e)}"
+                    ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🎉 完成！共 {len(targets)} 条航线，生成 {built_count} 个快照"
+        ))
@@ -0,0 +1,96 @@
+"""
+Django管理命令：归档vessel_schedule中超出保留范围的历史版本
+建议在每次爬虫发布新版本后执行（run_crawler_docker.sh 已在爬虫完成后自动调用）
+用法：
+    python manage.py compact_schedule_versions                 # 按配置保留最近N个版本
+    python manage.py compact_schedule_versions --keep 5        # 保留最近5个版本
+    python manage.py compact_schedule_versions --dry-run       # 预览模式，不实际执行
+    python manage.py compact_schedule_versions --optimize      # 归档后回收表空间（MySQL）
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from schedules.services import ScheduleRetentionService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '将vessel_schedule中超出保留范围的历史版本迁移到归档表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep',
+            type=int,
+            default=getattr(settings, 'SCHEDULE_RETENTION_KEEP_VERSIONS', 10),
+            help='保留最近的已发布版本数量'
+        )
+
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='预览模式，显示将要归档的版本但不实际执行'
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每批处理的记录数量，默认1000'
+        )
+
+        parser.add_argument(
+            '--optimize',
+            action='store_true',
+            help='归档完成后执行OPTIMIZE TABLE回收空间（仅MySQL）'
+        )
+
+    def handle(self, *args, **options):
+        if options['keep'] < 1:
+            raise CommandError("--keep 至少为1")
+
+        self.stdout.write(f"🚀 开始归档历史版本，保留最近 {options['keep']} 个版本")
+
+        try:
+            result = ScheduleRetentionService.compact(
+                keep_versions=options['keep'],
+                dry_run=options['dry_run'],
+                chunk_size=options['chunk_size']
+            )
+            if options['optimize'] and not options['dry_run'] and result['rows_moved']:
+                ScheduleRetentionService.optimize_table()
+                result['table_bytes_after'] = ScheduleRetentionService.get_table_bytes()
+        except Exception as e:
+            logger.error(f"归档历史版本失败: {e}")
+            raise CommandError(f"归档失败: {str(e)}")
+
+        self.display_results(result, options['dry_run'])
+
+    def display_results(self, result, dry_run):
+        """显示归档结果"""
+        versions = result['archived_versions']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("🔍 预览模式 - 不会实际修改数据"))
+            self.stdout.write(f"📊 将归档版本: {versions or '无'}")
+            self.stdout.write(f"  📝 将迁移记录: {result['rows_moved']}")
+            return
+
+        if not versions:
+            self.stdout.write("⚠️  没有需要归档的版本")
+            return
+
+        self.stdout.write(self.style.SUCCESS("🎉 归档完成!"))
+        self.stdout.write(f"📊 归档统计:")
+        self.stdout.write(f"  🗂️  归档版本: {versions}")
+        self.stdout.write(f"  📝 迁移记录: {result['rows_moved']}")
+        self.stdout.write(f"  ✅ 新建归档: {result['archive_created']}")
+        self.stdout.write(f"  🔄 合并归档: {result['archive_merged']}")
+        self.stdout.write(f"  💾 原始数据: {result['raw_bytes']} 字节")
+        self.stdout.write(f"  📦 归档数据: {result['archived_bytes']} 字节")
+        self.stdout.write(f"  ♻️  回收空间: {result['bytes_reclaimed']} 字节")
+
+        if result['table_bytes_before'] is not None:
+            self.stdout.write(
+                f"  🗄️  表空间: {result['table_bytes_before']} → {result['table_bytes_after']} 字节"
+            )
@@ -0,0 +1,91 @@
+"""
+Django管理命令：流式导出船舶航线（CSV/NDJSON，可gzip压缩）
+按主键分批读取并逐批写入文件，内存占用与导出行数无关
+用法：
+    python manage.py export_vessel_schedules --data-version 12 -o v12.csv           # 导出一个版本的有效数据
+    python manage.py export_vessel_schedules --data-version 12 --format ndjson --gzip -o v12.ndjson.gz
+    python manage.py export_vessel_schedules --pol-cd CNSHA --pod-cd USNYC -o route.csv
+    python manage.py export_vessel_schedules --all-status -o all.csv                # 包含无效数据
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from schedules.services import VesselScheduleExportService
+
+
+class Command(BaseCommand):
+    help = '流式导出船舶航线（CSV/NDJSON，可gzip压缩）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output',
+            required=True,
+            help='输出文件路径'
+        )
+
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=VesselScheduleExportService.FORMATS,
+            default='csv',
+            help='导出格式，默认csv'
+        )
+
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='gzip压缩输出'
+        )
+
+        parser.add_argument(
+            '--data-version',
+            type=int,
+            help='只导出指定数据版本'
+        )
+
+        parser.add_argument(
+            '--all-status',
+            action='store_true',
+            help='包含无效数据（默认只导出status=1的有效数据）'
+        )
+
+        parser.add_argument('--pol-cd', help='起运港五字码')
+        parser.add_argument('--pod-cd', help='目的港五字码')
+        parser.add_argument('--carrier', help='船公司代码')
+
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=VesselScheduleExportService.CHUNK_SIZE,
+            help=f'每批读取的行数，默认{VesselScheduleExportService.CHUNK_SIZE}'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size 必须大于0")
+
+        output = options['output']
+        output_dir = os.path.dirname(os.path.abspath(output))
+        if not os.path.isdir(output_dir):
+            raise CommandError(f"输出目录不存在: {output_dir}")
+
+        export_format = options['file_format']
+        if options['gzip']:
+            export_format += VesselScheduleExportService.GZIP_SUFFIX
+
+        queryset = VesselScheduleExportService.build_queryset(
+            data_version=options['data_version'],
+            status=None if options['all_status'] else 1,
+            pol_cd=options['pol_cd'],
+            pod_cd=options['pod_cd'],
+            carrier_cd=options['carrier']
+        )
+
+        self.stdout.write(f"🚀 开始导出船舶航线到 {output}（{export_format}）")
+
+        with open(output, 'wb') as file:
+            for chunk in VesselScheduleExportService.stream(queryset, export_format, options['chunk_size']):
+                file.write(chunk)
+
+        self.stdout.write(f"📊 文件大小: {os.path.getsize(output)} 字节")
+        self.stdout.write(self.style.SUCCESS("🎉 完成！"))
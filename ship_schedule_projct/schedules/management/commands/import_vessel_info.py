@@ -0,0 +1,83 @@
+"""
+Django管理命令：导入船舶额外信息价格表（CSV/XLSX）
+逐行流式读取文件，按批校验并新增或更新VesselInfoFromCompany，内存占用与文件大小无关
+用法：
+    python manage.py import_vessel_info rates.csv                    # 按扩展名判断格式
+    python manage.py import_vessel_info rates.csv --encoding gbk     # GBK编码的CSV
+    python manage.py import_vessel_info rates.xlsx --chunk-size 5000 # 每批处理5000行
+表头支持字段名（carrierCd/carriercd、polCd、podCd、vessel、voyage、gp_20、hq_40、cut_off_time、price）
+或中文名称（船公司、起运港五字码等）；表中出现的价格/舱位列会覆盖已有记录，未出现的列保持不变
+"""
+import codecs
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from schedules.models import VesselInfoImportJob
+from schedules.services import VesselInfoImportService
+
+
+class Command(BaseCommand):
+    help = '流式导入船舶额外信息价格表（CSV/XLSX）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file_path',
+            help='价格表文件路径'
+        )
+
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=[choice for choice, _ in VesselInfoImportJob.FORMAT_CHOICES],
+            help='文件格式，默认按扩展名判断'
+        )
+
+        parser.add_argument(
+            '--encoding',
+            default='utf-8-sig',
+            help='CSV文件编码，默认utf-8-sig'
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=VesselInfoImportService.CHUNK_SIZE,
+            help=f'每批校验和写入的行数，默认{VesselInfoImportService.CHUNK_SIZE}'
+        )
+
+    def handle(self, *args, **options):
+        file_path = options['file_path']
+        if not os.path.isfile(file_path):
+            raise CommandError(f"文件不存在: {file_path}")
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size 必须大于0")
+        try:
+            codecs.lookup(options['encoding'])
+            job = VesselInfoImportService.create_job(os.path.basename(file_path), options['file_format'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"🚀 开始导入 {file_path}（任务ID: {job.id}）")
+
+        def _report_progress(current_job):
+            self.stdout.write(
+                f"⏳ 已处理 {current_job.processed_rows} 行，新增 {current_job.created_count}，"
+                f"更新 {current_job.updated_count}，失败 {current_job.failed_count}"
+            )
+
+        with open(file_path, 'rb') as file:
+            job = VesselInfoImportService.run(
+                job, file,
+                encoding=options['encoding'],
+                chunk_size=options['chunk_size'],
+                progress_callback=_report_progress
+            )
+
+        if job.status != VesselInfoImportJob.STATUS_COMPLETED:
+            raise CommandError(job.message)
+
+        self.stdout.write(f"📊 {job.message}")
+        if job.error_report:
+            self.stdout.write(self.style.WARNING(f"⚠️  错误报告: {job.error_report.name}"))
+
+        self.stdout.write(self.style.SUCCESS("🎉 完成！"))
@@ -0,0 +1,30 @@
+"""
+Django管理命令：根据现有航线数据重建数据版本登记表
+首次部署版本登记表、或手工修复数据后执行
+用法：
+    python manage.py rebuild_data_version_registry
+"""
+from django.core.management.base import BaseCommand
+from schedules.models import DataVersionRegistry
+from schedules.services import DataVersionService
+
+
+class Command(BaseCommand):
+    help = '根据vessel_schedule现有数据重建数据版本登记表'
+
+    def handle(self, *args, **options):
+        self.stdout.write("🚀 开始重建数据版本登记表")
+
+        route_count = DataVersionService.rebuild_registry()
+
+        global_version = DataVersionRegistry.objects.filter(
+            polCd=DataVersionRegistry.GLOBAL_CODE, podCd=DataVersionRegistry.GLOBAL_CODE
+        ).values_list('data_version', flat=True).first()
+
+        if global_version is None:
+            self.stdout.write(self.style.WARNING("⚠️  没有航线数据，登记表未更新"))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🎉 完成！全局版本: {global_version}，登记航线: {route_count} 条"
+        ))
@@ -0,0 +1,43 @@
+"""
+Django管理命令：根据现有数据重建航线统计和船舶信息统计汇总表
+首次部署统计汇总表、或手工修复数据后执行
+用法：
+    python manage.py rebuild_stats_rollups                      # 重建全部统计
+    python manage.py rebuild_stats_rollups --schedules-only     # 只重建航线统计
+    python manage.py rebuild_stats_rollups --vessel-info-only   # 只重建船舶信息统计
+"""
+from django.core.management.base import BaseCommand, CommandError
+from schedules.services import ScheduleStatsService, VesselInfoStatsService
+
+
+class Command(BaseCommand):
+    help = '根据现有数据重建vessel_schedule_stats和vessel_info_stats统计汇总表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--schedules-only',
+            action='store_true',
+            help='只重建航线统计'
+        )
+
+        parser.add_argument(
+            '--vessel-info-only',
+            action='store_true',
+            help='只重建船舶信息统计'
+        )
+
+    def handle(self, *args, **options):
+        if options['schedules_only'] and options['vessel_info_only']:
+            raise CommandError("--schedules-only 和 --vessel-info-only 不能同时使用")
+
+        self.stdout.write("🚀 开始重建统计汇总表")
+
+        if not options['vessel_info_only']:
+            result = ScheduleStatsService.rebuild()
+            self.stdout.write(f"📊 航线统计: {result['versions']} 个版本，{result['rows']} 行")
+
+        if not options['schedules_only']:
+            result = VesselInfoStatsService.rebuild()
+            self.stdout.write(f"📊 船舶信息统计: {result['rows']} 行")
+
+        self.stdout.write(self.style.SUCCESS("🎉 完成！"))
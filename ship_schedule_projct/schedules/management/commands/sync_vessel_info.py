@@ -5,10 +5,11 @@ Django管理命令：同步VesselSchedule到VesselInfoFromCompany
     python manage.py sync_vessel_info --force           # 强制更新所有记录  
     python manage.py sync_vessel_info --ids 1,2,3       # 只同步指定ID的记录
     python manage.py sync_vessel_info --dry-run         # 预览模式，不实际执行
+    python manage.py sync_vessel_info --chunk-size 2000 # 每批读取和创建2000条
 """
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from schedules.signals import manual_sync_vessel_schedules
+from schedules.signals import manual_sync_vessel_schedules, extract_carrier_codes_from_share_cabins
 from schedules.models import VesselSchedule, VesselInfoFromCompany
 import logging
 
@@ -40,8 +41,8 @@ class Command(BaseCommand):
         parser.add_argument(
             '--chunk-size',
             type=int,
-            default=100,
-            help='每次处理的记录数量，默认100'
+            default=1000,
+            help='每批读取和批量创建的记录数量，默认1000'
         )
 
     def handle(self, *args, **options):
@@ -56,9 +57,12 @@ class Command(BaseCommand):
             except ValueError:
                 raise CommandError("ID列表格式错误，请使用逗号分隔的数字，如: 1,2,3")
         
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size 必须大于0")
+        
         # 预览模式
         if options['dry_run']:
-            self.show_preview(vessel_schedule_ids, options['force'])
+            self.show_preview(vessel_schedule_ids, options['force'], options['chunk_size'])
             return
         
         # 执行同步
@@ -66,7 +70,8 @@ class Command(BaseCommand):
             with transaction.atomic():
                 result = manual_sync_vessel_schedules(
                     vessel_schedule_ids=vessel_schedule_ids,
-                    force_update=options['force']
+                    force_update=options['force'],
+                    chunk_size=options['chunk_size']
                 )
                 
                 self.display_results(result)
@@ -77,64 +82,33 @@ class Command(BaseCommand):
             )
             raise CommandError(f"同步失败: {str(e)}")
 
-    def show_preview(self, vessel_schedule_ids, force_update):
+    def show_preview(self, vessel_schedule_ids, force_update, chunk_size):
         """显示预览信息"""
         self.stdout.write(self.style.WARNING("🔍 预览模式 - 不会实际修改数据"))
         
-        # 构建查询条件
-        queryset = VesselSchedule.objects.filter(status=1)
-        if vessel_schedule_ids:
-            queryset = queryset.filter(id__in=vessel_schedule_ids)
-        
-        total_schedules = queryset.count()
-        self.stdout.write(f"📊 找到 {total_schedules} 条VesselSchedule记录")
+        result = manual_sync_vessel_schedules(
+            vessel_schedule_ids=vessel_schedule_ids,
+            force_update=force_update,
+            chunk_size=chunk_size,
+            dry_run=True
+        )
+        self.stdout.write(f"📊 找到 {result['total_processed']} 条VesselSchedule记录")
         
-        if total_schedules == 0:
+        if result['total_processed'] == 0:
             self.stdout.write("⚠️  没有找到符合条件的记录")
             return
         
-        # 统计将要创建的记录
-        will_create = 0
-        will_update = 0
-        will_skip = 0
-        
-        for schedule in queryset[:10]:  # 只预览前10条
-            from schedules.signals import extract_carrier_codes_from_share_cabins
-            
-            carrier_codes = extract_carrier_codes_from_share_cabins(schedule.shareCabins)
-            if not carrier_codes and schedule.carriercd:
-                carrier_codes = [schedule.carriercd]
-            
-            if not carrier_codes:
-                will_skip += 1
-                continue
-            
-            for carrier_code in carrier_codes:
-                exists = VesselInfoFromCompany.objects.filter(
-                    carriercd=carrier_code,
-                    polCd=schedule.polCd,
-                    podCd=schedule.podCd,
-                    vessel=schedule.vessel,
-                    voyage=schedule.voyage
-                ).exists()
-                
-                if exists:
-                    if force_update:
-                        will_update += 1
-                    else:
-                        will_skip += 1
-                else:
-                    will_create += 1
-        
-        self.stdout.write(f"📈 预计操作 (仅基于前10条记录):")
-        self.stdout.write(f"  ✅ 将创建: {will_create} 条记录")
-        self.stdout.write(f"  🔄 将更新: {will_update} 条记录")
-        self.stdout.write(f"  ⏭️  将跳过: {will_skip} 条记录")
+        self.stdout.write(f"📈 预计操作:")
+        self.stdout.write(f"  ✅ 将创建: {result['created']} 条记录")
+        self.stdout.write(f"  🔄 将更新: {result['updated']} 条记录")
+        self.stdout.write(f"  ⏭️  将跳过: {result['skipped']} 条航线（无船公司信息）")
         
         # 显示样例
-        if queryset.exists():
-            sample = queryset.first()
-            from schedules.signals import extract_carrier_codes_from_share_cabins
+        queryset = VesselSchedule.objects.filter(status=1)
+        if vessel_schedule_ids:
+            queryset = queryset.filter(id__in=vessel_schedule_ids)
+        sample = queryset.first()
+        if sample:
             carrier_codes = extract_carrier_codes_from_share_cabins(sample.shareCabins)
             
             self.stdout.write(f"\n📋 样例记录:")
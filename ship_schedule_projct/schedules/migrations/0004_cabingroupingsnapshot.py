@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0003_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CabinGroupingSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('basic', '共舱分组'), ('with_vessel_info', '共舱分组(含船舶信息)')], max_length=20, verbose_name='分组类型')),
+                ('polCd', models.CharField(max_length=10, verbose_name='起运港五字码')),
+                ('podCd', models.CharField(max_length=10, verbose_name='目的港五字码')),
+                ('data_version', models.IntegerField(verbose_name='数据版本号')),
+                ('payload', models.TextField(verbose_name='分组结果(JSON)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='生成时间')),
+            ],
+            options={
+                'verbose_name': '共舱分组快照',
+                'verbose_name_plural': '共舱分组快照',
+                'db_table': 'cabin_grouping_snapshot',
+                'unique_together': {('kind', 'polCd', 'podCd', 'data_version')},
+            },
+        ),
+    ]
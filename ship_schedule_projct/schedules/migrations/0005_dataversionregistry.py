@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0004_cabingroupingsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersionRegistry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('polCd', models.CharField(blank=True, default='', max_length=10, verbose_name='起运港五字码')),
+                ('podCd', models.CharField(blank=True, default='', max_length=10, verbose_name='目的港五字码')),
+                ('data_version', models.IntegerField(verbose_name='已发布数据版本号')),
+                ('published_at', models.DateTimeField(auto_now=True, verbose_name='发布时间')),
+            ],
+            options={
+                'verbose_name': '数据版本登记',
+                'verbose_name_plural': '数据版本登记',
+                'db_table': 'data_version_registry',
+                'unique_together': {('polCd', 'podCd')},
+            },
+        ),
+    ]
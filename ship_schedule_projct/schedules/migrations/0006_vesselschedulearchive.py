@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0005_dataversionregistry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VesselScheduleArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('polCd', models.CharField(max_length=10, verbose_name='起运港五字码')),
+                ('podCd', models.CharField(max_length=10, verbose_name='目的港五字码')),
+                ('vessel', models.CharField(max_length=100, verbose_name='船名')),
+                ('voyage', models.CharField(max_length=50, verbose_name='航次')),
+                ('content_hash', models.CharField(max_length=64, unique=True, verbose_name='内容哈希')),
+                ('first_version', models.IntegerField(verbose_name='首个版本号')),
+                ('last_version', models.IntegerField(verbose_name='最后版本号')),
+                ('version_count', models.IntegerField(default=0, verbose_name='版本数量')),
+                ('versions', models.TextField(verbose_name='版本号列表(JSON)')),
+                ('payload', models.BinaryField(verbose_name='航线数据(压缩JSON)')),
+                ('archived_at', models.DateTimeField(auto_now=True, verbose_name='归档时间')),
+            ],
+            options={
+                'verbose_name': '船舶航线归档',
+                'verbose_name_plural': '船舶航线归档',
+                'db_table': 'vessel_schedule_archive',
+                'indexes': [models.Index(fields=['polCd', 'podCd', 'vessel', 'voyage'], name='idx_vsa_route_vessel')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0006_vesselschedulearchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='航线内容哈希'),
+        ),
+    ]
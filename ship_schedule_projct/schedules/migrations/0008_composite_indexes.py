@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:52
+
+from django.db import migrations, models
+
+
+# 0003中被新组合索引覆盖的索引：(表名, 索引名, 字段)
+SUPERSEDED_INDEXES = [
+    ('vessel_schedule', 'idx_vessel_schedule_pol_pod', ('polCd', 'podCd')),
+    ('vessel_schedule', 'idx_vessel_schedule_data_version', ('data_version',)),
+    ('vessel_schedule', 'idx_vessel_schedule_carrier', ('carriercd',)),
+    ('vessel_schedule', 'idx_vessel_schedule_vessel_voyage', ('vessel', 'voyage')),
+    ('vessel_schedule', 'idx_vessel_schedule_status', ('status',)),
+    ('vessel_info_from_company', 'idx_vessel_info_pol_pod', ('polCd', 'podCd')),
+    ('vessel_info_from_company', 'idx_vessel_info_carrier', ('carrierCd',)),
+]
+
+
+def drop_superseded_indexes(apps, schema_editor):
+    """删除被组合索引覆盖的单列/前缀索引（不存在时跳过）"""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for table, index_name, _ in SUPERSEDED_INDEXES:
+            constraints = connection.introspection.get_constraints(cursor, table)
+            if index_name not in constraints:
+                continue
+            if connection.vendor == 'mysql':
+                schema_editor.execute(f'DROP INDEX {index_name} ON {table}')
+            else:
+                schema_editor.execute(f'DROP INDEX {index_name}')
+
+
+def restore_superseded_indexes(apps, schema_editor):
+    """回滚时恢复0003中的索引"""
+    for table, index_name, fields in SUPERSEDED_INDEXES:
+        columns = ', '.join(fields)
+        schema_editor.execute(f'CREATE INDEX {index_name} ON {table} ({columns})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0007_vesselschedule_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vesselinfofromcompany',
+            index=models.Index(fields=['polCd', 'podCd', 'vessel', 'voyage', 'carrierCd'], name='idx_vi_route_lookup'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['polCd', 'podCd', 'status', 'data_version'], name='idx_vs_route_lookup'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['carriercd', 'status'], name='idx_vs_carrier_status'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['vessel', 'voyage'], name='idx_vs_vessel_voyage'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['data_version', 'status'], name='idx_vs_version_status'),
+        ),
+        migrations.RunPython(drop_superseded_indexes, restore_superseded_indexes),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0008_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='vesselschedule',
+            name='idx_vs_route_lookup',
+        ),
+        migrations.RemoveIndex(
+            model_name='vesselschedule',
+            name='idx_vs_version_status',
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='booking_cutoff_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='截订舱时间(时间类型)'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='custom_cutoff_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='截放行(时间类型)'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='cut_off_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='截申报(时间类型)'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='cy_close_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='截港时间(时间类型)'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='cy_open_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='进港时间(时间类型)'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='eta_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='计划到港时间'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='etd_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='计划离港时间'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='si_cutoff_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='截单时间(时间类型)'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='vgm_cutoff_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='截VGM时间(时间类型)'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['polCd', 'podCd', 'status', 'data_version', 'etd_at'], name='idx_vs_route_lookup'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['data_version', 'status', 'etd_at'], name='idx_vs_version_status'),
+        ),
+    ]
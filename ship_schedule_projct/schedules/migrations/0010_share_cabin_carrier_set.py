@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0009_vesselschedule_typed_datetimes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VesselScheduleShareCabin',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('carrierCd', models.CharField(max_length=20, verbose_name='船公司')),
+                ('sort_order', models.PositiveSmallIntegerField(default=0, verbose_name='在shareCabins中的顺序')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='价格')),
+                ('available', models.BooleanField(blank=True, null=True, verbose_name='是否可用')),
+                ('remark', models.CharField(blank=True, max_length=255, null=True, verbose_name='备注')),
+            ],
+            options={
+                'verbose_name': '航线共舱船公司',
+                'verbose_name_plural': '航线共舱船公司',
+                'db_table': 'vessel_schedule_share_cabin',
+            },
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='carrier_set',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='共舱船公司集合'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedule',
+            name='carrier_set_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='共舱船公司集合哈希'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['polCd', 'podCd', 'data_version', 'carrier_set_hash'], name='idx_vs_carrier_set'),
+        ),
+        migrations.AddField(
+            model_name='vesselschedulesharecabin',
+            name='schedule',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='share_cabin_rows', to='schedules.vesselschedule', verbose_name='航线'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedulesharecabin',
+            index=models.Index(fields=['carrierCd', 'schedule'], name='idx_vssc_carrier_schedule'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='vesselschedulesharecabin',
+            unique_together={('schedule', 'carrierCd')},
+        ),
+    ]
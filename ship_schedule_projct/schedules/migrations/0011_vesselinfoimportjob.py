@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('schedules', '0010_share_cabin_carrier_set'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VesselInfoImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255, verbose_name='文件名')),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel(XLSX)')], max_length=10, verbose_name='文件格式')),
+                ('status', models.CharField(choices=[('pending', '等待导入'), ('running', '导入中'), ('completed', '已完成'), ('failed', '导入失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('processed_rows', models.IntegerField(default=0, verbose_name='已处理行数')),
+                ('created_count', models.IntegerField(default=0, verbose_name='新增记录数')),
+                ('updated_count', models.IntegerField(default=0, verbose_name='更新记录数')),
+                ('failed_count', models.IntegerField(default=0, verbose_name='失败行数')),
+                ('message', models.TextField(blank=True, default='', verbose_name='结果说明')),
+                ('error_report', models.FileField(blank=True, null=True, upload_to='imports/vessel_info/', verbose_name='错误报告')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vessel_info_import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='导入人')),
+            ],
+            options={
+                'verbose_name': '船舶信息导入任务',
+                'verbose_name_plural': '船舶信息导入任务',
+                'db_table': 'vessel_info_import_job',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
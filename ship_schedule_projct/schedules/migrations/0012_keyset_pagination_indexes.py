@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0011_vesselinfoimportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['status', 'fetch_date'], name='idx_vs_status_fetch_date'),
+        ),
+        migrations.AddIndex(
+            model_name='vesselschedule',
+            index=models.Index(fields=['status', 'etd_at'], name='idx_vs_status_etd'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0012_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VesselScheduleStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_version', models.IntegerField(verbose_name='数据版本号')),
+                ('status', models.SmallIntegerField(verbose_name='数据状态：1-有效，0-无效')),
+                ('dimension', models.CharField(choices=[('carrier', '船公司'), ('pol', '起运港'), ('pod', '目的港')], max_length=10, verbose_name='统计维度')),
+                ('code', models.CharField(blank=True, default='', max_length=20, verbose_name='船公司代码/港口五字码')),
+                ('name', models.CharField(blank=True, default='', max_length=100, verbose_name='港口名称')),
+                ('count', models.IntegerField(default=0, verbose_name='航线数量')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '航线统计',
+                'verbose_name_plural': '航线统计',
+                'db_table': 'vessel_schedule_stats',
+                'indexes': [models.Index(fields=['dimension', 'status'], name='idx_vss_dimension_status')],
+                'unique_together': {('data_version', 'status', 'dimension', 'code', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='VesselInfoStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('carrier', '船公司'), ('route', '航线')], max_length=10, verbose_name='统计维度')),
+                ('carrierCd', models.CharField(blank=True, default='', max_length=10, verbose_name='船公司')),
+                ('polCd', models.CharField(blank=True, default='', max_length=10, verbose_name='起运港五字码')),
+                ('podCd', models.CharField(blank=True, default='', max_length=10, verbose_name='目的港五字码')),
+                ('total_count', models.IntegerField(default=0, verbose_name='船舶信息数量')),
+                ('filled_count', models.IntegerField(default=0, verbose_name='已填写数量')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '船舶信息统计',
+                'verbose_name_plural': '船舶信息统计',
+                'db_table': 'vessel_info_stats',
+                'unique_together': {('dimension', 'carrierCd', 'polCd', 'podCd')},
+            },
+        ),
+    ]
@@ -1,3 +1,7 @@
+import json
+import zlib
+
+from django.conf import settings
 from django.db import models
 
 # Create your models here.
@@ -51,6 +55,17 @@ class VesselSchedule(models.Model):
     siCutoff = models.CharField(max_length=30, blank=True, null=True, verbose_name="截单时间")
     vgmCutoff = models.CharField(max_length=30, blank=True, null=True, verbose_name="截VGM时间")
     
+    # 时间字段的类型化副本（由抓取程序写入或backfill_schedule_datetimes回填），用于数据库内的范围过滤和排序
+    eta_at = models.DateTimeField(blank=True, null=True, verbose_name="计划到港时间")
+    etd_at = models.DateTimeField(blank=True, null=True, verbose_name="计划离港时间")
+    booking_cutoff_at = models.DateTimeField(blank=True, null=True, verbose_name="截订舱时间(时间类型)")
+    cy_open_at = models.DateTimeField(blank=True, null=True, verbose_name="进港时间(时间类型)")
+    cy_close_at = models.DateTimeField(blank=True, null=True, verbose_name="截港时间(时间类型)")
+    custom_cutoff_at = models.DateTimeField(blank=True, null=True, verbose_name="截放行(时间类型)")
+    cut_off_at = models.DateTimeField(blank=True, null=True, verbose_name="截申报(时间类型)")
+    si_cutoff_at = models.DateTimeField(blank=True, null=True, verbose_name="截单时间(时间类型)")
+    vgm_cutoff_at = models.DateTimeField(blank=True, null=True, verbose_name="截VGM时间(时间类型)")
+    
     # 中转相关信息
     isTransit = models.CharField(max_length=5, blank=True, null=True, verbose_name="是否中转")
     transitPortEn = models.CharField(max_length=100, blank=True, null=True, verbose_name="中转1港口名")
@@ -69,6 +84,36 @@ class VesselSchedule(models.Model):
     ext_field2 = models.CharField(max_length=255, blank=True, null=True, verbose_name="扩展字段2")
     ext_field3 = models.TextField(blank=True, null=True, verbose_name="扩展字段3")
     
+    # 抓取程序计算的航线内容哈希，与上一版本相同的航线在库内复制到新版本（仍为完整记录）；通过ORM修改时清空
+    content_hash = models.CharField(max_length=64, blank=True, null=True, verbose_name="航线内容哈希")
+    
+    # 共舱船公司集合：shareCabins中去重排序后的船公司代码（逗号分隔）及其哈希，保存时写入，
+    # 共舱分组直接按该字段分组，不再逐条解析shareCabins；为空表示尚未回填
+    carrier_set = models.CharField(max_length=255, blank=True, null=True, verbose_name="共舱船公司集合")
+    carrier_set_hash = models.CharField(max_length=64, blank=True, null=True, verbose_name="共舱船公司集合哈希")
+    
+    # 修改共舱配置时需要一并保存的字段（carrier_set由pre_save信号根据shareCabins计算，content_hash由pre_save信号清空）
+    SHARE_CABIN_FIELDS = ('shareCabins', 'carrier_set', 'carrier_set_hash', 'content_hash')
+    
+    # 字符串时间字段 -> 类型化时间字段
+    DATETIME_FIELDS = {
+        'eta': 'eta_at',
+        'etd': 'etd_at',
+        'bookingCutoff': 'booking_cutoff_at',
+        'cyOpen': 'cy_open_at',
+        'cyClose': 'cy_close_at',
+        'customCutoff': 'custom_cutoff_at',
+        'cutOff': 'cut_off_at',
+        'siCutoff': 'si_cutoff_at',
+        'vgmCutoff': 'vgm_cutoff_at',
+    }
+    
+    # 由其他字段推导、只修改这些字段时不清空content_hash的字段
+    DERIVED_FIELDS = frozenset(DATETIME_FIELDS.values()) | {'carrier_set', 'carrier_set_hash', 'content_hash'}
+    
+    # 航线统计的维度字段，逐条保存/删除时按变化前后的取值增量更新统计
+    STATS_FIELDS = ('data_version', 'status', 'carriercd', 'polCd', 'pol', 'podCd', 'pod')
+    
     class Meta:
         """元数据类"""
         db_table = 'vessel_schedule'  # 数据库表名
@@ -76,21 +121,78 @@ class VesselSchedule(models.Model):
         verbose_name_plural = '船舶航线'
         # 组合唯一约束，确保在同一版本中不会有重复的航线
         unique_together = ('polCd', 'podCd', 'vessel', 'voyage', 'data_version')
-        # 数据库索引优化 - 暂时注释以解决启动问题
-        # indexes = [
-        #     models.Index(fields=['polCd', 'podCd', 'status'], name='idx_vs_pol_pod_status'),
-        #     models.Index(fields=['carriercd', 'status'], name='idx_vs_carrier_status'),
-        #     models.Index(fields=['vessel', 'voyage'], name='idx_vs_vessel_voyage'),
-        #     models.Index(fields=['data_version', 'status'], name='idx_vs_version_status'),
-        #     models.Index(fields=['-fetch_date'], name='idx_vs_fetch_date_desc'),
-        #     models.Index(fields=['polCd', 'podCd', 'carriercd', 'status', 'data_version'], name='idx_vs_route_lookup'),
-        # ]
+        # 数据库索引（迁移0008同时删除0003中被以下组合索引覆盖的单列索引）
+        indexes = [
+            # 航线查询：按航线读取某一版本的有效数据（可按ETD范围过滤、排序），以及按航线取最新有效版本
+            models.Index(fields=['polCd', 'podCd', 'status', 'data_version', 'etd_at'], name='idx_vs_route_lookup'),
+            # 按船公司筛选有效航线
+            models.Index(fields=['carriercd', 'status'], name='idx_vs_carrier_status'),
+            # 按船名航次查询
+            models.Index(fields=['vessel', 'voyage'], name='idx_vs_vessel_voyage'),
+            # 按版本读取/归档有效数据、全局最新版本聚合，以及跨航线的ETD范围查询
+            models.Index(fields=['data_version', 'status', 'etd_at'], name='idx_vs_version_status'),
+            # 按航线、版本对共舱船公司组合做GROUP BY
+            models.Index(fields=['polCd', 'podCd', 'data_version', 'carrier_set_hash'], name='idx_vs_carrier_set'),
+            # 列表/搜索接口的游标分页：按 (fetch_date, id) 或 (etd_at, id) 定位有效数据（索引隐含主键列）
+            models.Index(fields=['status', 'fetch_date'], name='idx_vs_status_fetch_date'),
+            models.Index(fields=['status', 'etd_at'], name='idx_vs_status_etd'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """从数据库加载时记录统计维度，保存/删除时据此增量更新航线统计"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stats_state = instance.get_stats_state()
+        return instance
+
+    def get_stats_state(self):
+        """
+        统计维度 (data_version, status, carriercd, polCd, pol, podCd, pod)；字段被延迟加载时返回None
+        """
+        if self.get_deferred_fields() & set(self.STATS_FIELDS):
+            return None
+        return tuple(getattr(self, field) for field in self.STATS_FIELDS)
         
     def __str__(self):
         """字符串表示"""
         return f"{self.vessel} {self.voyage}: {self.pol}({self.polCd}) → {self.pod}({self.podCd})"
 
 
+class VesselScheduleShareCabin(models.Model):
+    """
+    航线共舱船公司明细
+    由VesselSchedule.shareCabins拆分而来，每个共舱船公司一条记录，写入航线时同步；
+    用于按船公司查询其参与共舱的全部航线，shareCabins仍是接口返回的原始数据。
+    不建数据库外键约束，抓取程序和归档可以直接按SQL删除航线
+    """
+    schedule = models.ForeignKey(
+        VesselSchedule, on_delete=models.CASCADE, db_constraint=False,
+        related_name='share_cabin_rows', verbose_name="航线"
+    )
+    carrierCd = models.CharField(max_length=20, verbose_name="船公司")
+    sort_order = models.PositiveSmallIntegerField(default=0, verbose_name="在shareCabins中的顺序")
+
+    # 共舱配置（cabin_config_update_api维护的字段）
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="价格")
+    available = models.BooleanField(null=True, blank=True, verbose_name="是否可用")
+    remark = models.CharField(max_length=255, blank=True, null=True, verbose_name="备注")
+
+    class Meta:
+        """元数据类"""
+        db_table = 'vessel_schedule_share_cabin'
+        verbose_name = '航线共舱船公司'
+        verbose_name_plural = '航线共舱船公司'
+        unique_together = ('schedule', 'carrierCd')
+        indexes = [
+            # 按船公司查询参与共舱的航线
+            models.Index(fields=['carrierCd', 'schedule'], name='idx_vssc_carrier_schedule'),
+        ]
+
+    def __str__(self):
+        """字符串表示"""
+        return f"{self.schedule_id}: {self.carrierCd}"
+
+
 class VesselInfoFromCompany(models.Model):
     """
     船舶价格和舱位,截关时间补充信息
@@ -116,14 +218,263 @@ class VesselInfoFromCompany(models.Model):
         verbose_name_plural = '船舶额外信息'
         # 组合唯一约束
         unique_together = ('carrierCd', 'polCd', 'podCd', 'vessel', 'voyage')
-        # 数据库索引优化 - 暂时注释以解决启动问题
-        # indexes = [
-        #     models.Index(fields=['carrierCd', 'polCd', 'podCd'], name='idx_vi_carrier_pol_pod'),
-        #     models.Index(fields=['vessel', 'voyage'], name='idx_vi_vessel_voyage'),
-        #     models.Index(fields=['price'], name='idx_vi_price'),
-        # ]
+        # 数据库索引：唯一约束以船公司开头，只能用于带船公司的精确查询；
+        # 按航线加载船舶信息（共舱分组、航线船舶信息映射）使用以航线开头的五字段索引
+        indexes = [
+            models.Index(fields=['polCd', 'podCd', 'vessel', 'voyage', 'carrierCd'], name='idx_vi_route_lookup'),
+        ]
         
+    # 判断是否已填写补充信息的字段（任一不为空即视为已填写）
+    FILLED_FIELDS = ('gp_20', 'hq_40', 'cut_off_time', 'price')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """从数据库加载时记录统计维度，保存/删除时据此增量更新船舶信息统计"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stats_state = instance.get_stats_state()
+        return instance
+
+    def is_filled(self):
+        """是否已填写价格、舱位或截关时间"""
+        return any(getattr(self, field) is not None for field in self.FILLED_FIELDS)
+
+    def get_stats_state(self):
+        """
+        统计维度 (carrierCd, polCd, podCd, 是否已填写)；字段被延迟加载时返回None
+        """
+        deferred = self.get_deferred_fields()
+        if deferred & {'carrierCd', 'polCd', 'podCd', *self.FILLED_FIELDS}:
+            return None
+        return self.carrierCd, self.polCd, self.podCd, self.is_filled()
+
     def __str__(self):
         """字符串表示"""
         return f"{self.vessel} {self.voyage}: {self.carrierCd} {self.polCd} → {self.podCd}, ¥{self.price if self.price else '--'}"
 
+
+
+class VesselScheduleArchive(models.Model):
+    """
+    船舶航线历史版本归档
+    超出保留范围的历史版本从vessel_schedule迁移到此表。内容相同的航线在多个版本中
+    只保存一条记录，versions记录其出现过的全部版本号；航线内容以zlib压缩的JSON保存
+    """
+    polCd = models.CharField(max_length=10, verbose_name="起运港五字码")
+    podCd = models.CharField(max_length=10, verbose_name="目的港五字码")
+    vessel = models.CharField(max_length=100, verbose_name="船名")
+    voyage = models.CharField(max_length=50, verbose_name="航次")
+    content_hash = models.CharField(max_length=64, unique=True, verbose_name="内容哈希")
+    first_version = models.IntegerField(verbose_name="首个版本号")
+    last_version = models.IntegerField(verbose_name="最后版本号")
+    version_count = models.IntegerField(default=0, verbose_name="版本数量")
+    versions = models.TextField(verbose_name="版本号列表(JSON)")
+    payload = models.BinaryField(verbose_name="航线数据(压缩JSON)")
+    archived_at = models.DateTimeField(auto_now=True, verbose_name="归档时间")
+
+    class Meta:
+        """元数据类"""
+        db_table = 'vessel_schedule_archive'
+        verbose_name = '船舶航线归档'
+        verbose_name_plural = '船舶航线归档'
+        indexes = [
+            models.Index(fields=['polCd', 'podCd', 'vessel', 'voyage'], name='idx_vsa_route_vessel'),
+        ]
+
+    def get_payload(self):
+        """解压并返回归档的航线数据"""
+        return json.loads(zlib.decompress(bytes(self.payload)).decode('utf-8'))
+
+    def get_versions(self):
+        """返回该内容出现过的版本号列表"""
+        return json.loads(self.versions)
+
+    def __str__(self):
+        """字符串表示"""
+        return f"{self.vessel} {self.voyage}: {self.polCd} → {self.podCd} v{self.first_version}-v{self.last_version}"
+
+
+class VesselScheduleStats(models.Model):
+    """
+    航线统计汇总表
+    按(数据版本, 状态, 维度, 代码, 名称)汇总航线数量，维度为船公司、起运港、目的港；
+    爬虫发布版本时及航线修改后按数据版本重算，统计接口只读取本表，不扫描vessel_schedule
+    """
+    DIMENSION_CARRIER = 'carrier'
+    DIMENSION_POL = 'pol'
+    DIMENSION_POD = 'pod'
+    DIMENSION_CHOICES = (
+        (DIMENSION_CARRIER, '船公司'),
+        (DIMENSION_POL, '起运港'),
+        (DIMENSION_POD, '目的港'),
+    )
+
+    data_version = models.IntegerField(verbose_name="数据版本号")
+    status = models.SmallIntegerField(verbose_name="数据状态：1-有效，0-无效")
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES, verbose_name="统计维度")
+    code = models.CharField(max_length=20, blank=True, default='', verbose_name="船公司代码/港口五字码")
+    name = models.CharField(max_length=100, blank=True, default='', verbose_name="港口名称")
+    count = models.IntegerField(default=0, verbose_name="航线数量")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        """元数据类"""
+        db_table = 'vessel_schedule_stats'
+        verbose_name = '航线统计'
+        verbose_name_plural = '航线统计'
+        unique_together = ('data_version', 'status', 'dimension', 'code', 'name')
+        indexes = [
+            models.Index(fields=['dimension', 'status'], name='idx_vss_dimension_status'),
+        ]
+
+    def __str__(self):
+        """字符串表示"""
+        return f"v{self.data_version} {self.dimension}:{self.code or '-'} status={self.status} {self.count}"
+
+
+class VesselInfoStats(models.Model):
+    """
+    船舶信息统计汇总表
+    按船公司、航线汇总船舶信息总数和已填写数；船舶信息写入时增量更新，
+    同步状态接口只读取本表
+    """
+    DIMENSION_CARRIER = 'carrier'
+    DIMENSION_ROUTE = 'route'
+    DIMENSION_CHOICES = (
+        (DIMENSION_CARRIER, '船公司'),
+        (DIMENSION_ROUTE, '航线'),
+    )
+
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES, verbose_name="统计维度")
+    carrierCd = models.CharField(max_length=10, blank=True, default='', verbose_name="船公司")
+    polCd = models.CharField(max_length=10, blank=True, default='', verbose_name="起运港五字码")
+    podCd = models.CharField(max_length=10, blank=True, default='', verbose_name="目的港五字码")
+    total_count = models.IntegerField(default=0, verbose_name="船舶信息数量")
+    filled_count = models.IntegerField(default=0, verbose_name="已填写数量")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        """元数据类"""
+        db_table = 'vessel_info_stats'
+        verbose_name = '船舶信息统计'
+        verbose_name_plural = '船舶信息统计'
+        unique_together = ('dimension', 'carrierCd', 'polCd', 'podCd')
+
+    def __str__(self):
+        """字符串表示"""
+        if self.dimension == self.DIMENSION_CARRIER:
+            return f"{self.carrierCd}: {self.filled_count}/{self.total_count}"
+        return f"{self.polCd} → {self.podCd}: {self.filled_count}/{self.total_count}"
+
+
+class DataVersionRegistry(models.Model):
+    """
+    数据版本登记表
+    记录当前已发布的数据版本：polCd、podCd为空字符串的记录表示全局版本，
+    其余记录表示各航线(polCd, podCd)的已发布版本。由爬虫发布版本时更新，
+    接口通过主键级别的查询读取，避免对vessel_schedule全表做MAX聚合
+    """
+    GLOBAL_CODE = ''
+
+    polCd = models.CharField(max_length=10, blank=True, default=GLOBAL_CODE, verbose_name="起运港五字码")
+    podCd = models.CharField(max_length=10, blank=True, default=GLOBAL_CODE, verbose_name="目的港五字码")
+    data_version = models.IntegerField(verbose_name="已发布数据版本号")
+    published_at = models.DateTimeField(auto_now=True, verbose_name="发布时间")
+
+    class Meta:
+        """元数据类"""
+        db_table = 'data_version_registry'
+        verbose_name = '数据版本登记'
+        verbose_name_plural = '数据版本登记'
+        unique_together = ('polCd', 'podCd')
+
+    def __str__(self):
+        """字符串表示"""
+        route = f"{self.polCd} → {self.podCd}" if self.polCd or self.podCd else '全局'
+        return f"{route}: v{self.data_version}"
+
+
+class CabinGroupingSnapshot(models.Model):
+    """
+    共舱分组结果快照
+    按(分组类型, polCd, podCd, data_version)保存已计算完成的分组结果，
+    前台查询时直接读取，避免每次请求重复解析shareCabins并重新分组
+    """
+    KIND_BASIC = 'basic'
+    KIND_WITH_VESSEL_INFO = 'with_vessel_info'
+    KIND_CHOICES = (
+        (KIND_BASIC, '共舱分组'),
+        (KIND_WITH_VESSEL_INFO, '共舱分组(含船舶信息)'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="分组类型")
+    polCd = models.CharField(max_length=10, verbose_name="起运港五字码")
+    podCd = models.CharField(max_length=10, verbose_name="目的港五字码")
+    data_version = models.IntegerField(verbose_name="数据版本号")
+    payload = models.TextField(verbose_name="分组结果(JSON)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="生成时间")
+
+    class Meta:
+        """元数据类"""
+        db_table = 'cabin_grouping_snapshot'
+        verbose_name = '共舱分组快照'
+        verbose_name_plural = '共舱分组快照'
+        unique_together = ('kind', 'polCd', 'podCd', 'data_version')
+
+    def __str__(self):
+        """字符串表示"""
+        return f"{self.kind} {self.polCd} → {self.podCd} v{self.data_version}"
+
+
+class VesselInfoImportJob(models.Model):
+    """
+    船舶额外信息导入任务
+    记录价格表（CSV/XLSX）导入的进度和结果；导入过程中按批更新进度，
+    校验失败的行写入错误报告文件供下载
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, '等待导入'),
+        (STATUS_RUNNING, '导入中'),
+        (STATUS_COMPLETED, '已完成'),
+        (STATUS_FAILED, '导入失败'),
+    )
+
+    FORMAT_CSV = 'csv'
+    FORMAT_XLSX = 'xlsx'
+    FORMAT_CHOICES = (
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_XLSX, 'Excel(XLSX)'),
+    )
+
+    file_name = models.CharField(max_length=255, verbose_name="文件名")
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, verbose_name="文件格式")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="状态")
+    processed_rows = models.IntegerField(default=0, verbose_name="已处理行数")
+    created_count = models.IntegerField(default=0, verbose_name="新增记录数")
+    updated_count = models.IntegerField(default=0, verbose_name="更新记录数")
+    failed_count = models.IntegerField(default=0, verbose_name="失败行数")
+    message = models.TextField(blank=True, default='', verbose_name="结果说明")
+    error_report = models.FileField(
+        upload_to='imports/vessel_info/', blank=True, null=True, verbose_name="错误报告"
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='vessel_info_import_jobs', verbose_name="导入人"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="开始时间")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="完成时间")
+
+    class Meta:
+        """元数据类"""
+        db_table = 'vessel_info_import_job'
+        verbose_name = '船舶信息导入任务'
+        verbose_name_plural = '船舶信息导入任务'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        """字符串表示"""
+        return f"{self.file_name} ({self.get_status_display()}): {self.processed_rows}行"
@@ -95,10 +95,20 @@ class VesselInfoFromCompanySerializer(serializers.ModelSerializer):
         # 验证价格不能为负数
         if data.get('price') is not None and data['price'] < 0:
             raise serializers.ValidationError("价格不能为负数")
-            
+
         return data
 
 
+class VesselInfoBulkItemSerializer(VesselInfoFromCompanySerializer):
+    """
+    批量写入时逐条校验用的船舶额外信息序列化器
+    去掉组合唯一校验（每条记录一次查询），由批量服务按关联键统一查询判断
+    """
+
+    class Meta(VesselInfoFromCompanySerializer.Meta):
+        validators = []
+
+
 class GroupedScheduleSerializer(serializers.Serializer):
     """分组航线序列化器（用于共舱分组API）"""
     
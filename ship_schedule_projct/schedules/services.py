@@ -2,30 +2,649 @@
 船舶航线业务逻辑服务层
 将复杂的业务逻辑从视图中分离出来
 """
+import csv
+import hashlib
+import io
 import json
 import logging
+import tempfile
+import zlib
+from collections import defaultdict, Counter
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from typing import List, Dict, Optional, Tuple
-from django.db import transaction
-from django.db.models import Q, Prefetch, Count, Max
+from django.db import connection, transaction, DatabaseError, IntegrityError
+from django.db.models import F, Q, Prefetch, Count, Max, Min, Sum, Case, When, Value
 from django.core.cache import cache
+from django.core.files import File
 from django.conf import settings
+from django.utils import timezone
 
-from .models import VesselSchedule, VesselInfoFromCompany
-from ship_schedule.utils import CacheHelper, ValidationHelper
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import (
+    VesselSchedule, VesselInfoFromCompany, CabinGroupingSnapshot,
+    DataVersionRegistry, VesselScheduleArchive, VesselScheduleShareCabin, VesselInfoImportJob,
+    VesselScheduleStats, VesselInfoStats
+)
+from .serializers import VesselInfoFromCompanySerializer, VesselInfoBulkItemSerializer
+from .signals import bulk_vessel_schedule_sync, invalidate_vessel_info_snapshots
+from ship_schedule.utils import CacheHelper, ConditionalGetHelper, KeysetPagination, ValidationHelper
 
 logger = logging.getLogger(__name__)
 
 
+class DataVersionService:
+    """
+    数据版本服务类
+    通过数据版本登记表读取当前已发布的版本，结果写入缓存，
+    请求处理时无需再对vessel_schedule做MAX(data_version)聚合
+    """
+
+    CACHE_KEY = 'data_version:latest:{pol_cd}:{pod_cd}'
+
+    @staticmethod
+    def get_latest_version(pol_cd: str = None, pod_cd: str = None) -> Optional[int]:
+        """
+        获取已发布的最新数据版本号
+
+        Args:
+            pol_cd: 起运港代码，与pod_cd同时为空时返回全局版本
+            pod_cd: 目的港代码
+
+        Returns:
+            Optional[int]: 数据版本号，没有任何数据时返回None
+        """
+        pol_cd = pol_cd or DataVersionRegistry.GLOBAL_CODE
+        pod_cd = pod_cd or DataVersionRegistry.GLOBAL_CODE
+        cache_key = DataVersionService.CACHE_KEY.format(pol_cd=pol_cd, pod_cd=pod_cd)
+
+        return CacheHelper.get_or_set(
+            cache_key,
+            lambda: DataVersionService._load_latest_version(pol_cd, pod_cd),
+            timeout=getattr(settings, 'DATA_VERSION_CACHE_TIMEOUT', 60)
+        )
+
+    @staticmethod
+    def get_latest_versions(routes) -> Dict[Tuple[str, str], Optional[int]]:
+        """
+        批量获取多条航线已发布的最新数据版本号，与get_latest_version共用缓存
+
+        缓存一次get_many读取；未命中的航线一次查询登记表，登记表中没有的航线再一次分组聚合
+
+        Args:
+            routes: [(polCd, podCd), ...]
+
+        Returns:
+            Dict: {(polCd, podCd): 数据版本号或None}
+        """
+        keys = {
+            route: DataVersionService.CACHE_KEY.format(pol_cd=route[0], pod_cd=route[1])
+            for route in routes
+        }
+        try:
+            cached = cache.get_many(list(keys.values()))
+        except Exception as e:
+            logger.warning(f"缓存操作失败: {e}")
+            cached = {}
+
+        versions = {route: cached.get(key) for route, key in keys.items()}
+        missing = [route for route, version in versions.items() if version is None]
+        if not missing:
+            return versions
+
+        loaded = DataVersionService._load_latest_versions(missing)
+        versions.update(loaded)
+        try:
+            cache.set_many(
+                {keys[route]: version for route, version in loaded.items() if version is not None},
+                getattr(settings, 'DATA_VERSION_CACHE_TIMEOUT', 60)
+            )
+        except Exception as e:
+            logger.warning(f"缓存操作失败: {e}")
+        return versions
+
+    @staticmethod
+    def _load_latest_versions(routes) -> Dict[Tuple[str, str], Optional[int]]:
+        """批量读取登记表中的航线版本号，没有登记的航线按_load_latest_version的规则回退到聚合查询"""
+        global_code = DataVersionRegistry.GLOBAL_CODE
+        rows = DataVersionRegistry.objects.filter(
+            polCd__in={pol_cd for pol_cd, _ in routes} | {global_code},
+            podCd__in={pod_cd for _, pod_cd in routes} | {global_code},
+        ).values_list('polCd', 'podCd', 'data_version')
+        pointers = {(row[0], row[1]): row[2] for row in rows}
+
+        versions = {route: pointers.get(route) for route in routes}
+        unregistered = [route for route in routes if route not in pointers]
+        if not unregistered:
+            return versions
+
+        condition = Q()
+        for pol_cd, pod_cd in unregistered:
+            condition |= Q(polCd=pol_cd, podCd=pod_cd)
+        queryset = VesselSchedule.objects.filter(condition, status=1)
+
+        global_version = pointers.get((global_code, global_code))
+        if global_version is not None:
+            queryset = queryset.filter(data_version__lte=global_version)
+
+        for row in queryset.order_by().values('polCd', 'podCd').annotate(max_version=Max('data_version')):
+            versions[(row['polCd'], row['podCd'])] = row['max_version']
+        return versions
+
+    @staticmethod
+    def _load_latest_version(pol_cd: str, pod_cd: str) -> Optional[int]:
+        """
+        从登记表读取版本号，登记表尚无记录时（如历史数据未登记）回退到聚合查询
+
+        回退查询不会超过已发布的全局版本，爬虫暂存中的版本不会被读取
+        """
+        # 一次查询同时取出航线版本和全局版本
+        rows = DataVersionRegistry.objects.filter(
+            polCd__in={pol_cd, DataVersionRegistry.GLOBAL_CODE},
+            podCd__in={pod_cd, DataVersionRegistry.GLOBAL_CODE},
+        ).values_list('polCd', 'podCd', 'data_version')
+        pointers = {(row[0], row[1]): row[2] for row in rows}
+
+        if (pol_cd, pod_cd) in pointers:
+            return pointers[(pol_cd, pod_cd)]
+
+        queryset = VesselSchedule.objects.all()
+        if pol_cd or pod_cd:
+            queryset = queryset.filter(polCd=pol_cd, podCd=pod_cd, status=1)
+
+        global_version = pointers.get((DataVersionRegistry.GLOBAL_CODE, DataVersionRegistry.GLOBAL_CODE))
+        if global_version is not None:
+            queryset = queryset.filter(data_version__lte=global_version)
+
+        return queryset.aggregate(max_version=Max('data_version'))['max_version']
+
+    @staticmethod
+    def publish(data_version: int, routes=None) -> None:
+        """
+        发布数据版本：更新全局版本及指定航线的版本，并清除对应缓存
+
+        Args:
+            data_version: 要发布的数据版本号
+            routes: 本次发布涉及的航线 [(polCd, podCd), ...]
+        """
+        pointers = [(DataVersionRegistry.GLOBAL_CODE, DataVersionRegistry.GLOBAL_CODE)]
+        pointers.extend(set(routes or []))
+
+        with transaction.atomic():
+            for pol_cd, pod_cd in pointers:
+                DataVersionRegistry.objects.update_or_create(
+                    polCd=pol_cd, podCd=pod_cd,
+                    defaults={'data_version': data_version}
+                )
+
+        DataVersionService.clear_cache(pointers)
+
+    @staticmethod
+    def rebuild_registry() -> int:
+        """
+        根据现有航线数据重建登记表（全局取最大版本，各航线取各自有效数据的最大版本）
+
+        Returns:
+            int: 登记的航线数量（不含全局记录）
+        """
+        global_version = VesselSchedule.objects.aggregate(
+            max_version=Max('data_version')
+        )['max_version']
+        if global_version is None:
+            return 0
+
+        routes = VesselSchedule.objects.filter(status=1).values(
+            'polCd', 'podCd'
+        ).annotate(max_version=Max('data_version'))
+
+        pointers = [(DataVersionRegistry.GLOBAL_CODE, DataVersionRegistry.GLOBAL_CODE)]
+        with transaction.atomic():
+            DataVersionRegistry.objects.update_or_create(
+                polCd=DataVersionRegistry.GLOBAL_CODE, podCd=DataVersionRegistry.GLOBAL_CODE,
+                defaults={'data_version': global_version}
+            )
+            for route in routes:
+                DataVersionRegistry.objects.update_or_create(
+                    polCd=route['polCd'], podCd=route['podCd'],
+                    defaults={'data_version': route['max_version']}
+                )
+                pointers.append((route['polCd'], route['podCd']))
+
+        DataVersionService.clear_cache(pointers)
+        return len(pointers) - 1
+
+    @staticmethod
+    def clear_cache(routes) -> None:
+        """
+        清除指定航线的版本缓存
+
+        Args:
+            routes: [(polCd, podCd), ...]，全局版本使用空字符串
+        """
+        try:
+            cache.delete_many([
+                DataVersionService.CACHE_KEY.format(pol_cd=pol_cd, pod_cd=pod_cd)
+                for pol_cd, pod_cd in routes
+            ])
+        except Exception as e:
+            logger.warning(f"清除数据版本缓存失败: {e}")
+
+
+class ScheduleDateTimeService:
+    """
+    航线时间字段服务类
+    将eta、etd及各截止时间等字符串字段解析为类型化时间字段，
+    ETD范围过滤、近N天开船筛选和最早ETD选择由数据库通过索引完成，无需逐条解析字符串
+    """
+
+    # 抓取数据中出现的时间格式，时间按settings.TIME_ZONE解释
+    DATETIME_FORMATS = (
+        '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+        '%Y/%m/%d %H:%M:%S', '%Y/%m/%d',
+    )
+
+    @staticmethod
+    def parse(value) -> Optional[datetime]:
+        """
+        解析时间字符串
+
+        Returns:
+            Optional[datetime]: 带时区的时间（USE_TZ=True时），无法解析时返回None
+        """
+        if not value:
+            return None
+        value = str(value).strip().replace('T', ' ')
+        for fmt in ScheduleDateTimeService.DATETIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+
+        if settings.USE_TZ:
+            return timezone.make_aware(parsed, timezone.get_default_timezone())
+        return parsed
+
+    @staticmethod
+    def populate(schedule: VesselSchedule) -> List[str]:
+        """
+        根据字符串时间字段填充航线的类型化时间字段
+
+        Returns:
+            List[str]: 类型化时间字段名
+        """
+        for source_field, target_field in VesselSchedule.DATETIME_FIELDS.items():
+            setattr(schedule, target_field, ScheduleDateTimeService.parse(getattr(schedule, source_field)))
+        return list(VesselSchedule.DATETIME_FIELDS.values())
+
+    @staticmethod
+    def get_etd_date(schedule: VesselSchedule):
+        """获取航线ETD日期，类型化字段未回填时解析字符串"""
+        etd_at = schedule.etd_at or ScheduleDateTimeService.parse(schedule.etd)
+        if etd_at is None:
+            return None
+        return ScheduleDateTimeService.to_local_date(etd_at)
+
+    @staticmethod
+    def to_local_date(value: datetime):
+        """类型化时间字段转换为本地日期"""
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+    @staticmethod
+    def parse_etd_window(etd_from: str = None, etd_to: str = None,
+                         sailing_within_days=None) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """
+        解析ETD查询窗口参数
+
+        Args:
+            etd_from: ETD起始日期或时间（含）
+            etd_to: ETD截止日期（含当天）或时间
+            sailing_within_days: 从今天起N天内开船（含今天）
+
+        Returns:
+            Tuple[Optional[datetime], Optional[datetime]]: [开始, 结束) 时间窗口
+
+        Raises:
+            ValueError: 参数格式错误
+        """
+        start = end = None
+        if etd_from:
+            start = ScheduleDateTimeService.parse(etd_from)
+            if start is None:
+                raise ValueError('etd_from格式错误，应为YYYY-MM-DD或YYYY-MM-DD HH:MM:SS')
+        if etd_to:
+            end = ScheduleDateTimeService.parse(etd_to)
+            if end is None:
+                raise ValueError('etd_to格式错误，应为YYYY-MM-DD或YYYY-MM-DD HH:MM:SS')
+            if len(str(etd_to).strip()) <= 10:
+                # 只有日期时包含当天
+                end += timedelta(days=1)
+        if sailing_within_days not in (None, ''):
+            try:
+                days = int(sailing_within_days)
+            except (TypeError, ValueError):
+                raise ValueError('sailing_within_days必须是整数')
+            if days < 0:
+                raise ValueError('sailing_within_days不能小于0')
+            today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+            window_end = today + timedelta(days=days + 1)
+            start = max(start, today) if start else today
+            end = min(end, window_end) if end else window_end
+        if start and end and start >= end:
+            raise ValueError('ETD开始时间必须早于结束时间')
+        return start, end
+
+    @staticmethod
+    def filter_etd_window(queryset, start: Optional[datetime], end: Optional[datetime]):
+        """按ETD窗口过滤查询集（[start, end)）"""
+        if start:
+            queryset = queryset.filter(etd_at__gte=start)
+        if end:
+            queryset = queryset.filter(etd_at__lt=end)
+        return queryset
+
+    @staticmethod
+    def backfill(chunk_size: int = 1000, data_version: int = None,
+                 only_missing: bool = True, dry_run: bool = False) -> Dict:
+        """
+        分批回填历史航线的类型化时间字段
+
+        按主键游标分批读取，每批通过bulk_update写入（不触发信号）
+
+        Args:
+            chunk_size: 每批处理的记录数
+            data_version: 只回填指定版本，None表示全部版本
+            only_missing: 只处理etd_at为空且etd不为空的记录
+            dry_run: 只统计不写入
+
+        Returns:
+            Dict: {'scanned', 'updated', 'unparsed'}
+        """
+        chunk_size = max(1, int(chunk_size))
+        source_fields = list(VesselSchedule.DATETIME_FIELDS)
+        target_fields = list(VesselSchedule.DATETIME_FIELDS.values())
+
+        queryset = VesselSchedule.objects.all()
+        if data_version is not None:
+            queryset = queryset.filter(data_version=data_version)
+        if only_missing:
+            queryset = queryset.filter(etd_at__isnull=True).exclude(etd__isnull=True).exclude(etd='')
+
+        scanned = 0
+        updated = 0
+        last_id = 0
+        while True:
+            rows = list(
+                queryset.filter(id__gt=last_id).order_by('id').only('id', *source_fields)[:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+            scanned += len(rows)
+
+            changed = []
+            for row in rows:
+                ScheduleDateTimeService.populate(row)
+                if any(getattr(row, field) is not None for field in target_fields):
+                    changed.append(row)
+
+            if changed and not dry_run:
+                VesselSchedule.objects.bulk_update(changed, target_fields, batch_size=chunk_size)
+            updated += len(changed)
+            logger.info(f"回填航线时间字段: 已处理{scanned}条，更新{updated}条")
+
+        return {'scanned': scanned, 'updated': updated, 'unparsed': scanned - updated}
+
+
+class ShareCabinService:
+    """
+    共舱船公司服务类
+    保存航线时将shareCabins拆分为共舱船公司集合（carrier_set）和明细表记录，
+    共舱分组按carrier_set分组、按船公司查询共舱航线走明细表索引，不再在查询路径上解析JSON
+    """
+
+    SEPARATOR = ','
+
+    @staticmethod
+    def parse(share_cabins) -> List[Dict]:
+        """
+        解析shareCabins字段，返回共舱配置列表（字符串格式的船公司转换为{'carrierCd': ...}）
+
+        Returns:
+            List[Dict]: 按原顺序去重后的共舱配置，解析失败时返回空列表
+        """
+        if not share_cabins:
+            return []
+        try:
+            data = json.loads(share_cabins) if isinstance(share_cabins, str) else share_cabins
+        except (json.JSONDecodeError, TypeError):
+            return []
+        if not isinstance(data, list):
+            return []
+
+        entries = []
+        seen = set()
+        for cabin in data:
+            if isinstance(cabin, dict):
+                carrier_cd = cabin.get('carrierCd')
+            elif isinstance(cabin, str):
+                carrier_cd, cabin = cabin, {'carrierCd': cabin}
+            else:
+                continue
+            if carrier_cd and carrier_cd not in seen:
+                seen.add(carrier_cd)
+                entries.append(cabin)
+        return entries
+
+    @staticmethod
+    def get_carrier_codes(share_cabins, carrier_cd: str = None) -> List[str]:
+        """共舱船公司代码（去重排序），没有共舱信息时使用航线的船公司"""
+        codes = sorted({entry['carrierCd'] for entry in ShareCabinService.parse(share_cabins)})
+        if not codes and carrier_cd:
+            codes = [carrier_cd]
+        return codes
+
+    @staticmethod
+    def get_carrier_set_hash(carrier_set: str) -> str:
+        """共舱船公司集合的哈希，与抓取程序的计算方式一致"""
+        return hashlib.sha256(carrier_set.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def populate(schedule: VesselSchedule) -> None:
+        """根据shareCabins填充航线的carrier_set和carrier_set_hash"""
+        carrier_set = ShareCabinService.SEPARATOR.join(
+            ShareCabinService.get_carrier_codes(schedule.shareCabins, schedule.carriercd)
+        )
+        schedule.carrier_set = carrier_set
+        schedule.carrier_set_hash = ShareCabinService.get_carrier_set_hash(carrier_set)
+
+    @staticmethod
+    def get_schedule_carrier_codes(schedule: VesselSchedule) -> List[str]:
+        """航线的共舱船公司代码，优先使用carrier_set，尚未回填时解析shareCabins"""
+        if schedule.carrier_set is not None:
+            return schedule.carrier_set.split(ShareCabinService.SEPARATOR) if schedule.carrier_set else []
+        return ShareCabinService.get_carrier_codes(schedule.shareCabins, schedule.carriercd)
+
+    @staticmethod
+    def build_rows(schedule_id: int, share_cabins, carrier_cd: str = None) -> List[VesselScheduleShareCabin]:
+        """根据shareCabins构建明细记录，没有共舱信息时使用航线的船公司"""
+        entries = ShareCabinService.parse(share_cabins)
+        if not entries and carrier_cd:
+            entries = [{'carrierCd': carrier_cd}]
+
+        rows = []
+        for sort_order, entry in enumerate(entries):
+            price = entry.get('price')
+            try:
+                price = Decimal(str(price)) if price not in (None, '') else None
+            except InvalidOperation:
+                price = None
+            available = entry.get('available')
+            remark = entry.get('remark')
+            rows.append(VesselScheduleShareCabin(
+                schedule_id=schedule_id,
+                carrierCd=str(entry['carrierCd'])[:20],
+                sort_order=sort_order,
+                price=price,
+                available=available if isinstance(available, bool) else None,
+                remark=str(remark)[:255] if remark not in (None, '') else None,
+            ))
+        return rows
+
+    @staticmethod
+    def sync_rows(schedule_ids, chunk_size: int = 1000) -> int:
+        """
+        按航线重建共舱明细记录（先删除再批量创建）
+
+        Returns:
+            int: 创建的明细记录数量
+        """
+        schedule_ids = sorted(set(schedule_ids))
+        created = 0
+        for start in range(0, len(schedule_ids), chunk_size):
+            chunk = schedule_ids[start:start + chunk_size]
+            rows = []
+            for schedule_id, share_cabins, carrier_cd in VesselSchedule.objects.filter(
+                id__in=chunk
+            ).values_list('id', 'shareCabins', 'carriercd'):
+                rows.extend(ShareCabinService.build_rows(schedule_id, share_cabins, carrier_cd))
+
+            VesselScheduleShareCabin.objects.filter(schedule_id__in=chunk).delete()
+            VesselScheduleShareCabin.objects.bulk_create(rows, batch_size=chunk_size)
+            created += len(rows)
+        return created
+
+    @staticmethod
+    def backfill(chunk_size: int = 1000, data_version: int = None,
+                 only_missing: bool = True, dry_run: bool = False) -> Dict:
+        """
+        分批回填历史航线的carrier_set和共舱明细记录
+
+        Args:
+            chunk_size: 每批处理的记录数
+            data_version: 只回填指定版本，None表示全部版本
+            only_missing: 只处理carrier_set为空的记录
+            dry_run: 只统计不写入
+
+        Returns:
+            Dict: {'scanned', 'updated', 'share_cabin_rows'}
+        """
+        chunk_size = max(1, int(chunk_size))
+        queryset = VesselSchedule.objects.all()
+        if data_version is not None:
+            queryset = queryset.filter(data_version=data_version)
+        if only_missing:
+            queryset = queryset.filter(carrier_set__isnull=True)
+
+        scanned = 0
+        share_cabin_rows = 0
+        last_id = 0
+        while True:
+            schedules = list(
+                queryset.filter(id__gt=last_id).order_by('id')
+                .only('id', 'shareCabins', 'carriercd')[:chunk_size]
+            )
+            if not schedules:
+                break
+            last_id = schedules[-1].id
+            scanned += len(schedules)
+
+            if dry_run:
+                share_cabin_rows += sum(
+                    len(ShareCabinService.build_rows(s.id, s.shareCabins, s.carriercd)) for s in schedules
+                )
+                continue
+
+            for schedule in schedules:
+                ShareCabinService.populate(schedule)
+            with transaction.atomic():
+                VesselSchedule.objects.bulk_update(
+                    schedules, ['carrier_set', 'carrier_set_hash'], batch_size=chunk_size
+                )
+                share_cabin_rows += ShareCabinService.sync_rows(
+                    [schedule.id for schedule in schedules], chunk_size=chunk_size
+                )
+            logger.info(f"回填共舱船公司: 已处理{scanned}条，明细{share_cabin_rows}条")
+
+        return {'scanned': scanned, 'updated': 0 if dry_run else scanned, 'share_cabin_rows': share_cabin_rows}
+
+    @staticmethod
+    def get_carrier_sailings(carrier_cd: str, data_version: int, pol_cd: str = None, pod_cd: str = None):
+        """
+        指定船公司参与共舱的有效航线查询集（通过明细表的船公司索引查找，不扫描shareCabins）
+
+        Args:
+            carrier_cd: 船公司代码
+            data_version: 数据版本号
+            pol_cd: 起运港代码（可选）
+            pod_cd: 目的港代码（可选）
+        """
+        queryset = VesselSchedule.objects.filter(
+            id__in=VesselScheduleShareCabin.objects.filter(carrierCd=carrier_cd).values('schedule_id'),
+            data_version=data_version,
+            status=1
+        )
+        if pol_cd:
+            queryset = queryset.filter(polCd=pol_cd)
+        if pod_cd:
+            queryset = queryset.filter(podCd=pod_cd)
+        return queryset
+
+    @staticmethod
+    def get_carrier_set_counts(queryset) -> List[Dict]:
+        """
+        按共舱船公司组合统计航线数量（数据库GROUP BY carrier_set_hash）
+
+        Returns:
+            List[Dict]: [{'carrier_codes', 'count'}]，按数量倒序
+        """
+        rows = queryset.order_by().values('carrier_set_hash').annotate(
+            carrier_set=Max('carrier_set'), count=Count('id')
+        ).order_by('-count', 'carrier_set')
+        return [
+            {
+                'carrier_codes': row['carrier_set'].split(ShareCabinService.SEPARATOR) if row['carrier_set'] else [],
+                'count': row['count'],
+            }
+            for row in rows
+        ]
+
+
 class VesselScheduleService:
     """
     船舶航线服务类
     处理航线相关的业务逻辑
     """
+
+    # 航线相关缓存的命名空间，航线数据变化时整体失效
+    CACHE_NAMESPACE = 'vessel_schedule'
+    # 航线列表总数缓存的命名空间，任意航线写入后失效
+    LIST_NAMESPACE = 'vessel_schedule_list'
+    # 游标分页支持的排序 {排序参数: 字段}
+    CURSOR_ORDERINGS = {'fetch_date': 'fetch_date', 'etd': 'etd_at', 'etd_at': 'etd_at'}
+
+    @staticmethod
+    def get_keyset_paginator(default_ordering: str = '-fetch_date') -> KeysetPagination:
+        """航线列表、搜索接口使用的游标分页器，按 (fetch_date, id) 或 (etd_at, id) 翻页"""
+        return KeysetPagination(
+            orderings=VesselScheduleService.CURSOR_ORDERINGS,
+            default_ordering=default_ordering,
+            count_namespaces=(VesselScheduleService.CACHE_NAMESPACE, VesselScheduleService.LIST_NAMESPACE)
+        )
+
+    @staticmethod
+    def get_route_namespace(pol_cd: str, pod_cd: str) -> str:
+        """单条航线的缓存命名空间，该航线数据变化时失效"""
+        return f"route:{pol_cd}:{pod_cd}"
     
     @staticmethod
     def get_vessel_schedules(pol_cd: str = None, pod_cd: str = None, 
                            carrier_cd: str = None, status: int = 1,
-                           data_version: int = None) -> List[VesselSchedule]:
+                           data_version: int = None, etd_from: datetime = None,
+                           etd_to: datetime = None) -> List[VesselSchedule]:
         """
         获取船舶航线列表
         
@@ -35,6 +654,8 @@ class VesselScheduleService:
             carrier_cd: 船公司代码
             status: 数据状态
             data_version: 数据版本
+            etd_from: ETD窗口开始（含）
+            etd_to: ETD窗口结束（不含）
             
         Returns:
             List[VesselSchedule]: 航线列表
@@ -43,9 +664,7 @@ class VesselScheduleService:
         
         # 如果没有指定版本，使用最新版本
         if data_version is None:
-            latest_version = VesselSchedule.objects.aggregate(
-                max_version=Max('data_version')
-            )['max_version']
+            latest_version = DataVersionService.get_latest_version()
             if latest_version:
                 queryset = queryset.filter(data_version=latest_version)
         else:
@@ -58,6 +677,7 @@ class VesselScheduleService:
             queryset = queryset.filter(podCd=pod_cd)
         if carrier_cd:
             queryset = queryset.filter(carriercd=carrier_cd)
+        queryset = ScheduleDateTimeService.filter_etd_window(queryset, etd_from, etd_to)
         
         return queryset.order_by('-fetch_date', 'vessel', 'voyage')
     
@@ -133,7 +753,13 @@ class VesselScheduleService:
                 'data_version': data_version
             }
         
-        return CacheHelper.get_or_set(cache_key, _get_data, timeout=300)
+        return CacheHelper.get_or_set(
+            cache_key, _get_data, timeout=300,
+            namespaces=(
+                VesselScheduleService.CACHE_NAMESPACE,
+                VesselScheduleService.get_route_namespace(pol_cd, pod_cd)
+            )
+        )
     
     @staticmethod
     def _get_vessel_info_map(schedules: List[VesselSchedule]) -> Dict:
@@ -203,7 +829,8 @@ class VesselScheduleService:
             Tuple[bool, str, Dict]: (是否成功, 消息, 结果数据)
         """
         try:
-            with transaction.atomic():
+            # 逐条创建时暂停信号同步，事务提交后统一同步船舶信息
+            with transaction.atomic(), bulk_vessel_schedule_sync():
                 created_schedules = []
                 errors = []
                 
@@ -294,11 +921,7 @@ class VesselScheduleService:
         """
         清除航线相关缓存
         """
-        try:
-            CacheHelper.delete_pattern("cabin_grouping:*")
-            CacheHelper.delete_pattern("api:VesselSchedule*")
-        except Exception as e:
-            logger.warning(f"清除缓存失败: {e}")
+        CacheHelper.invalidate_namespace(VesselScheduleService.CACHE_NAMESPACE)
 
 
 class VesselInfoService:
@@ -338,7 +961,69 @@ class VesselInfoService:
             queryset = queryset.filter(voyage__icontains=voyage)
         
         return queryset.order_by('carrierCd', 'vessel', 'voyage')
-    
+
+    @staticmethod
+    def get_route_vessel_info_map(pol_cd: str, pod_cd: str,
+                                  vessels=None) -> Dict[Tuple[str, str, str], VesselInfoFromCompany]:
+        """
+        一次性获取某条航线(polCd, podCd)下的全部船舶信息，构建内存映射
+
+        替代逐条航线调用 filter(...).first() 的做法，
+        无论航线数量多少都只执行一次查询
+
+        Args:
+            pol_cd: 起运港代码
+            pod_cd: 目的港代码
+            vessels: 限定的船名集合（通常为当前版本航线中出现的船名），None表示不限定
+
+        Returns:
+            Dict: 船舶信息映射 {(carrierCd, vessel, voyage): VesselInfoFromCompany}
+        """
+        queryset = VesselInfoFromCompany.objects.filter(polCd=pol_cd, podCd=pod_cd)
+
+        if vessels is not None:
+            vessels = {vessel for vessel in vessels if vessel}
+            if not vessels:
+                return {}
+            queryset = queryset.filter(vessel__in=vessels)
+
+        vessel_info_map = {}
+        for info in queryset.only(
+            'id', 'carrierCd', 'vessel', 'voyage',
+            'gp_20', 'hq_40', 'cut_off_time', 'price'
+        ):
+            vessel_info_map[(info.carrierCd, info.vessel, info.voyage)] = info
+
+        return vessel_info_map
+
+    @staticmethod
+    def get_routes_vessel_info_map(route_vessels: Dict[Tuple[str, str], set]) -> Dict[Tuple[str, str], Dict]:
+        """
+        一次查询获取多条航线的船舶信息映射（多航线批量分组使用）
+
+        Args:
+            route_vessels: {(polCd, podCd): 该航线当前版本中出现的船名集合}
+
+        Returns:
+            Dict: {(polCd, podCd): {(carrierCd, vessel, voyage): VesselInfoFromCompany}}
+        """
+        condition = Q()
+        for (pol_cd, pod_cd), vessels in route_vessels.items():
+            vessels = {vessel for vessel in vessels if vessel}
+            if vessels:
+                condition |= Q(polCd=pol_cd, podCd=pod_cd, vessel__in=vessels)
+
+        route_maps = {route: {} for route in route_vessels}
+        if not condition:
+            return route_maps
+
+        for info in VesselInfoFromCompany.objects.filter(condition).only(
+            'id', 'polCd', 'podCd', 'carrierCd', 'vessel', 'voyage',
+            'gp_20', 'hq_40', 'cut_off_time', 'price'
+        ):
+            route_maps[(info.polCd, info.podCd)][(info.carrierCd, info.vessel, info.voyage)] = info
+        return route_maps
+
     @staticmethod
     def bulk_update_vessel_info(info_data: List[Dict]) -> Tuple[bool, str, Dict]:
         """
@@ -402,8 +1087,2145 @@ class VesselInfoService:
             return False, f"批量更新失败: {str(e)}", {}
 
 
+class VesselInfoBulkService:
+    """
+    船舶额外信息批量写入服务
+    整批校验后用一次查询解析全部五字段关联键，再在一个事务中通过bulk_create、bulk_update
+    和按关联键的批量DELETE落库，逐条返回成功/失败结果
+    """
+
+    # 单次批量操作的最大记录数
+    MAX_ITEMS = 5000
+    # 关联键字段，与唯一约束一致
+    KEY_FIELDS = ('carrierCd', 'polCd', 'podCd', 'vessel', 'voyage')
+    # 兼容旧版请求中使用的VesselSchedule字段名
+    KEY_ALIASES = {'carriercd': 'carrierCd'}
+    # 每条查询/删除语句包含的关联键数量
+    KEY_CHUNK_SIZE = 500
+
+    @staticmethod
+    def normalize_item(item):
+        """复制请求数据并把字段别名换成模型字段名"""
+        if not isinstance(item, dict):
+            return item
+
+        item = dict(item)
+        for alias, field in VesselInfoBulkService.KEY_ALIASES.items():
+            if alias in item:
+                value = item.pop(alias)
+                item.setdefault(field, value)
+        return item
+
+    @staticmethod
+    def get_missing_key_fields(item: Dict) -> List[str]:
+        """返回缺少的关联字段"""
+        return [
+            field for field in VesselInfoBulkService.KEY_FIELDS
+            if item.get(field) in (None, '')
+        ]
+
+    @staticmethod
+    def get_key(item) -> Tuple:
+        """获取记录或请求数据的关联键"""
+        if isinstance(item, dict):
+            values = (item[field] for field in VesselInfoBulkService.KEY_FIELDS)
+        else:
+            values = (getattr(item, field) for field in VesselInfoBulkService.KEY_FIELDS)
+        return tuple(str(value).strip() for value in values)
+
+    @staticmethod
+    def _key_condition(keys: List[Tuple]) -> Tuple[str, List]:
+        """生成 (关联字段) IN (关联键列表) 条件；SQLite的行值IN右侧只能是子查询，改用VALUES"""
+        columns = ', '.join(
+            connection.ops.quote_name(VesselInfoFromCompany._meta.get_field(field).column)
+            for field in VesselInfoBulkService.KEY_FIELDS
+        )
+        row = '(' + ', '.join(['%s'] * len(VesselInfoBulkService.KEY_FIELDS)) + ')'
+        rows = ', '.join([row] * len(keys))
+        if connection.vendor == 'sqlite':
+            rows = f'VALUES {rows}'
+
+        params = [value for key in keys for value in key]
+        return f'({columns}) IN ({rows})', params
+
+    @staticmethod
+    def _key_filter(keys: List[Tuple]) -> Q:
+        """按关联键列表生成ORM查询条件"""
+        condition = Q()
+        for key in keys:
+            condition |= Q(**dict(zip(VesselInfoBulkService.KEY_FIELDS, key)))
+        return condition
+
+    @staticmethod
+    def fetch_existing(keys, for_update: bool = False) -> Dict[Tuple, VesselInfoFromCompany]:
+        """按关联键批量读取已有记录，返回 {关联键: 记录}"""
+        keys = list(dict.fromkeys(keys))
+        existing = {}
+        chunk_size = VesselInfoBulkService.KEY_CHUNK_SIZE
+
+        for start in range(0, len(keys), chunk_size):
+            queryset = VesselInfoFromCompany.objects.filter(
+                VesselInfoBulkService._key_filter(keys[start:start + chunk_size])
+            )
+            if for_update:
+                queryset = queryset.select_for_update()
+            for info in queryset:
+                existing[VesselInfoBulkService.get_key(info)] = info
+
+        return existing
+
+    @staticmethod
+    def _delete_keys(keys: List[Tuple]) -> int:
+        """按关联键分批执行DELETE，不逐条加载和触发信号"""
+        table = connection.ops.quote_name(VesselInfoFromCompany._meta.db_table)
+        chunk_size = VesselInfoBulkService.KEY_CHUNK_SIZE
+        deleted = 0
+
+        with connection.cursor() as cursor:
+            for start in range(0, len(keys), chunk_size):
+                condition, params = VesselInfoBulkService._key_condition(keys[start:start + chunk_size])
+                cursor.execute(f'DELETE FROM {table} WHERE {condition}', params)
+                deleted += cursor.rowcount
+
+        return deleted
+
+    @staticmethod
+    def _failure(index: int, errors, item, data_key: str = 'data') -> Dict:
+        """单条失败结果"""
+        return {'index': index, 'success': False, 'errors': errors, data_key: item}
+
+    @staticmethod
+    def _success(index: int, vessel_info=None, data: Dict = None) -> Dict:
+        """单条成功结果"""
+        if data is None:
+            data = VesselInfoFromCompanySerializer(vessel_info).data
+        return {'index': index, 'success': True, 'data': data}
+
+    @staticmethod
+    def bulk_create(items: List[Dict]) -> Dict:
+        """
+        批量创建船舶额外信息
+
+        Args:
+            items: 船舶信息数据列表，关联字段可使用carrierCd或carriercd
+
+        Returns:
+            Dict: {'created': [...], 'failed': [...]}，均按请求下标排序
+        """
+        failed = []
+        pending = {}
+
+        for index, raw_item in enumerate(items):
+            serializer = VesselInfoBulkItemSerializer(data=VesselInfoBulkService.normalize_item(raw_item))
+            if not serializer.is_valid():
+                failed.append(VesselInfoBulkService._failure(index, serializer.errors, raw_item))
+                continue
+
+            key = VesselInfoBulkService.get_key(serializer.validated_data)
+            if key in pending:
+                failed.append(VesselInfoBulkService._failure(index, '批次内关联字段重复', raw_item))
+                continue
+            pending[key] = (index, raw_item, serializer.validated_data)
+
+        created_keys = []
+        with transaction.atomic():
+            existing = VesselInfoBulkService.fetch_existing(pending.keys())
+            new_records = []
+            for key, (index, raw_item, data) in pending.items():
+                if key in existing:
+                    failed.append(VesselInfoBulkService._failure(index, '记录已存在', raw_item))
+                    continue
+                new_records.append(VesselInfoFromCompany(**data))
+                created_keys.append(key)
+
+            try:
+                with transaction.atomic():
+                    VesselInfoFromCompany.objects.bulk_create(
+                        new_records, batch_size=VesselInfoBulkService.KEY_CHUNK_SIZE
+                    )
+            except IntegrityError:
+                # 并发请求在读取之后写入了相同关联键的记录：回滚到保存点后逐条写入，冲突的记录计为失败
+                candidate_keys = created_keys
+                new_records, created_keys = [], []
+                for key in candidate_keys:
+                    record = VesselInfoFromCompany(**pending[key][2])
+                    try:
+                        with transaction.atomic():
+                            VesselInfoFromCompany.objects.bulk_create([record])
+                    except IntegrityError:
+                        index, raw_item, _ = pending[key]
+                        failed.append(VesselInfoBulkService._failure(index, '记录已存在', raw_item))
+                        continue
+                    new_records.append(record)
+                    created_keys.append(key)
+
+            VesselInfoStatsService.apply(added=[record.get_stats_state() for record in new_records])
+            # MySQL的bulk_create不回填主键，按关联键重新读取
+            saved = VesselInfoBulkService.fetch_existing(created_keys)
+            invalidate_vessel_info_snapshots((key[1], key[2]) for key in created_keys)
+
+        created = [
+            VesselInfoBulkService._success(pending[key][0], saved[key])
+            for key in created_keys
+        ]
+        failed.sort(key=lambda record: record['index'])
+        return {'created': created, 'failed': failed}
+
+    @staticmethod
+    def bulk_update(items: List[Dict]) -> Dict:
+        """
+        按关联键批量更新船舶额外信息
+
+        Args:
+            items: 包含五个关联字段及待更新字段的数据列表
+
+        Returns:
+            Dict: {'updated': [...], 'failed': [...]}，均按请求下标排序
+        """
+        failed = []
+        valid_items = []
+
+        for index, raw_item in enumerate(items):
+            item = VesselInfoBulkService.normalize_item(raw_item)
+            if not isinstance(item, dict):
+                failed.append(VesselInfoBulkService._failure(index, '数据必须是对象格式', raw_item))
+                continue
+
+            missing_fields = VesselInfoBulkService.get_missing_key_fields(item)
+            if missing_fields:
+                failed.append(VesselInfoBulkService._failure(
+                    index, f'缺少必需字段: {", ".join(missing_fields)}', raw_item
+                ))
+                continue
+
+            serializer = VesselInfoBulkItemSerializer(data=item, partial=True)
+            if not serializer.is_valid():
+                failed.append(VesselInfoBulkService._failure(index, serializer.errors, raw_item))
+                continue
+
+            valid_items.append((index, raw_item, VesselInfoBulkService.get_key(item), serializer.validated_data))
+
+        updated = []
+        with transaction.atomic():
+            existing = VesselInfoBulkService.fetch_existing(
+                (key for _, _, key, _ in valid_items), for_update=True
+            )
+            changed = {}
+            update_fields = set()
+            for index, raw_item, key, data in valid_items:
+                vessel_info = existing.get(key)
+                if vessel_info is None:
+                    failed.append(VesselInfoBulkService._failure(index, '记录不存在', raw_item))
+                    continue
+
+                for field, value in data.items():
+                    if field in VesselInfoBulkService.KEY_FIELDS:
+                        continue
+                    setattr(vessel_info, field, value)
+                    update_fields.add(field)
+                changed[vessel_info.pk] = vessel_info
+                updated.append((index, vessel_info))
+
+            if update_fields:
+                VesselInfoFromCompany.objects.bulk_update(
+                    list(changed.values()), sorted(update_fields),
+                    batch_size=VesselInfoBulkService.KEY_CHUNK_SIZE
+                )
+                VesselInfoStatsService.apply(
+                    removed=[info._loaded_stats_state for info in changed.values()],
+                    added=[info.get_stats_state() for info in changed.values()]
+                )
+                invalidate_vessel_info_snapshots(
+                    (info.polCd, info.podCd) for info in changed.values()
+                )
+
+        failed.sort(key=lambda record: record['index'])
+        return {
+            'updated': [VesselInfoBulkService._success(index, info) for index, info in updated],
+            'failed': failed
+        }
+
+    @staticmethod
+    def bulk_delete(conditions: List[Dict]) -> Dict:
+        """
+        按关联键批量删除船舶额外信息
+
+        Args:
+            conditions: 删除条件列表，每条包含五个关联字段
+
+        Returns:
+            Dict: {'deleted': [...], 'failed': [...]}，deleted中为删除前的数据
+        """
+        failed = []
+        valid_conditions = []
+        seen = set()
+
+        for index, raw_condition in enumerate(conditions):
+            condition = VesselInfoBulkService.normalize_item(raw_condition)
+            if not isinstance(condition, dict):
+                failed.append(VesselInfoBulkService._failure(index, '删除条件必须是对象格式', raw_condition, 'condition'))
+                continue
+
+            missing_fields = VesselInfoBulkService.get_missing_key_fields(condition)
+            if missing_fields:
+                failed.append(VesselInfoBulkService._failure(
+                    index, f'缺少必需字段: {", ".join(missing_fields)}', raw_condition, 'condition'
+                ))
+                continue
+
+            key = VesselInfoBulkService.get_key(condition)
+            if key in seen:
+                # 同一批中重复的条件，第一条删除后记录已不存在
+                failed.append(VesselInfoBulkService._failure(index, '记录不存在', raw_condition, 'condition'))
+                continue
+            seen.add(key)
+            valid_conditions.append((index, raw_condition, key))
+
+        deleted = []
+        with transaction.atomic():
+            existing = VesselInfoBulkService.fetch_existing(
+                (key for _, _, key in valid_conditions), for_update=True
+            )
+            delete_keys = []
+            for index, raw_condition, key in valid_conditions:
+                vessel_info = existing.get(key)
+                if vessel_info is None:
+                    failed.append(VesselInfoBulkService._failure(index, '记录不存在', raw_condition, 'condition'))
+                    continue
+                deleted.append(VesselInfoBulkService._success(index, vessel_info))
+                delete_keys.append(key)
+
+            if delete_keys:
+                VesselInfoBulkService._delete_keys(delete_keys)
+                VesselInfoStatsService.apply(removed=[existing[key]._loaded_stats_state for key in delete_keys])
+                invalidate_vessel_info_snapshots((key[1], key[2]) for key in delete_keys)
+
+        failed.sort(key=lambda record: record['index'])
+        return {'deleted': deleted, 'failed': failed}
+
+
+class VesselInfoImportService:
+    """
+    船舶额外信息价格表导入服务
+    逐行流式读取CSV/XLSX，按批校验、按关联键一次查询后批量新增/更新（upsert），
+    每批单独提交并更新导入任务进度；失败的行写入错误报告，内存占用与文件大小无关
+    """
+
+    CHUNK_SIZE = 1000
+    # 表头中可以出现的字段：关联字段和价格、舱位、截关时间
+    VALUE_FIELDS = ('gp_20', 'hq_40', 'cut_off_time', 'price')
+    ERROR_REPORT_HEADER = ['row', 'carrierCd', 'polCd', 'podCd', 'vessel', 'voyage', 'errors']
+
+    @staticmethod
+    def detect_format(file_name: str) -> str:
+        """根据文件扩展名判断文件格式，不支持时抛出ValueError"""
+        extension = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+        formats = dict(VesselInfoImportJob.FORMAT_CHOICES)
+        if extension not in formats:
+            raise ValueError(f"不支持的文件格式: {extension or file_name}，仅支持{'、'.join(formats)}")
+        return extension
+
+    @staticmethod
+    def get_header_map() -> Dict[str, str]:
+        """表头名称到模型字段的映射：支持字段名（不区分大小写）和中文名称"""
+        header_map = {
+            alias.lower(): field for alias, field in VesselInfoBulkService.KEY_ALIASES.items()
+        }
+        for name in VesselInfoBulkService.KEY_FIELDS + VesselInfoImportService.VALUE_FIELDS:
+            field = VesselInfoFromCompany._meta.get_field(name)
+            header_map[name.lower()] = name
+            header_map[str(field.verbose_name)] = name
+        return header_map
+
+    @staticmethod
+    def resolve_header(header) -> List[Optional[str]]:
+        """把表头解析为字段列表，无法识别的列为None；缺少关联字段时抛出ValueError"""
+        header_map = VesselInfoImportService.get_header_map()
+        columns = []
+        for cell in header:
+            name = str(cell).strip() if cell is not None else ''
+            columns.append(header_map.get(name) or header_map.get(name.lower()))
+
+        missing = [field for field in VesselInfoBulkService.KEY_FIELDS if field not in columns]
+        if missing:
+            raise ValueError(f"表头缺少必需列: {', '.join(missing)}")
+        return columns
+
+    @staticmethod
+    def _clean_cell(value):
+        """单元格转为字符串，空单元格为None"""
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M')
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        value = str(value).strip()
+        return value or None
+
+    @staticmethod
+    def _iter_csv(file, encoding: str):
+        """逐行读取CSV"""
+        stream = io.TextIOWrapper(getattr(file, 'file', file), encoding=encoding, newline='')
+        try:
+            yield from csv.reader(stream)
+        finally:
+            # 不随包装对象关闭上传文件
+            stream.detach()
+
+    @staticmethod
+    def _iter_xlsx(file):
+        """以只读模式逐行读取XLSX第一个工作表"""
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("导入xlsx文件需要安装openpyxl")
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def iter_rows(file, file_format: str, encoding: str = 'utf-8-sig'):
+        """
+        流式读取价格表
+
+        Yields:
+            Tuple[int, Dict]: (文件中的行号, {字段: 值})，跳过空行
+        """
+        if file_format == VesselInfoImportJob.FORMAT_XLSX:
+            rows = VesselInfoImportService._iter_xlsx(file)
+        else:
+            rows = VesselInfoImportService._iter_csv(file, encoding)
+
+        columns = None
+        for row_number, row in enumerate(rows, start=1):
+            if columns is None:
+                columns = VesselInfoImportService.resolve_header(row)
+                continue
+
+            item = {}
+            for field, value in zip(columns, row):
+                if field is not None:
+                    item[field] = VesselInfoImportService._clean_cell(value)
+            if any(value is not None for value in item.values()):
+                yield row_number, item
+
+        if columns is None:
+            raise ValueError("文件为空，缺少表头")
+
+    @staticmethod
+    def _format_errors(errors) -> str:
+        """把序列化器错误转为一行文本"""
+        if isinstance(errors, dict):
+            return '; '.join(
+                f"{field}: {VesselInfoImportService._format_errors(messages)}"
+                for field, messages in errors.items()
+            )
+        if isinstance(errors, (list, tuple)):
+            return ', '.join(VesselInfoImportService._format_errors(message) for message in errors)
+        return str(errors)
+
+    @staticmethod
+    def import_chunk(rows: List[Tuple[int, Dict]]) -> Dict:
+        """
+        校验并写入一批数据：新记录bulk_create，已有记录只更新该行非空且取值变化的列
+        （空单元格表示不修改，不会清空已有的价格等信息），按更新的列组合分组bulk_update
+
+        同一批内关联键重复的行计为失败，以先出现的行为准
+
+        Returns:
+            Dict: {'created': 新增数, 'updated': 取值有变化的记录数, 'failed': [(行号, 数据, 错误)]}
+        """
+        failed = []
+        pending = {}
+        row_numbers = {}
+
+        for row_number, item in rows:
+            serializer = VesselInfoBulkItemSerializer(data=item)
+            if not serializer.is_valid():
+                failed.append((row_number, item, VesselInfoImportService._format_errors(serializer.errors)))
+                continue
+            key = VesselInfoBulkService.get_key(serializer.validated_data)
+            if key in pending:
+                failed.append((row_number, item, f'与第{row_numbers[key]}行关联字段重复'))
+                continue
+            pending[key] = serializer.validated_data
+            row_numbers[key] = row_number
+
+        with transaction.atomic():
+            existing = VesselInfoBulkService.fetch_existing(pending.keys(), for_update=True)
+            new_records = []
+            # {更新的列组合: [记录]}
+            changed = defaultdict(list)
+            for key, data in pending.items():
+                vessel_info = existing.get(key)
+                if vessel_info is None:
+                    new_records.append(VesselInfoFromCompany(**data))
+                    continue
+                fields = []
+                for field in VesselInfoImportService.VALUE_FIELDS:
+                    value = data.get(field)
+                    if value is not None and getattr(vessel_info, field) != value:
+                        setattr(vessel_info, field, value)
+                        fields.append(field)
+                if fields:
+                    changed[tuple(fields)].append(vessel_info)
+
+            VesselInfoFromCompany.objects.bulk_create(
+                new_records, batch_size=VesselInfoBulkService.KEY_CHUNK_SIZE
+            )
+            updated_records = []
+            for fields, records in changed.items():
+                VesselInfoFromCompany.objects.bulk_update(
+                    records, fields, batch_size=VesselInfoBulkService.KEY_CHUNK_SIZE
+                )
+                updated_records.extend(records)
+            VesselInfoStatsService.apply(
+                removed=[info._loaded_stats_state for info in updated_records],
+                added=[info.get_stats_state() for info in new_records + updated_records]
+            )
+            invalidate_vessel_info_snapshots(
+                (info.polCd, info.podCd) for info in new_records + updated_records
+            )
+
+        return {'created': len(new_records), 'updated': len(updated_records), 'failed': failed}
+
+    @staticmethod
+    def create_job(file_name: str, file_format: str = None, user=None) -> VesselInfoImportJob:
+        """创建导入任务，未指定格式时按扩展名判断"""
+        return VesselInfoImportJob.objects.create(
+            file_name=file_name,
+            file_format=file_format or VesselInfoImportService.detect_format(file_name),
+            created_by=user
+        )
+
+    @staticmethod
+    def _save_progress(job: VesselInfoImportJob, *fields) -> None:
+        """只更新进度字段，不覆盖其他字段"""
+        VesselInfoImportJob.objects.filter(pk=job.pk).update(
+            **{field: getattr(job, field) for field in fields}
+        )
+
+    @staticmethod
+    def run(job: VesselInfoImportJob, file, encoding: str = 'utf-8-sig',
+            chunk_size: int = None, progress_callback=None) -> VesselInfoImportJob:
+        """
+        执行导入任务
+
+        每批数据在独立事务中提交，任务进度随之更新；文件格式或表头错误、某批写入数据库失败时
+        任务标记为失败，此前已提交的批次保留，写入失败的整批数据计入错误报告
+
+        在请求中同步执行（项目没有任务队列），按批提交使单批的锁和事务保持短小
+
+        Args:
+            job: 导入任务
+            file: 以二进制模式打开的文件或上传文件
+            encoding: CSV文件编码
+            chunk_size: 每批处理的行数
+            progress_callback: 每批完成后调用，参数为导入任务
+        """
+        chunk_size = chunk_size or VesselInfoImportService.CHUNK_SIZE
+        progress_fields = ('processed_rows', 'created_count', 'updated_count', 'failed_count')
+
+        job.status = VesselInfoImportJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        VesselInfoImportService._save_progress(job, 'status', 'started_at')
+
+        with tempfile.TemporaryFile() as report_file:
+            # 带BOM的UTF-8，便于用Excel直接打开
+            report = io.TextIOWrapper(report_file, encoding='utf-8-sig', newline='')
+            writer = csv.writer(report)
+            writer.writerow(VesselInfoImportService.ERROR_REPORT_HEADER)
+
+            def _write_errors(failed):
+                for row_number, item, errors in failed:
+                    writer.writerow(
+                        [row_number]
+                        + [item.get(field) for field in VesselInfoBulkService.KEY_FIELDS]
+                        + [errors]
+                    )
+
+            def _flush(chunk):
+                try:
+                    result = VesselInfoImportService.import_chunk(chunk)
+                except DatabaseError as e:
+                    # 本批事务已回滚，整批计为失败后终止导入
+                    _write_errors((row_number, item, f'数据库错误: {str(e)}') for row_number, item in chunk)
+                    job.processed_rows += len(chunk)
+                    job.failed_count += len(chunk)
+                    raise
+                _write_errors(result['failed'])
+                job.processed_rows += len(chunk)
+                job.created_count += result['created']
+                job.updated_count += result['updated']
+                job.failed_count += len(result['failed'])
+                VesselInfoImportService._save_progress(job, *progress_fields)
+                if progress_callback:
+                    progress_callback(job)
+
+            try:
+                chunk = []
+                for row in VesselInfoImportService.iter_rows(file, job.file_format, encoding):
+                    chunk.append(row)
+                    if len(chunk) >= chunk_size:
+                        _flush(chunk)
+                        chunk = []
+                if chunk:
+                    _flush(chunk)
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                job.status = VesselInfoImportJob.STATUS_FAILED
+                job.message = f"导入失败: {str(e)}"
+                logger.warning(f"船舶信息导入任务 {job.pk} 失败: {str(e)}")
+            except DatabaseError as e:
+                job.status = VesselInfoImportJob.STATUS_FAILED
+                job.message = f"导入失败: 数据库错误: {str(e)}，此前已提交的批次保留"
+                logger.error(f"船舶信息导入任务 {job.pk} 写入数据库失败: {str(e)}")
+            else:
+                job.status = VesselInfoImportJob.STATUS_COMPLETED
+                job.message = (
+                    f"导入完成，新增: {job.created_count}，更新: {job.updated_count}，"
+                    f"失败: {job.failed_count}"
+                )
+
+            report.flush()
+            if job.failed_count:
+                report_file.seek(0)
+                job.error_report.save(f'import_{job.pk}_errors.csv', File(report_file), save=False)
+            report.detach()
+
+        job.finished_at = timezone.now()
+        VesselInfoImportService._save_progress(
+            job, *progress_fields, 'status', 'message', 'error_report', 'finished_at'
+        )
+        return job
+
+    @staticmethod
+    def get_progress(job: VesselInfoImportJob) -> Dict:
+        """导入任务的进度和结果"""
+        return {
+            'id': job.id,
+            'file_name': job.file_name,
+            'file_format': job.file_format,
+            'status': job.status,
+            'processed_rows': job.processed_rows,
+            'created_count': job.created_count,
+            'updated_count': job.updated_count,
+            'failed_count': job.failed_count,
+            'message': job.message,
+            'has_error_report': bool(job.error_report),
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+
+
+class VesselScheduleExportService:
+    """
+    船舶航线导出服务
+    按主键分批读取（values_list，不创建模型实例），逐批生成CSV/NDJSON并可gzip压缩，
+    配合StreamingHttpResponse或写文件使用，内存占用与导出行数无关
+    """
+
+    CHUNK_SIZE = 2000
+    MAX_CHUNK_SIZE = 10000
+    FORMATS = ('csv', 'ndjson')
+    GZIP_SUFFIX = '.gz'
+    CONTENT_TYPES = {
+        'csv': 'text/csv; charset=utf-8',
+        'ndjson': 'application/x-ndjson; charset=utf-8',
+    }
+
+    @staticmethod
+    def get_fields() -> List[str]:
+        """导出的字段：航线表的全部数据库列"""
+        return [field.attname for field in VesselSchedule._meta.concrete_fields]
+
+    @staticmethod
+    def parse_format(export_format: str) -> Tuple[str, bool]:
+        """
+        解析导出格式：csv、ndjson，加 .gz 后缀表示gzip压缩
+
+        Returns:
+            tuple: (文件格式, 是否压缩)
+
+        Raises:
+            ValueError: 不支持的格式
+        """
+        export_format = (export_format or 'csv').lower()
+        compress = export_format.endswith(VesselScheduleExportService.GZIP_SUFFIX)
+        file_format = export_format[:-len(VesselScheduleExportService.GZIP_SUFFIX)] if compress else export_format
+        if file_format not in VesselScheduleExportService.FORMATS:
+            supported = [
+                f"{name}{suffix}" for name in VesselScheduleExportService.FORMATS
+                for suffix in ('', VesselScheduleExportService.GZIP_SUFFIX)
+            ]
+            raise ValueError(f"不支持的导出格式: {export_format}，仅支持{'、'.join(supported)}")
+        return file_format, compress
+
+    @staticmethod
+    def get_content_type(export_format: str) -> str:
+        """响应的Content-Type"""
+        file_format, compress = VesselScheduleExportService.parse_format(export_format)
+        return 'application/gzip' if compress else VesselScheduleExportService.CONTENT_TYPES[file_format]
+
+    @staticmethod
+    def get_filename(export_format: str, data_version: int = None) -> str:
+        """导出文件名，如 vessel_schedule_v12_20250527103000.csv.gz"""
+        file_format, compress = VesselScheduleExportService.parse_format(export_format)
+        version = f"_v{data_version}" if data_version else ''
+        suffix = VesselScheduleExportService.GZIP_SUFFIX if compress else ''
+        return f"vessel_schedule{version}_{timezone.localtime().strftime('%Y%m%d%H%M%S')}.{file_format}{suffix}"
+
+    @staticmethod
+    def build_queryset(data_version: int = None, status: Optional[int] = 1, pol_cd: str = None,
+                       pod_cd: str = None, carrier_cd: str = None):
+        """按数据版本、状态、航线和船公司构造导出查询集（管理命令使用）"""
+        queryset = VesselSchedule.objects.all()
+        if data_version is not None:
+            queryset = queryset.filter(data_version=data_version)
+        if status is not None:
+            queryset = queryset.filter(status=status)
+        if pol_cd:
+            queryset = queryset.filter(polCd=pol_cd)
+        if pod_cd:
+            queryset = queryset.filter(podCd=pod_cd)
+        if carrier_cd:
+            queryset = queryset.filter(carriercd=carrier_cd)
+        return queryset
+
+    @staticmethod
+    def iter_batches(queryset, fields: List[str], chunk_size: int = CHUNK_SIZE):
+        """
+        按主键分批读取：每批取 id 大于上一批最大id 的前chunk_size行
+        MySQL驱动会把 iterator() 的整个结果集读入内存，按主键分批在各数据库上都只保留一批
+
+        Yields:
+            list: 一批行元组，字段顺序与fields一致
+        """
+        pk_index = fields.index('id')
+        queryset = queryset.order_by('id')
+        last_id = None
+        while True:
+            batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+            rows = list(batch.values_list(*fields)[:chunk_size])
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1][pk_index]
+
+    @staticmethod
+    def _format_value(value):
+        """时间转为当前时区的ISO格式，与接口返回一致"""
+        if isinstance(value, datetime):
+            return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+        return value
+
+    @staticmethod
+    def _iter_csv(batches, fields: List[str]):
+        """生成CSV：带BOM的表头先输出，之后每批一块"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+
+        for rows in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                [VesselScheduleExportService._format_value(value) for value in row] for row in rows
+            )
+            yield buffer.getvalue().encode('utf-8')
+
+    @staticmethod
+    def _iter_ndjson(batches, fields: List[str]):
+        """生成NDJSON：每行一个JSON对象，每批一块"""
+        for rows in batches:
+            lines = [
+                json.dumps(
+                    {field: VesselScheduleExportService._format_value(value) for field, value in zip(fields, row)},
+                    cls=JSONEncoder, ensure_ascii=False
+                )
+                for row in rows
+            ]
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    @staticmethod
+    def gzip_chunks(chunks):
+        """逐块gzip压缩，每块后同步刷新，客户端可以边下载边解压"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    @staticmethod
+    def stream(queryset, export_format: str = 'csv', chunk_size: int = CHUNK_SIZE):
+        """
+        生成导出内容
+
+        Args:
+            queryset: 航线查询集（排序会被忽略，按主键顺序导出）
+            export_format: csv、ndjson、csv.gz、ndjson.gz
+            chunk_size: 每批读取的行数
+
+        Returns:
+            generator: 字节块
+        """
+        file_format, compress = VesselScheduleExportService.parse_format(export_format)
+        fields = VesselScheduleExportService.get_fields()
+        batches = VesselScheduleExportService.iter_batches(queryset, fields, chunk_size)
+        if file_format == 'csv':
+            chunks = VesselScheduleExportService._iter_csv(batches, fields)
+        else:
+            chunks = VesselScheduleExportService._iter_ndjson(batches, fields)
+        return VesselScheduleExportService.gzip_chunks(chunks) if compress else chunks
+
+
+class ScheduleStatsService:
+    """
+    航线统计汇总服务
+    爬虫发布版本时按数据版本重算 vessel_schedule_stats，归档时删除对应版本；
+    Django中逐条保存/删除航线时由信号按变化前后的统计维度增量更新（apply），
+    queryset.update()等批量修改在事务提交时重算受影响的版本；统计接口只读取汇总表
+    """
+
+    # 统计的变更计数命名空间，重算或删除统计时递增，用于生成统计接口ETag
+    CACHE_NAMESPACE = 'schedule_stats'
+
+    # 统计维度 -> (代码字段, 名称字段)
+    DIMENSION_FIELDS = {
+        VesselScheduleStats.DIMENSION_CARRIER: ('carriercd', None),
+        VesselScheduleStats.DIMENSION_POL: ('polCd', 'pol'),
+        VesselScheduleStats.DIMENSION_POD: ('podCd', 'pod'),
+    }
+    TOP_N = 10
+
+    @staticmethod
+    def compute_versions(versions: List[int]) -> List[VesselScheduleStats]:
+        """按数据版本分组统计航线数量（不写入）；NULL与空字符串合并为空字符串"""
+        counts = Counter()
+        for dimension, (code_field, name_field) in ScheduleStatsService.DIMENSION_FIELDS.items():
+            fields = ['data_version', 'status', code_field] + ([name_field] if name_field else [])
+            rows = VesselSchedule.objects.filter(data_version__in=versions)\
+                .values(*fields)\
+                .annotate(count=Count('id'))\
+                .order_by()
+            for row in rows:
+                name = (row[name_field] or '') if name_field else ''
+                counts[(row['data_version'], row['status'], dimension, row[code_field] or '', name)] += row['count']
+
+        return [
+            VesselScheduleStats(
+                data_version=data_version, status=status, dimension=dimension,
+                code=code, name=name, count=count
+            )
+            for (data_version, status, dimension, code, name), count in counts.items()
+        ]
+
+    @staticmethod
+    def refresh_versions(versions) -> int:
+        """
+        重算指定数据版本的统计
+
+        Returns:
+            int: 写入的统计行数
+        """
+        versions = sorted({version for version in versions if version is not None})
+        if not versions:
+            return 0
+
+        with transaction.atomic():
+            VesselScheduleStats.objects.filter(data_version__in=versions).delete()
+            rows = ScheduleStatsService.compute_versions(versions)
+            VesselScheduleStats.objects.bulk_create(rows, batch_size=1000)
+        CacheHelper.invalidate_namespace(ScheduleStatsService.CACHE_NAMESPACE)
+        return len(rows)
+
+    @staticmethod
+    def _deltas(removed, added) -> Dict[Tuple, int]:
+        """把变化前后的统计维度换算为各统计行 (data_version, status, dimension, code, name) 的数量增量"""
+        deltas = Counter()
+        for states, sign in ((removed, -1), (added, 1)):
+            for state in states:
+                if state is None:
+                    continue
+                data_version, status, carrier_cd, pol_cd, pol, pod_cd, pod = state
+                for dimension, code, name in (
+                    (VesselScheduleStats.DIMENSION_CARRIER, carrier_cd, None),
+                    (VesselScheduleStats.DIMENSION_POL, pol_cd, pol),
+                    (VesselScheduleStats.DIMENSION_POD, pod_cd, pod),
+                ):
+                    deltas[(data_version, status, dimension, code or '', name or '')] += sign
+        return {key: delta for key, delta in deltas.items() if delta}
+
+    @staticmethod
+    def _key_condition(key) -> Q:
+        """统计行的查询条件"""
+        data_version, status, dimension, code, name = key
+        return Q(data_version=data_version, status=status, dimension=dimension, code=code, name=name)
+
+    @staticmethod
+    def _increment(deltas: Dict[Tuple, int]) -> int:
+        """一条UPDATE按各统计行的增量累加，返回更新的行数"""
+        if not deltas:
+            return 0
+        conditions = {key: ScheduleStatsService._key_condition(key) for key in deltas}
+        count_case = Case(*[When(conditions[key], then=Value(delta)) for key, delta in deltas.items()], default=Value(0))
+        condition = Q()
+        for key_condition in conditions.values():
+            condition |= key_condition
+        return VesselScheduleStats.objects.filter(condition).update(
+            count=F('count') + count_case,
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def apply(removed=(), added=()) -> None:
+        """
+        增量更新航线统计，在调用方的事务中执行（回滚时一并撤销）；统计接口缓存由调用方在事务提交后失效
+        查询次数与记录数无关：查询已有统计行、一条UPDATE累加、补齐缺少的行、删除数量归零的行
+
+        Args:
+            removed: 被删除或修改前的统计维度（VesselSchedule.get_stats_state）
+            added: 新增或修改后的统计维度
+        """
+        deltas = ScheduleStatsService._deltas(removed, added)
+        if not deltas:
+            return
+
+        condition = Q()
+        for key in deltas:
+            condition |= ScheduleStatsService._key_condition(key)
+        existing = set(
+            VesselScheduleStats.objects.filter(condition).values_list('data_version', 'status', 'dimension', 'code', 'name')
+        )
+        ScheduleStatsService._increment({key: delta for key, delta in deltas.items() if key in existing})
+
+        missing = {key: delta for key, delta in deltas.items() if key not in existing}
+        if missing:
+            try:
+                with transaction.atomic():
+                    VesselScheduleStats.objects.bulk_create([
+                        VesselScheduleStats(
+                            data_version=data_version, status=status, dimension=dimension,
+                            code=code, name=name, count=count
+                        )
+                        for (data_version, status, dimension, code, name), count in sorted(missing.items())
+                    ])
+            except IntegrityError:
+                # 并发创建了部分统计行：逐行累加，仍不存在的行再创建
+                for key, delta in sorted(missing.items()):
+                    if ScheduleStatsService._increment({key: delta}):
+                        continue
+                    data_version, status, dimension, code, name = key
+                    VesselScheduleStats.objects.create(
+                        data_version=data_version, status=status, dimension=dimension,
+                        code=code, name=name, count=delta
+                    )
+
+        # 与重算结果保持一致：不保留数量为0的统计行
+        if any(delta < 0 for delta in deltas.values()):
+            VesselScheduleStats.objects.filter(condition, count__lte=0).delete()
+
+    @staticmethod
+    def delete_versions(versions) -> None:
+        """删除指定数据版本的统计（版本归档后调用）"""
+        VesselScheduleStats.objects.filter(data_version__in=list(versions)).delete()
+        CacheHelper.invalidate_namespace(ScheduleStatsService.CACHE_NAMESPACE)
+
+    @staticmethod
+    def rebuild() -> Dict:
+        """
+        逐个版本重建全部航线统计，用于初次上线和修复偏差
+
+        Returns:
+            Dict: {'versions': 版本数, 'rows': 统计行数}
+        """
+        versions = sorted(
+            VesselSchedule.objects.order_by().values_list('data_version', flat=True).distinct()
+        )
+        VesselScheduleStats.objects.exclude(data_version__in=versions).delete()
+        CacheHelper.invalidate_namespace(ScheduleStatsService.CACHE_NAMESPACE)
+        rows = sum(ScheduleStatsService.refresh_versions([version]) for version in versions)
+        return {'versions': len(versions), 'rows': rows}
+
+    @staticmethod
+    def _top(dimension: str, code_key: str, name_key: str = None, limit: int = TOP_N) -> List[Dict]:
+        """有效航线数量最多的船公司/港口"""
+        fields = ['code'] + (['name'] if name_key else [])
+        rows = VesselScheduleStats.objects.filter(dimension=dimension, status=1)\
+            .values(*fields)\
+            .annotate(total=Sum('count'))\
+            .order_by('-total', *fields)[:limit]
+
+        result = []
+        for row in rows:
+            item = {code_key: row['code'] or None}
+            if name_key:
+                item[name_key] = row['name'] or None
+            item['count'] = row['total']
+            result.append(item)
+        return result
+
+    @staticmethod
+    def get_status_counts() -> Dict[int, int]:
+        """各状态的航线总数：船公司维度每行航线恰好统计一次，按状态求和即为总数"""
+        return dict(
+            VesselScheduleStats.objects.filter(dimension=VesselScheduleStats.DIMENSION_CARRIER)
+            .values('status')
+            .annotate(total=Sum('count'))
+            .order_by()
+            .values_list('status', 'total')
+        )
+
+    @staticmethod
+    def get_etag() -> str:
+        """
+        统计接口的ETag：由全局版本登记（爬虫发布时在数据库中重算统计，不经过Django缓存）和统计的变更计数组成
+        直接读取登记表的唯一索引，不回退到对vessel_schedule的聚合
+        """
+        namespace = ScheduleStatsService.CACHE_NAMESPACE
+        registry = DataVersionRegistry.objects.filter(
+            polCd=DataVersionRegistry.GLOBAL_CODE, podCd=DataVersionRegistry.GLOBAL_CODE
+        ).values_list('data_version', 'published_at').first()
+        return ConditionalGetHelper.make_etag(
+            namespace, registry, CacheHelper.get_namespace_versions(namespace)[namespace]
+        )
+
+    @staticmethod
+    def get_summary(limit: int = TOP_N) -> Dict:
+        """统计接口数据：总数、有效/无效数量，及有效航线数量最多的船公司、起运港、目的港"""
+        status_counts = ScheduleStatsService.get_status_counts()
+        return {
+            'total_count': sum(status_counts.values()),
+            'active_count': status_counts.get(1, 0),
+            'inactive_count': status_counts.get(0, 0),
+            'carrier_stats': ScheduleStatsService._top(
+                VesselScheduleStats.DIMENSION_CARRIER, 'carriercd', limit=limit
+            ),
+            'pol_stats': ScheduleStatsService._top(
+                VesselScheduleStats.DIMENSION_POL, 'polCd', 'pol', limit=limit
+            ),
+            'pod_stats': ScheduleStatsService._top(
+                VesselScheduleStats.DIMENSION_POD, 'podCd', 'pod', limit=limit
+            ),
+        }
+
+
+class VesselInfoStatsService:
+    """
+    船舶信息统计汇总服务
+    船舶信息写入时按 (船公司, 航线) 维度增量更新 vessel_info_stats 的总数和已填写数：
+    逐条保存/删除由信号处理，bulk_create、bulk_update、原生DELETE等批量写入由调用方传入变化前后的状态
+    """
+
+    TOP_N = 10
+
+    @staticmethod
+    def _deltas(removed, added) -> Dict[Tuple, Tuple[int, int]]:
+        """把变化前后的统计状态换算为各统计行的 (总数, 已填写数) 增量"""
+        deltas = defaultdict(lambda: [0, 0])
+        for states, sign in ((removed, -1), (added, 1)):
+            for state in states:
+                if state is None:
+                    continue
+                carrier_cd, pol_cd, pod_cd, filled = state
+                for key in (
+                    (VesselInfoStats.DIMENSION_CARRIER, carrier_cd, '', ''),
+                    (VesselInfoStats.DIMENSION_ROUTE, '', pol_cd, pod_cd),
+                ):
+                    deltas[key][0] += sign
+                    deltas[key][1] += sign * int(filled)
+        return {key: tuple(delta) for key, delta in deltas.items() if delta != [0, 0]}
+
+    @staticmethod
+    def _key_condition(key) -> Q:
+        """统计行的查询条件"""
+        dimension, carrier_cd, pol_cd, pod_cd = key
+        return Q(dimension=dimension, carrierCd=carrier_cd, polCd=pol_cd, podCd=pod_cd)
+
+    @staticmethod
+    def _increment(deltas: Dict[Tuple, Tuple[int, int]]) -> int:
+        """一条UPDATE按各统计行的增量累加，返回更新的行数"""
+        if not deltas:
+            return 0
+        conditions = {key: VesselInfoStatsService._key_condition(key) for key in deltas}
+        total_case = Case(*[When(conditions[key], then=Value(total)) for key, (total, _) in deltas.items()], default=Value(0))
+        filled_case = Case(*[When(conditions[key], then=Value(filled)) for key, (_, filled) in deltas.items()], default=Value(0))
+        condition = Q()
+        for key_condition in conditions.values():
+            condition |= key_condition
+        return VesselInfoStats.objects.filter(condition).update(
+            total_count=F('total_count') + total_case,
+            filled_count=F('filled_count') + filled_case,
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def apply(removed=(), added=()) -> None:
+        """
+        增量更新统计，在调用方的事务中执行（回滚时一并撤销）
+        查询次数与记录数、统计行数无关：查询已有统计行、一条UPDATE累加、一次bulk_create补齐缺少的行
+
+        Args:
+            removed: 被删除或修改前的记录状态 [(carrierCd, polCd, podCd, 是否已填写), ...]
+            added: 新增或修改后的记录状态
+        """
+        deltas = VesselInfoStatsService._deltas(removed, added)
+        if not deltas:
+            return
+
+        condition = Q()
+        for key in deltas:
+            condition |= VesselInfoStatsService._key_condition(key)
+        existing = set(
+            VesselInfoStats.objects.filter(condition).values_list('dimension', 'carrierCd', 'polCd', 'podCd')
+        )
+        VesselInfoStatsService._increment({key: delta for key, delta in deltas.items() if key in existing})
+
+        missing = {key: delta for key, delta in deltas.items() if key not in existing}
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                VesselInfoStats.objects.bulk_create([
+                    VesselInfoStats(
+                        dimension=dimension, carrierCd=carrier_cd, polCd=pol_cd, podCd=pod_cd,
+                        total_count=total, filled_count=filled
+                    )
+                    for (dimension, carrier_cd, pol_cd, pod_cd), (total, filled) in sorted(missing.items())
+                ])
+        except IntegrityError:
+            # 并发创建了部分统计行：逐行累加，仍不存在的行再创建
+            for key, delta in sorted(missing.items()):
+                if VesselInfoStatsService._increment({key: delta}):
+                    continue
+                dimension, carrier_cd, pol_cd, pod_cd = key
+                VesselInfoStats.objects.create(
+                    dimension=dimension, carrierCd=carrier_cd, polCd=pol_cd, podCd=pod_cd,
+                    total_count=delta[0], filled_count=delta[1]
+                )
+
+    @staticmethod
+    def _filled_condition() -> Q:
+        """已填写补充信息的条件"""
+        condition = Q()
+        for field in VesselInfoFromCompany.FILLED_FIELDS:
+            condition |= Q(**{f'{field}__isnull': False})
+        return condition
+
+    @staticmethod
+    def compute() -> List[VesselInfoStats]:
+        """全量统计（不写入）"""
+        filled = VesselInfoStatsService._filled_condition()
+        stats = []
+        for dimension, fields in (
+            (VesselInfoStats.DIMENSION_CARRIER, ['carrierCd']),
+            (VesselInfoStats.DIMENSION_ROUTE, ['polCd', 'podCd']),
+        ):
+            rows = VesselInfoFromCompany.objects.values(*fields)\
+                .annotate(total=Count('id'), filled=Count('id', filter=filled))\
+                .order_by()
+            stats.extend(
+                VesselInfoStats(
+                    dimension=dimension,
+                    carrierCd=row.get('carrierCd', ''),
+                    polCd=row.get('polCd', ''),
+                    podCd=row.get('podCd', ''),
+                    total_count=row['total'],
+                    filled_count=row['filled'],
+                )
+                for row in rows
+            )
+        return stats
+
+    @staticmethod
+    def rebuild() -> Dict:
+        """
+        全量重建船舶信息统计，用于初次上线和修复偏差
+
+        Returns:
+            Dict: {'rows': 统计行数}
+        """
+        with transaction.atomic():
+            VesselInfoStats.objects.all().delete()
+            stats = VesselInfoStatsService.compute()
+            VesselInfoStats.objects.bulk_create(stats, batch_size=1000)
+        return {'rows': len(stats)}
+
+    @staticmethod
+    def get_summary(limit: int = TOP_N) -> Dict:
+        """同步状态接口数据：总数、已填写数，及记录最多的船公司和航线"""
+        totals = VesselInfoStats.objects.filter(dimension=VesselInfoStats.DIMENSION_CARRIER).aggregate(
+            total=Sum('total_count'), filled=Sum('filled_count'), last_updated=Max('updated_at')
+        )
+        total = totals['total'] or 0
+        filled = totals['filled'] or 0
+
+        carriers = VesselInfoStats.objects.filter(
+            dimension=VesselInfoStats.DIMENSION_CARRIER, total_count__gt=0
+        ).order_by('-total_count', 'carrierCd')[:limit]
+        routes = VesselInfoStats.objects.filter(
+            dimension=VesselInfoStats.DIMENSION_ROUTE, total_count__gt=0
+        ).order_by('-total_count', 'polCd', 'podCd')[:limit]
+
+        return {
+            'vessel_info_count': total,
+            'filled_info_count': filled,
+            'empty_info_count': total - filled,
+            'fill_rate': round(filled / total * 100, 2) if total > 0 else 0,
+            'carrier_stats': [{'carrierCd': row.carrierCd, 'count': row.total_count} for row in carriers],
+            'route_stats': [
+                {'polCd': row.polCd, 'podCd': row.podCd, 'count': row.total_count} for row in routes
+            ],
+            'last_updated': totals['last_updated'],
+        }
+
+
+class CabinGroupingService:
+    """
+    共舱分组服务类
+    负责共舱分组结果的计算，以及按(polCd, podCd, data_version)持久化的分组快照读写
+
+    分组结果在同一数据版本内是确定的，首次计算后写入快照表，
+    后续请求只需一次唯一索引查询；航线或船舶信息变化时由信号失效对应快照
+    """
+
+    # 每条航线、每种分组的变更计数命名空间，失效快照时递增，用于生成接口ETag
+    ROUTE_NAMESPACE = 'cabin_grouping:{kind}:{pol_cd}:{pod_cd}'
+    # 紧凑格式中提到data.route的航线级字段
+    ROUTE_FIELDS = ('polCd', 'podCd', 'pol', 'pod')
+    # 分组计算读取航线的顺序（与航线查询索引 idx_vs_route_lookup 的顺序一致），保证单航线和多航线的分组结果相同
+    SCHEDULE_ORDERING = ('etd_at', 'id')
+    # 多航线查询参数 routes=CNSHA:USNYC,CNSHA:USLAX 的分隔符
+    ROUTES_SEPARATOR = ','
+    ROUTE_CODE_SEPARATOR = ':'
+
+    @staticmethod
+    def get_route_namespace(kind: str, pol_cd: str, pod_cd: str) -> str:
+        """航线分组的缓存命名空间"""
+        return CabinGroupingService.ROUTE_NAMESPACE.format(kind=kind, pol_cd=pol_cd, pod_cd=pod_cd)
+
+    @staticmethod
+    def get_etag(kind: str, pol_cd: str, pod_cd: str, data_version: int,
+                 etd_from=None, etd_to=None, compact: bool = False) -> str:
+        """
+        分组接口的ETag：由已发布版本号、航线分组的变更计数、ETD窗口和响应格式组成，只读缓存，不查询分组数据
+        """
+        namespace = CabinGroupingService.get_route_namespace(kind, pol_cd, pod_cd)
+        return ConditionalGetHelper.make_etag(
+            kind, pol_cd, pod_cd, data_version,
+            CacheHelper.get_namespace_versions(namespace)[namespace],
+            etd_from, etd_to, 'compact' if compact else 'full'
+        )
+
+    @staticmethod
+    def get_batch_etag(kind: str, route_versions: Dict[Tuple[str, str], Optional[int]],
+                       etd_from=None, etd_to=None, compact: bool = False) -> str:
+        """多航线分组接口的ETag：各航线的已发布版本号和分组变更计数（一次读取），以及ETD窗口和响应格式"""
+        namespaces = {
+            route: CabinGroupingService.get_route_namespace(kind, *route) for route in route_versions
+        }
+        namespace_versions = CacheHelper.get_namespace_versions(*namespaces.values())
+        return ConditionalGetHelper.make_etag(
+            kind,
+            [[pol_cd, pod_cd, data_version, namespace_versions[namespaces[(pol_cd, pod_cd)]]]
+             for (pol_cd, pod_cd), data_version in route_versions.items()],
+            etd_from, etd_to, 'compact' if compact else 'full'
+        )
+
+    @staticmethod
+    def parse_routes(value: str, max_routes: int = None) -> List[Tuple[str, str]]:
+        """
+        解析多航线参数，如 "CNSHA:USNYC,CNSHA:USLAX"，重复的航线只保留一次
+
+        Args:
+            value: 航线参数
+            max_routes: 最多允许的航线数量，默认取设置 CABIN_GROUPING_BATCH_MAX_ROUTES
+
+        Returns:
+            List[Tuple[str, str]]: 按参数顺序的 [(polCd, podCd), ...]
+
+        Raises:
+            ValueError: 参数为空、格式错误或航线数量超过上限
+        """
+        routes = []
+        for item in (value or '').split(CabinGroupingService.ROUTES_SEPARATOR):
+            item = item.strip()
+            if not item:
+                continue
+            pol_cd, separator, pod_cd = item.partition(CabinGroupingService.ROUTE_CODE_SEPARATOR)
+            pol_cd, pod_cd = pol_cd.strip(), pod_cd.strip()
+            if not separator or not pol_cd or not pod_cd:
+                raise ValueError(f'航线格式错误: {item}，应为 起运港五字码:目的港五字码')
+            if (pol_cd, pod_cd) not in routes:
+                routes.append((pol_cd, pod_cd))
+
+        if not routes:
+            raise ValueError('缺少必需参数 routes，如 routes=CNSHA:USNYC,CNSHA:USLAX')
+        if max_routes is None:
+            max_routes = getattr(settings, 'CABIN_GROUPING_BATCH_MAX_ROUTES', 20)
+        if len(routes) > max_routes:
+            raise ValueError(f'一次最多查询 {max_routes} 条航线')
+        return routes
+
+    @staticmethod
+    def get_grouping_data(kind: str, pol_cd: str, pod_cd: str,
+                          data_version: int, etd_from: datetime = None,
+                          etd_to: datetime = None) -> Dict:
+        """
+        获取共舱分组数据，优先读取快照，快照不存在时计算并写入
+
+        指定ETD窗口时在数据库中按etd_at过滤后直接计算，不读写快照
+
+        Args:
+            kind: 分组类型（CabinGroupingSnapshot.KIND_*）
+            pol_cd: 起运港代码
+            pod_cd: 目的港代码
+            data_version: 数据版本号
+            etd_from: ETD窗口开始（含）
+            etd_to: ETD窗口结束（不含）
+
+        Returns:
+            Dict: 与接口data字段一致的结构 {version, total_groups, filter, groups}
+        """
+        return CabinGroupingService.get_grouping_data_batch(
+            kind, {(pol_cd, pod_cd): data_version}, etd_from=etd_from, etd_to=etd_to
+        )[(pol_cd, pod_cd)]
+
+    @staticmethod
+    def get_grouping_data_batch(kind: str, route_versions: Dict[Tuple[str, str], Optional[int]],
+                                etd_from: datetime = None, etd_to: datetime = None) -> Dict:
+        """
+        批量获取多条航线的共舱分组数据，与get_grouping_data共用分组快照
+
+        快照一次查询读取；缺失快照的航线一次查询航线、一次查询船舶信息后分别计算，再一次写入快照。
+        指定ETD窗口时同单航线一样不读写快照
+
+        Args:
+            kind: 分组类型（CabinGroupingSnapshot.KIND_*）
+            route_versions: {(polCd, podCd): 已发布版本号}，版本号为None的航线返回空分组
+            etd_from: ETD窗口开始（含）
+            etd_to: ETD窗口结束（不含）
+
+        Returns:
+            Dict: {(polCd, podCd): 与get_grouping_data返回值结构相同的数据}
+        """
+        versions = {route: version for route, version in route_versions.items() if version is not None}
+        route_groups = {}
+
+        if etd_from or etd_to:
+            route_schedules = CabinGroupingService.get_schedules_many(versions, etd_from, etd_to)
+            route_summaries = CabinGroupingService.get_group_summaries_many(versions, etd_from, etd_to)
+            route_groups = {
+                route: json.loads(json.dumps(groups, cls=JSONEncoder, ensure_ascii=False))
+                for route, groups in CabinGroupingService.build_groups_many(
+                    kind, route_schedules, route_summaries
+                ).items()
+            }
+        elif versions:
+            condition = Q()
+            for (pol_cd, pod_cd), data_version in versions.items():
+                condition |= Q(polCd=pol_cd, podCd=pod_cd, data_version=data_version)
+            for pol_cd, pod_cd, payload in CabinGroupingSnapshot.objects.filter(condition, kind=kind).values_list(
+                'polCd', 'podCd', 'payload'
+            ):
+                route_groups[(pol_cd, pod_cd)] = json.loads(payload)
+
+            missing = {route: version for route, version in versions.items() if route not in route_groups}
+            if missing:
+                route_groups.update(CabinGroupingService.build_snapshots(kind, missing))
+
+        results = {}
+        for (pol_cd, pod_cd), data_version in route_versions.items():
+            route_filter = {'polCd': pol_cd, 'podCd': pod_cd}
+            if etd_from or etd_to:
+                route_filter['etd_from'] = etd_from.isoformat() if etd_from else None
+                route_filter['etd_to'] = etd_to.isoformat() if etd_to else None
+            groups = route_groups.get((pol_cd, pod_cd), [])
+            results[(pol_cd, pod_cd)] = {
+                'version': data_version,
+                'total_groups': len(groups),
+                'filter': route_filter,
+                'groups': groups
+            }
+        return results
+
+    @staticmethod
+    def to_compact(grouping_data: Dict) -> Dict:
+        """
+        将分组数据转换为紧凑格式（?format=compact）
+
+        - 航线级字段（polCd、podCd、pol、pod）提到data.route，与之相同的航线省略这些字段
+        - 每个分组内的共舱配置去重后放在分组的share_cabins中，航线的shareCabins改为其下标
+
+        Args:
+            grouping_data: get_grouping_data返回的数据
+
+        Returns:
+            Dict: 增加format、route字段的紧凑数据，其余字段不变
+        """
+        first_schedule = next(
+            (schedule for group in grouping_data['groups'] for schedule in group['schedules']), None
+        )
+        route = {}
+        if first_schedule is not None:
+            route = {field: first_schedule.get(field) for field in CabinGroupingService.ROUTE_FIELDS}
+
+        groups = []
+        for group in grouping_data['groups']:
+            # 组内的共舱配置通常只有一两种，按值比较查找下标比序列化后做字典键更快
+            share_cabins = []
+            schedules = []
+            for schedule in group['schedules']:
+                item = {
+                    key: value for key, value in schedule.items()
+                    if key not in route or value != route[key]
+                }
+                config = schedule.get('shareCabins')
+                if config not in share_cabins:
+                    share_cabins.append(config)
+                item['shareCabins'] = share_cabins.index(config)
+                schedules.append(item)
+
+            groups.append(dict(group, share_cabins=share_cabins, schedules=schedules))
+
+        return dict(grouping_data, format='compact', route=route, groups=groups)
+
+    @staticmethod
+    def get_route_schedules(pol_cd: str, pod_cd: str, data_version: int):
+        """指定航线和版本的有效航线查询集"""
+        return VesselSchedule.objects.filter(
+            polCd=pol_cd,
+            podCd=pod_cd,
+            status=1,
+            data_version=data_version
+        ).order_by(*CabinGroupingService.SCHEDULE_ORDERING)
+
+    @staticmethod
+    def get_schedules_many(route_versions: Dict[Tuple[str, str], int],
+                           etd_from: datetime = None, etd_to: datetime = None) -> Dict[Tuple[str, str], List]:
+        """
+        一次查询读取多条航线指定版本的有效航线，按航线拆分
+
+        Returns:
+            Dict: {(polCd, podCd): 航线列表}，顺序与get_route_schedules相同
+        """
+        route_schedules = {route: [] for route in route_versions}
+        if not route_versions:
+            return route_schedules
+
+        queryset = CabinGroupingService._get_schedules_queryset(route_versions, etd_from, etd_to)
+        for schedule in queryset.order_by(*CabinGroupingService.SCHEDULE_ORDERING):
+            route_schedules[(schedule.polCd, schedule.podCd)].append(schedule)
+        return route_schedules
+
+    @staticmethod
+    def get_group_summaries_many(route_versions: Dict[Tuple[str, str], int],
+                                 etd_from: datetime = None, etd_to: datetime = None) -> Dict[Tuple[str, str], Dict]:
+        """
+        一次GROUP BY查询多条航线的共舱分组：按 (polCd, podCd, carrier_set_hash) 分组（索引 idx_vs_carrier_set）
+
+        尚未回填carrier_set的航线归入carrier_set_hash为None的分组，由分组计算在内存中拆分；
+        earliest_etd_at为分组内最早的ETD（MIN(etd_at)），用于选取cabin_price
+
+        Returns:
+            Dict: {(polCd, podCd): {carrier_set_hash: {'carrier_set', 'schedule_count', 'earliest_etd_at'}}}
+        """
+        route_summaries = {route: {} for route in route_versions}
+        if not route_versions:
+            return route_summaries
+
+        queryset = CabinGroupingService._get_schedules_queryset(route_versions, etd_from, etd_to)
+        rows = queryset.order_by().values('polCd', 'podCd', 'carrier_set_hash').annotate(
+            carrier_set=Max('carrier_set'), schedule_count=Count('id'), earliest_etd_at=Min('etd_at')
+        )
+        for row in rows:
+            route_summaries[(row['polCd'], row['podCd'])][row['carrier_set_hash']] = {
+                'carrier_set': row['carrier_set'],
+                'schedule_count': row['schedule_count'],
+                'earliest_etd_at': row['earliest_etd_at'],
+            }
+        return route_summaries
+
+    @staticmethod
+    def _get_schedules_queryset(route_versions: Dict[Tuple[str, str], int],
+                                etd_from: datetime = None, etd_to: datetime = None):
+        """多条航线指定版本（及ETD窗口内）的有效航线查询集"""
+        condition = Q()
+        for (pol_cd, pod_cd), data_version in route_versions.items():
+            condition |= Q(polCd=pol_cd, podCd=pod_cd, data_version=data_version)
+        return ScheduleDateTimeService.filter_etd_window(
+            VesselSchedule.objects.filter(condition, status=1), etd_from, etd_to
+        )
+
+    @staticmethod
+    def get_route_group_summaries(schedules: List[VesselSchedule]) -> Dict:
+        """查询一组航线（同一航线、同一版本）的分组汇总，供未传入汇总的调用方使用"""
+        if not schedules:
+            return {}
+        route = (schedules[0].polCd, schedules[0].podCd)
+        return CabinGroupingService.get_group_summaries_many({route: schedules[0].data_version})[route]
+
+    @staticmethod
+    def group_schedules(schedules: List[VesselSchedule], group_summaries: Dict) -> List[Tuple[List[str], Dict, List]]:
+        """
+        按共舱船公司组合划分航线
+
+        分组及其船公司组合取自数据库GROUP BY carrier_set_hash的结果（get_group_summaries_many），
+        航线按carrier_set_hash直接归入分组；尚未回填carrier_set的航线解析shareCabins计算哈希后并入对应分组
+
+        Returns:
+            List[Tuple[List[str], Dict, List]]: [(船公司代码列表, 分组汇总, 航线列表)]，按分组首条航线的顺序排列
+        """
+        group_summaries = dict(group_summaries)
+        groups = {}
+        for schedule in schedules:
+            group_hash = schedule.carrier_set_hash if schedule.carrier_set is not None else None
+            if group_hash is None or group_hash not in group_summaries:
+                carrier_set = ShareCabinService.SEPARATOR.join(ShareCabinService.get_schedule_carrier_codes(schedule))
+                group_hash = ShareCabinService.get_carrier_set_hash(carrier_set)
+                group_summaries.setdefault(
+                    group_hash, {'carrier_set': carrier_set, 'schedule_count': 0, 'earliest_etd_at': None}
+                )
+            if group_hash not in groups:
+                summary = group_summaries[group_hash]
+                carrier_set = summary['carrier_set']
+                groups[group_hash] = (
+                    carrier_set.split(ShareCabinService.SEPARATOR) if carrier_set else [], summary, []
+                )
+            groups[group_hash][2].append(schedule)
+        return list(groups.values())
+
+    @staticmethod
+    def build_groups(kind: str, pol_cd: str, pod_cd: str, schedules: List[VesselSchedule],
+                     vessel_info_map: Dict = None, group_summaries: Dict = None) -> List[Dict]:
+        """
+        按分组类型计算分组结果
+
+        vessel_info_map为已加载的该航线船舶信息（None时按航线查询），
+        group_summaries为已查询的该航线分组汇总（None时按航线查询）
+        """
+        if not schedules:
+            return []
+        if kind == CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO:
+            return CabinGroupingService.build_groups_with_vessel_info(
+                pol_cd, pod_cd, schedules, vessel_info_map=vessel_info_map, group_summaries=group_summaries
+            )
+        return CabinGroupingService.build_basic_groups(schedules, group_summaries=group_summaries)
+
+    @staticmethod
+    def build_groups_many(kind: str, route_schedules: Dict[Tuple[str, str], List],
+                          route_summaries: Dict[Tuple[str, str], Dict]) -> Dict[Tuple[str, str], List]:
+        """
+        计算多条航线的分组结果
+
+        route_summaries为get_group_summaries_many的结果；含船舶信息的分组一次查询加载全部航线的船舶信息
+        """
+        vessel_info_maps = {}
+        if kind == CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO:
+            vessel_info_maps = VesselInfoService.get_routes_vessel_info_map({
+                route: {schedule.vessel for schedule in schedules}
+                for route, schedules in route_schedules.items() if schedules
+            })
+
+        return {
+            (pol_cd, pod_cd): CabinGroupingService.build_groups(
+                kind, pol_cd, pod_cd, schedules, vessel_info_map=vessel_info_maps.get((pol_cd, pod_cd)),
+                group_summaries=route_summaries.get((pol_cd, pod_cd), {})
+            )
+            for (pol_cd, pod_cd), schedules in route_schedules.items()
+        }
+
+    @staticmethod
+    def build_snapshots(kind: str, route_versions: Dict[Tuple[str, str], int]) -> Dict[Tuple[str, str], List]:
+        """
+        计算多条航线的分组结果并一次写入快照表（已存在的快照保留不覆盖）
+
+        没有航线数据的航线不写入快照
+
+        Returns:
+            Dict: {(polCd, podCd): 分组结果列表}
+        """
+        route_groups = CabinGroupingService.build_groups_many(
+            kind, CabinGroupingService.get_schedules_many(route_versions),
+            CabinGroupingService.get_group_summaries_many(route_versions)
+        )
+
+        # 通过JSON往返，保证首次返回与读取快照返回的数据类型完全一致（如Decimal价格）
+        payloads = {
+            route: json.dumps(groups, cls=JSONEncoder, ensure_ascii=False)
+            for route, groups in route_groups.items() if groups
+        }
+        # 并发请求同时写入同一快照时保留已写入的结果
+        CabinGroupingSnapshot.objects.bulk_create([
+            CabinGroupingSnapshot(
+                kind=kind, polCd=pol_cd, podCd=pod_cd,
+                data_version=route_versions[(pol_cd, pod_cd)], payload=payload
+            )
+            for (pol_cd, pod_cd), payload in payloads.items()
+        ], ignore_conflicts=True)
+
+        return {route: json.loads(payloads[route]) if route in payloads else [] for route in route_groups}
+
+    @staticmethod
+    def build_snapshot(kind: str, pol_cd: str, pod_cd: str, data_version: int) -> List[Dict]:
+        """
+        计算指定航线和版本的分组结果并写入快照表（已存在则覆盖）
+
+        没有航线数据时不写入快照，避免任意查询参数在快照表中产生空记录
+
+        Returns:
+            List[Dict]: 分组结果列表
+        """
+        schedules = list(CabinGroupingService.get_route_schedules(pol_cd, pod_cd, data_version))
+
+        if not schedules:
+            return []
+
+        groups = CabinGroupingService.build_groups(kind, pol_cd, pod_cd, schedules)
+
+        # 通过JSON往返，保证首次返回与读取快照返回的数据类型完全一致（如Decimal价格）
+        payload = json.dumps(groups, cls=JSONEncoder, ensure_ascii=False)
+        try:
+            CabinGroupingSnapshot.objects.update_or_create(
+                kind=kind, polCd=pol_cd, podCd=pod_cd, data_version=data_version,
+                defaults={'payload': payload}
+            )
+        except IntegrityError:
+            # 并发请求同时写入同一快照，保留已写入的结果即可
+            logger.info(f"共舱分组快照已由其他请求生成: {kind} {pol_cd}->{pod_cd} v{data_version}")
+
+        return json.loads(payload)
+
+    @staticmethod
+    def invalidate(pol_cd: str, pod_cd: str, data_version: int = None, kinds=None) -> int:
+        """
+        失效指定航线的分组快照
+
+        Args:
+            pol_cd: 起运港代码
+            pod_cd: 目的港代码
+            data_version: 数据版本号，None表示该航线全部版本
+            kinds: 分组类型列表，None表示全部类型
+
+        Returns:
+            int: 删除的快照数量
+        """
+        queryset = CabinGroupingSnapshot.objects.filter(polCd=pol_cd, podCd=pod_cd)
+        if data_version is not None:
+            queryset = queryset.filter(data_version=data_version)
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        deleted_count, _ = queryset.delete()
+        CacheHelper.invalidate_namespace(*(
+            CabinGroupingService.get_route_namespace(kind, pol_cd, pod_cd)
+            for kind in (kinds or [kind for kind, _ in CabinGroupingSnapshot.KIND_CHOICES])
+        ))
+        return deleted_count
+
+    @staticmethod
+    def build_basic_groups(schedules: List[VesselSchedule], group_summaries: Dict = None) -> List[Dict]:
+        """
+        按shareCabins中的船公司组合对航线分组（共舱分组接口）
+
+        Args:
+            schedules: 同一航线、同一版本的有效航线列表
+            group_summaries: 该航线的分组汇总（get_group_summaries_many），None时按航线查询
+
+        Returns:
+            List[Dict]: 按plan_open排序的分组列表
+        """
+        if group_summaries is None:
+            group_summaries = CabinGroupingService.get_route_group_summaries(schedules)
+
+        # 处理每个分组
+        result_groups = []
+        group_id = 1
+
+        for carrier_codes, _, group_schedules in CabinGroupingService.group_schedules(schedules, group_summaries):
+            # 按routeEtd排序
+            group_schedules.sort(key=lambda x: int(x.routeEtd) if x.routeEtd and x.routeEtd.isdigit() else 999)
+
+            # 统计routeEtd出现次数，选择最多的
+            route_etds = [s.routeEtd for s in group_schedules if s.routeEtd]
+            route_etd_counter = Counter(route_etds)
+            plan_open = [etd for etd, count in route_etd_counter.most_common(3)]  # 取前3个最常见的
+
+            # 计算最短航程
+            durations = []
+            for s in group_schedules:
+                if s.totalDuration and s.totalDuration.isdigit():
+                    durations.append(int(s.totalDuration))
+            plan_duration = str(min(durations)) if durations else "--"
+
+            # 构建每个航线的详细信息
+            schedule_details = []
+            for schedule in group_schedules:
+                # 解析shareCabins为JSON格式
+                parsed_share_cabins = []
+                if schedule.shareCabins:
+                    try:
+                        parsed_share_cabins = json.loads(schedule.shareCabins) if isinstance(schedule.shareCabins, str) else schedule.shareCabins
+                    except (json.JSONDecodeError, TypeError):
+                        parsed_share_cabins = []
+
+                schedule_details.append({
+                    'id': schedule.id,
+                    'vessel': schedule.vessel,
+                    'voyage': schedule.voyage,
+                    'polCd': schedule.polCd,
+                    'podCd': schedule.podCd,
+                    'pol': schedule.pol,
+                    'pod': schedule.pod,
+                    'eta': schedule.eta,
+                    'etd': schedule.etd,
+                    'routeEtd': schedule.routeEtd,
+                    'carriercd': schedule.carriercd,
+                    'totalDuration': schedule.totalDuration,
+                    'shareCabins': parsed_share_cabins
+                })
+
+            result_groups.append({
+                'group_id': f"group_{group_id}",
+                'cabins_count': len(carrier_codes),
+                'carrier_codes': carrier_codes,
+                'plan_open': plan_open,
+                'plan_duration': plan_duration,
+                'schedules': schedule_details
+            })
+            group_id += 1
+
+        # 按plan_open排序（周一到周日）
+        def sort_by_plan_open(group):
+            if not group['plan_open']:
+                return 999  # 没有班期的排在最后
+            # 取第一个班期进行排序
+            first_open = group['plan_open'][0]
+            return int(first_open) if first_open.isdigit() else 999
+
+        result_groups.sort(key=sort_by_plan_open)
+        return result_groups
+
+    @staticmethod
+    def build_groups_with_vessel_info(pol_cd: str, pod_cd: str, schedules: List[VesselSchedule],
+                                      vessel_info_map: Dict = None, group_summaries: Dict = None) -> List[Dict]:
+        """
+        按船公司组合分组并附带船舶额外信息（前台航期查询接口）
+
+        Args:
+            pol_cd: 起运港代码
+            pod_cd: 目的港代码
+            schedules: 同一航线、同一版本的有效航线列表
+            vessel_info_map: 已加载的船舶信息映射，None时按航线查询
+            group_summaries: 该航线的分组汇总（get_group_summaries_many），None时按航线查询
+
+        Returns:
+            List[Dict]: 按plan_open排序的分组列表，含cabin_price和现舱标识
+        """
+        # 一次性加载该航线下的船舶额外信息，避免逐条查询
+        if vessel_info_map is None:
+            vessel_info_map = VesselInfoService.get_route_vessel_info_map(
+                pol_cd, pod_cd, vessels={schedule.vessel for schedule in schedules}
+            )
+        if group_summaries is None:
+            group_summaries = CabinGroupingService.get_route_group_summaries(schedules)
+
+        # 按船公司组合分组
+        groups = {}
+        group_counter = 1
+        # 各航线的ETD日期，取自类型化字段，不再逐条解析字符串
+        etd_dates = {}
+
+        # 分组由数据库按carrier_set_hash GROUP BY得到，这里按分组顺序逐条处理航线
+        for carrier_set_codes, summary, group_schedules in CabinGroupingService.group_schedules(
+            schedules, group_summaries
+        ):
+            for schedule in group_schedules:
+                etd_dates[schedule.id] = ScheduleDateTimeService.get_etd_date(schedule)
+                try:
+                    share_cabins = json.loads(schedule.shareCabins) if schedule.shareCabins else []
+                except:
+                    share_cabins = []
+
+                # 分组key：共舱船公司集合（已去重排序），没有共舱信息时为主船公司
+                carrier_codes = carrier_set_codes or [schedule.carriercd]
+                group_key = ShareCabinService.SEPARATOR.join(str(code) for code in carrier_codes)
+
+                if group_key not in groups:
+                    groups[group_key] = {
+                        'group_id': f'group_{group_counter}',
+                        'cabins_count': len(carrier_codes),
+                        'carrier_codes': carrier_codes,
+                        'schedules': [],
+                        'route_etds': [],  # 用于计算plan_open
+                        'total_durations': [],  # 用于计算plan_duration
+                        'earliest_etd_dates': [],  # 用于选取cabin_price
+                    }
+                    group_counter += 1
+                    # 数据库GROUP BY得到的最早ETD（MIN(etd_at)）
+                    if carrier_set_codes and summary['earliest_etd_at'] is not None:
+                        groups[group_key]['earliest_etd_dates'].append(
+                            ScheduleDateTimeService.to_local_date(summary['earliest_etd_at'])
+                        )
+
+                # 没有共舱信息（按主船公司拆分）、尚未回填carrier_set或etd_at的航线
+                # 不能使用数据库分组的MIN(etd_at)，单独计入
+                if not carrier_set_codes or schedule.carrier_set is None or schedule.etd_at is None:
+                    if etd_dates[schedule.id] is not None:
+                        groups[group_key]['earliest_etd_dates'].append(etd_dates[schedule.id])
+
+                # 从内存映射中获取每条航线的船舶额外信息
+                vessel_info = {}
+                vessel_info_obj = vessel_info_map.get(
+                    (schedule.carriercd, schedule.vessel, schedule.voyage)
+                )
+                if vessel_info_obj:
+                    vessel_info = {
+                        'id': vessel_info_obj.id,
+                        'gp_20': vessel_info_obj.gp_20 if vessel_info_obj.gp_20 is not None else '--',
+                        'hq_40': vessel_info_obj.hq_40 if vessel_info_obj.hq_40 is not None else '--',
+                        'price': vessel_info_obj.price if vessel_info_obj.price is not None else '--',
+                        'cut_off_time': vessel_info_obj.cut_off_time if vessel_info_obj.cut_off_time is not None else '--'
+                    }
+
+                # 添加航线到分组
+                groups[group_key]['schedules'].append({
+                    'id': schedule.id,
+                    'vessel': schedule.vessel,
+                    'voyage': schedule.voyage,
+                    'polCd': schedule.polCd,
+                    'podCd': schedule.podCd,
+                    'pol': schedule.pol,
+                    'pod': schedule.pod,
+                    'eta': schedule.eta,
+                    'etd': schedule.etd,
+                    'routeEtd': schedule.routeEtd,
+                    'carriercd': schedule.carriercd,
+                    'totalDuration': schedule.totalDuration,
+                    'shareCabins': share_cabins,
+                    'vessel_info': vessel_info
+                })
+
+                # 收集用于汇总计算的数据
+                if schedule.routeEtd is not None:
+                    groups[group_key]['route_etds'].append(schedule.routeEtd)
+                if schedule.totalDuration is not None:
+                    groups[group_key]['total_durations'].append(schedule.totalDuration)
+
+        # 计算汇总字段
+        for group_key, group_data in groups.items():
+            # 组内按routeEtd排序
+            group_data['schedules'].sort(key=lambda x: x['routeEtd'] if x['routeEtd'] is not None else 999)
+
+            # 计算plan_open：routeEtd出现次数最多的值
+            if group_data['route_etds']:
+                route_etd_counter = Counter(group_data['route_etds'])
+                most_common_etds = route_etd_counter.most_common()
+                # 如果多个相同，选择所有最多的
+                max_count = most_common_etds[0][1]
+                plan_open_values = [etd for etd, count in most_common_etds if count == max_count]
+                # 当有多个最高频率值时，选择最小的值（最早的航线）
+                group_data['plan_open'] = min(plan_open_values) if plan_open_values else None
+            else:
+                group_data['plan_open'] = None
+
+            # 计算plan_duration：totalDuration的最小值
+            if group_data['total_durations']:
+                group_data['plan_duration'] = min(group_data['total_durations'])
+            else:
+                group_data['plan_duration'] = None
+
+            # 计算cabin_price：使用最近ETD日期（最早开船）的航线价格
+            # 最早ETD日期由数据库MIN(etd_at)得到，组内按routeEtd排序后取第一条该日期开船的航线
+            cabin_price = None
+            earliest_etd_schedule = None
+            earliest_etd = min(group_data['earliest_etd_dates'], default=None)
+
+            if earliest_etd is not None:
+                earliest_etd_schedule = next(
+                    (schedule for schedule in group_data['schedules'] if etd_dates.get(schedule['id']) == earliest_etd),
+                    None
+                )
+
+            # 使用最早ETD日期对应的价格
+            if earliest_etd_schedule and earliest_etd_schedule['vessel_info'].get('price'):
+                cabin_price = earliest_etd_schedule['vessel_info']['price']
+
+            # 如果没有价格数据，显示 '--'
+            group_data['cabin_price'] = cabin_price if cabin_price is not None else '--'
+
+            # 计算is_has_gp_20和is_has_hq_40 - 检查字段是否不为空
+            has_gp_20 = False
+            has_hq_40 = False
+
+            for schedule in group_data['schedules']:
+                vessel_info = schedule['vessel_info']
+
+                # 检查gp_20字段是否不为空（不是None、不是空字符串、不是0、不是'--'）
+                gp_20_val = vessel_info.get('gp_20')
+                if (gp_20_val is not None and
+                    str(gp_20_val).strip() != '' and
+                    str(gp_20_val).strip() != '0' and
+                    str(gp_20_val).strip() != '--'):
+                    has_gp_20 = True
+
+                # 检查hq_40字段是否不为空（不是None、不是空字符串、不是0、不是'--'）
+                hq_40_val = vessel_info.get('hq_40')
+                if (hq_40_val is not None and
+                    str(hq_40_val).strip() != '' and
+                    str(hq_40_val).strip() != '0' and
+                    str(hq_40_val).strip() != '--'):
+                    has_hq_40 = True
+
+            group_data['is_has_gp_20'] = '有现舱' if has_gp_20 else '--'
+            group_data['is_has_hq_40'] = '有现舱' if has_hq_40 else '--'
+
+            # 清理临时数据
+            del group_data['route_etds']
+            del group_data['total_durations']
+            del group_data['earliest_etd_dates']
+
+        # 转换为列表并按plan_open排序（周一到周日）
+        groups_list = list(groups.values())
+
+        def sort_key(group):
+            plan_open = group['plan_open']
+            if plan_open is None:
+                return (7, 0)  # 没有plan_open的排在最后
+            elif isinstance(plan_open, list):
+                return (min(plan_open), 0)  # 多个值时取最小的
+            else:
+                return (plan_open, 0)
+
+        groups_list.sort(key=sort_key)
+        return groups_list
+
+
+class ScheduleRetentionService:
+    """
+    航线历史版本保留服务类
+    在vessel_schedule中只保留最近N个已发布版本，更早的版本迁移到归档表：
+    同一航线内容相同的多个版本合并为一条归档记录，航线内容压缩存储
+    """
+
+    # 计算内容哈希时忽略的字段（每个版本都会变化，但不代表航线内容变化）
+    HASH_EXCLUDED_FIELDS = ('id', 'data_version', 'fetch_timestamp', 'fetch_date', 'content_hash')
+
+    @staticmethod
+    def get_archivable_versions(keep_versions: int) -> List[int]:
+        """
+        计算可归档的版本号
+
+        以下版本不会被归档：
+        - 最近keep_versions个已发布版本
+        - 高于全局已发布版本的版本（爬虫暂存中，尚未发布）
+        - 任一航线版本登记仍指向的版本
+
+        Args:
+            keep_versions: 保留的已发布版本数量
+
+        Returns:
+            List[int]: 可归档的版本号（升序）
+        """
+        versions = sorted(
+            VesselSchedule.objects.values_list('data_version', flat=True).distinct(),
+            reverse=True
+        )
+        if not versions:
+            return []
+
+        registered = set(DataVersionRegistry.objects.values_list('data_version', flat=True))
+        published_version = DataVersionRegistry.objects.filter(
+            polCd=DataVersionRegistry.GLOBAL_CODE, podCd=DataVersionRegistry.GLOBAL_CODE
+        ).values_list('data_version', flat=True).first()
+        if published_version is None:
+            published_version = versions[0]
+
+        published = [v for v in versions if v <= published_version]
+        kept = set(published[:max(keep_versions, 1)])
+
+        return sorted(
+            v for v in published
+            if v not in kept and v not in registered
+        )
+
+    @staticmethod
+    def compact(keep_versions: int, dry_run: bool = False, chunk_size: int = 1000) -> Dict:
+        """
+        将超出保留范围的历史版本迁移到归档表
+
+        Args:
+            keep_versions: 保留的已发布版本数量
+            dry_run: 预览模式，只统计不修改
+            chunk_size: 每批处理的记录数
+
+        Returns:
+            Dict: 归档统计
+        """
+        archive_versions = ScheduleRetentionService.get_archivable_versions(keep_versions)
+        result = {
+            'archived_versions': archive_versions,
+            'rows_moved': 0,
+            'archive_created': 0,
+            'archive_merged': 0,
+            'raw_bytes': 0,
+            'archived_bytes': 0,
+            'bytes_reclaimed': 0,
+            'table_bytes_before': ScheduleRetentionService.get_table_bytes(),
+            'table_bytes_after': None,
+        }
+
+        if dry_run:
+            result['rows_moved'] = VesselSchedule.objects.filter(
+                data_version__in=archive_versions
+            ).count()
+            return result
+
+        for data_version in archive_versions:
+            with transaction.atomic():
+                stats = ScheduleRetentionService._archive_version(data_version, chunk_size)
+            for key, value in stats.items():
+                result[key] += value
+            logger.info(f"数据版本 {data_version} 已归档: {stats}")
+
+        result['bytes_reclaimed'] = result['raw_bytes'] - result['archived_bytes']
+        result['table_bytes_after'] = ScheduleRetentionService.get_table_bytes()
+        return result
+
+    @staticmethod
+    def _archive_version(data_version: int, chunk_size: int) -> Dict:
+        """归档单个版本：写入/合并归档记录后删除热表数据"""
+        stats = {'rows_moved': 0, 'archive_created': 0, 'archive_merged': 0,
+                 'raw_bytes': 0, 'archived_bytes': 0}
+        field_names = [f.attname for f in VesselSchedule._meta.concrete_fields]
+        rows = VesselSchedule.objects.filter(data_version=data_version).values(*field_names)
+
+        batch = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                ScheduleRetentionService._archive_rows(batch, data_version, stats)
+                batch = []
+        if batch:
+            ScheduleRetentionService._archive_rows(batch, data_version, stats)
+
+        # 直接删除，不触发post_delete信号（信号会清理VesselInfoFromCompany中的补充信息）
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(VesselScheduleShareCabin._meta.db_table)} "
+                f"WHERE schedule_id IN (SELECT id FROM {connection.ops.quote_name(VesselSchedule._meta.db_table)} "
+                f"WHERE data_version = %s)",
+                [data_version]
+            )
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(VesselSchedule._meta.db_table)} "
+                f"WHERE data_version = %s",
+                [data_version]
+            )
+        CabinGroupingSnapshot.objects.filter(data_version=data_version).delete()
+        ScheduleStatsService.delete_versions([data_version])
+        return stats
+
+    @staticmethod
+    def _archive_rows(rows: List[Dict], data_version: int, stats: Dict) -> None:
+        """将一批航线写入归档表，内容相同的记录只追加版本号"""
+        archives = {}
+        for row in rows:
+            content = {
+                key: value for key, value in row.items()
+                if key not in ScheduleRetentionService.HASH_EXCLUDED_FIELDS
+            }
+            serialized = json.dumps(content, cls=JSONEncoder, ensure_ascii=False, sort_keys=True)
+            content_hash = hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+            stats['rows_moved'] += 1
+            stats['raw_bytes'] += len(serialized.encode('utf-8'))
+            archives[content_hash] = (row, serialized)
+
+        existing = {
+            archive.content_hash: archive
+            for archive in VesselScheduleArchive.objects.filter(content_hash__in=list(archives))
+        }
+
+        to_create = []
+        to_update = []
+        for content_hash, (row, serialized) in archives.items():
+            archive = existing.get(content_hash)
+            if archive:
+                versions = archive.get_versions()
+                if data_version not in versions:
+                    versions.append(data_version)
+                    archive.versions = json.dumps(sorted(versions))
+                    archive.version_count = len(versions)
+                    archive.first_version = min(archive.first_version, data_version)
+                    archive.last_version = max(archive.last_version, data_version)
+                    archive.archived_at = timezone.now()
+                    to_update.append(archive)
+                continue
+
+            payload = zlib.compress(serialized.encode('utf-8'))
+            stats['archived_bytes'] += len(payload)
+            to_create.append(VesselScheduleArchive(
+                polCd=row['polCd'],
+                podCd=row['podCd'],
+                vessel=row['vessel'],
+                voyage=row['voyage'],
+                content_hash=content_hash,
+                first_version=data_version,
+                last_version=data_version,
+                version_count=1,
+                versions=json.dumps([data_version]),
+                payload=payload,
+            ))
+
+        VesselScheduleArchive.objects.bulk_create(to_create)
+        VesselScheduleArchive.objects.bulk_update(
+            to_update, ['versions', 'version_count', 'first_version', 'last_version', 'archived_at']
+        )
+        stats['archive_created'] += len(to_create)
+        stats['archive_merged'] += len(to_update)
+
+    @staticmethod
+    def get_table_bytes() -> Optional[int]:
+        """
+        获取vessel_schedule表占用空间（数据+索引），仅MySQL支持，其他数据库返回None
+        """
+        if connection.vendor != 'mysql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT data_length + index_length FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s",
+                [VesselSchedule._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+
+    @staticmethod
+    def optimize_table() -> None:
+        """回收已删除记录占用的空间（MySQL执行OPTIMIZE TABLE）"""
+        if connection.vendor != 'mysql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"OPTIMIZE TABLE {connection.ops.quote_name(VesselSchedule._meta.db_table)}")
+            cursor.fetchall()
+
+
 # 导出服务类
 __all__ = [
+    'DataVersionService',
+    'ScheduleDateTimeService',
+    'ShareCabinService',
     'VesselScheduleService',
-    'VesselInfoService'
+    'VesselInfoService',
+    'VesselInfoBulkService',
+    'VesselInfoImportService',
+    'VesselScheduleExportService',
+    'ScheduleStatsService',
+    'VesselInfoStatsService',
+    'CabinGroupingService',
+    'ScheduleRetentionService'
 ]
\ No newline at end of file
@@ -4,91 +4,245 @@ VesselSchedule数据同步信号处理器
 """
 import json
 import logging
-from django.db.models.signals import post_save, post_delete
+import threading
+import weakref
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import VesselSchedule, VesselInfoFromCompany
+from .models import VesselSchedule, VesselInfoFromCompany, CabinGroupingSnapshot
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 
+# 每次对账处理的航线ID数量
+SYNC_FLUSH_CHUNK_SIZE = 1000
+
+# 按线程隔离的bulk_vessel_schedule_sync上下文缓冲区；当前事务的缓冲区记录在数据库连接上
+_sync_state = threading.local()
+
+# 数据库连接上记录当前事务提交回调（弱引用）的属性名
+PENDING_SYNC_ATTR = '_schedule_pending_sync'
+
+
+class _PendingSync:
+    """
+    待同步的航线ID、待重建共舱明细的航线ID、待失效的共舱分组快照和待重算统计的数据版本
+    事务内的保存先记录到缓冲区，事务提交后统一执行一次批量对账
+    """
+
+    def __init__(self):
+        self.schedule_ids = set()
+        self.share_cabin_ids = set()
+        self.snapshot_keys = set()  # (polCd, podCd, data_version)
+        self.stats_versions = set()
+        self.stats_changed = False  # 航线统计已增量更新，需要失效统计接口缓存
+
+    def merge(self, other):
+        """合并另一个缓冲区的内容"""
+        self.schedule_ids.update(other.schedule_ids)
+        self.share_cabin_ids.update(other.share_cabin_ids)
+        self.snapshot_keys.update(other.snapshot_keys)
+        self.stats_versions.update(other.stats_versions)
+        self.stats_changed = self.stats_changed or other.stats_changed
+
+    def flush(self):
+        """批量重建共舱明细、同步船舶信息、重算航线统计并失效分组快照和航线缓存"""
+        from ship_schedule.utils import CacheHelper
+        from .services import CabinGroupingService, ScheduleStatsService, ShareCabinService, VesselScheduleService
+
+        if self.share_cabin_ids:
+            try:
+                ShareCabinService.sync_rows(self.share_cabin_ids, chunk_size=SYNC_FLUSH_CHUNK_SIZE)
+            except Exception as e:
+                logger.error(f"重建航线共舱明细失败: {str(e)}")
+
+        schedule_ids = sorted(self.schedule_ids)
+        for start in range(0, len(schedule_ids), SYNC_FLUSH_CHUNK_SIZE):
+            try:
+                manual_sync_vessel_schedules(
+                    vessel_schedule_ids=schedule_ids[start:start + SYNC_FLUSH_CHUNK_SIZE]
+                )
+            except Exception as e:
+                logger.error(f"批量同步VesselSchedule到VesselInfoFromCompany失败: {str(e)}")
+
+        for pol_cd, pod_cd, data_version in self.snapshot_keys:
+            try:
+                CabinGroupingService.invalidate(pol_cd, pod_cd, data_version=data_version)
+            except Exception as e:
+                logger.error(f"失效共舱分组快照失败 {pol_cd}->{pod_cd}: {str(e)}")
+
+        CacheHelper.invalidate_namespace(*{
+            VesselScheduleService.get_route_namespace(pol_cd, pod_cd)
+            for pol_cd, pod_cd, _ in self.snapshot_keys
+        })
+        if self.snapshot_keys:
+            CacheHelper.invalidate_namespace(VesselScheduleService.LIST_NAMESPACE)
+
+        if self.stats_versions:
+            try:
+                ScheduleStatsService.refresh_versions(self.stats_versions)
+            except Exception as e:
+                logger.error(f"重算航线统计失败 {sorted(self.stats_versions)}: {str(e)}")
+        if self.stats_changed:
+            CacheHelper.invalidate_namespace(ScheduleStatsService.CACHE_NAMESPACE)
+
+
+class _PendingSyncCallback:
+    """
+    事务提交回调，持有当前事务的缓冲区
+    执行时先清除连接上的记录，再对账
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.pending = _PendingSync()
+
+    def __call__(self):
+        callback_ref = getattr(self.connection, PENDING_SYNC_ATTR, None)
+        if callback_ref is not None and callback_ref() is self:
+            setattr(self.connection, PENDING_SYNC_ATTR, None)
+        self.pending.flush()
+
+
+def _get_pending_sync():
+    """
+    获取当前事务的缓冲区，必要时新建并注册事务提交回调
+
+    连接上只保存回调的弱引用：事务或保存点回滚时Django丢弃已注册的回调，
+    弱引用随之失效，缓冲区作废，下次保存重新注册
+    """
+    connection = transaction.get_connection()
+    callback_ref = getattr(connection, PENDING_SYNC_ATTR, None)
+    callback = callback_ref() if callback_ref is not None else None
+
+    if callback is None:
+        callback = _PendingSyncCallback(connection)
+        setattr(connection, PENDING_SYNC_ATTR, weakref.ref(callback))
+        transaction.on_commit(callback)
+    return callback.pending
+
+
+def _enqueue_sync(schedule_ids=(), snapshot_keys=(), share_cabin_ids=(), stats_versions=(), stats_changed=False):
+    """记录需要同步的航线、需要重建共舱明细的航线、需要失效的快照和需要重算统计的版本；不在事务中时立即执行"""
+    bulk = getattr(_sync_state, 'bulk', None)
+    deferred = bulk is not None or transaction.get_connection().in_atomic_block
+    if bulk is not None:
+        target = bulk
+    elif deferred:
+        target = _get_pending_sync()
+    else:
+        target = _PendingSync()
+
+    target.schedule_ids.update(schedule_ids)
+    target.share_cabin_ids.update(share_cabin_ids)
+    target.snapshot_keys.update(snapshot_keys)
+    target.stats_versions.update(stats_versions)
+    target.stats_changed = target.stats_changed or stats_changed
+
+    if not deferred:
+        target.flush()
+
+
+def enqueue_vessel_schedule_sync(schedule_ids, share_cabins=False, data_versions=()):
+    """
+    手动登记需要同步到VesselInfoFromCompany的航线
+    用于queryset.update()等不触发post_save信号的批量修改；修改了shareCabins时传share_cabins=True重建共舱明细，
+    修改了状态、船公司或港口时传入受影响的data_versions重算航线统计
+    """
+    _enqueue_sync(
+        schedule_ids=schedule_ids,
+        share_cabin_ids=schedule_ids if share_cabins else (),
+        stats_versions=data_versions
+    )
+
+
+@contextmanager
+def bulk_vessel_schedule_sync():
+    """
+    批量修改VesselSchedule时暂停逐条同步
+
+    上下文内的保存只记录航线ID和受影响的分组快照，正常退出时统一对账一次
+    （在事务中时于事务提交后执行）；发生异常时丢弃记录。可以嵌套使用。
+
+    用法：
+        with transaction.atomic(), bulk_vessel_schedule_sync():
+            for schedule in schedules:
+                schedule.save()
+    """
+    outer = getattr(_sync_state, 'bulk', None)
+    buffer = _PendingSync()
+    _sync_state.bulk = buffer
+    try:
+        yield buffer
+    except BaseException:
+        _sync_state.bulk = outer
+        raise
+    _sync_state.bulk = outer
+    if outer is not None:
+        outer.merge(buffer)
+    else:
+        _enqueue_sync(
+            buffer.schedule_ids, buffer.snapshot_keys, buffer.share_cabin_ids, buffer.stats_versions,
+            buffer.stats_changed
+        )
+
+
+@receiver(pre_save, sender=VesselSchedule)
+def populate_vessel_schedule_derived_fields(sender, instance, update_fields=None, raw=False, **kwargs):
+    """
+    VesselSchedule保存前，填充由字符串字段推导的字段：
+    - 根据eta、etd及各截止时间字符串填充类型化时间字段
+    - 根据shareCabins填充共舱船公司集合carrier_set、carrier_set_hash
+    - 清空抓取程序写入的内容哈希content_hash，下次抓取时该航线完整写入，
+      不会把修改前的上游内容（如原shareCabins、状态）沿用到新版本
+
+    指定update_fields且不包含对应的源字段时跳过，避免读取延迟加载的字段；
+    只更新shareCabins时需要把carrier_set、carrier_set_hash、content_hash一并加入update_fields
+    （即VesselSchedule.SHARE_CABIN_FIELDS），update_fields不包含content_hash时单独清空
+    """
+    from .services import ScheduleDateTimeService, ShareCabinService
+    update_fields = set(update_fields) if update_fields is not None else None
+    if update_fields is None or update_fields & set(VesselSchedule.DATETIME_FIELDS):
+        ScheduleDateTimeService.populate(instance)
+    if update_fields is None or update_fields & {'shareCabins', 'carriercd'}:
+        ShareCabinService.populate(instance)
+    # 加载fixture等原样保存时保留内容哈希
+    if not raw and (update_fields is None or update_fields - VesselSchedule.DERIVED_FIELDS):
+        instance.content_hash = None
+        if update_fields is not None and 'content_hash' not in update_fields and instance.pk:
+            VesselSchedule.objects.filter(pk=instance.pk).exclude(content_hash=None).update(content_hash=None)
+
+
+@receiver(post_save, sender=VesselSchedule)
+def sync_share_cabin_rows(sender, instance, created, update_fields=None, **kwargs):
+    """
+    VesselSchedule保存后，按shareCabins重建共舱明细记录（包括无效数据）
+
+    与船舶信息同步共用缓冲区，事务提交后批量重建；只更新其他字段时跳过
+    """
+    if created or update_fields is None or set(update_fields) & {'shareCabins', 'carriercd'}:
+        _enqueue_sync(share_cabin_ids=[instance.id])
+
+
 @receiver(post_save, sender=VesselSchedule)
 def sync_vessel_schedule_to_info(sender, instance, created, **kwargs):
     """
     VesselSchedule创建或更新时，同步到VesselInfoFromCompany
     
     同步逻辑：
-    1. 解析shareCabins字段，提取所有船公司代码
-    2. 为每个船公司创建或更新VesselInfoFromCompany记录
-    3. 关联字段从VesselSchedule同步，补充字段保持原值或设为空
+    1. 航线ID记录到当前事务的缓冲区，事务提交后统一批量对账（不在事务中时立即对账）
+    2. 对账时解析shareCabins字段，为每个船公司创建缺少的VesselInfoFromCompany记录
+    3. 已存在的记录保留已填写的补充字段
     """
-    try:
-        # 只同步有效的数据
-        if instance.status != 1:
-            logger.info(f"跳过同步：VesselSchedule {instance.id} 状态为无效")
-            return
-        
-        # 解析shareCabins字段
-        carrier_codes = extract_carrier_codes_from_share_cabins(instance.shareCabins)
-        
-        if not carrier_codes:
-            # 如果没有共舱信息，使用VesselSchedule的船公司代码
-            if instance.carriercd:
-                carrier_codes = [instance.carriercd]
-            else:
-                logger.warning(f"VesselSchedule {instance.id} 没有有效的船公司信息")
-                return
-        
-        # 为每个船公司创建或更新VesselInfoFromCompany记录
-        created_count = 0
-        updated_count = 0
-        
-        for carrier_code in carrier_codes:
-            vessel_info, created = VesselInfoFromCompany.objects.get_or_create(
-                carriercd=carrier_code,
-                polCd=instance.polCd,
-                podCd=instance.podCd,
-                vessel=instance.vessel,
-                voyage=instance.voyage,
-                defaults={
-                    # 补充字段默认为空，允许后续手动填写
-                    'gp_20': None,
-                    'hq_40': None,
-                    'cut_off_time': None,
-                    'price': None,
-                }
-            )
-            
-            if created:
-                created_count += 1
-                logger.info(f"创建VesselInfoFromCompany: {carrier_code} - {instance.vessel} {instance.voyage}")
-            else:
-                # 更新关联字段，但保留已填写的补充字段
-                # 只有当关联字段发生变化时才更新
-                needs_update = False
-                if vessel_info.polCd != instance.polCd:
-                    vessel_info.polCd = instance.polCd
-                    needs_update = True
-                if vessel_info.podCd != instance.podCd:
-                    vessel_info.podCd = instance.podCd
-                    needs_update = True
-                if vessel_info.vessel != instance.vessel:
-                    vessel_info.vessel = instance.vessel
-                    needs_update = True
-                if vessel_info.voyage != instance.voyage:
-                    vessel_info.voyage = instance.voyage
-                    needs_update = True
-                
-                if needs_update:
-                    vessel_info.save()
-                    updated_count += 1
-                    logger.info(f"更新VesselInfoFromCompany: {carrier_code} - {instance.vessel} {instance.voyage}")
-        
-        if created_count > 0 or updated_count > 0:
-            logger.info(f"同步完成：VesselSchedule {instance.id} -> 创建{created_count}条，更新{updated_count}条VesselInfoFromCompany记录")
-    
-    except Exception as e:
-        logger.error(f"同步VesselSchedule {instance.id} 到VesselInfoFromCompany失败: {str(e)}")
+    # 只同步有效的数据
+    if instance.status != 1:
+        logger.info(f"跳过同步：VesselSchedule {instance.id} 状态为无效")
+        return
+
+    _enqueue_sync(schedule_ids=[instance.id])
 
 
 @receiver(post_delete, sender=VesselSchedule)
@@ -99,49 +253,161 @@ def cleanup_vessel_info_on_schedule_delete(sender, instance, **kwargs):
     注意：只清理没有填写补充信息的记录，避免删除有价值的数据
     """
     try:
-        # 解析shareCabins字段
-        carrier_codes = extract_carrier_codes_from_share_cabins(instance.shareCabins)
-        
-        if not carrier_codes and instance.carriercd:
-            carrier_codes = [instance.carriercd]
+        from .services import ShareCabinService
+
+        # 共舱船公司取自carrier_set，尚未回填时解析shareCabins
+        carrier_codes = ShareCabinService.get_schedule_carrier_codes(instance)
         
         if not carrier_codes:
             return
         
-        # 清理没有补充信息的VesselInfoFromCompany记录
-        deleted_count = 0
-        for carrier_code in carrier_codes:
-            try:
-                vessel_info = VesselInfoFromCompany.objects.get(
-                    carriercd=carrier_code,
-                    polCd=instance.polCd,
-                    podCd=instance.podCd,
-                    vessel=instance.vessel,
-                    voyage=instance.voyage
-                )
-                
-                # 只删除没有填写补充信息的记录
-                if (not vessel_info.gp_20 and 
-                    not vessel_info.hq_40 and 
-                    not vessel_info.cut_off_time and 
-                    not vessel_info.price):
-                    vessel_info.delete()
-                    deleted_count += 1
-                    logger.info(f"删除空的VesselInfoFromCompany: {carrier_code} - {instance.vessel} {instance.voyage}")
-                else:
-                    logger.info(f"保留有补充信息的VesselInfoFromCompany: {carrier_code} - {instance.vessel} {instance.voyage}")
-            
-            except VesselInfoFromCompany.DoesNotExist:
-                # 记录不存在，跳过
-                pass
-        
+        # 清理没有补充信息的VesselInfoFromCompany记录：一次查询各共舱船公司的记录，
+        # 补充字段均为空（None、空字符串或价格为0）的才删除
+        empty = Q(price__isnull=True) | Q(price=0)
+        for field in ('gp_20', 'hq_40', 'cut_off_time'):
+            empty &= Q(**{f'{field}__isnull': True}) | Q(**{field: ''})
+        deleted_count, _ = VesselInfoFromCompany.objects.filter(
+            empty,
+            carrierCd__in=carrier_codes,
+            polCd=instance.polCd,
+            podCd=instance.podCd,
+            vessel=instance.vessel,
+            voyage=instance.voyage
+        ).delete()
+
         if deleted_count > 0:
-            logger.info(f"清理完成：删除{deleted_count}条空的VesselInfoFromCompany记录")
-    
+            logger.info(
+                f"清理完成：删除{deleted_count}条空的VesselInfoFromCompany记录 - {instance.vessel} {instance.voyage}"
+            )
+
     except Exception as e:
         logger.error(f"清理VesselSchedule {instance.id} 相关VesselInfoFromCompany记录失败: {str(e)}")
 
 
+@receiver(post_save, sender=VesselSchedule)
+@receiver(post_delete, sender=VesselSchedule)
+def invalidate_grouping_snapshot_on_schedule_change(sender, instance, **kwargs):
+    """
+    VesselSchedule变化时，失效对应航线和版本的全部共舱分组快照
+
+    与船舶信息同步共用缓冲区，同一事务中的多次修改只失效一次
+    """
+    _enqueue_sync(snapshot_keys=[(instance.polCd, instance.podCd, instance.data_version)])
+
+
+@receiver(post_save, sender=VesselSchedule)
+def update_schedule_stats_on_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """
+    VesselSchedule保存后，按保存前后的统计维度增量更新航线统计（在当前事务中执行）
+    保存前的状态在从数据库加载时记录；无法得知原状态（未经加载直接保存、原样加载fixture）时，
+    以及在bulk_vessel_schedule_sync上下文中，改为在事务提交后重算受影响的版本
+    """
+    from .services import ScheduleStatsService
+
+    old_state = None if created else getattr(instance, '_loaded_stats_state', None)
+    if raw or getattr(_sync_state, 'bulk', None) is not None or (not created and old_state is None):
+        versions = {instance.data_version} | ({old_state[0]} if old_state else set())
+        _enqueue_sync(stats_versions=versions)
+        instance._loaded_stats_state = instance.get_stats_state()
+        return
+
+    if update_fields is None:
+        state = instance.get_stats_state()
+    else:
+        # 只保存了部分字段时，其余维度沿用保存前的状态
+        state = tuple(
+            getattr(instance, field) if field in update_fields else value
+            for field, value in zip(VesselSchedule.STATS_FIELDS, old_state)
+        )
+    ScheduleStatsService.apply(removed=[old_state] if old_state else [], added=[state])
+    instance._loaded_stats_state = state
+    _enqueue_sync(stats_changed=True)
+
+
+@receiver(post_delete, sender=VesselSchedule)
+def update_schedule_stats_on_delete(sender, instance, **kwargs):
+    """VesselSchedule删除后，扣减航线统计；在bulk_vessel_schedule_sync上下文中于事务提交后重算该版本"""
+    from .services import ScheduleStatsService
+
+    state = getattr(instance, '_loaded_stats_state', None) or instance.get_stats_state()
+    if state is None:
+        logger.warning(f"VesselSchedule {instance.pk} 统计维度字段未加载，跳过统计更新")
+        return
+    if getattr(_sync_state, 'bulk', None) is not None:
+        _enqueue_sync(stats_versions=[state[0]])
+        return
+    ScheduleStatsService.apply(removed=[state])
+    _enqueue_sync(stats_changed=True)
+
+
+@receiver(post_save, sender=VesselInfoFromCompany)
+@receiver(post_delete, sender=VesselInfoFromCompany)
+def invalidate_grouping_snapshot_on_vessel_info_change(sender, instance, **kwargs):
+    """
+    VesselInfoFromCompany变化时，失效对应航线的含船舶信息分组快照
+
+    船舶信息不区分数据版本，因此失效该航线所有版本的快照
+    """
+    _invalidate_grouping_snapshot(
+        instance.polCd, instance.podCd,
+        kinds=[CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO]
+    )
+
+
+@receiver(post_save, sender=VesselInfoFromCompany)
+def update_vessel_info_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    VesselInfoFromCompany保存后，按保存前后的统计状态增量更新船舶信息统计
+    保存前的状态在从数据库加载时记录；未经加载直接保存已有记录时无法得知原状态，跳过（可用rebuild_stats_rollups修复）
+    """
+    from .services import VesselInfoStatsService
+
+    if raw:
+        return
+    state = instance.get_stats_state()
+    if created:
+        VesselInfoStatsService.apply(added=[state])
+    elif hasattr(instance, '_loaded_stats_state'):
+        VesselInfoStatsService.apply(removed=[instance._loaded_stats_state], added=[state])
+    else:
+        logger.warning(f"VesselInfoFromCompany {instance.pk} 未从数据库加载，跳过统计更新")
+    instance._loaded_stats_state = state
+
+
+@receiver(post_delete, sender=VesselInfoFromCompany)
+def update_vessel_info_stats_on_delete(sender, instance, **kwargs):
+    """VesselInfoFromCompany删除后，扣减船舶信息统计"""
+    from .services import VesselInfoStatsService
+
+    state = getattr(instance, '_loaded_stats_state', None) or instance.get_stats_state()
+    VesselInfoStatsService.apply(removed=[state])
+
+
+def invalidate_vessel_info_snapshots(routes):
+    """
+    失效一批航线的含船舶信息分组快照
+    用于bulk_create、bulk_update和原生DELETE等不触发信号的批量修改，每条航线只失效一次
+    """
+    for pol_cd, pod_cd in set(routes):
+        _invalidate_grouping_snapshot(
+            pol_cd, pod_cd,
+            kinds=[CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO]
+        )
+
+
+def _invalidate_grouping_snapshot(pol_cd, pod_cd, data_version=None, kinds=None):
+    """在事务提交后删除快照，避免回滚时误删或读到未提交的数据"""
+    from .services import CabinGroupingService
+
+    def _invalidate():
+        try:
+            CabinGroupingService.invalidate(pol_cd, pod_cd, data_version=data_version, kinds=kinds)
+        except Exception as e:
+            logger.error(f"失效共舱分组快照失败 {pol_cd}->{pod_cd}: {str(e)}")
+
+    transaction.on_commit(_invalidate)
+
+
 def extract_carrier_codes_from_share_cabins(share_cabins_field):
     """
     从shareCabins字段中提取船公司代码列表
@@ -184,81 +450,116 @@ def extract_carrier_codes_from_share_cabins(share_cabins_field):
     return sorted(list(set(carrier_codes)))
 
 
-def manual_sync_vessel_schedules(vessel_schedule_ids=None, force_update=False):
+def manual_sync_vessel_schedules(vessel_schedule_ids=None, force_update=False, chunk_size=1000, dry_run=False):
     """
     手动同步VesselSchedule到VesselInfoFromCompany
     
+    按集合批量同步：流式读取有效航线，在内存中计算需要存在的
+    (船公司, 起运港, 目的港, 船名, 航次) 键集合，一次查询加载已存在的键，
+    缺少的记录按chunk_size分批bulk_create。查询次数与航线数量无关。
+    
     Args:
         vessel_schedule_ids: 指定要同步的VesselSchedule ID列表，None表示同步所有
-        force_update: 是否强制更新已存在的记录
+        force_update: 是否强制更新已存在的记录。关联字段即匹配键，已存在的记录内容必然一致，
+            因此不再逐条保存，仅计入更新统计
+        chunk_size: 每批读取和创建的记录数
+        dry_run: 预览模式，只统计不写入
         
     Returns:
         dict: 同步结果统计
     """
+    from .services import VesselInfoStatsService
+
     logger.info("开始手动同步VesselSchedule到VesselInfoFromCompany")
+    chunk_size = max(1, int(chunk_size))
     
     # 构建查询条件
     queryset = VesselSchedule.objects.filter(status=1)
     if vessel_schedule_ids:
         queryset = queryset.filter(id__in=vessel_schedule_ids)
     
-    total_count = queryset.count()
-    created_count = 0
-    updated_count = 0
+    total_count = 0
     skipped_count = 0
     error_count = 0
+    desired_keys = set()
+    carrier_codes_cache = {}
     
-    logger.info(f"找到{total_count}条VesselSchedule记录需要同步")
+    # 流式读取航线，计算需要存在的船舶信息键
+    rows = queryset.values_list(
+        'carrier_set', 'shareCabins', 'carriercd', 'polCd', 'podCd', 'vessel', 'voyage'
+    ).iterator(chunk_size=chunk_size)
+    for carrier_set, share_cabins, carriercd, pol_cd, pod_cd, vessel, voyage in rows:
+        total_count += 1
+        
+        # 优先使用保存时写入的共舱船公司集合；尚未回填时解析shareCabins，相同的共舱结果集只解析一次
+        if carrier_set is not None:
+            carrier_codes = carrier_set.split(',') if carrier_set else []
+        else:
+            if share_cabins not in carrier_codes_cache:
+                carrier_codes_cache[share_cabins] = extract_carrier_codes_from_share_cabins(share_cabins)
+            carrier_codes = carrier_codes_cache[share_cabins]
+        if not carrier_codes and carriercd:
+            carrier_codes = [carriercd]
+        
+        if not carrier_codes:
+            skipped_count += 1
+            continue
+        
+        for carrier_code in carrier_codes:
+            desired_keys.add((carrier_code, pol_cd, pod_cd, vessel, voyage))
     
-    for i, schedule in enumerate(queryset, 1):
-        try:
-            if i % 100 == 0:
-                logger.info(f"同步进度: {i}/{total_count}")
-            
-            # 解析船公司代码
-            carrier_codes = extract_carrier_codes_from_share_cabins(schedule.shareCabins)
-            if not carrier_codes and schedule.carriercd:
-                carrier_codes = [schedule.carriercd]
-            
-            if not carrier_codes:
-                skipped_count += 1
-                continue
-            
-            # 为每个船公司创建或更新记录
-            for carrier_code in carrier_codes:
-                try:
-                    vessel_info, created = VesselInfoFromCompany.objects.get_or_create(
-                        carriercd=carrier_code,
-                        polCd=schedule.polCd,
-                        podCd=schedule.podCd,
-                        vessel=schedule.vessel,
-                        voyage=schedule.voyage,
-                        defaults={
-                            'gp_20': None,
-                            'hq_40': None,
-                            'cut_off_time': None,
-                            'price': None,
-                        }
+    logger.info(f"找到{total_count}条VesselSchedule记录，需要{len(desired_keys)}条VesselInfoFromCompany记录")
+    
+    # 一次查询加载已存在的键；指定ID时按船名缩小范围
+    existing_queryset = VesselInfoFromCompany.objects.all()
+    if vessel_schedule_ids:
+        existing_queryset = existing_queryset.filter(vessel__in={key[3] for key in desired_keys})
+    existing_keys = set(
+        existing_queryset.values_list('carrierCd', 'polCd', 'podCd', 'vessel', 'voyage').iterator(chunk_size=chunk_size)
+    )
+    
+    missing_keys = sorted(desired_keys - existing_keys)
+    created_count = 0
+    updated_count = len(desired_keys & existing_keys) if force_update else 0
+    
+    if dry_run:
+        created_count = len(missing_keys)
+    else:
+        created_routes = set()
+        created_states = []
+        for start in range(0, len(missing_keys), chunk_size):
+            chunk = missing_keys[start:start + chunk_size]
+            try:
+                # 每批使用独立的保存点：在外层事务中调用时，失败的批次回滚到保存点，不影响外层事务和后续批次
+                with transaction.atomic():
+                    VesselInfoFromCompany.objects.bulk_create(
+                        [
+                            VesselInfoFromCompany(
+                                carrierCd=carrier_code, polCd=pol_cd, podCd=pod_cd,
+                                vessel=vessel, voyage=voyage
+                            )
+                            for carrier_code, pol_cd, pod_cd, vessel, voyage in chunk
+                        ],
+                        ignore_conflicts=True
                     )
-                    
-                    if created:
-                        created_count += 1
-                    elif force_update:
-                        # 强制更新关联字段
-                        vessel_info.polCd = schedule.polCd
-                        vessel_info.podCd = schedule.podCd
-                        vessel_info.vessel = schedule.vessel
-                        vessel_info.voyage = schedule.voyage
-                        vessel_info.save()
-                        updated_count += 1
-                
-                except Exception as e:
-                    logger.error(f"处理船公司{carrier_code}记录失败: {e}")
-                    error_count += 1
+                created_states.extend(
+                    (carrier_code, pol_cd, pod_cd, False) for carrier_code, pol_cd, pod_cd, _, _ in chunk
+                )
+                created_count += len(chunk)
+                created_routes.update((key[1], key[2]) for key in chunk)
+                logger.info(f"同步进度: 已创建{created_count}/{len(missing_keys)}条")
+            except Exception as e:
+                logger.error(f"批量创建VesselInfoFromCompany失败: {e}")
+                error_count += len(chunk)
         
-        except Exception as e:
-            logger.error(f"处理VesselSchedule {schedule.id} 失败: {e}")
-            error_count += 1
+        # 新建的记录都未填写补充信息，统一更新一次统计；并发写入被忽略的冲突行会产生偏差，由rebuild_stats_rollups修复
+        VesselInfoStatsService.apply(added=created_states)
+        
+        # bulk_create不会触发post_save，手动失效受影响航线的含船舶信息分组快照
+        for pol_cd, pod_cd in created_routes:
+            _invalidate_grouping_snapshot(
+                pol_cd, pod_cd, kinds=[CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO]
+            )
     
     result = {
         'total_processed': total_count,
@@ -269,4 +570,4 @@ def manual_sync_vessel_schedules(vessel_schedule_ids=None, force_update=False):
     }
     
     logger.info(f"手动同步完成: {result}")
-    return result 
\ No newline at end of file
+    return result
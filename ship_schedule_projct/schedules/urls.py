@@ -11,10 +11,13 @@ urlpatterns = [
     # 船舶航线搜索和统计接口
     path('schedules/search/', views.vessel_schedule_search, name='vessel-schedule-search'),
     path('schedules/stats/', views.vessel_schedule_stats, name='vessel-schedule-stats'),
+    path('schedules/carrier-sailings/', views.carrier_sailings_api, name='carrier-sailings'),
+    path('schedules/export/', views.VesselScheduleExportView.as_view(), name='vessel-schedule-export'),
     
     # 共舱分组API
     path('schedules/cabin-grouping/', views.cabin_grouping_api, name='cabin-grouping'),
     path('schedules/cabin-grouping-with-info/', views.cabin_grouping_with_vessel_info_api, name='cabin-grouping-with-info'),
+    path('schedules/cabin-grouping-with-info/batch/', views.cabin_grouping_with_vessel_info_batch_api, name='cabin-grouping-with-info-batch'),
     
     # 共舱配置管理API
     path('cabin-config/detail/', views.cabin_config_detail_api, name='cabin-config-detail'),
@@ -29,9 +32,15 @@ urlpatterns = [
     # VesselInfo查询API
     path('vessel-info/query/', views.vessel_info_query_api, name='vessel-info-query'),
     path('vessel-info/bulk-query/', views.vessel_info_bulk_query_api, name='vessel-info-bulk-query'),
+    path('vessel-info/sync-status/', views.vessel_info_sync_status, name='vessel-info-sync-status'),
     
     # VesselInfo批量操作API
     path('vessel-info/bulk-create/', views.vessel_info_bulk_create_api, name='vessel-info-bulk-create'),
     path('vessel-info/bulk-update/', views.vessel_info_bulk_update_api, name='vessel-info-bulk-update'),
     path('vessel-info/bulk-delete/', views.vessel_info_bulk_delete_api, name='vessel-info-bulk-delete'),
+
+    # 价格表导入
+    path('vessel-info/import/', views.vessel_info_import_api, name='vessel-info-import'),
+    path('vessel-info/import/<int:job_id>/', views.vessel_info_import_detail_api, name='vessel-info-import-detail'),
+    path('vessel-info/import/<int:job_id>/errors/', views.vessel_info_import_errors_api, name='vessel-info-import-errors'),
 ] 
\ No newline at end of file
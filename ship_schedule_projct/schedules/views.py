@@ -1,15 +1,17 @@
 from django.shortcuts import render
 from rest_framework import generics, status, filters
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, Count, Max
 from django.db import models
+import codecs
 import json
 from collections import defaultdict, Counter
 from datetime import datetime, timezone
-from .models import VesselSchedule, VesselInfoFromCompany
+from .models import VesselSchedule, VesselInfoFromCompany, CabinGroupingSnapshot, VesselInfoImportJob
 from .serializers import (
     VesselScheduleSerializer,
     VesselScheduleListSerializer,
@@ -19,26 +21,27 @@ from .serializers import (
     CabinGroupingResponseSerializer
 )
 from authentication.permissions import HasPermission, get_permission_map
-from .signals import manual_sync_vessel_schedules
+from authentication.renderers import CompactJSONRenderer, UnicodeJSONRenderer
+from .signals import manual_sync_vessel_schedules, bulk_vessel_schedule_sync
+from .services import (
+    CabinGroupingService, DataVersionService, ScheduleDateTimeService, ScheduleStatsService, ShareCabinService,
+    VesselInfoBulkService, VesselInfoImportService, VesselInfoStatsService, VesselScheduleExportService,
+    VesselScheduleService
+)
+from ship_schedule.utils import ConditionalGetHelper, KeysetPagination
 from django.core.paginator import Paginator, EmptyPage
+from django.http import FileResponse, StreamingHttpResponse
 
 
-class VesselScheduleListCreateView(generics.ListCreateAPIView):
-    """船舶航线列表和创建视图"""
+class VesselScheduleFilterMixin:
+    """船舶航线列表的筛选条件，列表接口和导出接口共用"""
     queryset = VesselSchedule.objects.all()
-    permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'polCd', 'podCd', 'carriercd', 'data_version']
     search_fields = ['vessel', 'voyage', 'pol', 'pod', 'routeCd']
-    ordering_fields = ['fetch_date', 'eta', 'etd', 'data_version']
+    ordering_fields = ['fetch_date', 'eta', 'etd', 'eta_at', 'etd_at', 'data_version']
     ordering = ['-fetch_date']
 
-    def get_serializer_class(self):
-        """根据请求方法选择序列化器"""
-        if self.request.method == 'POST':
-            return VesselScheduleCreateSerializer
-        return VesselScheduleListSerializer
-
     def get_queryset(self):
         """自定义查询集"""
         queryset = VesselSchedule.objects.all()
@@ -64,9 +67,155 @@ class VesselScheduleListCreateView(generics.ListCreateAPIView):
         if date_to:
             queryset = queryset.filter(fetch_date__lte=date_to)
 
+        # 按ETD窗口过滤（etd_from、etd_to、sailing_within_days）
+        try:
+            etd_from, etd_to = get_etd_window(self.request)
+        except ValueError as e:
+            raise ValidationError({'etd': str(e)})
+        queryset = ScheduleDateTimeService.filter_etd_window(queryset, etd_from, etd_to)
+
         return queryset
 
 
+class VesselScheduleListCreateView(VesselScheduleFilterMixin, generics.ListCreateAPIView):
+    """船舶航线列表和创建视图"""
+    permission_classes = [IsAuthenticated]
+
+    def get_serializer_class(self):
+        """根据请求方法选择序列化器"""
+        if self.request.method == 'POST':
+            return VesselScheduleCreateSerializer
+        return VesselScheduleListSerializer
+
+    @property
+    def paginator(self):
+        """携带 pagination=cursor 或 cursor 参数时使用游标分页，否则使用默认的页码分页"""
+        if not hasattr(self, '_paginator') and KeysetPagination.is_requested(self.request):
+            self._paginator = VesselScheduleService.get_keyset_paginator()
+        return super().paginator
+
+
+class VesselScheduleExportView(VesselScheduleFilterMixin, generics.GenericAPIView):
+    """
+    船舶航线流式导出
+    筛选条件与航线列表一致，按主键分批查询、边查询边输出，不在内存中组装整个响应
+
+    参数：
+    - export_format: csv（默认）、ndjson、csv.gz、ndjson.gz（DRF保留了format参数用于内容协商）
+    - chunk_size: 每批读取的行数，默认2000
+    - 其余筛选参数同航线列表，如 data_version、status、pol_cd、pod_cd、etd_from、etd_to
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """导出航线"""
+        export_format = request.query_params.get('export_format', 'csv')
+        try:
+            VesselScheduleExportService.parse_format(export_format)
+            chunk_size = int(request.query_params.get('chunk_size', VesselScheduleExportService.CHUNK_SIZE))
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'message': str(e),
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        chunk_size = min(max(chunk_size, 1), VesselScheduleExportService.MAX_CHUNK_SIZE)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            VesselScheduleExportService.stream(queryset, export_format, chunk_size),
+            content_type=VesselScheduleExportService.get_content_type(export_format)
+        )
+        data_version = request.query_params.get('data_version', '')
+        filename = VesselScheduleExportService.get_filename(
+            export_format, int(data_version) if data_version.isdigit() else None
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+def get_etd_window(request):
+    """
+    从查询参数解析ETD窗口：etd_from、etd_to（日期，含当天）、sailing_within_days（今天起N天内开船）
+
+    Raises:
+        ValueError: 参数格式错误
+    """
+    return ScheduleDateTimeService.parse_etd_window(
+        etd_from=request.GET.get('etd_from'),
+        etd_to=request.GET.get('etd_to'),
+        sailing_within_days=request.GET.get('sailing_within_days')
+    )
+
+
+def get_published_version(request, pol_cd, pod_cd):
+    """
+    读取航线已发布的最新数据版本号，同一请求内ETag和视图共用一次读取
+    """
+    versions = request.__dict__.setdefault('_published_versions', {})
+    if (pol_cd, pod_cd) not in versions:
+        versions[(pol_cd, pod_cd)] = DataVersionService.get_latest_version(pol_cd, pod_cd)
+    return versions[(pol_cd, pod_cd)]
+
+
+def get_published_versions(request, routes):
+    """批量读取多条航线已发布的最新数据版本号，与get_published_version共用请求内的记录"""
+    versions = request.__dict__.setdefault('_published_versions', {})
+    missing = [route for route in routes if route not in versions]
+    if missing:
+        versions.update(DataVersionService.get_latest_versions(missing))
+    return {route: versions[route] for route in routes}
+
+
+def is_compact(request):
+    """是否请求紧凑格式（?format=compact）"""
+    return request.accepted_renderer.format == CompactJSONRenderer.format
+
+
+def get_batch_params(request):
+    """
+    解析多航线分组接口的参数，返回 (航线列表, etd_from, etd_to)
+
+    Raises:
+        ValueError: 参数格式错误
+    """
+    routes = CabinGroupingService.parse_routes(request.GET.get('routes'))
+    etd_from, etd_to = get_etd_window(request)
+    return routes, etd_from, etd_to
+
+
+def batch_grouping_etag(request):
+    """多航线共舱分组接口的ETag函数：参数错误时返回None，交给视图返回400"""
+    try:
+        routes, etd_from, etd_to = get_batch_params(request)
+    except ValueError:
+        return None
+    return CabinGroupingService.get_batch_etag(
+        CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO, get_published_versions(request, routes),
+        etd_from, etd_to, compact=is_compact(request)
+    )
+
+
+def grouping_etag(kind):
+    """
+    共舱分组接口的ETag函数：参数缺失或格式错误时返回None，交给视图返回400
+    """
+    def etag_func(request):
+        pol_cd = request.GET.get('polCd')
+        pod_cd = request.GET.get('podCd')
+        if not pol_cd or not pod_cd:
+            return None
+        try:
+            etd_from, etd_to = get_etd_window(request)
+        except ValueError:
+            return None
+        return CabinGroupingService.get_etag(
+            kind, pol_cd, pod_cd, get_published_version(request, pol_cd, pod_cd), etd_from, etd_to,
+            compact=is_compact(request)
+        )
+    return etag_func
+
+
 class VesselScheduleDetailView(generics.RetrieveUpdateDestroyAPIView):
     """船舶航线详情、更新和删除视图"""
     queryset = VesselSchedule.objects.all()
@@ -109,7 +258,9 @@ class VesselInfoFromCompanyDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 
 @api_view(['GET'])
+@renderer_classes([UnicodeJSONRenderer, CompactJSONRenderer])
 @permission_classes([IsAuthenticated])
+@ConditionalGetHelper.conditional(grouping_etag(CabinGroupingSnapshot.KIND_BASIC))
 def cabin_grouping_api(request):
     """
     共舱分组API
@@ -128,148 +279,40 @@ def cabin_grouping_api(request):
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 构建过滤条件
-        # 首先获取最新的数据版本号
-        latest_version = VesselSchedule.objects.filter(
-            polCd=pol_cd,
-            podCd=pod_cd,
-            status=1
-        ).aggregate(max_version=models.Max('data_version'))['max_version']
+        try:
+            etd_from, etd_to = get_etd_window(request)
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'message': str(e),
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 从版本登记表获取该航线已发布的最新数据版本号
+        latest_version = get_published_version(request, pol_cd, pod_cd)
 
         if latest_version is None:
             latest_version = 1  # 默认版本号
 
-        queryset = VesselSchedule.objects.filter(
-            polCd=pol_cd,
-            podCd=pod_cd,
-            status=1,  # 只查询有效记录
-            data_version=latest_version  # 只查询最新版本
+        # 读取分组快照（不存在时计算并写入）；指定ETD窗口时在数据库中过滤后计算
+        grouping_data = CabinGroupingService.get_grouping_data(
+            CabinGroupingSnapshot.KIND_BASIC, pol_cd, pod_cd, latest_version,
+            etd_from=etd_from, etd_to=etd_to
         )
+        if is_compact(request):
+            grouping_data = CabinGroupingService.to_compact(grouping_data)
 
-        if not queryset.exists():
+        if not grouping_data['groups']:
             return Response({
                 'success': True,
                 'message': '没有找到符合条件的航线数据',
-                'data': {
-                    'version': latest_version,
-                    'total_groups': 0,
-                    'filter': {'polCd': pol_cd, 'podCd': pod_cd},
-                    'groups': []
-                }
+                'data': grouping_data
             })
 
-        # 分组处理
-        groups = defaultdict(list)
-
-        for schedule in queryset:
-            # 解析shareCabins字段获取船公司代码
-            carrier_codes = []
-            if schedule.shareCabins:
-                try:
-                    share_cabins_data = json.loads(schedule.shareCabins) if isinstance(schedule.shareCabins, str) else schedule.shareCabins
-                    if isinstance(share_cabins_data, list):
-                        for cabin in share_cabins_data:
-                            if isinstance(cabin, dict) and 'carrierCd' in cabin:
-                                carrier_codes.append(cabin['carrierCd'])
-                            elif isinstance(cabin, str):
-                                # 如果shareCabins是简单的字符串列表
-                                carrier_codes.append(cabin)
-                except (json.JSONDecodeError, TypeError):
-                    # 如果解析失败，使用当前航线的船公司代码
-                    if schedule.carriercd:
-                        carrier_codes = [schedule.carriercd]
-
-            # 如果没有解析到船公司代码，使用当前航线的船公司代码
-            if not carrier_codes and schedule.carriercd:
-                carrier_codes = [schedule.carriercd]
-
-            # 去重并排序形成分组key
-            unique_carriers = sorted(list(set(carrier_codes)))
-            group_key = ','.join(unique_carriers)
-
-            groups[group_key].append(schedule)
-
-        # 处理每个分组
-        result_groups = []
-        group_id = 1
-
-        for group_key, group_schedules in groups.items():
-            # 按routeEtd排序
-            group_schedules.sort(key=lambda x: int(x.routeEtd) if x.routeEtd and x.routeEtd.isdigit() else 999)
-
-            # 计算汇总字段
-            carrier_codes = group_key.split(',') if group_key else []
-
-            # 统计routeEtd出现次数，选择最多的
-            route_etds = [s.routeEtd for s in group_schedules if s.routeEtd]
-            route_etd_counter = Counter(route_etds)
-            plan_open = [etd for etd, count in route_etd_counter.most_common(3)]  # 取前3个最常见的
-
-            # 计算最短航程
-            durations = []
-            for s in group_schedules:
-                if s.totalDuration and s.totalDuration.isdigit():
-                    durations.append(int(s.totalDuration))
-            plan_duration = str(min(durations)) if durations else "--"
-
-            # 构建每个航线的详细信息
-            schedule_details = []
-            for schedule in group_schedules:
-                # 解析shareCabins为JSON格式
-                parsed_share_cabins = []
-                if schedule.shareCabins:
-                    try:
-                        parsed_share_cabins = json.loads(schedule.shareCabins) if isinstance(schedule.shareCabins, str) else schedule.shareCabins
-                    except (json.JSONDecodeError, TypeError):
-                        parsed_share_cabins = []
-
-                schedule_details.append({
-                    'id': schedule.id,
-                    'vessel': schedule.vessel,
-                    'voyage': schedule.voyage,
-                    'polCd': schedule.polCd,
-                    'podCd': schedule.podCd,
-                    'pol': schedule.pol,
-                    'pod': schedule.pod,
-                    'eta': schedule.eta,
-                    'etd': schedule.etd,
-                    'routeEtd': schedule.routeEtd,
-                    'carriercd': schedule.carriercd,
-                    'totalDuration': schedule.totalDuration,
-                    'shareCabins': parsed_share_cabins
-                })
-
-            group_info = {
-                'group_id': f"group_{group_id}",
-                'cabins_count': len(carrier_codes),
-                'carrier_codes': carrier_codes,
-                'plan_open': plan_open,
-                'plan_duration': plan_duration,
-                'schedules': schedule_details
-            }
-
-            result_groups.append(group_info)
-            group_id += 1
-
-        # 按plan_open排序（周一到周日）
-        def sort_by_plan_open(group):
-            if not group['plan_open']:
-                return 999  # 没有班期的排在最后
-            # 取第一个班期进行排序
-            first_open = group['plan_open'][0]
-            return int(first_open) if first_open.isdigit() else 999
-
-        result_groups.sort(key=sort_by_plan_open)
-
         return Response({
             'success': True,
             'message': '共舱分组数据获取成功',
-            'data': {
-                'version': latest_version,
-                'total_groups': len(result_groups),
-                'filter': {'polCd': pol_cd, 'podCd': pod_cd},
-                'groups': result_groups
-            }
+            'data': grouping_data
         })
 
     except Exception as e:
@@ -306,6 +349,21 @@ def vessel_schedule_search(request):
         if carrier:
             queryset = queryset.filter(carriercd__icontains=carrier)
 
+        # 游标分页：按 (fetch_date, id) 或 (etd_at, id) 定位，不使用OFFSET
+        if KeysetPagination.is_requested(request):
+            paginator = VesselScheduleService.get_keyset_paginator()
+            results = paginator.paginate_queryset(queryset, request)
+            serializer = VesselScheduleListSerializer(results, many=True)
+
+            return Response({
+                'success': True,
+                'message': '搜索成功',
+                'data': {
+                    'results': serializer.data,
+                    **paginator.page_meta
+                }
+            })
+
         # 排序
         queryset = queryset.order_by('-fetch_date', 'eta')
 
@@ -342,45 +400,91 @@ def vessel_schedule_search(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def vessel_schedule_stats(request):
-    """船舶航线统计信息"""
+def carrier_sailings_api(request):
+    """
+    船公司参与共舱的航线查询
+    通过共舱明细表的船公司索引查找，返回已发布版本中包含该船公司的航线，
+    以及按共舱船公司组合统计的航线数量
+
+    参数：
+    - carrierCd: 船公司代码（必需）
+    - polCd / podCd: 起运港、目的港五字码（可选）
+    - page / page_size: 分页参数
+    """
     try:
-        # 总记录数
-        total_count = VesselSchedule.objects.count()
-        active_count = VesselSchedule.objects.filter(status=1).count()
-        inactive_count = VesselSchedule.objects.filter(status=0).count()
-
-        # 按船公司统计
-        carrier_stats = VesselSchedule.objects.filter(status=1)\
-            .values('carriercd')\
-            .annotate(count=Count('id'))\
-            .order_by('-count')[:10]
-
-        # 按起运港统计
-        pol_stats = VesselSchedule.objects.filter(status=1)\
-            .values('polCd', 'pol')\
-            .annotate(count=Count('id'))\
-            .order_by('-count')[:10]
-
-        # 按目的港统计
-        pod_stats = VesselSchedule.objects.filter(status=1)\
-            .values('podCd', 'pod')\
-            .annotate(count=Count('id'))\
-            .order_by('-count')[:10]
+        carrier_cd = request.GET.get('carrierCd')
+        pol_cd = request.GET.get('polCd') or None
+        pod_cd = request.GET.get('podCd') or None
+
+        if not carrier_cd:
+            return Response({
+                'success': False,
+                'message': '缺少必需参数 carrierCd',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 指定航线时使用该航线的已发布版本，否则使用全局版本
+        if pol_cd and pod_cd:
+            latest_version = DataVersionService.get_latest_version(pol_cd, pod_cd)
+        else:
+            latest_version = DataVersionService.get_latest_version()
+
+        if latest_version is None:
+            latest_version = 1  # 默认版本号
+
+        queryset = ShareCabinService.get_carrier_sailings(
+            carrier_cd, latest_version, pol_cd=pol_cd, pod_cd=pod_cd
+        )
+
+        # 分页
+        page_size = int(request.GET.get('page_size', 20))
+        page = int(request.GET.get('page', 1))
+        start = (page - 1) * page_size
+        end = start + page_size
+
+        total_count = queryset.count()
+        results = queryset.order_by('polCd', 'podCd', 'etd_at', 'id')[start:end]
+
+        serializer = VesselScheduleListSerializer(results, many=True)
 
         return Response({
             'success': True,
-            'message': '统计信息获取成功',
+            'message': '查询成功',
             'data': {
+                'version': latest_version,
+                'carrierCd': carrier_cd,
+                'carrier_sets': ShareCabinService.get_carrier_set_counts(queryset),
+                'results': serializer.data,
                 'total_count': total_count,
-                'active_count': active_count,
-                'inactive_count': inactive_count,
-                'carrier_stats': list(carrier_stats),
-                'pol_stats': list(pol_stats),
-                'pod_stats': list(pod_stats)
+                'page': page,
+                'page_size': page_size,
+                'total_pages': (total_count + page_size - 1) // page_size
             }
         })
 
+    except Exception as e:
+        return Response({
+            'success': False,
+            'message': f'查询失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@ConditionalGetHelper.conditional(lambda request: ScheduleStatsService.get_etag())
+def vessel_schedule_stats(request):
+    """
+    船舶航线统计信息
+    读取按数据版本维护的统计汇总表，不扫描vessel_schedule
+    """
+    try:
+        return Response({
+            'success': True,
+            'message': '统计信息获取成功',
+            'data': ScheduleStatsService.get_summary()
+        })
+
     except Exception as e:
         return Response({
             'success': False,
@@ -472,42 +576,18 @@ def vessel_info_sync_status(request):
                 'data': None
             }, status=status.HTTP_403_FORBIDDEN)
 
-        # 统计VesselSchedule
-        total_schedules = VesselSchedule.objects.filter(status=1).count()
-
-        # 统计VesselInfoFromCompany
-        total_vessel_info = VesselInfoFromCompany.objects.count()
-        filled_vessel_info = VesselInfoFromCompany.objects.filter(
-            models.Q(gp_20__isnull=False) |
-            models.Q(hq_40__isnull=False) |
-            models.Q(cut_off_time__isnull=False) |
-            models.Q(price__isnull=False)
-        ).count()
-        empty_vessel_info = total_vessel_info - filled_vessel_info
-
-        # 按船公司统计
-        carrier_stats = VesselInfoFromCompany.objects.values('carriercd')\
-            .annotate(count=Count('id'))\
-            .order_by('-count')[:10]
-
-        # 按航线统计
-        route_stats = VesselInfoFromCompany.objects.values('polCd', 'podCd')\
-            .annotate(count=Count('id'))\
-            .order_by('-count')[:10]
+        # 读取增量维护的统计汇总表，不扫描vessel_schedule和vessel_info_from_company
+        data = {
+            'vessel_schedule_count': ScheduleStatsService.get_status_counts().get(1, 0),
+            **VesselInfoStatsService.get_summary(),
+        }
+        if data['last_updated']:
+            data['last_updated'] = data['last_updated'].isoformat()
 
         return Response({
             'success': True,
             'message': '同步状态获取成功',
-            'data': {
-                'vessel_schedule_count': total_schedules,
-                'vessel_info_count': total_vessel_info,
-                'filled_info_count': filled_vessel_info,
-                'empty_info_count': empty_vessel_info,
-                'fill_rate': round(filled_vessel_info / total_vessel_info * 100, 2) if total_vessel_info > 0 else 0,
-                'carrier_stats': list(carrier_stats),
-                'route_stats': list(route_stats),
-                'last_updated': datetime.now().isoformat()
-            }
+            'data': data
         })
 
     except Exception as e:
@@ -753,41 +833,17 @@ def vessel_info_bulk_create_api(request):
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        if len(bulk_data) > 100:
+        if len(bulk_data) > VesselInfoBulkService.MAX_ITEMS:
             return Response({
                 'success': False,
-                'message': '一次最多创建100条记录',
+                'message': f'一次最多创建{VesselInfoBulkService.MAX_ITEMS}条记录',
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 批量创建
-        created_records = []
-        failed_records = []
-
-        for i, item_data in enumerate(bulk_data):
-            try:
-                serializer = VesselInfoFromCompanySerializer(data=item_data)
-                if serializer.is_valid():
-                    vessel_info = serializer.save()
-                    created_records.append({
-                        'index': i,
-                        'success': True,
-                        'data': VesselInfoFromCompanySerializer(vessel_info).data
-                    })
-                else:
-                    failed_records.append({
-                        'index': i,
-                        'success': False,
-                        'errors': serializer.errors,
-                        'data': item_data
-                    })
-            except Exception as e:
-                failed_records.append({
-                    'index': i,
-                    'success': False,
-                    'errors': str(e),
-                    'data': item_data
-                })
+        # 整批校验后一次写入
+        result = VesselInfoBulkService.bulk_create(bulk_data)
+        created_records = result['created']
+        failed_records = result['failed']
 
         return Response({
             'success': True,
@@ -837,71 +893,17 @@ def vessel_info_bulk_update_api(request):
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        if len(bulk_data) > 100:
+        if len(bulk_data) > VesselInfoBulkService.MAX_ITEMS:
             return Response({
                 'success': False,
-                'message': '一次最多更新100条记录',
+                'message': f'一次最多更新{VesselInfoBulkService.MAX_ITEMS}条记录',
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 批量更新
-        updated_records = []
-        failed_records = []
-
-        for i, item_data in enumerate(bulk_data):
-            try:
-                # 通过关联字段查找记录
-                required_fields = ['carriercd', 'polCd', 'podCd', 'vessel', 'voyage']
-                missing_fields = [field for field in required_fields if field not in item_data]
-
-                if missing_fields:
-                    failed_records.append({
-                        'index': i,
-                        'success': False,
-                        'errors': f'缺少必需字段: {", ".join(missing_fields)}',
-                        'data': item_data
-                    })
-                    continue
-
-                vessel_info = VesselInfoFromCompany.objects.get(
-                    carriercd=item_data['carriercd'],
-                    polCd=item_data['polCd'],
-                    podCd=item_data['podCd'],
-                    vessel=item_data['vessel'],
-                    voyage=item_data['voyage']
-                )
-
-                # 使用序列化器更新
-                serializer = VesselInfoFromCompanySerializer(vessel_info, data=item_data, partial=True)
-                if serializer.is_valid():
-                    updated_vessel_info = serializer.save()
-                    updated_records.append({
-                        'index': i,
-                        'success': True,
-                        'data': VesselInfoFromCompanySerializer(updated_vessel_info).data
-                    })
-                else:
-                    failed_records.append({
-                        'index': i,
-                        'success': False,
-                        'errors': serializer.errors,
-                        'data': item_data
-                    })
-
-            except VesselInfoFromCompany.DoesNotExist:
-                failed_records.append({
-                    'index': i,
-                    'success': False,
-                    'errors': '记录不存在',
-                    'data': item_data
-                })
-            except Exception as e:
-                failed_records.append({
-                    'index': i,
-                    'success': False,
-                    'errors': str(e),
-                    'data': item_data
-                })
+        # 按关联键一次查出全部记录后批量更新
+        result = VesselInfoBulkService.bulk_update(bulk_data)
+        updated_records = result['updated']
+        failed_records = result['failed']
 
         return Response({
             'success': True,
@@ -951,64 +953,17 @@ def vessel_info_bulk_delete_api(request):
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        if len(delete_conditions) > 100:
+        if len(delete_conditions) > VesselInfoBulkService.MAX_ITEMS:
             return Response({
                 'success': False,
-                'message': '一次最多删除100条记录',
+                'message': f'一次最多删除{VesselInfoBulkService.MAX_ITEMS}条记录',
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 批量删除
-        deleted_records = []
-        failed_records = []
-
-        for i, condition in enumerate(delete_conditions):
-            try:
-                # 验证删除条件
-                required_fields = ['carriercd', 'polCd', 'podCd', 'vessel', 'voyage']
-                missing_fields = [field for field in required_fields if field not in condition]
-
-                if missing_fields:
-                    failed_records.append({
-                        'index': i,
-                        'success': False,
-                        'errors': f'缺少必需字段: {", ".join(missing_fields)}',
-                        'condition': condition
-                    })
-                    continue
-
-                vessel_info = VesselInfoFromCompany.objects.get(
-                    carriercd=condition['carriercd'],
-                    polCd=condition['polCd'],
-                    podCd=condition['podCd'],
-                    vessel=condition['vessel'],
-                    voyage=condition['voyage']
-                )
-
-                # 保存删除前的数据用于返回
-                deleted_data = VesselInfoFromCompanySerializer(vessel_info).data
-                vessel_info.delete()
-
-                deleted_records.append({
-                    'index': i,
-                    'success': True,
-                    'data': deleted_data
-                })
-
-            except VesselInfoFromCompany.DoesNotExist:
-                failed_records.append({
-                    'index': i,
-                    'success': False,
-                    'errors': '记录不存在',
-                    'condition': condition
-                })
-            except Exception as e:
-                failed_records.append({
-                    'index': i,
-                    'success': False,
-                    'errors': str(e),
-                    'condition': condition
-                })
+        # 按关联键一次查出全部记录后批量删除
+        result = VesselInfoBulkService.bulk_delete(delete_conditions)
+        deleted_records = result['deleted']
+        failed_records = result['failed']
 
         return Response({
             'success': True,
@@ -1032,6 +987,124 @@ def vessel_info_bulk_delete_api(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _get_import_job(request, job_id):
+    """获取当前用户可查看的导入任务：超级用户可查看全部，其他用户只能查看自己的任务"""
+    queryset = VesselInfoImportJob.objects.all()
+    if not request.user.is_superuser:
+        queryset = queryset.filter(created_by=request.user)
+    return queryset.filter(pk=job_id).first()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def vessel_info_import_api(request):
+    """
+    船舶额外信息价格表导入API
+    上传CSV/XLSX文件（multipart字段file），逐行流式读取后按批新增或更新，返回导入任务结果
+    导入在请求中同步执行，较大的价格表使用import_vessel_info管理命令导入
+    需要vessel_info.create和vessel_info.update权限
+
+    可选参数：
+        file_format: csv 或 xlsx，默认按文件扩展名判断
+        encoding: CSV文件编码，默认utf-8-sig（GBK编码的文件传gbk）
+    """
+    try:
+        # 检查权限
+        permission_map = get_permission_map()
+        if not request.user.is_superuser and not (
+            request.user.has_permission(permission_map.get('vessel_info_create'))
+            and request.user.has_permission(permission_map.get('vessel_info_update'))
+        ):
+            return Response({
+                'success': False,
+                'message': '没有权限导入船舶额外信息',
+                'data': None
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({
+                'success': False,
+                'message': '请上传file文件',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        encoding = request.data.get('encoding') or 'utf-8-sig'
+        try:
+            codecs.lookup(encoding)
+            file_format = request.data.get('file_format') or VesselInfoImportService.detect_format(upload.name)
+            if file_format not in dict(VesselInfoImportJob.FORMAT_CHOICES):
+                raise ValueError(f'不支持的文件格式: {file_format}')
+        except (LookupError, ValueError) as e:
+            return Response({
+                'success': False,
+                'message': f'参数错误: {str(e)}',
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        job = VesselInfoImportService.create_job(upload.name, file_format, user=request.user)
+        job = VesselInfoImportService.run(job, upload, encoding=encoding)
+        completed = job.status == VesselInfoImportJob.STATUS_COMPLETED
+
+        return Response({
+            'success': completed,
+            'message': job.message,
+            'data': VesselInfoImportService.get_progress(job)
+        }, status=status.HTTP_201_CREATED if completed else status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        return Response({
+            'success': False,
+            'message': f'导入失败: {str(e)}',
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def vessel_info_import_detail_api(request, job_id):
+    """
+    船舶额外信息导入任务进度API
+    GET /api/vessel-info/import/{job_id}/
+    """
+    job = _get_import_job(request, job_id)
+    if job is None:
+        return Response({
+            'success': False,
+            'message': '导入任务不存在',
+            'data': None
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'success': True,
+        'message': '导入任务获取成功',
+        'data': VesselInfoImportService.get_progress(job)
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def vessel_info_import_errors_api(request, job_id):
+    """
+    下载导入任务的错误报告（CSV）
+    GET /api/vessel-info/import/{job_id}/errors/
+    """
+    job = _get_import_job(request, job_id)
+    if job is None or not job.error_report:
+        return Response({
+            'success': False,
+            'message': '导入任务不存在或没有错误报告',
+            'data': None
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return FileResponse(
+        job.error_report.open('rb'),
+        as_attachment=True,
+        filename=f'import_{job.id}_errors.csv',
+        content_type='text/csv'
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def cabin_config_detail_api(request):
@@ -1083,7 +1156,7 @@ def cabin_config_detail_api(request):
 
             try:
                 # 获取最新版本的记录
-                latest_version = VesselSchedule.objects.aggregate(max_version=Max('data_version'))['max_version']
+                latest_version = DataVersionService.get_latest_version()
                 schedule = VesselSchedule.objects.get(
                     polCd=pol_cd,
                     podCd=pod_cd,
@@ -1203,7 +1276,7 @@ def cabin_config_update_api(request):
                 }, status=status.HTTP_400_BAD_REQUEST)
 
             try:
-                latest_version = VesselSchedule.objects.aggregate(max_version=Max('data_version'))['max_version']
+                latest_version = DataVersionService.get_latest_version()
                 schedule = VesselSchedule.objects.get(
                     polCd=pol_cd,
                     podCd=pod_cd,
@@ -1272,7 +1345,7 @@ def cabin_config_update_api(request):
 
         # 更新数据库
         schedule.shareCabins = json.dumps(final_config, ensure_ascii=False)
-        schedule.save(update_fields=['shareCabins'])
+        schedule.save(update_fields=VesselSchedule.SHARE_CABIN_FIELDS)
 
         return Response({
             'success': True,
@@ -1349,7 +1422,7 @@ def cabin_config_delete_api(request):
                 }, status=status.HTTP_400_BAD_REQUEST)
 
             try:
-                latest_version = VesselSchedule.objects.aggregate(max_version=Max('data_version'))['max_version']
+                latest_version = DataVersionService.get_latest_version()
                 schedule = VesselSchedule.objects.get(
                     polCd=pol_cd,
                     podCd=pod_cd,
@@ -1397,7 +1470,7 @@ def cabin_config_delete_api(request):
 
         # 更新数据库
         schedule.shareCabins = json.dumps(final_config, ensure_ascii=False) if final_config else None
-        schedule.save(update_fields=['shareCabins'])
+        schedule.save(update_fields=VesselSchedule.SHARE_CABIN_FIELDS)
 
         return Response({
             'success': True,
@@ -1479,111 +1552,115 @@ def cabin_config_bulk_update_api(request):
         # 批量更新处理
         updated_records = []
         failed_records = []
+        latest_version = None  # 首次需要时读取一次，整批更新使用同一版本
 
-        for i, update_item in enumerate(updates):
-            try:
-                # 获取航线记录
-                schedule_id = update_item.get('schedule_id')
-
-                if schedule_id:
-                    try:
-                        schedule = VesselSchedule.objects.get(id=schedule_id, status=1)
-                    except VesselSchedule.DoesNotExist:
-                        failed_records.append({
-                            'index': i,
-                            'success': False,
-                            'error': f'航线记录不存在: {schedule_id}',
-                            'data': update_item
-                        })
-                        continue
-                else:
-                    # 通过其他字段查找
-                    pol_cd = update_item.get('polCd')
-                    pod_cd = update_item.get('podCd')
-                    vessel = update_item.get('vessel')
-                    voyage = update_item.get('voyage')
-
-                    if not all([pol_cd, pod_cd, vessel, voyage]):
-                        failed_records.append({
-                            'index': i,
-                            'success': False,
-                            'error': '缺少必需参数',
-                            'data': update_item
-                        })
-                        continue
-
-                    try:
-                        latest_version = VesselSchedule.objects.aggregate(max_version=Max('data_version'))['max_version']
-                        schedule = VesselSchedule.objects.get(
-                            polCd=pol_cd,
-                            podCd=pod_cd,
-                            vessel=vessel,
-                            voyage=voyage,
-                            data_version=latest_version,
-                            status=1
-                        )
-                    except VesselSchedule.DoesNotExist:
-                        failed_records.append({
-                            'index': i,
-                            'success': False,
-                            'error': '航线记录不存在',
-                            'data': update_item
-                        })
-                        continue
-
-                # 获取新配置
-                new_config = update_item.get('share_cabins_config', [])
-                update_method = update_item.get('update_method', 'replace')
-
-                # 处理更新方式
-                if update_method == 'merge':
-                    # 合并配置
-                    current_config = []
-                    if schedule.shareCabins:
-                        try:
-                            if isinstance(schedule.shareCabins, str):
-                                current_config = json.loads(schedule.shareCabins)
-                            else:
-                                current_config = schedule.shareCabins
-                        except (json.JSONDecodeError, TypeError):
-                            current_config = []
-
-                    current_carriers = {item.get('carrierCd'): item for item in current_config if isinstance(item, dict)}
+        # 整批保存完成后统一同步船舶信息和失效分组快照
+        with bulk_vessel_schedule_sync():
+            for i, update_item in enumerate(updates):
+                try:
+                    # 获取航线记录
+                    schedule_id = update_item.get('schedule_id')
 
-                    for new_item in new_config:
-                        if isinstance(new_item, dict) and 'carrierCd' in new_item:
-                            current_carriers[new_item['carrierCd']] = new_item
+                    if schedule_id:
+                        try:
+                            schedule = VesselSchedule.objects.get(id=schedule_id, status=1)
+                        except VesselSchedule.DoesNotExist:
+                            failed_records.append({
+                                'index': i,
+                                'success': False,
+                                'error': f'航线记录不存在: {schedule_id}',
+                                'data': update_item
+                            })
+                            continue
+                    else:
+                        # 通过其他字段查找
+                        pol_cd = update_item.get('polCd')
+                        pod_cd = update_item.get('podCd')
+                        vessel = update_item.get('vessel')
+                        voyage = update_item.get('voyage')
+
+                        if not all([pol_cd, pod_cd, vessel, voyage]):
+                            failed_records.append({
+                                'index': i,
+                                'success': False,
+                                'error': '缺少必需参数',
+                                'data': update_item
+                            })
+                            continue
 
-                    final_config = list(current_carriers.values())
-                else:
-                    # 替换配置
-                    final_config = new_config
+                        try:
+                            if latest_version is None:
+                                latest_version = DataVersionService.get_latest_version()
+                            schedule = VesselSchedule.objects.get(
+                                polCd=pol_cd,
+                                podCd=pod_cd,
+                                vessel=vessel,
+                                voyage=voyage,
+                                data_version=latest_version,
+                                status=1
+                            )
+                        except VesselSchedule.DoesNotExist:
+                            failed_records.append({
+                                'index': i,
+                                'success': False,
+                                'error': '航线记录不存在',
+                                'data': update_item
+                            })
+                            continue
+
+                    # 获取新配置
+                    new_config = update_item.get('share_cabins_config', [])
+                    update_method = update_item.get('update_method', 'replace')
+
+                    # 处理更新方式
+                    if update_method == 'merge':
+                        # 合并配置
+                        current_config = []
+                        if schedule.shareCabins:
+                            try:
+                                if isinstance(schedule.shareCabins, str):
+                                    current_config = json.loads(schedule.shareCabins)
+                                else:
+                                    current_config = schedule.shareCabins
+                            except (json.JSONDecodeError, TypeError):
+                                current_config = []
+
+                        current_carriers = {item.get('carrierCd'): item for item in current_config if isinstance(item, dict)}
+
+                        for new_item in new_config:
+                            if isinstance(new_item, dict) and 'carrierCd' in new_item:
+                                current_carriers[new_item['carrierCd']] = new_item
+
+                        final_config = list(current_carriers.values())
+                    else:
+                        # 替换配置
+                        final_config = new_config
 
-                # 更新数据库
-                schedule.shareCabins = json.dumps(final_config, ensure_ascii=False)
-                schedule.save(update_fields=['shareCabins'])
+                    # 更新数据库
+                    schedule.shareCabins = json.dumps(final_config, ensure_ascii=False)
+                    schedule.save(update_fields=VesselSchedule.SHARE_CABIN_FIELDS)
 
-                updated_records.append({
-                    'index': i,
-                    'success': True,
-                    'schedule_id': schedule.id,
-                    'schedule_info': {
-                        'polCd': schedule.polCd,
-                        'podCd': schedule.podCd,
-                        'vessel': schedule.vessel,
-                        'voyage': schedule.voyage
-                    },
-                    'carrier_count': len(final_config),
-                    'update_method': update_method
-                })
+                    updated_records.append({
+                        'index': i,
+                        'success': True,
+                        'schedule_id': schedule.id,
+                        'schedule_info': {
+                            'polCd': schedule.polCd,
+                            'podCd': schedule.podCd,
+                            'vessel': schedule.vessel,
+                            'voyage': schedule.voyage
+                        },
+                        'carrier_count': len(final_config),
+                        'update_method': update_method
+                    })
 
-            except Exception as e:
-                failed_records.append({
-                    'index': i,
-                    'success': False,
-                    'error': str(e),
-                    'data': update_item
-                })
+                except Exception as e:
+                    failed_records.append({
+                        'index': i,
+                        'success': False,
+                        'error': str(e),
+                        'data': update_item
+                    })
 
         return Response({
             'success': True,
@@ -1608,7 +1685,9 @@ def cabin_config_bulk_update_api(request):
 
 
 @api_view(['GET'])
+@renderer_classes([UnicodeJSONRenderer, CompactJSONRenderer])
 @permission_classes([IsAuthenticated])
+@ConditionalGetHelper.conditional(grouping_etag(CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO))
 def cabin_grouping_with_vessel_info_api(request):
     """
     获取共舱分组数据并附带船舶额外信息
@@ -1617,11 +1696,10 @@ def cabin_grouping_with_vessel_info_api(request):
     参数：
     - polCd: 起运港五字码（必需）
     - podCd: 目的港五字码（必需）
+    - etd_from / etd_to: ETD日期范围（可选，含当天）
+    - sailing_within_days: 今天起N天内开船（可选）
     """
     try:
-        from datetime import datetime, date
-        from collections import Counter
-
         # 获取请求参数
         pol_cd = request.GET.get('polCd')
         pod_cd = request.GET.get('podCd')
@@ -1633,229 +1711,104 @@ def cabin_grouping_with_vessel_info_api(request):
                 'data': None
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 获取最新版本数据
-        latest_version = VesselSchedule.objects.filter(
-            polCd=pol_cd,
-            podCd=pod_cd,
-            status=1
-        ).aggregate(max_version=models.Max('data_version'))['max_version']
+        try:
+            etd_from, etd_to = get_etd_window(request)
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'message': str(e),
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # 从版本登记表获取该航线已发布的最新数据版本号
+        latest_version = get_published_version(request, pol_cd, pod_cd)
 
         if latest_version is None:
+            grouping_data = {
+                'version': None,
+                'total_groups': 0,
+                'filter': {'polCd': pol_cd, 'podCd': pod_cd},
+                'groups': []
+            }
             return Response({
                 'success': True,
                 'message': '没有找到符合条件的航线数据',
-                'data': {
-                    'version': None,
-                    'total_groups': 0,
-                    'filter': {'polCd': pol_cd, 'podCd': pod_cd},
-                    'groups': []
-                }
+                'data': CabinGroupingService.to_compact(grouping_data) if is_compact(request) else grouping_data
             })
 
-        # 查询数据
-        queryset = VesselSchedule.objects.filter(
-            polCd=pol_cd,
-            podCd=pod_cd,
-            status=1,
-            data_version=latest_version
+        # 读取分组快照（不存在时计算并写入），船舶信息变化时快照由信号失效；
+        # 指定ETD窗口时在数据库中过滤后计算
+        grouping_data = CabinGroupingService.get_grouping_data(
+            CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO, pol_cd, pod_cd, latest_version,
+            etd_from=etd_from, etd_to=etd_to
         )
+        if is_compact(request):
+            grouping_data = CabinGroupingService.to_compact(grouping_data)
 
-        # 按船公司组合分组
-        groups = {}
-        group_counter = 1
+        return Response({
+            'success': True,
+            'message': '共舱分组数据获取成功',
+            'data': grouping_data
+        })
 
-        for schedule in queryset:
-            try:
-                share_cabins = json.loads(schedule.shareCabins) if schedule.shareCabins else []
-            except:
-                share_cabins = []
-
-            # 提取船公司代码
-            carrier_codes = []
-            for cabin in share_cabins:
-                if isinstance(cabin, dict) and 'carrierCd' in cabin:
-                    carrier_codes.append(cabin['carrierCd'])
-
-            # 如果没有共舱信息，使用主船公司
-            if not carrier_codes:
-                carrier_codes = [schedule.carriercd]
-
-            # 生成分组key：按船公司代码排序组合
-            group_key = ','.join(sorted(set(carrier_codes)))
-
-            if group_key not in groups:
-                groups[group_key] = {
-                    'group_id': f'group_{group_counter}',
-                    'cabins_count': len(set(carrier_codes)),
-                    'carrier_codes': sorted(list(set(carrier_codes))),
-                    'schedules': [],
-                    'route_etds': [],  # 用于计算plan_open
-                    'total_durations': [],  # 用于计算plan_duration
-                }
-                group_counter += 1
+    except Exception as e:
+        import traceback
+        error_msg = f"航期查询出错: {str(e)}"
+        print(f"API Error: {error_msg}")
+        print(traceback.format_exc())
+        return Response({
+            'success': False,
+            'message': error_msg,
+            'data': None
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            # 获取每条航线的船舶额外信息
-            vessel_info = {}
-            try:
-                vessel_info_obj = VesselInfoFromCompany.objects.filter(
-                    polCd=schedule.polCd,
-                    podCd=schedule.podCd,
-                    vessel=schedule.vessel,
-                    voyage=schedule.voyage,
-                    carriercd=schedule.carriercd
-                ).first()
-
-                if vessel_info_obj:
-                    vessel_info = {
-                        'id': vessel_info_obj.id,
-                        'gp_20': vessel_info_obj.gp_20 if vessel_info_obj.gp_20 is not None else '--',
-                        'hq_40': vessel_info_obj.hq_40 if vessel_info_obj.hq_40 is not None else '--',
-                        'price': vessel_info_obj.price if vessel_info_obj.price is not None else '--',
-                        'cut_off_time': vessel_info_obj.cut_off_time if vessel_info_obj.cut_off_time is not None else '--'
-                    }
-            except:
-                pass
-
-            # 添加航线到分组
-            groups[group_key]['schedules'].append({
-                'id': schedule.id,
-                'vessel': schedule.vessel,
-                'voyage': schedule.voyage,
-                'polCd': schedule.polCd,
-                'podCd': schedule.podCd,
-                'pol': schedule.pol,
-                'pod': schedule.pod,
-                'eta': schedule.eta,
-                'etd': schedule.etd,
-                'routeEtd': schedule.routeEtd,
-                'carriercd': schedule.carriercd,
-                'totalDuration': schedule.totalDuration,
-                'shareCabins': share_cabins,
-                'vessel_info': vessel_info
-            })
 
-            # 收集用于汇总计算的数据
-            if schedule.routeEtd is not None:
-                groups[group_key]['route_etds'].append(schedule.routeEtd)
-            if schedule.totalDuration is not None:
-                groups[group_key]['total_durations'].append(schedule.totalDuration)
-
-        # 计算汇总字段
-        current_date = date.today()
-
-        for group_key, group_data in groups.items():
-            # 组内按routeEtd排序
-            group_data['schedules'].sort(key=lambda x: x['routeEtd'] if x['routeEtd'] is not None else 999)
-
-            # 计算plan_open：routeEtd出现次数最多的值
-            if group_data['route_etds']:
-                route_etd_counter = Counter(group_data['route_etds'])
-                most_common_etds = route_etd_counter.most_common()
-                # 如果多个相同，选择所有最多的
-                max_count = most_common_etds[0][1]
-                plan_open_values = [etd for etd, count in most_common_etds if count == max_count]
-                # 修改：当有多个最高频率值时，选择最小的值（最早的航线）
-                group_data['plan_open'] = min(plan_open_values) if plan_open_values else None
-            else:
-                group_data['plan_open'] = None
-
-            # 计算plan_duration：totalDuration的最小值
-            if group_data['total_durations']:
-                group_data['plan_duration'] = min(group_data['total_durations'])
-            else:
-                group_data['plan_duration'] = None
-
-            # 计算cabin_price：使用最近ETD日期（最早开船）的航线价格
-            cabin_price = None
-            earliest_etd_schedule = None
-            earliest_etd = None
-
-            for schedule in group_data['schedules']:
-                if schedule['etd']:
-                    try:
-                        # 支持两种ETD格式：'%Y-%m-%d %H:%M:%S' 和 '%Y-%m-%d'
-                        etd_str = schedule['etd']
-                        if ' ' in etd_str:
-                            etd_date = datetime.strptime(etd_str, '%Y-%m-%d %H:%M:%S').date()
-                        else:
-                            etd_date = datetime.strptime(etd_str, '%Y-%m-%d').date()
-
-                        # 找到最早的ETD日期（最近要开船的）
-                        if earliest_etd is None or etd_date < earliest_etd:
-                            earliest_etd = etd_date
-                            earliest_etd_schedule = schedule
-                    except:
-                        pass
-
-            # 使用最早ETD日期对应的价格
-            if earliest_etd_schedule and earliest_etd_schedule['vessel_info'].get('price'):
-                cabin_price = earliest_etd_schedule['vessel_info']['price']
-
-            # 如果没有价格数据，显示 '--'
-            group_data['cabin_price'] = cabin_price if cabin_price is not None else '--'
-
-            # 计算is_has_gp_20和is_has_hq_40 - 检查字段是否不为空
-            has_gp_20 = False
-            has_hq_40 = False
-
-            for schedule in group_data['schedules']:
-                vessel_info = schedule['vessel_info']
-
-                # 检查gp_20字段是否不为空（不是None、不是空字符串、不是0、不是'--'）
-                gp_20_val = vessel_info.get('gp_20')
-                if (gp_20_val is not None and
-                    str(gp_20_val).strip() != '' and
-                    str(gp_20_val).strip() != '0' and
-                    str(gp_20_val).strip() != '--'):
-                    has_gp_20 = True
-
-                # 检查hq_40字段是否不为空（不是None、不是空字符串、不是0、不是'--'）
-                hq_40_val = vessel_info.get('hq_40')
-                if (hq_40_val is not None and
-                    str(hq_40_val).strip() != '' and
-                    str(hq_40_val).strip() != '0' and
-                    str(hq_40_val).strip() != '--'):
-                    has_hq_40 = True
-
-            group_data['is_has_gp_20'] = '有现舱' if has_gp_20 else '--'
-            group_data['is_has_hq_40'] = '有现舱' if has_hq_40 else '--'
-
-            # 清理临时数据
-            del group_data['route_etds']
-            del group_data['total_durations']
-
-        # 转换为列表并按plan_open排序（周一到周日）
-        groups_list = list(groups.values())
-
-        def sort_key(group):
-            plan_open = group['plan_open']
-            if plan_open is None:
-                return (7, 0)  # 没有plan_open的排在最后
-            elif isinstance(plan_open, list):
-                return (min(plan_open), 0)  # 多个值时取最小的
-            else:
-                return (plan_open, 0)
-
-        groups_list.sort(key=sort_key)
+@api_view(['GET'])
+@renderer_classes([UnicodeJSONRenderer, CompactJSONRenderer])
+@permission_classes([IsAuthenticated])
+@ConditionalGetHelper.conditional(batch_grouping_etag)
+def cabin_grouping_with_vessel_info_batch_api(request):
+    """
+    多航线共舱分组（附带船舶额外信息）
+    一次请求查询多条航线，版本号、分组快照、航线和船舶信息都按集合批量读取，
+    各航线的分组快照与单航线接口共用
+
+    参数：
+    - routes: 航线列表，如 CNSHA:USNYC,CNSHA:USLAX（必需，数量上限见CABIN_GROUPING_BATCH_MAX_ROUTES）
+    - etd_from / etd_to / sailing_within_days: 同单航线接口
+    - format=compact: 紧凑格式
+    """
+    try:
+        try:
+            routes, etd_from, etd_to = get_batch_params(request)
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'message': str(e),
+                'data': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        route_data = CabinGroupingService.get_grouping_data_batch(
+            CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO, get_published_versions(request, routes),
+            etd_from=etd_from, etd_to=etd_to
+        )
+
+        results = [route_data[route] for route in routes]
+        if is_compact(request):
+            results = [CabinGroupingService.to_compact(data) for data in results]
 
         return Response({
             'success': True,
             'message': '共舱分组数据获取成功',
             'data': {
-                'version': latest_version,
-                'total_groups': len(groups_list),
-                'filter': {'polCd': pol_cd, 'podCd': pod_cd},
-                'groups': groups_list
+                'total_routes': len(results),
+                'routes': results
             }
         })
 
     except Exception as e:
-        import traceback
-        error_msg = f"航期查询出错: {str(e)}"
-        print(f"API Error: {error_msg}")
-        print(traceback.format_exc())
         return Response({
             'success': False,
-            'message': error_msg,
+            'message': f'多航线航期查询出错: {str(e)}',
             'data': None
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -178,6 +178,8 @@ class CachedViewMixin:
     """
     cache_timeout = 300  # 默认5分钟缓存
     cache_key_prefix = 'api'
+    # 缓存所属的命名空间，如航线视图设置为 (VesselScheduleService.CACHE_NAMESPACE,)，随航线数据一起失效
+    cache_namespaces = ()
     
     def get_cache_key(self, request, *args, **kwargs):
         """
@@ -195,7 +197,8 @@ class CachedViewMixin:
         return CacheHelper.get_or_set(
             cache_key,
             lambda: self._get_response_data(request, *args, **kwargs),
-            self.cache_timeout
+            self.cache_timeout,
+            namespaces=self.cache_namespaces
         )
     
     def _get_response_data(self, request, *args, **kwargs):
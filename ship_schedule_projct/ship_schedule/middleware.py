@@ -0,0 +1,102 @@
+"""
+响应压缩中间件
+没有在nginx等反向代理上配置压缩的部署，由应用按Accept-Encoding协商压缩响应
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import has_vary_header, patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    响应压缩中间件
+    客户端接受br且安装了brotli时使用brotli，否则回退到Django的gzip实现；
+    RESPONSE_COMPRESSION_ENABLED 为False（默认，由反向代理压缩）时不加载
+
+    压缩后的强ETag变为弱ETag，条件请求按弱比较匹配（见ConditionalGetHelper）
+
+    brotli没有gzip头部那样可以填充随机长度的位置，无法缓解BREACH攻击，
+    携带凭证的请求或按Cookie/Authorization区分的响应（可能包含令牌等敏感内容）只使用gzip
+    """
+
+    # 小于该长度的响应不压缩
+    MIN_LENGTH = 200
+    # brotli压缩级别：0-11，级别越高压缩率越高、耗时越长，5在压缩率和耗时之间比较均衡
+    BROTLI_QUALITY = 5
+    # 本身已压缩的内容类型（如gzip格式的导出文件）不再压缩
+    COMPRESSED_CONTENT_TYPES = ('application/gzip', 'application/zip', 'image/', 'video/')
+    # 表明响应与用户凭证相关的请求头
+    CREDENTIAL_HEADERS = ('Cookie', 'Authorization')
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'RESPONSE_COMPRESSION_ENABLED', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    @staticmethod
+    def get_accepted_encodings(request):
+        """
+        解析Accept-Encoding，返回客户端接受的编码集合（忽略q=0的编码）
+        """
+        encodings = set()
+        for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            coding, _, params = item.strip().partition(';')
+            coding = coding.strip().lower()
+            if not coding:
+                continue
+            quality = params.strip()
+            if quality.startswith('q='):
+                try:
+                    if float(quality[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            encodings.add(coding)
+        return encodings
+
+    @classmethod
+    def carries_credentials(cls, request, response):
+        """
+        请求携带凭证或响应按凭证区分时返回True
+        """
+        for header in cls.CREDENTIAL_HEADERS:
+            if has_vary_header(response, header):
+                return True
+            if request.META.get('HTTP_' + header.upper()):
+                return True
+        return False
+
+    def process_response(self, request, response):
+        """按协商结果压缩响应"""
+        if not response.streaming and len(response.content) < self.MIN_LENGTH:
+            return response
+        if response.has_header('Content-Encoding') or \
+                response.get('Content-Type', '').startswith(self.COMPRESSED_CONTENT_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = self.get_accepted_encodings(request)
+
+        # 流式响应只支持gzip逐块压缩；与凭证相关的响应使用带随机填充的gzip
+        if brotli is not None and 'br' in accepted and not response.streaming and \
+                not self.carries_credentials(request, response):
+            compressed_content = brotli.compress(response.content, quality=self.BROTLI_QUALITY)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response.headers['ETag'] = 'W/' + etag
+            response.headers['Content-Encoding'] = 'br'
+            return response
+
+        if 'gzip' in accepted:
+            return super().process_response(request, response)
+        return response
@@ -64,6 +64,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ship_schedule.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -177,7 +178,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework 配置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.backends.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -323,3 +324,24 @@ else:
 # 会话缓存
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
+
+# 数据版本指针缓存时间（秒），爬虫发布新版本后最长在该时间内对接口生效
+DATA_VERSION_CACHE_TIMEOUT = config('DATA_VERSION_CACHE_TIMEOUT', default=60, cast=int)
+
+# 每个进程缓存的JWT认证主体数量，超出后淘汰最久未使用的用户
+AUTH_PRINCIPAL_CACHE_SIZE = config('AUTH_PRINCIPAL_CACHE_SIZE', default=10000, cast=int)
+
+# JWT认证主体在进程内缓存的最长时间（秒），用户被停用等变化最迟在该时间后生效
+AUTH_PRINCIPAL_CACHE_TIMEOUT = config('AUTH_PRINCIPAL_CACHE_TIMEOUT', default=60, cast=int)
+
+# API响应的JSON编码实现：orjson（已安装时，默认）或 json（标准库）
+JSON_RENDER_BACKEND = config('JSON_RENDER_BACKEND', default='orjson')
+
+# 多航线共舱分组接口一次最多查询的航线数量
+CABIN_GROUPING_BATCH_MAX_ROUTES = config('CABIN_GROUPING_BATCH_MAX_ROUTES', default=20, cast=int)
+
+# 由应用压缩响应（gzip，安装了Brotli时优先br）；已在nginx等反向代理上压缩的部署保持关闭
+RESPONSE_COMPRESSION_ENABLED = config('RESPONSE_COMPRESSION_ENABLED', default=False, cast=bool)
+
+# vessel_schedule热表保留的已发布版本数量，更早的版本由compact_schedule_versions命令归档
+SCHEDULE_RETENTION_KEEP_VERSIONS = config('SCHEDULE_RETENTION_KEEP_VERSIONS', default=10, cast=int)
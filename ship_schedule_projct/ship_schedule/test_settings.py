@@ -49,6 +49,7 @@ LOGGING = {
 # 简化中间件
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ship_schedule.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -4,9 +4,22 @@
 """
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
 from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
 from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from functools import wraps
+import base64
+import binascii
+import hashlib
+import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -176,10 +189,85 @@ class CacheHelper:
     """
     缓存助手类
     简化缓存操作
+
+    命名空间失效：缓存键可以挂在一个或多个命名空间（如航线、船公司、用户）下，
+    每个命名空间有一个版本号并嵌入缓存键中；失效时只对版本号做一次INCR，
+    旧版本的缓存键不再被读取，随过期时间自然淘汰。只使用标准缓存接口，
+    在LocMem和Redis上行为一致，不需要按模式扫描键空间
     """
-    
+
+    NAMESPACE_VERSION_KEY = 'cache_ns:{namespace}'
+
+    @staticmethod
+    def _new_namespace_version():
+        """新版本号取当前纳秒时间戳，版本键被淘汰后重新初始化也不会回退到用过的版本"""
+        return time.time_ns()
+
+    @staticmethod
+    def get_namespace_versions(*namespaces):
+        """
+        一次读取多个命名空间的版本号，不存在的命名空间初始化后返回
+
+        Args:
+            namespaces: 命名空间名称
+
+        Returns:
+            dict: {命名空间: 版本号}
+        """
+        version_keys = {
+            namespace: CacheHelper.NAMESPACE_VERSION_KEY.format(namespace=namespace)
+            for namespace in namespaces
+        }
+        cached = cache.get_many(list(version_keys.values()))
+
+        versions = {}
+        for namespace, version_key in version_keys.items():
+            version = cached.get(version_key)
+            if version is None:
+                # 并发初始化时以先写入的为准
+                cache.add(version_key, CacheHelper._new_namespace_version(), None)
+                version = cache.get(version_key) or 0
+            versions[namespace] = version
+        return versions
+
+    @staticmethod
+    def namespaced_key(key, *namespaces):
+        """
+        生成嵌入命名空间版本号的缓存键
+
+        Args:
+            key: 原始缓存键
+            namespaces: 缓存所属的命名空间，任一命名空间失效时该键失效
+
+        Returns:
+            str: 带版本号的缓存键
+        """
+        if not namespaces:
+            return key
+        versions = CacheHelper.get_namespace_versions(*namespaces)
+        suffix = ':'.join(f"{namespace}@{versions[namespace]}" for namespace in namespaces)
+        return f"{key}:{suffix}"
+
+    @staticmethod
+    def invalidate_namespace(*namespaces):
+        """
+        失效命名空间下的全部缓存：每个命名空间一次INCR
+
+        Args:
+            namespaces: 命名空间名称
+        """
+        for namespace in namespaces:
+            version_key = CacheHelper.NAMESPACE_VERSION_KEY.format(namespace=namespace)
+            try:
+                cache.incr(version_key)
+            except ValueError:
+                # 版本号不存在（未使用过或已被淘汰），直接设置新版本
+                cache.set(version_key, CacheHelper._new_namespace_version(), None)
+            except Exception as e:
+                logger.warning(f"失效缓存命名空间 {namespace} 失败: {e}")
+
     @staticmethod
-    def get_or_set(key, callable_func, timeout=300):
+    def get_or_set(key, callable_func, timeout=300, namespaces=()):
         """
         获取缓存，如果不存在则设置
         
@@ -187,11 +275,13 @@ class CacheHelper:
             key: 缓存键
             callable_func: 获取数据的函数
             timeout: 缓存超时时间（秒）
+            namespaces: 缓存所属的命名空间
             
         Returns:
             缓存的数据
         """
         try:
+            key = CacheHelper.namespaced_key(key, *namespaces)
             data = cache.get(key)
             if data is None:
                 data = callable_func()
@@ -205,6 +295,7 @@ class CacheHelper:
     def delete_pattern(pattern):
         """
         删除匹配模式的缓存
+        需要扫描键空间且只有Redis后端支持，新代码使用invalidate_namespace
         
         Args:
             pattern: 缓存键模式
@@ -219,6 +310,248 @@ class CacheHelper:
             logger.warning(f"删除缓存模式失败: {e}")
 
 
+class KeysetPagination(BasePagination):
+    """
+    游标（键集）分页
+    按 (排序字段, id) 定位下一页，用 WHERE 条件代替 OFFSET，深翻页与第一页一样快；
+    返回不透明的 next/previous 游标，总数从缓存读取，不在每一页都执行 COUNT(*)
+
+    通过 ?pagination=cursor 或携带 ?cursor= 启用，原有 page/page_size 分页保持不变；
+    可排序字段为 NULL 时按数据库默认规则视为最小值（与MySQL、SQLite一致）
+    """
+
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    total_query_param = 'include_total'
+    default_page_size = 20
+    max_page_size = 200
+    count_cache_timeout = 300
+    invalid_cursor_message = '无效的游标'
+
+    def __init__(self, orderings, default_ordering, count_namespaces=()):
+        """
+        Args:
+            orderings: 支持的排序 {排序参数名: 模型字段}，如 {'fetch_date': 'fetch_date', 'etd': 'etd_at'}
+            default_ordering: 默认排序，如 '-fetch_date'
+            count_namespaces: 缓存总数所属的命名空间，数据变化时随之失效
+        """
+        self.orderings = orderings
+        self.default_ordering = default_ordering
+        self.count_namespaces = tuple(count_namespaces)
+        self.page_meta = None
+
+    @classmethod
+    def is_requested(cls, request):
+        """请求是否使用游标分页"""
+        params = request.query_params if hasattr(request, 'query_params') else request.GET
+        return params.get(cls.mode_query_param) == 'cursor' or cls.cursor_query_param in params
+
+    def get_page_size(self, request):
+        """解析每页数量"""
+        try:
+            page_size = int(request.GET.get(self.page_size_query_param, self.default_page_size))
+        except (TypeError, ValueError):
+            return self.default_page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        """
+        解析排序参数
+
+        Returns:
+            tuple: (排序参数, 模型字段, 是否降序)
+        """
+        ordering = request.GET.get(self.ordering_query_param) or self.default_ordering
+        name = ordering.lstrip('-')
+        if name not in self.orderings:
+            raise ValidationError({
+                self.ordering_query_param: f"游标分页只支持按 {', '.join(sorted(self.orderings))} 排序"
+            })
+        return ordering, self.orderings[name], ordering.startswith('-')
+
+    def encode_cursor(self, ordering, value, pk, reverse):
+        """编码游标：排序、定位行的排序字段值和id、翻页方向"""
+        payload = {'o': ordering, 'v': value, 'id': pk, 'r': reverse}
+        # 时间按完整精度转为字符串（DjangoJSONEncoder会截断到毫秒，导致定位不准）
+        raw = json.dumps(payload, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """解码游标"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            return payload['o'], payload['v'], int(payload['id']), bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+
+    @staticmethod
+    def _seek_condition(field, nullable, value, pk, descending):
+        """按排序方向构造“排在定位行之后”的条件：(字段, id) 的行值比较，NULL视为最小值"""
+        op = 'lt' if descending else 'gt'
+        if value is None:
+            after_nulls = Q(**{f'{field}__isnull': True, f'id__{op}': pk})
+            return after_nulls if descending else after_nulls | Q(**{f'{field}__isnull': False})
+
+        condition = Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+        if descending and nullable:
+            condition |= Q(**{f'{field}__isnull': True})
+        return condition
+
+    def get_total(self, queryset):
+        """读取总数：按查询语句缓存，数据变化时随命名空间失效"""
+        sql = str(queryset.order_by().query)
+        key = f"keyset_count:{hashlib.md5(sql.encode('utf-8')).hexdigest()}"
+        return CacheHelper.get_or_set(
+            key, queryset.count, timeout=self.count_cache_timeout, namespaces=self.count_namespaces
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        读取一页数据
+
+        Returns:
+            list: 当前页的记录
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.GET.get(self.cursor_query_param)
+        if cursor:
+            ordering, value, pk, reverse = self.decode_cursor(cursor)
+            if ordering.lstrip('-') not in self.orderings:
+                raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+            field = self.orderings[ordering.lstrip('-')]
+            descending = ordering.startswith('-')
+        else:
+            ordering, field, descending = self.get_ordering(request)
+            value, pk, reverse = None, None, False
+
+        include_total = request.GET.get(self.total_query_param, 'true').lower() != 'false'
+        total = self.get_total(queryset) if include_total else None
+
+        # 向前翻页时反向查询，取出后再恢复顺序
+        scan_descending = descending != reverse
+        page_queryset = queryset
+        if cursor:
+            model_field = queryset.model._meta.get_field(field)
+            if value is not None:
+                try:
+                    value = model_field.to_python(value)
+                except DjangoValidationError:
+                    raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+            page_queryset = page_queryset.filter(
+                self._seek_condition(field, model_field.null, value, pk, scan_descending)
+            )
+
+        prefix = '-' if scan_descending else ''
+        rows = list(page_queryset.order_by(f'{prefix}{field}', f'{prefix}id')[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = has_more if not reverse else bool(cursor)
+        has_previous = has_more if reverse else bool(cursor)
+
+        def cursor_for(row, to_previous):
+            return self.encode_cursor(ordering, getattr(row, field), row.pk, to_previous)
+
+        self.page_meta = {
+            'next_cursor': cursor_for(rows[-1], False) if rows and has_next else None,
+            'previous_cursor': cursor_for(rows[0], True) if rows and has_previous else None,
+            'page_size': page_size,
+            'ordering': ordering,
+            'total_count': total,
+        }
+        return rows
+
+    def get_page_link(self, cursor):
+        """生成带游标的翻页链接"""
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        """DRF通用视图使用的分页响应，字段与默认分页一致并附带游标"""
+        return Response({
+            'count': self.page_meta['total_count'],
+            'next': self.get_page_link(self.page_meta['next_cursor']),
+            'previous': self.get_page_link(self.page_meta['previous_cursor']),
+            'next_cursor': self.page_meta['next_cursor'],
+            'previous_cursor': self.page_meta['previous_cursor'],
+            'results': data,
+        })
+
+
+class ConditionalGetHelper:
+    """
+    条件请求助手类
+    接口按版本号、变更计数等廉价数据生成ETag，请求携带的If-None-Match匹配时直接返回304，
+    不再计算和发送完整响应
+    """
+
+    # 浏览器每次都带ETag重新验证，共享缓存不保存需要登录的响应
+    CACHE_CONTROL = {'private': True, 'no_cache': True}
+
+    @staticmethod
+    def make_etag(*parts):
+        """
+        由组成部分生成强ETag
+
+        Args:
+            parts: 影响响应内容的值（版本号、命名空间版本、筛选参数等）
+
+        Returns:
+            str: 带引号的ETag
+        """
+        raw = json.dumps(parts, default=str, ensure_ascii=False, separators=(',', ':'))
+        return '"%s"' % hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_not_modified(request, etag):
+        """If-None-Match是否与当前ETag匹配（弱比较，W/前缀不影响匹配）"""
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header or not etag:
+            return False
+        etags = parse_etags(header)
+        if '*' in etags:
+            return True
+        return etag in {value[2:] if value.startswith('W/') else value for value in etags}
+
+    @staticmethod
+    def conditional(etag_func):
+        """
+        为GET接口加上ETag条件请求支持
+        放在@api_view/@permission_classes之下（或用于视图集的方法），认证和权限检查之后才比较ETag
+
+        Args:
+            etag_func: 与视图参数相同的函数，返回ETag；返回None时不做条件处理（如参数错误交给视图返回400）
+        """
+        def decorator(view_func):
+            @wraps(view_func)
+            def wrapper(*args, **kwargs):
+                request = next(arg for arg in args if hasattr(arg, 'META'))
+                etag = etag_func(*args, **kwargs) if request.method in ('GET', 'HEAD') else None
+                if etag is None:
+                    return view_func(*args, **kwargs)
+
+                if ConditionalGetHelper.is_not_modified(request, etag):
+                    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                else:
+                    response = view_func(*args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                response['ETag'] = etag
+                patch_cache_control(response, **ConditionalGetHelper.CACHE_CONTROL)
+                return response
+            return wrapper
+        return decorator
+
+
 class ValidationHelper:
     """
     验证助手类
@@ -269,5 +602,7 @@ __all__ = [
     'StandardResponse',
     'PermissionHelper', 
     'CacheHelper',
+    'KeysetPagination',
+    'ConditionalGetHelper',
     'ValidationHelper'
 ]
\ No newline at end of file
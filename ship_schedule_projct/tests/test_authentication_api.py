@@ -3,6 +3,7 @@
 测试用户注册、登录、权限管理等API功能
 """
 from django.contrib.auth import get_user_model
+from django.test.utils import override_settings
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -425,3 +426,45 @@ class APIHealthCheckTest(APITestCase):
         response = self.client.get('/api/')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UserListCursorPaginationTest(APITestCase):
+    """用户列表游标分页测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='testpass123')
+        for i in range(11):
+            User.objects.create_user(email=f'user{i:02d}@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+        self.expected = list(User.objects.order_by('-date_joined', '-id').values_list('id', flat=True))
+
+    def _walk(self, url):
+        """沿next游标翻到最后一页"""
+        ids, params = [], {'pagination': 'cursor', 'page_size': 5}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['total'], 12)
+            ids.extend(user['id'] for user in response.data['users'])
+            if not response.data['next_cursor']:
+                return ids
+            params = {'cursor': response.data['next_cursor'], 'page_size': 5}
+
+    def test_users_list_view(self):
+        """兼容的用户列表接口按 (date_joined, id) 翻页"""
+        self.assertEqual(self._walk('/api/auth/users/'), self.expected)
+
+    def test_user_management_list(self):
+        """用户管理列表按 (date_joined, id) 翻页"""
+        self.assertEqual(self._walk('/api/auth/users-management/'), self.expected)
+
+    def test_page_number_still_supported(self):
+        """不带游标参数时保持原有的页码分页"""
+        response = self.client.get('/api/auth/users/', {'page': 2, 'page_size': 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['id'] for user in response.data['users']], self.expected[5:10])
+        self.assertEqual(response.data['total'], 12)
@@ -0,0 +1,112 @@
+"""
+缓存助手测试用例
+验证命名空间版本号失效在LocMem和Redis（本地fakeredis）后端上的行为一致
+"""
+import importlib.util
+import unittest
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from ship_schedule.utils import CacheHelper
+
+HAS_FAKE_REDIS = all(importlib.util.find_spec(name) for name in ('redis', 'fakeredis'))
+if HAS_FAKE_REDIS:
+    from fakeredis import FakeConnection
+else:
+    FakeConnection = None
+
+
+class NamespaceInvalidationTests:
+    """两种缓存后端共用的测试"""
+
+    def setUp(self):
+        """测试前准备"""
+        cache.clear()
+        self.calls = 0
+
+    def _load(self):
+        """被缓存的数据源，记录调用次数"""
+        self.calls += 1
+        return {'calls': self.calls}
+
+    def test_get_or_set_caches_within_namespace(self):
+        """同一命名空间版本下只计算一次"""
+        first = CacheHelper.get_or_set('grouping:CNSHA:USNYC', self._load, namespaces=('route:CNSHA:USNYC',))
+        second = CacheHelper.get_or_set('grouping:CNSHA:USNYC', self._load, namespaces=('route:CNSHA:USNYC',))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidate_namespace(self):
+        """失效命名空间后重新计算，其他命名空间不受影响"""
+        CacheHelper.get_or_set('grouping:CNSHA:USNYC', self._load, namespaces=('route:CNSHA:USNYC',))
+        CacheHelper.get_or_set('grouping:CNSHA:DEHAM', self._load, namespaces=('route:CNSHA:DEHAM',))
+
+        CacheHelper.invalidate_namespace('route:CNSHA:USNYC')
+        CacheHelper.get_or_set('grouping:CNSHA:USNYC', self._load, namespaces=('route:CNSHA:USNYC',))
+        CacheHelper.get_or_set('grouping:CNSHA:DEHAM', self._load, namespaces=('route:CNSHA:DEHAM',))
+
+        self.assertEqual(self.calls, 3)
+
+    def test_any_namespace_invalidates_key(self):
+        """挂在多个命名空间下的键，任一命名空间失效都会失效"""
+        namespaces = ('vessel_schedule', 'carrier:MSK')
+        CacheHelper.get_or_set('carrier_sailings:MSK', self._load, namespaces=namespaces)
+
+        CacheHelper.invalidate_namespace('carrier:MSK')
+        CacheHelper.get_or_set('carrier_sailings:MSK', self._load, namespaces=namespaces)
+        CacheHelper.invalidate_namespace('vessel_schedule')
+        CacheHelper.get_or_set('carrier_sailings:MSK', self._load, namespaces=namespaces)
+
+        self.assertEqual(self.calls, 3)
+
+    def test_invalidate_is_single_incr(self):
+        """失效只递增版本号，不删除或扫描已有缓存键"""
+        versions = CacheHelper.get_namespace_versions('user:1')
+
+        CacheHelper.invalidate_namespace('user:1')
+
+        self.assertEqual(CacheHelper.get_namespace_versions('user:1')['user:1'], versions['user:1'] + 1)
+
+    def test_evicted_version_does_not_roll_back(self):
+        """版本键被淘汰后重新初始化，不会回到已经使用过的版本"""
+        CacheHelper.get_or_set('profile:1', self._load, namespaces=('user:1',))
+        CacheHelper.invalidate_namespace('user:1')
+        cache.delete(CacheHelper.NAMESPACE_VERSION_KEY.format(namespace='user:1'))
+
+        CacheHelper.get_or_set('profile:1', self._load, namespaces=('user:1',))
+
+        self.assertEqual(self.calls, 2)
+
+    def test_invalidate_unused_namespace(self):
+        """失效从未使用过的命名空间不报错"""
+        CacheHelper.invalidate_namespace('route:NEW:NEW')
+
+        self.assertIn('route:NEW:NEW', CacheHelper.get_namespace_versions('route:NEW:NEW'))
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cache-helper-tests',
+    }
+})
+class LocMemNamespaceInvalidationTest(NamespaceInvalidationTests, SimpleTestCase):
+    """LocMem后端"""
+
+
+@unittest.skipUnless(HAS_FAKE_REDIS, '需要安装redis和fakeredis')
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/15',
+        'OPTIONS': {
+            # 连接本地内存中的fakeredis服务器，不需要真实的Redis
+            'connection_class': FakeConnection,
+        },
+    }
+})
+class RedisNamespaceInvalidationTest(NamespaceInvalidationTests, SimpleTestCase):
+    """Redis后端（fakeredis）"""
@@ -4,6 +4,9 @@
 """
 from decimal import Decimal
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import override_settings, CaptureQueriesContext
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
@@ -535,3 +538,71 @@ class LocalFeePermissionTest(APITestCase):
         # 不能删除
         response = self.client.delete(self.detail_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'local-fee-conditional-get-tests',
+    }
+})
+class LocalFeeConditionalGetTest(APITestCase):
+    """本地费用查询接口的ETag条件请求"""
+
+    def setUp(self):
+        """测试前准备"""
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(email='admin@example.com', password='adminpass123')
+        self.client.force_authenticate(user=self.user)
+        self.query_url = '/api/local-fees/local-fees/query/'
+        self.params = {'polCd': 'CNSHA', 'podCd': 'USNYC'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fee = LocalFee.objects.create(
+                polCd='CNSHA', podCd='USNYC', carriercd='MSK', name='起运港吊头费',
+                price_20gp=Decimal('100.00'), currency='CNY'
+            )
+
+    def test_not_modified(self):
+        """If-None-Match匹配时返回304，不查询本地费用表"""
+        response = self.client.get(self.query_url, self.params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.query_url, self.params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        for query in context.captured_queries:
+            self.assertNotIn('"local_fee"', query['sql'])
+
+        # 船公司筛选不同，ETag不同
+        response = self.client.get(self.query_url, dict(self.params, carriercd='MSK'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_changes_on_fee_change(self):
+        """费用修改或删除后ETag变化"""
+        etag = self.client.get(self.query_url, self.params)['ETag']
+
+        self.fee.price_20gp = Decimal('120.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fee.save()
+
+        response = self.client.get(self.query_url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data'][0]['20GP'], '120.00')
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fee.delete()
+
+        response = self.client.get(self.query_url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data'], [])
+
+    def test_no_etag_on_missing_params(self):
+        """缺少必填参数返回400，不带ETag"""
+        response = self.client.get(self.query_url, {'polCd': 'CNSHA'}, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.has_header('ETag'))
@@ -0,0 +1,157 @@
+"""
+响应压缩中间件测试用例
+验证Accept-Encoding协商、跳过规则，以及压缩后ETag条件请求仍然有效
+"""
+import gzip
+import json
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from schedules.models import VesselSchedule
+from ship_schedule.middleware import CompressionMiddleware, brotli
+
+User = get_user_model()
+
+BODY = json.dumps({'success': True, 'data': [{'polCd': 'CNSHA', 'podCd': 'USNYC'}] * 50}).encode()
+
+
+def make_response(request, content=BODY, content_type='application/json'):
+    """中间件包装的视图返回固定内容"""
+    response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = '"abc"'
+    return response
+
+
+@override_settings(RESPONSE_COMPRESSION_ENABLED=True)
+class CompressionMiddlewareTest(SimpleTestCase):
+    """压缩中间件"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.factory = RequestFactory()
+        self.middleware = CompressionMiddleware(make_response)
+
+    def get(self, accept_encoding):
+        """以指定的Accept-Encoding请求"""
+        return self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    @override_settings(RESPONSE_COMPRESSION_ENABLED=False)
+    def test_disabled_by_default(self):
+        """关闭时中间件不加载"""
+        with self.assertRaises(MiddlewareNotUsed):
+            CompressionMiddleware(make_response)
+
+    def test_gzip(self):
+        """接受gzip时压缩，强ETag变为弱ETag"""
+        response = self.get('gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_accept_encoding_negotiation(self):
+        """不接受压缩、q=0拒绝gzip时返回原始内容"""
+        for accept_encoding in ('', 'identity', 'gzip;q=0', 'deflate, gzip; q=0.0'):
+            response = self.get(accept_encoding)
+            self.assertFalse(response.has_header('Content-Encoding'), accept_encoding)
+            self.assertEqual(response.content, BODY)
+
+        self.assertEqual(self.get('br;q=0, gzip;q=0.5')['Content-Encoding'], 'gzip')
+
+    def test_skip_small_and_compressed_content(self):
+        """过短的响应和本身已压缩的内容不压缩"""
+        middleware = CompressionMiddleware(lambda request: make_response(request, b'{}'))
+        response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        compressed = gzip.compress(BODY)
+        middleware = CompressionMiddleware(
+            lambda request: make_response(request, compressed, 'application/gzip')
+        )
+        response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, compressed)
+
+    def test_streaming_gzip(self):
+        """流式响应逐块gzip压缩"""
+        middleware = CompressionMiddleware(
+            lambda request: StreamingHttpResponse([BODY, BODY], content_type='text/csv')
+        )
+        response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='br, gzip'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), BODY + BODY)
+
+    @unittest.skipUnless(brotli, '需要安装Brotli')
+    def test_brotli_preferred(self):
+        """接受br且安装了brotli时优先使用br"""
+        response = self.get('gzip, deflate, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(brotli.decompress(response.content), BODY)
+
+    @unittest.skipUnless(brotli, '需要安装Brotli')
+    def test_brotli_skipped_for_credentials(self):
+        """携带凭证的请求、按Cookie/Authorization区分的响应使用gzip"""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='br, gzip', HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(self.middleware(request)['Content-Encoding'], 'gzip')
+
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='br, gzip', HTTP_COOKIE='sessionid=abc')
+        self.assertEqual(self.middleware(request)['Content-Encoding'], 'gzip')
+
+        def make_vary_response(request):
+            response = make_response(request)
+            response['Vary'] = 'Cookie'
+            return response
+
+        middleware = CompressionMiddleware(make_vary_response)
+        response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='br, gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+
+    @unittest.skipIf(brotli, '未安装Brotli时的回退')
+    def test_brotli_fallback(self):
+        """未安装brotli时回退到gzip"""
+        self.assertEqual(self.get('br, gzip')['Content-Encoding'], 'gzip')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RESPONSE_COMPRESSION_ENABLED=True)
+class CompressionAPITest(TestCase):
+    """接口响应压缩"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        for i in range(10):
+            VesselSchedule.objects.create(
+                polCd='CNSHA', podCd='USNYC', vessel=f'VESSEL_{i}', voyage='V001', data_version=1,
+                carriercd='MSK', fetch_timestamp=1716825600, fetch_date=timezone.now(), routeEtd='3', totalDuration='26',
+                shareCabins='[{"carrierCd": "MSK"}]', status=1
+            )
+
+    def test_conditional_get_after_compression(self):
+        """压缩后的弱ETag再次请求时仍返回304"""
+        url = '/api/schedules/cabin-grouping-with-info/'
+        params = {'polCd': 'CNSHA', 'podCd': 'USNYC'}
+
+        response = self.client.get(url, params, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(json.loads(gzip.decompress(response.content))['data']['total_groups'], 1)
+
+        response = self.client.get(url, params, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
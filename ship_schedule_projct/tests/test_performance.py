@@ -14,7 +14,8 @@ from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
 from authentication.models import Permission, Role
-from schedules.models import VesselSchedule, VesselInfoFromCompany
+from schedules.models import VesselSchedule, VesselInfoFromCompany, CabinGroupingSnapshot
+from schedules.services import DataVersionService
 from local_fees.models import LocalFee
 
 User = get_user_model()
@@ -545,3 +546,188 @@ class LoadTestCase(TransactionTestCase):
         records_per_second = total_records / processing_time
         self.assertGreater(records_per_second, 1000, 
                           f"数据处理速度过慢: {records_per_second:.0f} 记录/秒")
+
+
+class CabinGroupingTestMixin:
+    """共舱分组API测试公共方法"""
+
+    url = '/api/schedules/cabin-grouping-with-info/'
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _create_route(self, pol_cd, pod_cd, size):
+        """创建指定数量的航线及对应的船舶额外信息"""
+        schedules = []
+        vessel_infos = []
+        for i in range(size):
+            carrier = 'MSK' if i % 2 else 'ONE'
+            schedules.append(VesselSchedule(
+                polCd=pol_cd,
+                podCd=pod_cd,
+                vessel=f'VESSEL_{i}',
+                voyage=f'V{i:04d}',
+                data_version=20250527,
+                carriercd=carrier,
+                fetch_timestamp=1716825600,
+                fetch_date=timezone.now(),
+                routeEtd=str(i % 7 + 1),
+                totalDuration='20',
+                etd='2025-06-01 10:00:00',
+                shareCabins='[{"carrierCd": "MSK"}, {"carrierCd": "ONE"}]',
+                status=1
+            ))
+            vessel_infos.append(VesselInfoFromCompany(
+                carrierCd=carrier,
+                polCd=pol_cd,
+                podCd=pod_cd,
+                vessel=f'VESSEL_{i}',
+                voyage=f'V{i:04d}',
+                gp_20='10',
+                price=Decimal('1000.00')
+            ))
+        VesselSchedule.objects.bulk_create(schedules)
+        VesselInfoFromCompany.objects.bulk_create(vessel_infos)
+
+    def _count_queries(self, pol_cd, pod_cd):
+        """请求分组API并返回执行的查询次数"""
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {'polCd': pol_cd, 'podCd': pod_cd})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['success'])
+        return len(context.captured_queries), response
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CabinGroupingQueryCountTest(CabinGroupingTestMixin, APITestCase):
+    """共舱分组API查询次数回归测试"""
+
+    def test_query_count_is_constant(self):
+        """查询次数不随分组内航线数量增长"""
+        self._create_route('CNSHA', 'USNYC', 2)
+        self._create_route('CNSHK', 'THBKK', 60)
+
+        small_count, _ = self._count_queries('CNSHA', 'USNYC')
+        large_count, response = self._count_queries('CNSHK', 'THBKK')
+
+        print(f"2条航线查询次数: {small_count}, 60条航线查询次数: {large_count}")
+        self.assertEqual(small_count, large_count)
+
+        schedules = response.data['data']['groups'][0]['schedules']
+        self.assertEqual(len(schedules), 60)
+        self.assertTrue(all(s['vessel_info'].get('gp_20') == '10' for s in schedules))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CabinGroupingSnapshotTest(CabinGroupingTestMixin, APITestCase):
+    """共舱分组快照测试"""
+
+    def test_second_request_reads_snapshot(self):
+        """第二次请求直接读取快照，结果与首次计算一致"""
+        self._create_route('CNSHA', 'USNYC', 30)
+        DataVersionService.publish(20250527, routes=[('CNSHA', 'USNYC')])
+
+        _, first_response = self._count_queries('CNSHA', 'USNYC')
+        snapshot_count, second_response = self._count_queries('CNSHA', 'USNYC')
+
+        # 版本登记查询 + 快照查询
+        self.assertEqual(snapshot_count, 2)
+        self.assertEqual(first_response.data['data'], second_response.data['data'])
+        self.assertEqual(CabinGroupingSnapshot.objects.count(), 1)
+
+    def test_vessel_info_change_invalidates_snapshot(self):
+        """船舶信息变化后快照失效，下一次请求返回新数据"""
+        self._create_route('CNSHA', 'USNYC', 1)
+        self._count_queries('CNSHA', 'USNYC')
+        self.assertEqual(CabinGroupingSnapshot.objects.count(), 1)
+
+        vessel_info = VesselInfoFromCompany.objects.get(vessel='VESSEL_0')
+        vessel_info.price = Decimal('2500.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            vessel_info.save()
+
+        self.assertEqual(CabinGroupingSnapshot.objects.count(), 0)
+        _, response = self._count_queries('CNSHA', 'USNYC')
+        self.assertEqual(response.data['data']['groups'][0]['cabin_price'], 2500.0)
+
+    def test_build_snapshots_command(self):
+        """预生成命令为最新版本生成两类快照"""
+        from django.core.management import call_command
+        from io import StringIO
+
+        self._create_route('CNSHA', 'USNYC', 3)
+        call_command('build_cabin_grouping_snapshots', stdout=StringIO())
+
+        self.assertEqual(
+            set(CabinGroupingSnapshot.objects.values_list('kind', 'data_version')),
+            {(CabinGroupingSnapshot.KIND_BASIC, 20250527),
+             (CabinGroupingSnapshot.KIND_WITH_VESSEL_INFO, 20250527)}
+        )
+
+    def test_build_snapshots_command_skips_staged_version(self):
+        """预生成命令使用已发布版本，不为暂存中的版本生成快照"""
+        from django.core.management import call_command
+        from io import StringIO
+
+        self._create_route('CNSHA', 'USNYC', 3)
+        DataVersionService.publish(20250527, routes=[('CNSHA', 'USNYC')])
+        VesselSchedule.objects.filter(vessel='VESSEL_0').update(data_version=20250528)
+
+        out = StringIO()
+        call_command('build_cabin_grouping_snapshots', stdout=out)
+
+        self.assertEqual(set(CabinGroupingSnapshot.objects.values_list('data_version', flat=True)), {20250527})
+        self.assertIn('生成 2 个快照', out.getvalue())
+
+        # 已发布版本没有有效航线时不生成快照，也不计数
+        VesselSchedule.objects.filter(data_version=20250527).update(status=0)
+        CabinGroupingSnapshot.objects.all().delete()
+        out = StringIO()
+        call_command('build_cabin_grouping_snapshots', stdout=out)
+        self.assertIn('生成 0 个快照', out.getvalue())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CabinGroupingPayloadBenchmarkTest(CabinGroupingTestMixin, APITestCase):
+    """共舱分组完整格式与紧凑格式的响应大小和耗时对比"""
+
+    def _measure(self, params, rounds):
+        """多次请求取平均耗时，返回 (平均耗时, 响应体)"""
+        start = time.perf_counter()
+        for _ in range(rounds):
+            response = self.client.get(self.url, params)
+        elapsed = (time.perf_counter() - start) / rounds
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return elapsed, response.content
+
+    def test_compact_payload_benchmark(self):
+        """
+        500条航线：紧凑格式的原始大小比完整格式小20%以上；
+        重复字段本身就容易被gzip压缩，压缩后的大小只做对比输出
+        """
+        import gzip
+
+        self._create_route('CNSHA', 'USNYC', 500)
+        DataVersionService.publish(20250527, routes=[('CNSHA', 'USNYC')])
+        params = {'polCd': 'CNSHA', 'podCd': 'USNYC'}
+        self.client.get(self.url, params)  # 生成快照
+        self.client.get(self.url, dict(params, format='compact'))
+
+        full_time, full_content = self._measure(params, 20)
+        compact_time, compact_content = self._measure(dict(params, format='compact'), 20)
+        full_gzip = len(gzip.compress(full_content))
+        compact_gzip = len(gzip.compress(compact_content))
+
+        print(f"500条航线 完整格式: {len(full_content)} 字节 (gzip {full_gzip}), {full_time * 1000:.1f}ms; "
+              f"紧凑格式: {len(compact_content)} 字节 (gzip {compact_gzip}), {compact_time * 1000:.1f}ms")
+        self.assertLess(len(compact_content), len(full_content) * 0.8)
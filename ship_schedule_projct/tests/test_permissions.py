@@ -2,13 +2,22 @@
 权限系统测试用例
 测试RBAC权限控制、权限检查、角色管理等功能
 """
+import time
+from unittest import mock
+from django.core.cache import cache
+from django.core.signals import request_started, request_finished
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.contrib.auth import get_user_model
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
 from rest_framework import status
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 
+from authentication.backends import CachedJWTAuthentication, PrincipalRefreshToken
 from authentication.models import Permission, Role
 from authentication.permissions import HasPermission
+from authentication.services import AuthPrincipalService, PermissionService, PermissionSnapshotService, RoleService
 
 User = get_user_model()
 
@@ -465,6 +474,195 @@ class PermissionCacheTest(TestCase):
         self.assertTrue(self.user.has_permission('test.permission'))
 
 
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'permission-snapshot-tests',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PermissionSnapshotCacheTest(PermissionCacheTest):
+    """权限快照使用真实缓存时，各类变更都能及时生效"""
+
+    def setUp(self):
+        """测试前准备"""
+        cache.clear()
+        super().setUp()
+
+    def test_snapshot_cached_across_checks(self):
+        """快照写入缓存后，权限检查不再查询数据库"""
+        self.user.roles.add(self.role)
+        self.assertTrue(self.user.has_permission('test.permission'))
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.user.has_permission('test.permission'))
+            self.assertFalse(self.user.has_permission('other.permission'))
+        self.assertIsInstance(self.user.get_permission_snapshot(), frozenset)
+
+    def test_snapshot_loaded_with_single_query(self):
+        """多个角色的权限通过一次关联查询获取"""
+        other_role = Role.objects.create(name='其他角色')
+        other_role.permissions.add(Permission.objects.create(code='other.permission', name='其他权限'))
+        self.user.roles.add(self.role, other_role)
+
+        with self.assertNumQueries(1):
+            codes = PermissionSnapshotService.load_permission_codes(self.user.pk)
+        self.assertEqual(codes, frozenset({'test.permission', 'other.permission'}))
+
+    def test_service_changes_bump_version(self):
+        """通过服务分配角色、修改角色权限后快照立即失效"""
+        self.assertFalse(PermissionService.check_user_permission(self.user, 'test.permission'))
+
+        PermissionService.assign_user_roles(self.user, [self.role.id])
+        self.assertTrue(PermissionService.check_user_permission(self.user, 'test.permission'))
+
+        RoleService.update_role_permissions(self.role, [])
+        self.assertFalse(PermissionService.check_user_permission(self.user, 'test.permission'))
+        self.assertEqual(PermissionService.get_user_permissions(self.user), [])
+
+    def test_reverse_role_assignment(self):
+        """通过角色一侧修改角色分配也会失效快照"""
+        self.assertFalse(self.user.has_permission('test.permission'))
+
+        self.role.user_set.add(self.user)
+        self.assertTrue(self.user.has_permission('test.permission'))
+
+        self.role.user_set.clear()
+        self.assertFalse(self.user.has_permission('test.permission'))
+
+    def test_request_memo(self):
+        """同一请求内只读取一次快照"""
+        self.user.roles.add(self.role)
+        request_started.send(sender=self.__class__)
+        try:
+            self.user.has_permission('test.permission')
+            cache.clear()
+            with self.assertNumQueries(0):
+                self.assertTrue(self.user.has_permission('test.permission'))
+        finally:
+            request_finished.send(sender=self.__class__)
+
+        self.assertIsNone(PermissionSnapshotService._get_memo())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, AUTH_PRINCIPAL_CACHE_ENABLED=True, SECURE_SSL_REDIRECT=False)
+class CachedJWTAuthenticationTest(TestCase):
+    """JWT认证从认证主体缓存解析用户"""
+
+    def setUp(self):
+        """测试前准备"""
+        cache.clear()
+        AuthPrincipalService.evict()
+        self.user = User.objects.create_user(email='jwt@example.com', password='testpass123')
+        self.permission = Permission.objects.create(code='test.permission', name='测试权限')
+        self.role = Role.objects.create(name='测试角色')
+        self.role.permissions.add(self.permission)
+        self.user.roles.add(self.role)
+        self.token = str(PrincipalRefreshToken.for_user(self.user).access_token)
+
+    def _authenticate(self, token=None):
+        """用访问令牌认证一次请求"""
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        return user
+
+    def test_token_claims(self):
+        """访问令牌携带超级管理员标记和权限快照版本号"""
+        token = AccessToken(self.token)
+        self.assertEqual(token['user_id'], self.user.pk)
+        self.assertFalse(token['su'])
+        self.assertEqual(token['pv'], PermissionSnapshotService.get_version(self.user.pk))
+
+    def test_cached_principal_skips_database(self):
+        """缓存命中后认证和权限检查都不查询数据库"""
+        self._authenticate()
+
+        request_started.send(sender=self.__class__)
+        try:
+            with self.assertNumQueries(0):
+                user = self._authenticate()
+                self.assertTrue(user.has_permission('test.permission'))
+                self.assertFalse(user.has_permission('other.permission'))
+        finally:
+            request_finished.send(sender=self.__class__)
+        self.assertEqual((user.pk, user.email), (self.user.pk, self.user.email))
+        self.assertIsNot(user, self._authenticate())
+
+    def test_role_change_refreshes_principal(self):
+        """角色分配变化后版本号改变，重新加载用户和权限"""
+        self._authenticate()
+        self.user.roles.remove(self.role)
+
+        user = self._authenticate()
+        self.assertFalse(user.has_permission('test.permission'))
+
+    def test_deactivated_user_rejected(self):
+        """停用或删除用户后，已签发的访问令牌立即失效"""
+        self._authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+    def test_last_login_keeps_principal(self):
+        """登录只更新最后登录时间，不失效缓存的主体"""
+        self._authenticate()
+        self.user.save(update_fields=['last_login'])
+
+        with self.assertNumQueries(0):
+            self._authenticate()
+
+    @override_settings(AUTH_PRINCIPAL_CACHE_SIZE=1)
+    def test_lru_eviction(self):
+        """超过容量时淘汰最久未使用的主体"""
+        other = User.objects.create_user(email='other@example.com', password='testpass123')
+        self._authenticate()
+        self._authenticate(str(PrincipalRefreshToken.for_user(other).access_token))
+
+        # 权限快照仍在共享缓存中，只回源查询用户
+        with self.assertNumQueries(1):
+            self._authenticate()
+
+    def test_principal_expires(self):
+        """条目超过最长保留时间后回源数据库，版本号未变化时也能拒绝停用的用户"""
+        self._authenticate()
+        # 模拟版本号失效未能传播到本进程（如其他进程写缓存失败）
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self._authenticate()
+        with mock.patch('authentication.services.time.monotonic', return_value=time.monotonic() + 3600):
+            with self.assertRaises(AuthenticationFailed):
+                self._authenticate()
+
+    @override_settings(AUTH_PRINCIPAL_CACHE_ENABLED=None)
+    def test_process_local_cache_bypasses_lru(self):
+        """默认缓存为本地内存时版本号不能跨进程失效，每次认证都回源数据库"""
+        self._authenticate()
+
+        self.assertFalse(AuthPrincipalService.is_enabled())
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self._authenticate()
+
+    def test_login_token_authenticates_api(self):
+        """登录接口签发的令牌可访问接口"""
+        client = APIClient()
+        response = client.post('/api/auth/login/', {'email': 'jwt@example.com', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['tokens']['access']}")
+        response = client.get('/api/auth/user/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'jwt@example.com')
+
+
 class PermissionEdgeCaseTest(TestCase):
     """权限边界情况测试"""
     
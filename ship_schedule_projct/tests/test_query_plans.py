@@ -0,0 +1,246 @@
+"""
+查询计划测试用例
+生成模拟数据后通过EXPLAIN验证热点查询使用了索引，而不是全表扫描
+
+默认生成2万条航线，便于日常运行；验证大数据量时可通过环境变量指定行数，并可使用MySQL配置运行：
+    QUERY_PLAN_ROWS=2000000 python manage.py test tests.test_query_plans
+"""
+import os
+import re
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from schedules.models import VesselSchedule, VesselInfoFromCompany, VesselScheduleShareCabin
+from schedules.services import DataVersionService, ShareCabinService, VesselScheduleService
+
+User = get_user_model()
+
+CARRIERS = ['MSK', 'CMA', 'COSCO', 'EVERGREEN', 'ONE', 'HMM', 'YML', 'ZIM', 'OOCL', 'HPL']
+POL_CODES = [f'CNP{i:02d}' for i in range(20)]
+POD_CODES = [f'USP{i:02d}' for i in range(50)]
+VERSIONS = 10
+ROUTE_COUNT = len(POL_CODES) * len(POD_CODES)
+BATCH_SIZE = 5000
+
+# 需要验证的表
+PLAN_TABLES = ('vessel_schedule', 'vessel_info_from_company', 'vessel_schedule_share_cabin')
+
+
+def generate_schedules(rows):
+    """生成模拟航线：1000个航线组合 × 10个版本，同一船名航次在各版本重复出现"""
+    fetch_date = timezone.now()
+    for i in range(rows):
+        route = i % ROUTE_COUNT
+        block = i // ROUTE_COUNT
+        share_cabins = CARRIERS[i % len(CARRIERS)], CARRIERS[(i + 3) % len(CARRIERS)]
+        yield VesselSchedule(
+            polCd=POL_CODES[route // len(POD_CODES)],
+            podCd=POD_CODES[route % len(POD_CODES)],
+            vessel=f'VESSEL_{block // VERSIONS:05d}',
+            voyage=f'{block // VERSIONS:04d}E',
+            data_version=block % VERSIONS + 1,
+            carriercd=share_cabins[0],
+            fetch_timestamp=1716825600,
+            fetch_date=fetch_date,
+            status=0 if i % 20 == 0 else 1,
+            routeEtd=str(i % 7 + 1),
+            etd_at=fetch_date + timedelta(days=i % 60),
+            totalDuration=str(20 + i % 15),
+            shareCabins='[{"carrierCd": "%s"}, {"carrierCd": "%s"}]' % share_cabins,
+        )
+
+
+def generate_vessel_infos(rows):
+    """为最新版本的航线生成船舶额外信息"""
+    for i in range(rows):
+        route = i % ROUTE_COUNT
+        block = i // ROUTE_COUNT
+        yield VesselInfoFromCompany(
+            carrierCd=CARRIERS[i % len(CARRIERS)],
+            polCd=POL_CODES[route // len(POD_CODES)],
+            podCd=POD_CODES[route % len(POD_CODES)],
+            vessel=f'VESSEL_{block:05d}',
+            voyage=f'{block:04d}E',
+            gp_20='10',
+        )
+
+
+def bulk_insert(model, objects):
+    """分批写入"""
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+def explain(sql):
+    """返回查询计划文本"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        else:
+            cursor.execute(f'EXPLAIN {sql}')
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    """返回查询计划中被全表扫描的表"""
+    tables = set()
+    for row in explain(sql):
+        if connection.vendor == 'sqlite':
+            match = re.match(r'SCAN (\w+)', row['detail'])
+            if match and 'USING' not in row['detail']:
+                tables.add(match.group(1))
+        elif row.get('type') == 'ALL' and row.get('table'):
+            tables.add(row['table'])
+    return tables & set(PLAN_TABLES)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class QueryPlanTest(TestCase):
+    """热点查询的索引使用验证"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = int(os.environ.get('QUERY_PLAN_ROWS', 20000))
+        bulk_insert(VesselSchedule, generate_schedules(rows))
+        bulk_insert(VesselInfoFromCompany, generate_vessel_infos(max(rows // 4, ROUTE_COUNT)))
+        ShareCabinService.backfill(chunk_size=BATCH_SIZE)
+
+        # 更新统计信息，让优化器按真实数据分布选择索引
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            else:
+                for table in PLAN_TABLES:
+                    cursor.execute(f'ANALYZE TABLE {table}')
+
+        DataVersionService.publish(VERSIONS, routes=[('CNP01', 'USP01')])
+        cls.user = User.objects.create_user(email='plan@example.com', password='testpass123')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        """断言查询使用了指定索引之一"""
+        plan = queryset.explain()
+        self.assertTrue(
+            any(index_name in plan for index_name in index_names),
+            f'查询未使用索引 {index_names}:\n{queryset.query}\n{plan}'
+        )
+
+    def _unique_index_name(self, model):
+        """获取模型唯一约束对应的索引名"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        return next(name for name, info in constraints.items() if info['unique'] and len(info['columns']) == 5)
+
+    def test_route_version_lookup(self):
+        """按航线读取某一版本的有效数据"""
+        queryset = VesselSchedule.objects.filter(polCd='CNP01', podCd='USP01', data_version=5, status=1)
+        self.assertUsesIndex(queryset, 'idx_vs_route_lookup')
+
+    def test_route_latest_version(self):
+        """按航线取最新有效版本"""
+        queryset = VesselSchedule.objects.filter(
+            polCd='CNP01', podCd='USP01', status=1
+        ).order_by('-data_version').values('data_version')[:1]
+        self.assertUsesIndex(queryset, 'idx_vs_route_lookup')
+
+    def test_route_etd_window_lookup(self):
+        """按航线和ETD窗口读取某一版本的有效数据"""
+        start = timezone.now()
+        queryset = VesselSchedule.objects.filter(
+            polCd='CNP01', podCd='USP01', status=1, data_version=5,
+            etd_at__gte=start, etd_at__lt=start + timedelta(days=7)
+        ).order_by('etd_at')
+        self.assertUsesIndex(queryset, 'idx_vs_route_lookup')
+
+    def test_share_cabin_carrier_lookup(self):
+        """按船公司查询参与共舱的航线"""
+        queryset = VesselScheduleShareCabin.objects.filter(carrierCd='CMA').values('schedule_id')
+        self.assertUsesIndex(queryset, 'idx_vssc_carrier_schedule')
+
+    def test_carrier_set_group_by(self):
+        """按航线和版本对共舱船公司组合分组统计"""
+        queryset = VesselSchedule.objects.filter(
+            polCd='CNP01', podCd='USP01', data_version=5
+        ).values('carrier_set_hash').annotate(count=Count('id')).order_by()
+        self.assertUsesIndex(queryset, 'idx_vs_carrier_set', 'idx_vs_route_lookup')
+
+    def test_carrier_status_lookup(self):
+        """按船公司筛选有效航线"""
+        queryset = VesselSchedule.objects.filter(carriercd='MSK', status=1)
+        self.assertUsesIndex(queryset, 'idx_vs_carrier_status')
+
+    def test_vessel_voyage_lookup(self):
+        """按船名航次查询"""
+        queryset = VesselSchedule.objects.filter(vessel='VESSEL_00001', voyage='0001E')
+        self.assertUsesIndex(queryset, 'idx_vs_vessel_voyage')
+
+    def test_version_status_lookup(self):
+        """按版本读取有效数据"""
+        queryset = VesselSchedule.objects.filter(data_version=3, status=1).values('id')
+        self.assertUsesIndex(queryset, 'idx_vs_version_status')
+
+    def test_keyset_page_lookup(self):
+        """游标分页按 (fetch_date, id) 和 (etd_at, id) 定位下一页"""
+        paginator = VesselScheduleService.get_keyset_paginator()
+        row = VesselSchedule.objects.filter(status=1).order_by('-fetch_date', '-id')[100]
+
+        queryset = VesselSchedule.objects.filter(status=1).filter(
+            paginator._seek_condition('fetch_date', False, row.fetch_date, row.id, True)
+        ).order_by('-fetch_date', '-id')[:20]
+        self.assertUsesIndex(queryset, 'idx_vs_status_fetch_date')
+
+        queryset = VesselSchedule.objects.filter(status=1).filter(
+            paginator._seek_condition('etd_at', True, row.etd_at, row.id, False)
+        ).order_by('etd_at', 'id')[:20]
+        self.assertUsesIndex(queryset, 'idx_vs_status_etd')
+
+    def test_vessel_info_route_lookup(self):
+        """按航线加载船舶信息"""
+        queryset = VesselInfoFromCompany.objects.filter(
+            polCd='CNP01', podCd='USP01', vessel__in=['VESSEL_00001', 'VESSEL_00002']
+        )
+        self.assertUsesIndex(queryset, 'idx_vi_route_lookup')
+
+    def test_vessel_info_five_key_lookup(self):
+        """按五个关联字段精确查询船舶信息"""
+        queryset = VesselInfoFromCompany.objects.filter(
+            carrierCd='MSK', polCd='CNP01', podCd='USP01', vessel='VESSEL_00001', voyage='0001E'
+        )
+        self.assertUsesIndex(
+            queryset, 'idx_vi_route_lookup', self._unique_index_name(VesselInfoFromCompany)
+        )
+
+    def test_hot_endpoints_avoid_full_scans(self):
+        """前台共舱分组、共舱航线接口的全部查询都不全表扫描航线、船舶信息和共舱明细表"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+
+        requests = [
+            (url, params)
+            for url in ('/api/schedules/cabin-grouping/', '/api/schedules/cabin-grouping-with-info/')
+            for params in ({}, {'sailing_within_days': 14})
+        ] + [('/api/schedules/carrier-sailings/', {'carrierCd': 'CMA'})]
+
+        for url, params in requests:
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url, {'polCd': 'CNP01', 'podCd': 'USP01', **params})
+            self.assertEqual(response.status_code, 200)
+
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or not any(table in sql for table in PLAN_TABLES):
+                    continue
+                self.assertEqual(full_scans(sql), set(), f'{url} 存在全表扫描:\n{sql}')
@@ -0,0 +1,198 @@
+"""
+JSON渲染器测试用例
+验证orjson渲染路径与标准库json的输出逐字节一致，并比较两者的渲染耗时
+"""
+import time
+import unittest
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+
+from authentication.renderers import UnicodeJSONRenderer, orjson
+from local_fees.models import LocalFee
+from local_fees.serializers import LocalFeeQuerySerializer
+from schedules.models import VesselSchedule, VesselInfoFromCompany
+
+User = get_user_model()
+
+
+def render(data, backend, indent=False):
+    """用指定的编码实现渲染"""
+    renderer_context = None
+    if indent:
+        renderer_context = {'request': Request(APIRequestFactory().get('/', {'indent': 1})), 'view': None}
+    with override_settings(JSON_RENDER_BACKEND=backend):
+        return UnicodeJSONRenderer().render(data, renderer_context=renderer_context)
+
+
+@unittest.skipUnless(orjson, '需要安装orjson')
+class RendererCompatibilityTest(SimpleTestCase):
+    """orjson与标准库json的输出一致性"""
+
+    def assertCompatible(self, data):
+        """紧凑和缩进两种格式下两种实现的输出逐字节一致"""
+        for indent in (False, True):
+            self.assertEqual(render(data, 'orjson', indent), render(data, 'json', indent))
+
+    def test_backend_selection(self):
+        """默认使用orjson，可切换为标准库"""
+        renderer = UnicodeJSONRenderer()
+        with override_settings(JSON_RENDER_BACKEND='orjson'):
+            self.assertEqual(renderer.get_backend(), 'orjson')
+        with override_settings(JSON_RENDER_BACKEND='json'):
+            self.assertEqual(renderer.get_backend(), 'json')
+
+    def test_none(self):
+        """None渲染为空字节串"""
+        self.assertEqual(render(None, 'orjson'), b'')
+
+    def test_scalars_and_containers(self):
+        """基本类型、空容器、嵌套结构和非字符串键"""
+        self.assertCompatible({
+            'str': 'abc', 'int': -12, 'float': 0.1 + 0.2, 'negative_zero': -0.0, 'big_float': 123456789.125,
+            'bool': True, 'none': None, 'empty_list': [], 'empty_dict': {}, 'tuple': (1, 2),
+            'nested': [1, {'a': [None, {'b': []}]}], 1: 'int key', None: 'none key',
+        })
+
+    def test_unicode_and_escapes(self):
+        """中文不转义，控制字符、引号、反斜杠的转义方式相同"""
+        self.assertCompatible({
+            '名称': '起运港吊头费', '单位': '箱型', 'emoji': '🚢',
+            'escapes': 'tab\t newline\n quote" backslash\\ slash/ \x00\x1f\x7f   ',
+        })
+
+    def test_decimal_datetime_and_other_types(self):
+        """Decimal、日期时间、UUID、延迟翻译字符串和集合交给encoder_class处理"""
+        shanghai = dt_timezone(timedelta(hours=8))
+        self.assertCompatible({
+            'decimal': Decimal('4500.00'), 'decimal_fraction': Decimal('0.1'),
+            'aware': datetime(2025, 6, 1, 10, 0, 0, 123456, tzinfo=shanghai),
+            'utc': datetime(2025, 6, 1, 2, 0, tzinfo=dt_timezone.utc),
+            'naive': datetime(2025, 6, 1, 10, 0),
+            'now': timezone.now(),
+            'date': date(2025, 6, 1), 'time': dt_time(10, 30, 15, 500),
+            'timedelta': timedelta(days=1, seconds=5),
+            'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'lazy': gettext_lazy('测试'),
+            'set': {1}, 'ordered': OrderedDict([('b', 1), ('a', 2)]),
+        })
+
+    def test_fallback_to_json(self):
+        """orjson不支持的数据回退到标准库"""
+        data = {'huge': 2 ** 70}
+        self.assertEqual(render(data, 'orjson'), render(data, 'json'))
+
+    def test_unsupported_type_raises(self):
+        """两种实现都不支持的类型照常抛出TypeError"""
+        with self.assertRaises(TypeError):
+            render({'object': object()}, 'orjson')
+
+
+@unittest.skipUnless(orjson, '需要安装orjson')
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RendererAPICompatibilityTest(TestCase):
+    """真实接口响应在两种实现下逐字节一致"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.user = User.objects.create_superuser(email='admin@example.com', password='adminpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def assertSameContent(self, url, params):
+        """两种实现的响应体相同"""
+        contents = []
+        for backend in ('orjson', 'json'):
+            with override_settings(JSON_RENDER_BACKEND=backend):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            contents.append(response.content)
+        self.assertEqual(contents[0], contents[1])
+
+    def test_local_fee_query(self):
+        """本地费用查询的中文键、Decimal价格"""
+        for i, name in enumerate(['起运港吊头费', '保安费', '文件费']):
+            LocalFee.objects.create(
+                polCd='CNSHA', podCd='USNYC', carriercd='MSK', name=name,
+                unit_name='票' if i else '箱型', price_20gp=Decimal('100.50') * (i + 1),
+                price_per_bill=Decimal('35.00') if i else None, currency='CNY'
+            )
+
+        data = LocalFeeQuerySerializer(LocalFee.objects.order_by('id'), many=True).data
+        self.assertEqual(render(data, 'orjson'), render(data, 'json'))
+        self.assertSameContent('/api/local-fees/local-fees/query/', {'polCd': 'CNSHA', 'podCd': 'USNYC'})
+
+    def test_cabin_grouping_with_info(self):
+        """共舱分组（含船舶信息）响应"""
+        for i in range(20):
+            VesselSchedule.objects.create(
+                polCd='CNSHA', podCd='USNYC', vessel=f'VESSEL_{i}', voyage=f'V{i:03d}',
+                data_version=1, carriercd='MSK', fetch_timestamp=1716825600, fetch_date=timezone.now(),
+                routeEtd=str(i % 7 + 1), totalDuration='26', etd='2025-06-01 10:00:00',
+                shareCabins='[{"carrierCd": "MSK"}, {"carrierCd": "ONE"}]', status=1
+            )
+        VesselInfoFromCompany.objects.filter(vessel='VESSEL_1').update(price=Decimal('1200.00'), gp_20='有现舱')
+
+        self.assertSameContent('/api/schedules/cabin-grouping-with-info/', {'polCd': 'CNSHA', 'podCd': 'USNYC'})
+
+    def test_schedule_list(self):
+        """航线列表的日期时间字段"""
+        VesselSchedule.objects.create(
+            polCd='CNSHA', podCd='USNYC', vessel='VESSEL_1', voyage='V001', data_version=1,
+            carriercd='MSK', fetch_timestamp=1716825600, fetch_date=timezone.now(),
+            etd_at=timezone.now(), status=1
+        )
+        self.assertSameContent('/api/schedules/', {})
+
+
+@unittest.skipUnless(orjson, '需要安装orjson')
+class RendererBenchmarkTest(SimpleTestCase):
+    """渲染耗时对比"""
+
+    def _grouping_payload(self, size):
+        """模拟包含size条航线的共舱分组响应"""
+        schedules = [
+            {
+                'id': i, 'vessel': f'VESSEL_{i}', 'voyage': f'V{i:04d}', 'polCd': 'CNSHA', 'podCd': 'USNYC',
+                'pol': 'SHANGHAI', 'pod': 'NEW YORK', 'eta': '2025-06-27 08:00:00', 'etd': '2025-06-01 10:00:00',
+                'routeEtd': str(i % 7 + 1), 'carriercd': 'MSK', 'totalDuration': '26',
+                'shareCabins': [{'carrierCd': 'MSK'}, {'carrierCd': 'ONE'}],
+                'vessel_info': {'gp_20': '有现舱', 'hq_40': '--', 'price': Decimal('1200.00'),
+                                'cut_off_time': '周三 12:00', 'updated_at': timezone.now()},
+            }
+            for i in range(size)
+        ]
+        return {'success': True, 'message': '获取共舱分组数据成功', 'data': {
+            'groups': [{'group_id': f'group_{g}', 'cabins_count': 2, 'carrier_codes': ['MSK', 'ONE'],
+                        'schedules': schedules[g::10]} for g in range(10)],
+        }}
+
+    def _measure(self, data, backend, rounds):
+        """多次渲染取总耗时"""
+        with override_settings(JSON_RENDER_BACKEND=backend):
+            renderer = UnicodeJSONRenderer()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                renderer.render(data)
+            return time.perf_counter() - start
+
+    def test_render_benchmark(self):
+        """500条航线的分组响应：orjson不慢于标准库"""
+        data = self._grouping_payload(500)
+        self.assertEqual(render(data, 'orjson'), render(data, 'json'))
+
+        json_time = self._measure(data, 'json', 20)
+        orjson_time = self._measure(data, 'orjson', 20)
+
+        print(f"渲染500条航线×20次: json {json_time:.3f}s, orjson {orjson_time:.3f}s, "
+              f"加速 {json_time / orjson_time:.1f}x")
+        self.assertLess(orjson_time, json_time)
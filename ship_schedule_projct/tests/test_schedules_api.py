@@ -3,8 +3,11 @@
 测试船舶航线管理、船舶额外信息管理、共舱分组查询等API功能
 """
 import json
+from datetime import timedelta
 from decimal import Decimal
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import override_settings, CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
@@ -551,3 +554,117 @@ class CabinGroupingAPITest(APITestCase):
         })
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'schedule-cursor-pagination-tests',
+    }
+})
+class VesselScheduleCursorPaginationTest(APITestCase):
+    """航线列表、搜索接口的游标分页测试"""
+
+    def setUp(self):
+        """测试前准备：25条有效航线，抓取时间有重复，部分航线没有ETD"""
+        from django.core.cache import cache
+        cache.clear()
+
+        self.user = User.objects.create_superuser(email='cursor@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        base = timezone.now()
+        VesselSchedule.objects.bulk_create([
+            VesselSchedule(
+                polCd='CNSHA', podCd='USNYC', vessel=f'CURSOR_{i:02d}', voyage='001E',
+                data_version=1, fetch_timestamp=1716825600, status=1,
+                fetch_date=base - timedelta(hours=i // 3),
+                etd_at=None if i % 5 == 0 else base + timedelta(days=i % 4),
+            )
+            for i in range(25)
+        ])
+        self.search_url = '/api/schedules/search/'
+        self.list_url = '/api/schedules/'
+
+    def _walk(self, url, params, results_of, next_of):
+        """沿next游标翻到最后一页，返回全部id和每页的响应数据"""
+        ids, pages, cursor = [], [], None
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+            pages.append(response.data)
+            ids.extend(row['id'] for row in results_of(response.data))
+            cursor = next_of(response.data)
+            if not cursor:
+                return ids, pages
+
+    def test_search_walks_forward_and_back(self):
+        """按 (fetch_date, id) 降序翻完全部页，再沿previous游标翻回第一页"""
+        expected = list(
+            VesselSchedule.objects.order_by('-fetch_date', '-id').values_list('id', flat=True)
+        )
+
+        ids, pages = self._walk(
+            self.search_url, {'pagination': 'cursor', 'page_size': 7},
+            lambda data: data['data']['results'], lambda data: data['data']['next_cursor']
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(pages), 4)
+        self.assertIsNone(pages[0]['data']['previous_cursor'])
+        self.assertEqual(pages[0]['data']['total_count'], 25)
+
+        # 从最后一页向前翻
+        data = pages[-1]['data']
+        backward = [row['id'] for row in data['results']]
+        while data['previous_cursor']:
+            data = self.client.get(self.search_url, {'cursor': data['previous_cursor'], 'page_size': 7}).data['data']
+            backward = [row['id'] for row in data['results']] + backward
+        self.assertEqual(backward, expected)
+
+    def test_search_etd_ordering_with_nulls(self):
+        """按 (etd_at, id) 升序翻页，没有ETD的航线排在最前且不重复、不遗漏"""
+        ids, _ = self._walk(
+            self.search_url, {'pagination': 'cursor', 'ordering': 'etd', 'page_size': 4},
+            lambda data: data['data']['results'], lambda data: data['data']['next_cursor']
+        )
+
+        schedules = VesselSchedule.objects.all()
+        no_etd = sorted(s.id for s in schedules if s.etd_at is None)
+        with_etd = [s.id for s in sorted((s for s in schedules if s.etd_at), key=lambda s: (s.etd_at, s.id))]
+        self.assertEqual(ids, no_etd + with_etd)
+
+    def test_total_count_is_cached(self):
+        """翻页时总数从缓存读取，不再执行COUNT"""
+        first = self.client.get(self.search_url, {'pagination': 'cursor', 'page_size': 5}).data['data']
+
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(self.search_url, {'cursor': first['next_cursor'], 'page_size': 5}).data['data']
+
+        self.assertEqual(second['total_count'], 25)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+        self.assertFalse(any('OFFSET' in query['sql'] for query in context.captured_queries))
+
+    def test_list_view_cursor_mode(self):
+        """列表接口携带pagination=cursor时返回游标，默认仍使用页码分页"""
+        ids, pages = self._walk(
+            self.list_url, {'pagination': 'cursor', 'page_size': 10, 'include_total': 'false'},
+            lambda data: data['results'], lambda data: data['next_cursor']
+        )
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        self.assertIsNone(pages[0]['count'])
+        self.assertIn('cursor=', pages[0]['next'])
+
+        response = self.client.get(self.list_url, {'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+        self.assertNotIn('next_cursor', response.data)
+
+    def test_invalid_cursor(self):
+        """无效游标和不支持的排序返回400"""
+        response = self.client.get(self.list_url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.list_url, {'pagination': 'cursor', 'ordering': 'vessel'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,1671 @@
+"""
+船期管理服务层测试用例
+测试数据版本登记、共舱分组等服务类的业务逻辑
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+
+from schedules.models import (
+    VesselSchedule, VesselInfoFromCompany, DataVersionRegistry, VesselScheduleArchive,
+    VesselScheduleShareCabin, VesselInfoImportJob, VesselScheduleStats, VesselInfoStats, CabinGroupingSnapshot
+)
+from schedules.services import (
+    DataVersionService, ScheduleRetentionService, ScheduleDateTimeService, ShareCabinService,
+    CabinGroupingService, VesselInfoBulkService, VesselInfoImportService, VesselScheduleExportService,
+    ScheduleStatsService, VesselInfoStatsService
+)
+from schedules.signals import (
+    manual_sync_vessel_schedules, bulk_vessel_schedule_sync, enqueue_vessel_schedule_sync,
+    PENDING_SYNC_ATTR
+)
+
+User = get_user_model()
+
+
+def create_schedule(pol_cd, pod_cd, vessel, data_version, **kwargs):
+    """创建测试航线"""
+    defaults = {
+        'voyage': 'V001',
+        'carriercd': 'MSK',
+        'fetch_timestamp': 1716825600,
+        'fetch_date': timezone.now(),
+        'routeEtd': '3',
+        'totalDuration': '26',
+        'shareCabins': json.dumps([{'carrierCd': 'MSK'}]),
+        'status': 1,
+    }
+    defaults.update(kwargs)
+    return VesselSchedule.objects.create(
+        polCd=pol_cd, podCd=pod_cd, vessel=vessel, data_version=data_version, **defaults
+    )
+
+
+class DataVersionServiceTest(TestCase):
+    """数据版本服务测试"""
+
+    def test_fallback_to_aggregate_without_registry(self):
+        """登记表没有记录时回退到聚合查询"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 2)
+        create_schedule('CNNGB', 'USLAX', 'VESSEL_2', 3)
+
+        self.assertEqual(DataVersionService.get_latest_version(), 3)
+        self.assertEqual(DataVersionService.get_latest_version('CNSHA', 'USNYC'), 2)
+        self.assertIsNone(DataVersionService.get_latest_version('CNXMN', 'VNVUT'))
+
+    def test_publish_updates_global_and_route_pointers(self):
+        """发布版本同时更新全局和航线版本"""
+        DataVersionService.publish(5, routes=[('CNSHA', 'USNYC')])
+        DataVersionService.publish(6, routes=[('CNNGB', 'USLAX')])
+
+        self.assertEqual(DataVersionService.get_latest_version(), 6)
+        self.assertEqual(DataVersionService.get_latest_version('CNSHA', 'USNYC'), 5)
+        self.assertEqual(DataVersionService.get_latest_version('CNNGB', 'USLAX'), 6)
+        self.assertEqual(DataVersionRegistry.objects.count(), 3)
+
+    def test_registry_takes_precedence_over_newer_rows(self):
+        """已写入但未发布的版本不会被读取"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 2)
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+        self.assertEqual(DataVersionService.get_latest_version('CNSHA', 'USNYC'), 1)
+
+    def test_fallback_ignores_staged_versions(self):
+        """未登记的航线回退查询时不会读取超过全局已发布版本的暂存数据"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+        create_schedule('CNNGB', 'USLAX', 'VESSEL_2', 1)
+        create_schedule('CNNGB', 'USLAX', 'VESSEL_2', 2)  # 暂存中的版本
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+        self.assertEqual(DataVersionService.get_latest_version(), 1)
+        self.assertEqual(DataVersionService.get_latest_version('CNNGB', 'USLAX'), 1)
+
+    def test_get_latest_versions_matches_single_lookup(self):
+        """批量读取与逐条读取结果相同：登记的航线、回退聚合的航线和没有数据的航线"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 2)
+        create_schedule('CNNGB', 'USLAX', 'VESSEL_2', 1)
+        create_schedule('CNNGB', 'USLAX', 'VESSEL_2', 2)  # 暂存中的版本
+        create_schedule('CNXMN', 'VNVUT', 'VESSEL_3', 1, status=0)
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+        routes = [('CNSHA', 'USNYC'), ('CNNGB', 'USLAX'), ('CNXMN', 'VNVUT'), ('CNSHK', 'THBKK')]
+
+        with CaptureQueriesContext(connection) as context:
+            versions = DataVersionService.get_latest_versions(routes)
+
+        self.assertEqual(versions, {route: DataVersionService.get_latest_version(*route) for route in routes})
+        self.assertEqual(versions[('CNNGB', 'USLAX')], 1)
+        self.assertEqual(len(context.captured_queries), 2)
+
+    def test_rebuild_registry_command(self):
+        """重建命令按现有数据登记全局和各航线版本"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+        create_schedule('CNNGB', 'USLAX', 'VESSEL_2', 2)
+
+        call_command('rebuild_data_version_registry', stdout=StringIO())
+
+        self.assertEqual(
+            set(DataVersionRegistry.objects.values_list('polCd', 'podCd', 'data_version')),
+            {('', '', 2), ('CNSHA', 'USNYC', 1), ('CNNGB', 'USLAX', 2)}
+        )
+
+
+class ManualSyncVesselSchedulesTest(TestCase):
+    """航线批量同步到船舶信息测试"""
+
+    def _create_schedules(self, count):
+        """创建共舱航线，每条航线对应MSK和CMA两个船公司"""
+        share_cabins = json.dumps([{'carrierCd': 'MSK'}, {'carrierCd': 'CMA'}])
+        for i in range(count):
+            create_schedule('CNSHA', 'USNYC', f'VESSEL_{i}', 1, shareCabins=share_cabins)
+
+    def test_creates_missing_records_per_carrier(self):
+        """为每个共舱船公司创建缺少的记录，保留已有记录的补充信息"""
+        self._create_schedules(3)
+        create_schedule('CNSHA', 'USNYC', 'NO_CARRIER', 1, shareCabins='', carriercd='')
+        VesselInfoFromCompany.objects.create(
+            carrierCd='MSK', polCd='CNSHA', podCd='USNYC', vessel='VESSEL_0', voyage='V001', gp_20='1000'
+        )
+
+        result = manual_sync_vessel_schedules()
+
+        self.assertEqual(result['total_processed'], 4)
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(result['skipped'], 1)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 6)
+        self.assertEqual(
+            VesselInfoFromCompany.objects.get(carrierCd='MSK', vessel='VESSEL_0').gp_20, '1000'
+        )
+
+        # 再次同步不会重复创建
+        self.assertEqual(manual_sync_vessel_schedules()['created'], 0)
+        self.assertEqual(manual_sync_vessel_schedules(force_update=True)['updated'], 6)
+
+    def test_delete_cleans_up_empty_records(self):
+        """删除航线时一次查询清理各共舱船公司没有补充信息的记录，保留已填写的记录"""
+        self._create_schedules(2)
+        manual_sync_vessel_schedules()
+        VesselInfoFromCompany.objects.filter(carrierCd='CMA', vessel='VESSEL_0').update(price='1200.00')
+
+        with CaptureQueriesContext(connection) as context:
+            VesselSchedule.objects.get(vessel='VESSEL_0').delete()
+
+        self.assertEqual(
+            sorted(VesselInfoFromCompany.objects.values_list('carrierCd', 'vessel')),
+            [('CMA', 'VESSEL_0'), ('CMA', 'VESSEL_1'), ('MSK', 'VESSEL_1')]
+        )
+        selects = [
+            q for q in context.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "vessel_info_from_company"' in q['sql']
+        ]
+        self.assertEqual(len(selects), 1)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """查询次数与航线数量无关，创建按chunk_size分批"""
+        self._create_schedules(40)
+
+        with CaptureQueriesContext(connection) as context:
+            result = manual_sync_vessel_schedules(chunk_size=50)
+
+        inserts = [
+            q for q in context.captured_queries
+            if q['sql'].startswith('INSERT') and '"vessel_info_from_company"' in q['sql']
+        ]
+        self.assertEqual(result['created'], 80)
+        self.assertEqual(len(inserts), 2)
+        # 另有船舶信息统计的查询、累加和补齐各一次（不计每批的保存点语句）
+        queries = [q for q in context.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(queries), 8)
+
+    def test_failed_chunk_rolls_back_to_savepoint(self):
+        """在外层事务中某批创建失败时回滚到该批的保存点，后续批次继续创建"""
+        self._create_schedules(2)
+        bulk_create = VesselInfoFromCompany.objects.bulk_create
+        calls = []
+
+        def fail_first_chunk(objs, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 1:
+                raise IntegrityError('duplicate')
+            return bulk_create(objs, **kwargs)
+
+        with transaction.atomic(), CaptureQueriesContext(connection) as context, \
+                mock.patch.object(VesselInfoFromCompany.objects, 'bulk_create', side_effect=fail_first_chunk):
+            result = manual_sync_vessel_schedules(chunk_size=2)
+            self.assertFalse(transaction.get_rollback())
+
+        self.assertEqual(result['errors'], 2)
+        self.assertEqual(result['created'], 2)
+        self.assertTrue(any(q['sql'].startswith('ROLLBACK TO SAVEPOINT') for q in context.captured_queries))
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 2)
+
+    def test_dry_run_does_not_write(self):
+        """预览模式只统计不写入"""
+        self._create_schedules(2)
+
+        result = manual_sync_vessel_schedules(dry_run=True)
+
+        self.assertEqual(result['created'], 4)
+        self.assertFalse(VesselInfoFromCompany.objects.exists())
+
+    def test_sync_command_uses_chunk_size(self):
+        """同步命令按--chunk-size分批创建"""
+        self._create_schedules(3)
+
+        with CaptureQueriesContext(connection) as context:
+            call_command('sync_vessel_info', '--chunk-size', '2', stdout=StringIO())
+
+        inserts = [
+            q for q in context.captured_queries
+            if q['sql'].startswith('INSERT') and 'vessel_info_from_company' in q['sql']
+        ]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 6)
+
+
+class DeferredVesselInfoSyncTest(TestCase):
+    """航线保存后延迟批量同步船舶信息测试"""
+
+    def _create(self, vessel, **kwargs):
+        """创建MSK、CMA共舱的航线"""
+        kwargs.setdefault('shareCabins', json.dumps([{'carrierCd': 'MSK'}, {'carrierCd': 'CMA'}]))
+        return create_schedule('CNSHA', 'USNYC', vessel, 1, **kwargs)
+
+    def test_saves_in_transaction_sync_once_on_commit(self):
+        """事务内多次保存只注册一次提交回调，提交后统一创建船舶信息"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            for i in range(5):
+                self._create(f'VESSEL_{i}')
+            self.assertFalse(VesselInfoFromCompany.objects.exists())
+
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 10)
+
+    def test_bulk_context_reconciles_once(self):
+        """批量上下文内只记录航线，退出后统一对账"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with bulk_vessel_schedule_sync() as buffer:
+                schedules = [self._create(f'VESSEL_{i}') for i in range(3)]
+                self.assertEqual(buffer.schedule_ids, {schedule.id for schedule in schedules})
+
+        self.assertEqual(
+            set(VesselInfoFromCompany.objects.values_list('carrierCd', 'vessel')),
+            {(carrier, f'VESSEL_{i}') for carrier in ('MSK', 'CMA') for i in range(3)}
+        )
+
+    def test_bulk_context_discards_on_error(self):
+        """批量上下文内发生异常时不执行同步"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(ValueError):
+                with transaction.atomic(), bulk_vessel_schedule_sync():
+                    self._create('VESSEL_1')
+                    raise ValueError('rollback')
+
+        self.assertEqual(callbacks, [])
+
+    def test_rolled_back_savepoint_does_not_block_later_sync(self):
+        """保存点回滚后，后续保存重新登记同步"""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self._create('ROLLED_BACK')
+                    raise ValueError('rollback')
+            except ValueError:
+                pass
+            self._create('VESSEL_1')
+
+        self.assertEqual(
+            set(VesselInfoFromCompany.objects.values_list('vessel', flat=True)), {'VESSEL_1'}
+        )
+
+    def test_pending_sync_recorded_on_connection(self):
+        """缓冲区记录在连接上，提交回调执行后清除"""
+        connection = transaction.get_connection()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._create('VESSEL_1')
+            self._create('VESSEL_2')
+            callback = getattr(connection, PENDING_SYNC_ATTR)()
+            self.assertEqual(len(callback.pending.schedule_ids), 2)
+
+        self.assertEqual(callbacks, [callback])
+        callbacks[0]()
+        self.assertIsNone(getattr(connection, PENDING_SYNC_ATTR))
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 4)
+
+    def test_inactive_schedule_is_not_synced(self):
+        """无效航线不同步，update()激活后手动登记同步"""
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule = self._create('VESSEL_1', status=0)
+        self.assertFalse(VesselInfoFromCompany.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VesselSchedule.objects.filter(id=schedule.id).update(status=1)
+            enqueue_vessel_schedule_sync([schedule.id])
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 2)
+
+
+class ScheduleRetentionServiceTest(TestCase):
+    """历史版本归档测试"""
+
+    def setUp(self):
+        """创建5个版本，VESSEL_1内容不变，VESSEL_2每个版本ETD不同"""
+        for version in range(1, 6):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', version, etd='2025-06-01')
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_2', version, etd=f'2025-06-0{version}')
+        DataVersionService.publish(5, routes=[('CNSHA', 'USNYC')])
+
+    def test_archivable_versions_skip_kept_pending_and_registered(self):
+        """保留最近版本、暂存版本和仍被登记的版本"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 6)  # 暂存中的版本
+        DataVersionRegistry.objects.create(polCd='CNNGB', podCd='USLAX', data_version=2)
+
+        self.assertEqual(ScheduleRetentionService.get_archivable_versions(2), [1, 3])
+
+    def test_compact_moves_rows_and_deduplicates(self):
+        """归档后热表只保留最近版本，内容不变的航线合并为一条归档"""
+        VesselInfoFromCompany.objects.create(
+            carrierCd='MSK', polCd='CNSHA', podCd='USNYC', vessel='VESSEL_1', voyage='V001'
+        )
+
+        result = ScheduleRetentionService.compact(keep_versions=2)
+
+        self.assertEqual(result['archived_versions'], [1, 2, 3])
+        self.assertEqual(result['rows_moved'], 6)
+        self.assertGreater(result['bytes_reclaimed'], 0)
+        self.assertEqual(
+            sorted(set(VesselSchedule.objects.values_list('data_version', flat=True))), [4, 5]
+        )
+
+        # VESSEL_1 三个版本合并为1条，VESSEL_2 每个版本各1条
+        self.assertEqual(VesselScheduleArchive.objects.count(), 4)
+        unchanged = VesselScheduleArchive.objects.get(vessel='VESSEL_1')
+        self.assertEqual(unchanged.get_versions(), [1, 2, 3])
+        self.assertEqual(unchanged.get_payload()['etd'], '2025-06-01')
+
+        # 归档不会触发航线删除信号清理船舶补充信息
+        self.assertTrue(VesselInfoFromCompany.objects.filter(vessel='VESSEL_1').exists())
+
+    def test_compact_dry_run(self):
+        """预览模式不修改数据"""
+        result = ScheduleRetentionService.compact(keep_versions=2, dry_run=True)
+
+        self.assertEqual(result['rows_moved'], 6)
+        self.assertEqual(VesselSchedule.objects.count(), 10)
+        self.assertFalse(VesselScheduleArchive.objects.exists())
+
+    def test_compact_command(self):
+        """归档命令"""
+        call_command('compact_schedule_versions', '--keep', '4', stdout=StringIO())
+
+        self.assertEqual(VesselSchedule.objects.filter(data_version=1).count(), 0)
+        self.assertEqual(VesselScheduleArchive.objects.count(), 2)
+
+
+class ScheduleDateTimeServiceTest(TestCase):
+    """类型化时间字段测试"""
+
+    def test_parse_formats(self):
+        """支持常见格式，按默认时区解释，无法解析时返回None"""
+        parsed = ScheduleDateTimeService.parse('2025-06-01 08:30:00')
+
+        self.assertEqual(timezone.localtime(parsed).replace(tzinfo=None), datetime(2025, 6, 1, 8, 30))
+        self.assertEqual(ScheduleDateTimeService.parse('2025/06/01').date(), datetime(2025, 6, 1).date())
+        self.assertIsNone(ScheduleDateTimeService.parse('TBA'))
+        self.assertIsNone(ScheduleDateTimeService.parse(''))
+
+    def test_save_populates_typed_fields(self):
+        """保存航线时根据字符串字段填充类型化时间字段"""
+        schedule = create_schedule(
+            'CNSHA', 'USNYC', 'VESSEL_1', 1, etd='2025-06-01 08:00:00', eta='2025-06-27', cyClose='TBA'
+        )
+        schedule.refresh_from_db()
+
+        self.assertEqual(schedule.etd_at, ScheduleDateTimeService.parse('2025-06-01 08:00:00'))
+        self.assertEqual(schedule.eta_at, ScheduleDateTimeService.parse('2025-06-27'))
+        self.assertIsNone(schedule.cy_close_at)
+
+        schedule.etd = '2025-06-03'
+        schedule.save()
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.etd_at, ScheduleDateTimeService.parse('2025-06-03'))
+
+    def test_parse_etd_window(self):
+        """etd_to只有日期时包含当天，N天内开船从今天零点开始"""
+        start, end = ScheduleDateTimeService.parse_etd_window('2025-06-01', '2025-06-03')
+        self.assertEqual(end - start, timedelta(days=3))
+
+        start, end = ScheduleDateTimeService.parse_etd_window(sailing_within_days='7')
+        self.assertEqual(timezone.localtime(start).date(), timezone.localdate())
+        self.assertEqual(end - start, timedelta(days=8))
+
+        for kwargs in ({'etd_from': 'bad'}, {'sailing_within_days': 'x'},
+                       {'sailing_within_days': '-1'}, {'etd_from': '2025-06-03', 'etd_to': '2025-06-01'}):
+            with self.assertRaises(ValueError):
+                ScheduleDateTimeService.parse_etd_window(**kwargs)
+
+    def test_backfill_command(self):
+        """回填命令分批填充历史数据的类型化时间字段"""
+        for index in range(5):
+            create_schedule('CNSHA', 'USNYC', f'VESSEL_{index}', 1, etd=f'2025-06-0{index + 1}')
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_TBA', 1, etd='TBA')
+        VesselSchedule.objects.update(etd_at=None, eta_at=None)
+
+        call_command('backfill_schedule_datetimes', '--dry-run', stdout=StringIO())
+        self.assertFalse(VesselSchedule.objects.filter(etd_at__isnull=False).exists())
+
+        result = ScheduleDateTimeService.backfill(chunk_size=2)
+
+        self.assertEqual(result, {'scanned': 6, 'updated': 5, 'unparsed': 1})
+        self.assertEqual(
+            VesselSchedule.objects.get(vessel='VESSEL_2').etd_at, ScheduleDateTimeService.parse('2025-06-03')
+        )
+
+        call_command('backfill_schedule_datetimes', '--all', '--chunk-size', '3', stdout=StringIO())
+        self.assertEqual(VesselSchedule.objects.filter(etd_at__isnull=False).count(), 5)
+
+
+class ShareCabinServiceTest(TestCase):
+    """共舱船公司集合和明细表测试"""
+
+    def _share_cabins(self, *carriers):
+        """生成shareCabins字段"""
+        return json.dumps([{'carrierCd': carrier} for carrier in carriers])
+
+    def _create(self, pol_cd, pod_cd, vessel, data_version, **kwargs):
+        """创建航线并执行提交回调（重建共舱明细）"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_schedule(pol_cd, pod_cd, vessel, data_version, **kwargs)
+
+    def test_save_populates_carrier_set_and_rows(self):
+        """保存航线时写入去重排序的船公司集合，并重建共舱明细"""
+        schedule = self._create(
+            'CNSHA', 'USNYC', 'VESSEL_1', 1, shareCabins=self._share_cabins('MSK', 'CMA', 'MSK')
+        )
+        schedule.refresh_from_db()
+
+        self.assertEqual(schedule.carrier_set, 'CMA,MSK')
+        self.assertEqual(schedule.carrier_set_hash, ShareCabinService.get_carrier_set_hash('CMA,MSK'))
+        self.assertEqual(
+            list(schedule.share_cabin_rows.order_by('sort_order').values_list('carrierCd', flat=True)),
+            ['MSK', 'CMA']
+        )
+
+    def test_rows_follow_share_cabins_in_transaction(self):
+        """事务中修改共舱配置，提交后按最终的shareCabins重建明细"""
+        schedule = self._create('CNSHA', 'USNYC', 'VESSEL_1', 1, shareCabins=self._share_cabins('MSK'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                schedule.shareCabins = json.dumps([{'carrierCd': 'ONE', 'price': '4200', 'available': True}])
+                schedule.save(update_fields=VesselSchedule.SHARE_CABIN_FIELDS)
+                schedule.status = 0
+                schedule.save(update_fields=['status'])
+
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.carrier_set, 'ONE')
+        row = VesselScheduleShareCabin.objects.get(schedule=schedule)
+        self.assertEqual((row.carrierCd, str(row.price), row.available), ('ONE', '4200.00', True))
+
+    def test_orm_edits_clear_content_hash(self):
+        """通过ORM修改航线时清空抓取程序写入的内容哈希，只回填推导字段时保留"""
+        schedule = self._create('CNSHA', 'USNYC', 'VESSEL_1', 1, shareCabins=self._share_cabins('MSK'))
+
+        def set_hash():
+            VesselSchedule.objects.filter(pk=schedule.pk).update(content_hash='a' * 64)
+            schedule.refresh_from_db()
+
+        set_hash()
+        schedule.carrier_set = 'MSK'
+        schedule.save(update_fields=['carrier_set', 'carrier_set_hash'])
+        self.assertEqual(VesselSchedule.objects.get(pk=schedule.pk).content_hash, 'a' * 64)
+
+        schedule.shareCabins = self._share_cabins('MSK', 'CMA')
+        schedule.save(update_fields=VesselSchedule.SHARE_CABIN_FIELDS)
+        self.assertIsNone(VesselSchedule.objects.get(pk=schedule.pk).content_hash)
+
+        set_hash()
+        schedule.status = 0
+        schedule.save(update_fields=['status'])
+        self.assertIsNone(VesselSchedule.objects.get(pk=schedule.pk).content_hash)
+
+        set_hash()
+        schedule.remark = '人工修改'
+        schedule.save()
+        self.assertIsNone(VesselSchedule.objects.get(pk=schedule.pk).content_hash)
+
+    def test_missing_share_cabins_falls_back_to_carrier(self):
+        """没有共舱信息时使用航线的船公司"""
+        schedule = self._create('CNSHA', 'USNYC', 'VESSEL_1', 1, carriercd='ONE', shareCabins='')
+
+        self.assertEqual(schedule.carrier_set, 'ONE')
+        self.assertEqual(list(schedule.share_cabin_rows.values_list('carrierCd', flat=True)), ['ONE'])
+
+    def test_carrier_sailings_and_set_counts(self):
+        """按船公司查询共舱航线，并按船公司组合统计"""
+        self._create('CNSHA', 'USNYC', 'VESSEL_1', 1, shareCabins=self._share_cabins('MSK', 'CMA'))
+        self._create('CNSHA', 'USNYC', 'VESSEL_2', 1, shareCabins=self._share_cabins('CMA', 'MSK'))
+        self._create('CNNGB', 'USLAX', 'VESSEL_3', 1, shareCabins=self._share_cabins('CMA', 'ONE'))
+        self._create('CNNGB', 'USLAX', 'VESSEL_4', 1, shareCabins=self._share_cabins('ONE'))
+        self._create('CNNGB', 'USLAX', 'VESSEL_5', 2, shareCabins=self._share_cabins('CMA'))
+
+        sailings = ShareCabinService.get_carrier_sailings('CMA', 1)
+
+        self.assertEqual(
+            sorted(sailings.values_list('vessel', flat=True)), ['VESSEL_1', 'VESSEL_2', 'VESSEL_3']
+        )
+        self.assertEqual(ShareCabinService.get_carrier_set_counts(sailings), [
+            {'carrier_codes': ['CMA', 'MSK'], 'count': 2},
+            {'carrier_codes': ['CMA', 'ONE'], 'count': 1},
+        ])
+        self.assertEqual(ShareCabinService.get_carrier_sailings('CMA', 1, pol_cd='CNNGB').count(), 1)
+
+    def test_grouping_uses_carrier_set(self):
+        """共舱分组按carrier_set分组，与解析shareCabins的结果一致"""
+        self._create('CNSHA', 'USNYC', 'VESSEL_1', 1, shareCabins=self._share_cabins('MSK', 'CMA'))
+        self._create('CNSHA', 'USNYC', 'VESSEL_2', 1, shareCabins=self._share_cabins('CMA', 'MSK'))
+        self._create('CNSHA', 'USNYC', 'VESSEL_3', 1, shareCabins=self._share_cabins('ONE'))
+        # 尚未回填carrier_set的记录解析shareCabins
+        VesselSchedule.objects.filter(vessel='VESSEL_2').update(carrier_set=None, carrier_set_hash=None)
+        schedules = list(VesselSchedule.objects.order_by('id'))
+
+        with CaptureQueriesContext(connection) as context:
+            groups = CabinGroupingService.build_basic_groups(schedules)
+
+        self.assertEqual(
+            sorted((g['carrier_codes'], len(g['schedules'])) for g in groups),
+            [(['CMA', 'MSK'], 2), (['ONE'], 1)]
+        )
+        self.assertEqual(groups[0]['schedules'][0]['shareCabins'][0]['carrierCd'], 'MSK')
+        # 分组由一次GROUP BY carrier_set_hash查询得到
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('GROUP BY', context.captured_queries[0]['sql'])
+        self.assertIn('carrier_set_hash', context.captured_queries[0]['sql'])
+
+    def test_cabin_price_uses_earliest_etd(self):
+        """cabin_price取最早ETD航线的价格，最早ETD由GROUP BY的MIN(etd_at)得到"""
+        share_cabins = self._share_cabins('MSK', 'CMA')
+        self._create('CNSHA', 'USNYC', 'VESSEL_1', 1, etd='2025-06-10', shareCabins=share_cabins)
+        self._create('CNSHA', 'USNYC', 'VESSEL_2', 1, etd='2025-06-03', routeEtd='5', shareCabins=share_cabins)
+        self._create('CNSHA', 'USNYC', 'VESSEL_3', 1, etd='2025-06-05', shareCabins=share_cabins)
+        for vessel, price in (('VESSEL_1', '1000'), ('VESSEL_2', '2000'), ('VESSEL_3', '3000')):
+            VesselInfoFromCompany.objects.filter(vessel=vessel).update(price=price)
+        schedules = list(VesselSchedule.objects.order_by('id'))
+
+        with CaptureQueriesContext(connection) as context:
+            groups = CabinGroupingService.build_groups_with_vessel_info('CNSHA', 'USNYC', schedules)
+
+        self.assertEqual(groups[0]['cabin_price'], 2000.0)
+        self.assertTrue(any('MIN' in query['sql'] for query in context.captured_queries))
+
+        # 尚未回填etd_at的航线不在MIN(etd_at)中，按字符串解析的ETD参与比较
+        VesselSchedule.objects.filter(vessel='VESSEL_3').update(etd='2025-06-01', etd_at=None)
+        schedules = list(VesselSchedule.objects.order_by('id'))
+
+        groups = CabinGroupingService.build_groups_with_vessel_info('CNSHA', 'USNYC', schedules)
+
+        self.assertEqual(groups[0]['cabin_price'], 3000.0)
+
+    def test_backfill_command(self):
+        """回填命令为历史数据写入carrier_set和共舱明细"""
+        for index in range(5):
+            self._create('CNSHA', 'USNYC', f'VESSEL_{index}', 1, shareCabins=self._share_cabins('MSK', 'CMA'))
+        VesselSchedule.objects.update(carrier_set=None, carrier_set_hash=None)
+        VesselScheduleShareCabin.objects.all().delete()
+
+        call_command('backfill_share_cabins', '--dry-run', stdout=StringIO())
+        self.assertFalse(VesselScheduleShareCabin.objects.exists())
+
+        result = ShareCabinService.backfill(chunk_size=2)
+
+        self.assertEqual(result, {'scanned': 5, 'updated': 5, 'share_cabin_rows': 10})
+        self.assertFalse(VesselSchedule.objects.filter(carrier_set__isnull=True).exists())
+
+        call_command('backfill_share_cabins', '--all', stdout=StringIO())
+        self.assertEqual(VesselScheduleShareCabin.objects.count(), 10)
+
+    def test_compact_removes_share_cabin_rows(self):
+        """归档历史版本时一并删除共舱明细"""
+        for version in range(1, 4):
+            self._create('CNSHA', 'USNYC', 'VESSEL_1', version, shareCabins=self._share_cabins('MSK'))
+        DataVersionService.publish(3, routes=[('CNSHA', 'USNYC')])
+
+        ScheduleRetentionService.compact(keep_versions=1)
+
+        self.assertEqual(
+            list(VesselScheduleShareCabin.objects.values_list('schedule__data_version', flat=True)), [3]
+        )
+
+
+class VesselInfoBulkServiceTest(TestCase):
+    """船舶额外信息批量写入"""
+
+    def _item(self, vessel, **kwargs):
+        """批量请求中的一条数据"""
+        item = {
+            'carrierCd': 'MSK', 'polCd': 'CNSHA', 'podCd': 'USNYC',
+            'vessel': vessel, 'voyage': 'V001',
+        }
+        item.update(kwargs)
+        return item
+
+    def test_bulk_create_reports_per_index(self):
+        """一次写入全部有效记录，逐条返回失败原因"""
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_EXISTS'))
+        items = [
+            self._item('VESSEL_1', price='100.00'),
+            self._item('VESSEL_EXISTS'),
+            self._item('VESSEL_2', price='-1'),
+            self._item('VESSEL_1'),
+            {'carriercd': 'ONE', 'polCd': 'CNSHA', 'podCd': 'USNYC', 'vessel': 'VESSEL_3', 'voyage': 'V001'},
+        ]
+
+        with CaptureQueriesContext(connection) as context:
+            result = VesselInfoBulkService.bulk_create(items)
+
+        self.assertEqual([record['index'] for record in result['created']], [0, 4])
+        self.assertEqual([record['index'] for record in result['failed']], [1, 2, 3])
+        self.assertEqual(result['failed'][0]['errors'], '记录已存在')
+        self.assertIsNotNone(result['created'][0]['data']['id'])
+        self.assertEqual(result['created'][1]['data']['carrierCd'], 'ONE')
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 3)
+        # 查询已有记录、批量插入、回读主键及更新船舶信息统计，不随记录数增长
+        inserts = [
+            q for q in context.captured_queries
+            if q['sql'].startswith('INSERT') and '"vessel_info_from_company"' in q['sql']
+        ]
+        self.assertEqual(len(inserts), 1)
+        queries = [q for q in context.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(queries), 10)
+
+    def test_bulk_create_concurrent_conflict(self):
+        """读取之后被并发写入的关联键计为单条失败，其余记录照常写入"""
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_EXISTS'))
+        fetch_existing = VesselInfoBulkService.fetch_existing
+        # 模拟并发：查询已有记录时另一个请求尚未提交
+        with mock.patch.object(VesselInfoBulkService, 'fetch_existing') as patched:
+            patched.side_effect = lambda keys, **kwargs: {} if patched.call_count == 1 else fetch_existing(keys, **kwargs)
+            result = VesselInfoBulkService.bulk_create([
+                self._item('VESSEL_1'), self._item('VESSEL_EXISTS'), self._item('VESSEL_2'),
+            ])
+
+        self.assertEqual([record['index'] for record in result['created']], [0, 2])
+        self.assertEqual([(record['index'], record['errors']) for record in result['failed']], [(1, '记录已存在')])
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 3)
+        stats = VesselInfoStats.objects.get(dimension=VesselInfoStats.DIMENSION_CARRIER, carrierCd='MSK')
+        self.assertEqual(stats.total_count, 3)
+
+    def test_bulk_update(self):
+        """按关联键批量更新，只修改请求中的字段"""
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_1', gp_20='10', price='100.00'))
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_2', gp_20='20'))
+
+        result = VesselInfoBulkService.bulk_update([
+            self._item('VESSEL_1', price='150.00'),
+            self._item('VESSEL_2', gp_20='25'),
+            self._item('VESSEL_MISSING', gp_20='1'),
+            {'polCd': 'CNSHA', 'vessel': 'VESSEL_1'},
+        ])
+
+        self.assertEqual([record['index'] for record in result['updated']], [0, 1])
+        self.assertEqual([record['errors'] for record in result['failed']], [
+            '记录不存在', '缺少必需字段: carrierCd, podCd, voyage'
+        ])
+        first = VesselInfoFromCompany.objects.get(vessel='VESSEL_1')
+        self.assertEqual(str(first.price), '150.00')
+        self.assertEqual(first.gp_20, '10')
+        self.assertEqual(VesselInfoFromCompany.objects.get(vessel='VESSEL_2').gp_20, '25')
+
+    def test_bulk_delete(self):
+        """按关联键批量删除，返回删除前的数据"""
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_1'))
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_2'))
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_3'))
+
+        result = VesselInfoBulkService.bulk_delete([
+            self._item('VESSEL_1'),
+            self._item('VESSEL_3'),
+            self._item('VESSEL_1'),
+            self._item('VESSEL_MISSING'),
+        ])
+
+        self.assertEqual([record['data']['vessel'] for record in result['deleted']], ['VESSEL_1', 'VESSEL_3'])
+        self.assertEqual([record['index'] for record in result['failed']], [2, 3])
+        self.assertEqual(list(VesselInfoFromCompany.objects.values_list('vessel', flat=True)), ['VESSEL_2'])
+
+    def test_bulk_write_invalidates_snapshots(self):
+        """批量写入不触发信号，提交后仍失效含船舶信息的分组快照"""
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            VesselInfoBulkService.bulk_create([self._item('VESSEL_1'), self._item('VESSEL_2')])
+
+        self.assertEqual(len(callbacks), 1)
+
+
+RATE_SHEET_CSV = (
+    'carriercd,polCd,podCd,vessel,voyage,gp_20,price\n'
+    'MSK,CNSHA,USNYC,VESSEL_1,V001,10,4500\n'
+    'MSK,CNSHA,USNYC,VESSEL_2,V001,20,-1\n'
+    ',,,,,,\n'
+    'MSK,CNSHA,USNYC,VESSEL_3,V001,30,\n'
+)
+
+
+class VesselInfoImportServiceTest(TestCase):
+    """价格表流式导入"""
+
+    def _run(self, content, file_name='rates.csv', **kwargs):
+        """导入字节内容"""
+        job = VesselInfoImportService.create_job(file_name)
+        upload = SimpleUploadedFile(file_name, content)
+        return VesselInfoImportService.run(job, upload, **kwargs)
+
+    def test_import_csv_upserts_and_reports_errors(self):
+        """新增和更新按批写入，表中未出现的列保持不变，失败行写入错误报告"""
+        VesselInfoFromCompany.objects.create(
+            carrierCd='MSK', polCd='CNSHA', podCd='USNYC', vessel='VESSEL_1', voyage='V001',
+            gp_20='1', hq_40='5', price='100.00'
+        )
+        progress = []
+
+        job = self._run(RATE_SHEET_CSV.encode('utf-8'), chunk_size=2,
+                        progress_callback=lambda current: progress.append(current.processed_rows))
+
+        self.assertEqual(job.status, VesselInfoImportJob.STATUS_COMPLETED)
+        self.assertEqual(progress, [2, 3])
+        self.assertEqual((job.created_count, job.updated_count, job.failed_count), (1, 1, 1))
+        updated = VesselInfoFromCompany.objects.get(vessel='VESSEL_1')
+        self.assertEqual((updated.gp_20, updated.hq_40, str(updated.price)), ('10', '5', '4500.00'))
+        created = VesselInfoFromCompany.objects.get(vessel='VESSEL_3')
+        self.assertIsNone(created.price)
+        self.assertFalse(VesselInfoFromCompany.objects.filter(vessel='VESSEL_2').exists())
+
+        with job.error_report.open('rb') as report:
+            lines = report.read().decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0], ','.join(VesselInfoImportService.ERROR_REPORT_HEADER))
+        self.assertTrue(lines[1].startswith('3,MSK,CNSHA,USNYC,VESSEL_2,V001,'))
+        self.assertEqual(len(lines), 2)
+        job.error_report.delete(save=False)
+
+    def test_blank_cells_keep_existing_values(self):
+        """已有记录的空单元格不清空原值，只有取值变化的记录计入更新数"""
+        for vessel in ('VESSEL_1', 'VESSEL_2'):
+            VesselInfoFromCompany.objects.create(
+                carrierCd='MSK', polCd='CNSHA', podCd='USNYC', vessel=vessel, voyage='V001',
+                gp_20='10', price='4500.00', cut_off_time='2025-05-18 18:00'
+            )
+        content = (
+            'carrierCd,polCd,podCd,vessel,voyage,gp_20,price,cut_off_time\n'
+            'MSK,CNSHA,USNYC,VESSEL_1,V001,12,,\n'
+            'MSK,CNSHA,USNYC,VESSEL_2,V001,10,4500,\n'
+        )
+
+        job = self._run(content.encode('utf-8'))
+
+        self.assertEqual((job.created_count, job.updated_count, job.failed_count), (0, 1, 0))
+        first = VesselInfoFromCompany.objects.get(vessel='VESSEL_1')
+        self.assertEqual(
+            (first.gp_20, str(first.price), first.cut_off_time), ('12', '4500.00', '2025-05-18 18:00')
+        )
+
+    def test_duplicate_keys_in_chunk_are_row_errors(self):
+        """同一批内关联键重复的行计为失败，以先出现的行为准"""
+        content = RATE_SHEET_CSV + 'MSK,CNSHA,USNYC,VESSEL_1,V001,99,\n'
+
+        job = self._run(content.encode('utf-8'))
+
+        self.assertEqual((job.created_count, job.failed_count), (2, 2))
+        self.assertEqual(VesselInfoFromCompany.objects.get(vessel='VESSEL_1').gp_20, '10')
+        with job.error_report.open('rb') as report:
+            lines = report.read().decode('utf-8-sig').splitlines()
+        self.assertTrue(lines[2].startswith('6,MSK,CNSHA,USNYC,VESSEL_1,V001,'))
+        self.assertIn('与第2行关联字段重复', lines[2])
+        job.error_report.delete(save=False)
+
+    def test_database_error_fails_job(self):
+        """某批写入数据库失败时任务标记为失败，整批计入错误报告，此前的批次保留"""
+        with mock.patch.object(
+            VesselInfoStatsService, 'apply', side_effect=[None, OperationalError('database is locked')]
+        ):
+            job = self._run(RATE_SHEET_CSV.encode('utf-8'), chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, VesselInfoImportJob.STATUS_FAILED)
+        self.assertIn('database is locked', job.message)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual((job.processed_rows, job.created_count, job.failed_count), (3, 1, 2))
+        self.assertEqual(list(VesselInfoFromCompany.objects.values_list('vessel', flat=True)), ['VESSEL_1'])
+        with job.error_report.open('rb') as report:
+            lines = report.read().decode('utf-8-sig').splitlines()
+        self.assertTrue(lines[2].startswith('5,MSK,CNSHA,USNYC,VESSEL_3,V001,数据库错误'))
+        job.error_report.delete(save=False)
+
+    def test_chinese_header_and_encoding(self):
+        """支持中文表头和GBK编码"""
+        content = '船公司,起运港五字码,目的港五字码,船名,航次,40尺高箱\nONE,CNSHA,USNYC,船A,V001,有\n'
+
+        job = self._run(content.encode('gbk'), encoding='gbk')
+
+        self.assertEqual(job.status, VesselInfoImportJob.STATUS_COMPLETED)
+        self.assertEqual(VesselInfoFromCompany.objects.get(vessel='船A').hq_40, '有')
+
+    def test_missing_key_column_fails_job(self):
+        """表头缺少关联字段时任务失败"""
+        job = self._run(b'polCd,podCd,vessel,voyage\nCNSHA,USNYC,V,V001\n')
+
+        self.assertEqual(job.status, VesselInfoImportJob.STATUS_FAILED)
+        self.assertIn('carrierCd', job.message)
+        self.assertFalse(VesselInfoFromCompany.objects.exists())
+
+    def test_unsupported_format(self):
+        """不支持的扩展名"""
+        with self.assertRaises(ValueError):
+            VesselInfoImportService.create_job('rates.txt')
+
+    @unittest.skipUnless(
+        __import__('importlib').util.find_spec('openpyxl'), '需要安装openpyxl'
+    )
+    def test_import_xlsx(self):
+        """以只读模式流式读取XLSX"""
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['carrierCd', 'polCd', 'podCd', 'vessel', 'voyage', 'price', 'cut_off_time'])
+        sheet.append(['MSK', 'CNSHA', 'USNYC', 'VESSEL_1', 'V001', 4500.5, datetime(2025, 5, 18, 18, 0)])
+        with tempfile.NamedTemporaryFile(suffix='.xlsx') as file:
+            workbook.save(file.name)
+            job = self._run(open(file.name, 'rb').read(), file_name='rates.xlsx')
+
+        self.assertEqual(job.status, VesselInfoImportJob.STATUS_COMPLETED)
+        vessel_info = VesselInfoFromCompany.objects.get(vessel='VESSEL_1')
+        self.assertEqual((str(vessel_info.price), vessel_info.cut_off_time), ('4500.50', '2025-05-18 18:00'))
+
+    def test_import_command(self):
+        """管理命令导入文件"""
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as file:
+            file.write(RATE_SHEET_CSV.encode('utf-8'))
+        try:
+            out = StringIO()
+            call_command('import_vessel_info', file.name, '--chunk-size', '1', stdout=out)
+        finally:
+            os.unlink(file.name)
+
+        self.assertEqual(VesselInfoFromCompany.objects.count(), 2)
+        self.assertIn('新增: 2', out.getvalue())
+        job = VesselInfoImportJob.objects.get()
+        self.assertEqual(job.processed_rows, 3)
+        job.error_report.delete(save=False)
+
+
+class VesselScheduleExportServiceTest(TestCase):
+    """航线流式导出"""
+
+    def setUp(self):
+        """测试前准备：版本2有5条有效航线和1条无效航线，版本1有1条航线"""
+        for i in range(5):
+            create_schedule('CNSHA', 'USNYC', f'VESSEL_{i}', 2, pol='上海')
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_INVALID', 2, status=0)
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_OLD', 1)
+        self.queryset = VesselScheduleExportService.build_queryset(data_version=2)
+
+    def _export(self, export_format, chunk_size=2):
+        """导出并拼接全部字节块"""
+        return b''.join(VesselScheduleExportService.stream(self.queryset, export_format, chunk_size))
+
+    def test_csv_export(self):
+        """CSV带BOM和表头，按主键顺序导出筛选后的全部行"""
+        content = self._export('csv').decode('utf-8-sig')
+        rows = list(csv.DictReader(io.StringIO(content)))
+
+        self.assertEqual([row['vessel'] for row in rows], [f'VESSEL_{i}' for i in range(5)])
+        self.assertEqual(rows[0]['pol'], '上海')
+        self.assertEqual(list(rows[0]), VesselScheduleExportService.get_fields())
+
+    def test_ndjson_gzip_export(self):
+        """gzip压缩的NDJSON每行一个对象"""
+        content = gzip.decompress(self._export('ndjson.gz')).decode('utf-8')
+        records = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual([record['vessel'] for record in records], [f'VESSEL_{i}' for i in range(5)])
+        self.assertTrue(all(record['data_version'] == 2 for record in records))
+
+    def test_reads_in_primary_key_batches(self):
+        """按主键分批读取，每批一次查询，不使用OFFSET"""
+        stream = VesselScheduleExportService.stream(self.queryset, 'csv', chunk_size=2)
+        with CaptureQueriesContext(connection) as context:
+            header = next(stream)
+        self.assertTrue(header.startswith('\ufeffid,'.encode('utf-8')))
+        self.assertEqual(len(context.captured_queries), 0)
+
+        with CaptureQueriesContext(connection) as context:
+            chunks = list(stream)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in context.captured_queries))
+
+    def test_unsupported_format(self):
+        """不支持的格式抛出ValueError"""
+        with self.assertRaises(ValueError):
+            VesselScheduleExportService.parse_format('xlsx')
+
+    def test_export_command(self):
+        """管理命令导出到文件"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'v2.csv.gz')
+            call_command(
+                'export_vessel_schedules', '-o', output, '--data-version', '2', '--gzip',
+                '--chunk-size', '2', stdout=StringIO()
+            )
+            with gzip.open(output, 'rt', encoding='utf-8-sig') as file:
+                rows = list(csv.DictReader(file))
+
+        self.assertEqual(len(rows), 5)
+
+
+class ScheduleStatsServiceTest(TestCase):
+    """航线统计汇总"""
+
+    def _stats(self):
+        """当前统计表内容"""
+        return sorted(VesselScheduleStats.objects.values_list(
+            'data_version', 'status', 'dimension', 'code', 'name', 'count'
+        ))
+
+    def test_refresh_on_commit(self):
+        """航线保存后在事务提交时按数据版本重算统计"""
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1, pol='SHANGHAI')
+            create_schedule('CNSHA', 'USLAX', 'VESSEL_2', 1, pol='SHANGHAI', carriercd='CMA')
+            create_schedule('CNNGB', 'USNYC', 'VESSEL_3', 1, status=0)
+
+        summary = ScheduleStatsService.get_summary()
+        self.assertEqual((summary['total_count'], summary['active_count'], summary['inactive_count']), (3, 2, 1))
+        self.assertEqual(summary['carrier_stats'], [
+            {'carriercd': 'CMA', 'count': 1}, {'carriercd': 'MSK', 'count': 1}
+        ])
+        self.assertEqual(summary['pol_stats'], [{'polCd': 'CNSHA', 'pol': 'SHANGHAI', 'count': 2}])
+
+        schedule = VesselSchedule.objects.get(vessel='VESSEL_3')
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule.status = 1
+            schedule.save()
+        self.assertEqual(ScheduleStatsService.get_status_counts(), {1: 3})
+
+    def test_single_row_changes_apply_deltas(self):
+        """逐条保存/删除按变化前后的统计维度增量更新，不重算整个版本，结果与重算一致"""
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1, pol='SHANGHAI')
+            create_schedule('CNSHA', 'USLAX', 'VESSEL_2', 1, pol='SHANGHAI')
+            create_schedule('CNNGB', 'USNYC', 'VESSEL_3', 1)
+
+        with mock.patch.object(ScheduleStatsService, 'refresh_versions') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule = VesselSchedule.objects.get(vessel='VESSEL_1')
+                schedule.carriercd = 'CMA'
+                schedule.save()
+                schedule.status = 0
+                schedule.pol = '上海'
+                # 只保存status，未保存的pol不计入统计
+                schedule.save(update_fields=['status'])
+                VesselSchedule.objects.get(vessel='VESSEL_3').delete()
+        refresh.assert_not_called()
+
+        incremental = self._stats()
+        self.assertIn((1, 0, 'carrier', 'CMA', '', 1), incremental)
+        self.assertFalse([row for row in incremental if row[3] == 'CNNGB'])
+        ScheduleStatsService.rebuild()
+        self.assertEqual(self._stats(), incremental)
+
+    def test_queryset_update_with_enqueue(self):
+        """queryset.update()后登记受影响的版本即可重算统计"""
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_2', 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VesselSchedule.objects.filter(data_version=2).update(status=0)
+            enqueue_vessel_schedule_sync((), data_versions=[2])
+
+        self.assertEqual(ScheduleStatsService.get_status_counts(), {1: 1, 0: 1})
+
+    def test_rebuild_matches_incremental(self):
+        """全量重建与增量维护的结果一致，并清除已不存在版本的统计"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for version in (1, 2):
+                create_schedule('CNSHA', 'USNYC', f'VESSEL_{version}', version, pod='NEW YORK')
+                create_schedule('CNSHA', 'USLAX', f'VESSEL_{version}', version, carriercd=None)
+        incremental = self._stats()
+        VesselScheduleStats.objects.create(data_version=99, status=1, dimension='carrier', code='OLD', count=1)
+
+        result = ScheduleStatsService.rebuild()
+
+        self.assertEqual(result, {'versions': 2, 'rows': len(incremental)})
+        self.assertEqual(self._stats(), incremental)
+        self.assertIn((1, 1, 'carrier', '', '', 1), incremental)
+
+    def test_archive_removes_version_stats(self):
+        """历史版本归档后删除其统计"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for version in (1, 2, 3):
+                create_schedule('CNSHA', 'USNYC', 'VESSEL_1', version)
+
+        ScheduleRetentionService.compact(keep_versions=1)
+
+        self.assertEqual(set(VesselScheduleStats.objects.values_list('data_version', flat=True)), {3})
+
+
+class VesselInfoStatsServiceTest(TestCase):
+    """船舶信息统计增量维护"""
+
+    def _item(self, vessel, **kwargs):
+        """一条船舶信息"""
+        item = {
+            'carrierCd': 'MSK', 'polCd': 'CNSHA', 'podCd': 'USNYC',
+            'vessel': vessel, 'voyage': 'V001',
+        }
+        item.update(kwargs)
+        return item
+
+    def _counts(self):
+        """当前统计表内容"""
+        return {
+            (row.dimension, row.carrierCd, row.polCd, row.podCd): (row.total_count, row.filled_count)
+            for row in VesselInfoStats.objects.all()
+        }
+
+    def _assertMatchesRebuild(self):
+        """增量结果与全量重建一致（忽略归零的统计行）"""
+        incremental = {key: value for key, value in self._counts().items() if value != (0, 0)}
+        VesselInfoStatsService.rebuild()
+        self.assertEqual(self._counts(), incremental)
+
+    def test_orm_save_and_delete(self):
+        """逐条创建、填写、修改关联字段和删除"""
+        info = VesselInfoFromCompany.objects.create(**self._item('VESSEL_1'))
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_2', carrierCd='CMA', gp_20='10'))
+        self.assertEqual(self._counts()[('carrier', 'MSK', '', '')], (1, 0))
+        self.assertEqual(self._counts()[('route', '', 'CNSHA', 'USNYC')], (2, 1))
+
+        info.price = '100.00'
+        info.save()
+        self.assertEqual(self._counts()[('carrier', 'MSK', '', '')], (1, 1))
+
+        loaded = VesselInfoFromCompany.objects.get(pk=info.pk)
+        loaded.carrierCd = 'ONE'
+        loaded.save()
+        self.assertEqual(self._counts()[('carrier', 'MSK', '', '')], (0, 0))
+        self.assertEqual(self._counts()[('carrier', 'ONE', '', '')], (1, 1))
+
+        VesselInfoFromCompany.objects.get(vessel='VESSEL_2').delete()
+        self.assertEqual(self._counts()[('route', '', 'CNSHA', 'USNYC')], (1, 1))
+        self._assertMatchesRebuild()
+
+    def test_bulk_service(self):
+        """批量创建、更新和删除不触发信号，由批量服务更新统计"""
+        VesselInfoBulkService.bulk_create([self._item(f'VESSEL_{i}') for i in range(3)])
+        VesselInfoBulkService.bulk_update([self._item('VESSEL_0', gp_20='10'), self._item('VESSEL_1', hq_40='5')])
+        VesselInfoBulkService.bulk_delete([self._item('VESSEL_1')])
+
+        self.assertEqual(self._counts()[('carrier', 'MSK', '', '')], (2, 1))
+        self._assertMatchesRebuild()
+
+    def test_import(self):
+        """价格表导入的新增和更新"""
+        VesselInfoFromCompany.objects.create(**self._item('VESSEL_1'))
+        job = VesselInfoImportService.create_job('rates.csv')
+        VesselInfoImportService.run(job, SimpleUploadedFile('rates.csv', RATE_SHEET_CSV.encode('utf-8')))
+
+        self.assertEqual(self._counts()[('carrier', 'MSK', '', '')], (2, 2))
+        self._assertMatchesRebuild()
+
+    def test_manual_sync_creates_empty_records(self):
+        """同步航线新建的船舶信息计入未填写"""
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1,
+                            shareCabins=json.dumps([{'carrierCd': 'MSK'}, {'carrierCd': 'CMA'}]))
+
+        self.assertEqual(self._counts()[('route', '', 'CNSHA', 'USNYC')], (2, 0))
+        self._assertMatchesRebuild()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class DataVersionRegistryAPITest(APITestCase):
+    """接口按已发布版本读取数据"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_cabin_grouping_reads_published_version(self):
+        """共舱分组接口返回已发布版本，而不是最大版本"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_2', 2)
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+        for url in ('/api/schedules/cabin-grouping/', '/api/schedules/cabin-grouping-with-info/'):
+            response = self.client.get(url, {'polCd': 'CNSHA', 'podCd': 'USNYC'})
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['data']['version'], 1)
+            vessels = [s['vessel'] for g in response.data['data']['groups'] for s in g['schedules']]
+            self.assertEqual(vessels, ['VESSEL_1'])
+
+    def test_cabin_grouping_etd_window(self):
+        """共舱分组接口按ETD窗口在数据库中过滤，参数错误返回400"""
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1, etd='2025-06-01')
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_2', 1, etd='2025-06-10')
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+        for url in ('/api/schedules/cabin-grouping/', '/api/schedules/cabin-grouping-with-info/'):
+            response = self.client.get(url, {
+                'polCd': 'CNSHA', 'podCd': 'USNYC', 'etd_from': '2025-06-05', 'etd_to': '2025-06-10'
+            })
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            vessels = [s['vessel'] for g in response.data['data']['groups'] for s in g['schedules']]
+            self.assertEqual(vessels, ['VESSEL_2'])
+
+            response = self.client.get(url, {'polCd': 'CNSHA', 'podCd': 'USNYC', 'sailing_within_days': 'x'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertFalse(response.data['success'])
+
+    def test_sailing_within_days(self):
+        """近N天开船筛选"""
+        today = timezone.localdate()
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_SOON', 1, etd=(today + timedelta(days=3)).isoformat())
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_LATER', 1, etd=(today + timedelta(days=30)).isoformat())
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_PAST', 1, etd=(today - timedelta(days=1)).isoformat())
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+        response = self.client.get('/api/schedules/cabin-grouping/', {
+            'polCd': 'CNSHA', 'podCd': 'USNYC', 'sailing_within_days': 7
+        })
+
+        vessels = [s['vessel'] for g in response.data['data']['groups'] for s in g['schedules']]
+        self.assertEqual(vessels, ['VESSEL_SOON'])
+
+    def test_carrier_sailings_api(self):
+        """船公司共舱航线接口读取已发布版本"""
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1, shareCabins=json.dumps([{'carrierCd': 'CMA'}]))
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_2', 2, shareCabins=json.dumps([{'carrierCd': 'CMA'}]))
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_3', 1, shareCabins=json.dumps([{'carrierCd': 'MSK'}]))
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+        response = self.client.get('/api/schedules/carrier-sailings/', {'carrierCd': 'CMA'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['total_count'], 1)
+        self.assertEqual(response.data['data']['results'][0]['vessel'], 'VESSEL_1')
+        self.assertEqual(response.data['data']['carrier_sets'], [{'carrier_codes': ['CMA'], 'count': 1}])
+
+        response = self.client.get('/api/schedules/carrier-sailings/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VesselInfoBulkAPITest(APITestCase):
+    """船舶额外信息批量接口"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com',
+            password='adminpass123'
+        )
+        self.client.force_authenticate(user=self.admin)
+
+    def _items(self, count):
+        """生成批量请求数据"""
+        return [
+            {'carriercd': 'MSK', 'polCd': 'CNSHA', 'podCd': 'USNYC', 'vessel': f'VESSEL_{i}', 'voyage': 'V001'}
+            for i in range(count)
+        ]
+
+    def test_bulk_create_update_delete(self):
+        """超过原100条上限的批量创建、更新和删除"""
+        items = self._items(300)
+
+        response = self.client.post('/api/vessel-info/bulk-create/', {'data': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['summary']['success_count'], 300)
+
+        updates = [dict(item, gp_20='10') for item in items]
+        response = self.client.patch('/api/vessel-info/bulk-update/', {'data': updates}, format='json')
+        self.assertEqual(response.data['data']['summary']['success_count'], 300)
+        self.assertEqual(VesselInfoFromCompany.objects.filter(gp_20='10').count(), 300)
+
+        response = self.client.delete('/api/vessel-info/bulk-delete/', {'conditions': items}, format='json')
+        self.assertEqual(response.data['data']['summary']['success_count'], 300)
+        self.assertFalse(VesselInfoFromCompany.objects.exists())
+
+    def test_bulk_limit(self):
+        """超过单次上限返回400"""
+        items = self._items(VesselInfoBulkService.MAX_ITEMS + 1)
+
+        response = self.client.post('/api/vessel-info/bulk-create/', {'data': items}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['success'])
+
+    def test_import_upload_and_error_report(self):
+        """上传价格表导入，查询进度并下载错误报告"""
+        upload = SimpleUploadedFile('rates.csv', RATE_SHEET_CSV.encode('utf-8'), content_type='text/csv')
+
+        response = self.client.post('/api/vessel-info/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['created_count'], 2)
+        self.assertTrue(response.data['data']['has_error_report'])
+        job_id = response.data['data']['id']
+
+        response = self.client.get(f'/api/vessel-info/import/{job_id}/')
+        self.assertEqual(response.data['data']['status'], VesselInfoImportJob.STATUS_COMPLETED)
+
+        response = self.client.get(f'/api/vessel-info/import/{job_id}/errors/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertIn('VESSEL_2', report)
+        response.close()
+        VesselInfoImportJob.objects.get(pk=job_id).error_report.delete(save=False)
+
+        other = User.objects.create_user(email='other@example.com', password='otherpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(f'/api/vessel-info/import/{job_id}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VesselScheduleExportAPITest(APITestCase):
+    """航线流式导出接口"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='export@example.com', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        for i in range(3):
+            create_schedule('CNSHA', 'USNYC', f'VESSEL_{i}', 2)
+        create_schedule('CNSHA', 'DEHAM', 'VESSEL_HAM', 2)
+        create_schedule('CNSHA', 'USNYC', 'VESSEL_OLD', 1)
+
+    def test_streams_csv_with_list_filters(self):
+        """流式返回CSV，筛选条件与航线列表一致"""
+        response = self.client.get('/api/schedules/export/', {'data_version': 2, 'pod_cd': 'USNYC'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('vessel_schedule_v2_', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        vessels = [row['vessel'] for row in csv.DictReader(io.StringIO(content))]
+        self.assertEqual(vessels, ['VESSEL_0', 'VESSEL_1', 'VESSEL_2'])
+
+    def test_streams_gzip_ndjson(self):
+        """ndjson.gz返回gzip文件"""
+        response = self.client.get('/api/schedules/export/', {'export_format': 'ndjson.gz', 'search': 'VESSEL_HAM'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['vessel'] for line in lines], ['VESSEL_HAM'])
+
+    def test_unsupported_format(self):
+        """不支持的格式返回400"""
+        response = self.client.get('/api/schedules/export/', {'export_format': 'xlsx'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['success'])
+
+    def test_requires_authentication(self):
+        """未认证返回401"""
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get('/api/schedules/export/')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class StatsAPITest(APITestCase):
+    """统计接口读取汇总表"""
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com',
+            password='adminpass123'
+        )
+        self.client.force_authenticate(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_2', 1, status=0)
+        VesselInfoFromCompany.objects.filter(vessel='VESSEL_1').update(gp_20='10')
+        VesselInfoStatsService.rebuild()
+
+    def _assertNoScan(self, context):
+        """接口没有查询航线和船舶信息表"""
+        for query in context.captured_queries:
+            self.assertNotIn('"vessel_schedule"', query['sql'])
+            self.assertNotIn('"vessel_info_from_company"', query['sql'])
+
+    def test_schedule_stats(self):
+        """航线统计"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/schedules/stats/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual((data['total_count'], data['active_count'], data['inactive_count']), (2, 1, 1))
+        self.assertEqual(data['carrier_stats'], [{'carriercd': 'MSK', 'count': 1}])
+        self._assertNoScan(context)
+
+    def test_vessel_info_sync_status(self):
+        """船舶信息同步状态按船公司代码carrierCd统计"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/vessel-info/sync-status/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual(data['vessel_schedule_count'], 1)
+        self.assertEqual((data['vessel_info_count'], data['filled_info_count'], data['fill_rate']), (1, 1, 100.0))
+        self.assertEqual(data['carrier_stats'], [{'carrierCd': 'MSK', 'count': 1}])
+        self.assertEqual(data['route_stats'], [{'polCd': 'CNSHA', 'podCd': 'USNYC', 'count': 1}])
+        self.assertIsNotNone(data['last_updated'])
+        self._assertNoScan(context)
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'conditional-get-tests',
+    }
+}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, CACHES=LOCMEM_CACHES)
+class ConditionalGetAPITest(APITestCase):
+    """读接口的ETag条件请求"""
+
+    GROUPING_URLS = ('/api/schedules/cabin-grouping/', '/api/schedules/cabin-grouping-with-info/')
+    PARAMS = {'polCd': 'CNSHA', 'podCd': 'USNYC'}
+
+    def setUp(self):
+        """测试前准备"""
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1)
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+    def _get_etag(self, url, params=None):
+        """首次请求返回200和ETag"""
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        return response['ETag']
+
+    def test_not_modified_without_heavy_queries(self):
+        """If-None-Match匹配时返回304，不查询航线、快照和统计表"""
+        for url, params in [(url, self.PARAMS) for url in self.GROUPING_URLS] + [('/api/schedules/stats/', None)]:
+            etag = self._get_etag(url, params)
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+            # 分组接口只读缓存；统计接口只读取全局版本登记
+            for query in context.captured_queries:
+                self.assertIn('"data_version_registry"', query['sql'])
+
+            # 弱校验形式和列表形式同样匹配，不匹配时返回完整响应
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH='"other"')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_depends_on_filters(self):
+        """航线、ETD窗口和响应格式不同，ETag不同"""
+        etags = {
+            self._get_etag(self.GROUPING_URLS[0], self.PARAMS),
+            self._get_etag(self.GROUPING_URLS[0], {'polCd': 'CNSHA', 'podCd': 'USLAX'}),
+            self._get_etag(self.GROUPING_URLS[0], dict(self.PARAMS, etd_from='2025-06-01')),
+            self._get_etag(self.GROUPING_URLS[0], dict(self.PARAMS, format='compact')),
+            self._get_etag(self.GROUPING_URLS[1], self.PARAMS),
+        }
+        self.assertEqual(len(etags), 5)
+
+    def test_etag_changes_on_publish(self):
+        """发布新版本后ETag变化，旧ETag返回完整响应"""
+        etags = {url: self._get_etag(url, self.PARAMS) for url in self.GROUPING_URLS}
+        stats_etag = self._get_etag('/api/schedules/stats/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_2', 2)
+        DataVersionService.publish(2, routes=[('CNSHA', 'USNYC')])
+
+        for url, etag in etags.items():
+            response = self.client.get(url, self.PARAMS, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['data']['version'], 2)
+            self.assertNotEqual(response['ETag'], etag)
+
+        response = self.client.get('/api/schedules/stats/', HTTP_IF_NONE_MATCH=stats_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['total_count'], 2)
+
+    def test_etag_changes_on_vessel_info_edit(self):
+        """船舶信息修改后含船舶信息分组的ETag变化"""
+        url = self.GROUPING_URLS[1]
+        etag = self._get_etag(url, self.PARAMS)
+
+        vessel_info = VesselInfoFromCompany.objects.get(vessel='VESSEL_1')
+        vessel_info.gp_20 = '有现舱'
+        with self.captureOnCommitCallbacks(execute=True):
+            vessel_info.save()
+
+        response = self.client.get(url, self.PARAMS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        schedule = response.data['data']['groups'][0]['schedules'][0]
+        self.assertEqual(schedule['vessel_info']['gp_20'], '有现舱')
+
+    def test_no_etag_on_error(self):
+        """参数错误返回400，不带ETag"""
+        for url in self.GROUPING_URLS:
+            for params in ({'polCd': 'CNSHA'}, dict(self.PARAMS, sailing_within_days='x')):
+                response = self.client.get(url, params, HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertFalse(response.has_header('ETag'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CabinGroupingCompactTest(APITestCase):
+    """共舱分组接口的紧凑格式"""
+
+    URLS = ('/api/schedules/cabin-grouping/', '/api/schedules/cabin-grouping-with-info/')
+    PARAMS = {'polCd': 'CNSHA', 'podCd': 'USNYC'}
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        share_cabins = [{'carrierCd': 'MSK'}, {'carrierCd': 'ONE'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_1', 1, pol='SHANGHAI', pod='NEW YORK',
+                            shareCabins=json.dumps(share_cabins))
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_2', 1, pol='SHANGHAI', pod='NEW YORK',
+                            shareCabins=json.dumps(list(reversed(share_cabins))))
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_3', 1, pol='YANGSHAN', pod='NEW YORK',
+                            shareCabins=json.dumps(share_cabins))
+            create_schedule('CNSHA', 'USNYC', 'VESSEL_4', 1, carriercd='CMA',
+                            shareCabins=json.dumps([{'carrierCd': 'CMA'}]))
+        DataVersionService.publish(1, routes=[('CNSHA', 'USNYC')])
+
+    @staticmethod
+    def expand(data):
+        """按紧凑格式的规则还原完整结构"""
+        data = dict(data)
+        route = data.pop('route')
+        data.pop('format')
+        groups = []
+        for group in data['groups']:
+            group = dict(group)
+            share_cabins = group.pop('share_cabins')
+            group['schedules'] = [
+                dict(route, **dict(schedule, shareCabins=share_cabins[schedule['shareCabins']]))
+                for schedule in group['schedules']
+            ]
+            groups.append(group)
+        data['groups'] = groups
+        return data
+
+    def test_compact_is_lossless(self):
+        """紧凑格式还原后与完整格式一致，且响应更小"""
+        for url in self.URLS:
+            full = self.client.get(url, self.PARAMS)
+            compact = self.client.get(url, dict(self.PARAMS, format='compact'))
+
+            self.assertEqual(compact.status_code, status.HTTP_200_OK)
+            self.assertEqual(compact['Content-Type'], full['Content-Type'])
+            data = compact.data['data']
+            self.assertEqual(data['format'], 'compact')
+            self.assertEqual(data['route'], {'polCd': 'CNSHA', 'podCd': 'USNYC', 'pol': 'SHANGHAI', 'pod': 'NEW YORK'})
+            self.assertEqual(self.expand(data), json.loads(json.dumps(full.data['data'])))
+            self.assertLess(len(compact.content), len(full.content))
+
+    def test_share_cabins_encoded_per_group(self):
+        """组内不同的共舱配置各出现一次，航线中只保留下标；与route不同的字段保留在航线中"""
+        response = self.client.get(self.URLS[1], dict(self.PARAMS, format='compact'))
+
+        groups = {tuple(group['carrier_codes']): group for group in response.data['data']['groups']}
+        group = groups[('MSK', 'ONE')]
+        self.assertEqual(len(group['share_cabins']), 2)
+        schedules = {schedule['vessel']: schedule for schedule in group['schedules']}
+        self.assertEqual(schedules['VESSEL_1']['shareCabins'], schedules['VESSEL_3']['shareCabins'])
+        self.assertNotEqual(schedules['VESSEL_1']['shareCabins'], schedules['VESSEL_2']['shareCabins'])
+        self.assertNotIn('pol', schedules['VESSEL_1'])
+        self.assertEqual(schedules['VESSEL_3']['pol'], 'YANGSHAN')
+        self.assertEqual(groups[('CMA',)]['share_cabins'], [[{'carrierCd': 'CMA'}]])
+
+    def test_errors_and_empty_route(self):
+        """紧凑格式下参数错误照常返回400，没有数据的航线返回空分组"""
+        for url in self.URLS:
+            response = self.client.get(url, {'polCd': 'CNSHA', 'format': 'compact'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.URLS[1], {'polCd': 'CNNGB', 'podCd': 'USLAX', 'format': 'compact'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['data']['groups'], response.data['data']['route']), ([], {}))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CabinGroupingBatchAPITest(APITestCase):
+    """多航线共舱分组接口"""
+
+    URL = '/api/schedules/cabin-grouping-with-info/batch/'
+    SINGLE_URL = '/api/schedules/cabin-grouping-with-info/'
+    ROUTES = [('CNSHA', 'USNYC'), ('CNSHA', 'USLAX'), ('CNNGB', 'DEHAM')]
+
+    def setUp(self):
+        """测试前准备"""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            for pol_cd, pod_cd in self.ROUTES:
+                for i in range(3):
+                    create_schedule(pol_cd, pod_cd, f'{pod_cd}_{i}', 1, routeEtd=str(i + 1),
+                                    etd=f'2025-06-0{i + 1}', carriercd='MSK' if i % 2 else 'ONE')
+            create_schedule('CNSHA', 'USNYC', 'USNYC_NEXT', 2)
+        VesselInfoFromCompany.objects.filter(vessel='USNYC_1').update(gp_20='有现舱', price=1200)
+        DataVersionService.publish(1, routes=self.ROUTES)
+
+    @staticmethod
+    def routes_param(routes):
+        """航线参数"""
+        return ','.join(f'{pol_cd}:{pod_cd}' for pol_cd, pod_cd in routes)
+
+    def test_matches_single_route_api(self):
+        """各航线结果与单航线接口相同，没有数据的航线返回空分组"""
+        routes = self.ROUTES + [('CNSHA', 'JPTYO')]
+        response = self.client.get(self.URL, {'routes': self.routes_param(routes)})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['total_routes'], 4)
+        for (pol_cd, pod_cd), data in zip(routes, response.data['data']['routes']):
+            single = self.client.get(self.SINGLE_URL, {'polCd': pol_cd, 'podCd': pod_cd})
+            self.assertEqual(data, single.data['data'])
+        self.assertEqual(response.data['data']['routes'][3]['groups'], [])
+
+    def test_set_based_queries(self):
+        """查询次数不随航线数量增长，快照与单航线接口共用"""
+        def count_queries(routes):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.URL, {'routes': self.routes_param(routes)})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(context.captured_queries)
+
+        # 单航线接口先生成一条航线的快照，批量接口只计算其余航线
+        self.client.get(self.SINGLE_URL, {'polCd': 'CNSHA', 'podCd': 'USNYC'})
+        self.assertEqual(CabinGroupingSnapshot.objects.count(), 1)
+
+        # 版本号 + 快照 + 航线 + 分组汇总（GROUP BY carrier_set_hash） + 船舶信息 + 写入快照
+        self.assertEqual(count_queries(self.ROUTES), 6)
+        self.assertEqual(CabinGroupingSnapshot.objects.count(), 3)
+        # 版本号 + 快照
+        self.assertEqual(count_queries(self.ROUTES), 2)
+        self.assertEqual(count_queries(self.ROUTES[:1]), 2)
+
+    def test_etd_window_and_compact(self):
+        """ETD窗口和紧凑格式对每条航线生效"""
+        response = self.client.get(self.URL, {
+            'routes': self.routes_param(self.ROUTES[:2]), 'etd_from': '2025-06-02', 'format': 'compact'
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for (pol_cd, pod_cd), data in zip(self.ROUTES, response.data['data']['routes']):
+            self.assertEqual(data['format'], 'compact')
+            self.assertEqual(data['route']['podCd'], pod_cd)
+            vessels = sorted(s['vessel'] for g in data['groups'] for s in g['schedules'])
+            self.assertEqual(vessels, [f'{pod_cd}_1', f'{pod_cd}_2'])
+        self.assertEqual(CabinGroupingSnapshot.objects.count(), 0)
+
+    def test_invalid_params(self):
+        """参数缺失、格式错误或超过数量上限返回400"""
+        for params in ({}, {'routes': 'CNSHA'}, {'routes': 'CNSHA:'},
+                       {'routes': 'CNSHA:USNYC', 'sailing_within_days': 'x'}):
+            response = self.client.get(self.URL, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertFalse(response.data['success'])
+
+        with self.settings(CABIN_GROUPING_BATCH_MAX_ROUTES=2):
+            response = self.client.get(self.URL, {'routes': self.routes_param(self.ROUTES)})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            # 重复的航线只计一次
+            response = self.client.get(self.URL, {'routes': 'CNSHA:USNYC, CNSHA:USNYC,CNSHA:USLAX'})
+            self.assertEqual(response.data['data']['total_routes'], 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_conditional_get(self):
+        """任一航线的船舶信息变化后ETag变化"""
+        from django.core.cache import cache
+        cache.clear()
+        params = {'routes': self.routes_param(self.ROUTES)}
+        etag = self.client.get(self.URL, params)['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.URL, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        vessel_info = VesselInfoFromCompany.objects.get(vessel='DEHAM_0')
+        vessel_info.gp_20 = '有现舱'
+        with self.captureOnCommitCallbacks(execute=True):
+            vessel_info.save()
+
+        response = self.client.get(self.URL, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)